@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Memory footprint checks of route import, upsampling and writing.
+
+Each stage runs under tracemalloc on a synthetic GPX route of each size.
+Two numbers are recorded per stage:
+  peak: the most memory allocated at once while the stage ran
+  retained: memory still allocated once it returned while its result is
+  kept, such as the Route a GPX import made
+Both are divided by the number of points the stage produced. A stage fails
+its budget when its peak bytes per point exceed it, so growth in the
+per-point cost of a route shows up before the bench PCs start swapping.
+
+  Typical usage example (from the repository root):
+  python3 -m benchmarks.memory_benchmarks --sizes 10000 1000000
+  python3 -m benchmarks.memory_benchmarks --budget upsample_route=64
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from benchmarks.route_benchmarks import FREQUENCY
+from benchmarks.route_benchmarks import get_environment
+from benchmarks.route_benchmarks import SPEED
+from benchmarks.route_benchmarks import write_synthetic_gpx_file
+from geobeam.generate_route import Route
+from geobeam.generate_route import TimedRoute
+
+DEFAULT_SIZES = [10000, 100000]
+STAGES = ["route_from_gpx", "upsample_route", "write_route"]
+# peak bytes per point each stage may use
+DEFAULT_BUDGETS = {"route_from_gpx": 1024, "upsample_route": 128, "write_route": 512}
+
+
+class MemoryBenchmark():
+  """The stages of a GPX import on a synthetic route of one size."""
+
+  def __init__(self, point_count, work_directory):
+    """Initialize benchmark and write its synthetic GPX file.
+
+    Args:
+      point_count: int, number of track points of the synthetic route
+      work_directory: path of a directory to write files to
+    """
+    self.point_count = point_count
+    self._work_directory = work_directory
+    self._gpx_file_path = os.path.join(work_directory, "synthetic_%d.gpx" % point_count)
+    write_synthetic_gpx_file(self._gpx_file_path, point_count)
+    self._route = None
+    self._timed_route = None
+
+  def prepare_stage(self, stage):
+    """Makes the input of a stage, outside of what is measured."""
+    if stage != "route_from_gpx" and not self._route:
+      self._route = Route.from_gpx(self._gpx_file_path)
+    if stage == "write_route" and not self._timed_route:
+      self._timed_route = TimedRoute.from_route(self._route, SPEED, FREQUENCY)
+
+  def run_stage(self, stage):
+    """Runs one prepared stage.
+
+    Args:
+      stage: string, one of STAGES
+
+    Returns:
+      the result of the stage, held while retained memory is measured
+      int, number of points the stage produced
+    """
+    return getattr(self, "_run_" + stage)()
+
+  def _run_route_from_gpx(self):
+    route = Route.from_gpx(self._gpx_file_path)
+    return route, len(route.route)
+
+  def _run_upsample_route(self):
+    timed_route = TimedRoute.from_route(self._route, SPEED, FREQUENCY)
+    return timed_route, len(timed_route.route)
+
+  def _run_write_route(self):
+    file_paths = self._timed_route.write_route(
+        os.path.join(self._work_directory, "synthetic_%d.csv" % self.point_count))
+    return file_paths, len(self._timed_route.route)
+
+
+def measure_stage(benchmark, stage):
+  """Measures the peak and retained memory of one stage with tracemalloc.
+
+  Returns:
+    int, number of points the stage produced
+    int, peak bytes allocated while it ran
+    int, bytes still allocated for its result after it returned
+  """
+  benchmark.prepare_stage(stage)
+  tracemalloc.start()
+  try:
+    baseline, _ = tracemalloc.get_traced_memory()
+    result, points = benchmark.run_stage(stage)
+    current, peak = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  del result
+  return points, peak - baseline, current - baseline
+
+
+def run_memory_benchmarks(sizes, stages=None):
+  """Measures every stage on synthetic routes of every size.
+
+  Args:
+    sizes: list of ints, numbers of track points of the synthetic routes
+    stages: list of stages to run, all STAGES by default
+
+  Returns:
+    list of result dicts with the stage, size, points produced, peak and
+    retained memory in bytes and both per point
+  """
+  stages = stages or STAGES
+  results = []
+  with tempfile.TemporaryDirectory(prefix="geobeam_benchmarks_") as work_directory:
+    for size in sizes:
+      benchmark = MemoryBenchmark(size, work_directory)
+      for stage in stages:
+        points, peak_memory, retained_memory = measure_stage(benchmark, stage)
+        results.append({"stage": stage,
+                        "size": size,
+                        "points": points,
+                        "peak_memory": peak_memory,
+                        "retained_memory": retained_memory,
+                        "peak_bytes_per_point": peak_memory/points,
+                        "retained_bytes_per_point": retained_memory/points})
+  return results
+
+
+def find_budget_violations(results, budgets=None):
+  """Checks results against peak bytes per point budgets.
+
+  Args:
+    results: list of result dicts from run_memory_benchmarks
+    budgets: dict of stage to the peak bytes per point it may use,
+    DEFAULT_BUDGETS by default. Stages without a budget are not checked
+
+  Returns:
+    list of strings describing each stage over its budget
+  """
+  budgets = DEFAULT_BUDGETS if budgets is None else budgets
+  violations = []
+  for result in results:
+    budget = budgets.get(result["stage"])
+    if budget is not None and result["peak_bytes_per_point"] > budget:
+      violations.append("%s at %d points: %.1f peak bytes/point, budget %s" % (
+          result["stage"], result["size"], result["peak_bytes_per_point"], budget))
+  return violations
+
+
+def parse_budget(text):
+  """Parses a STAGE=BYTES budget option.
+
+  Returns:
+    tuple of the stage and float bytes per point
+
+  Raises:
+    argparse.ArgumentTypeError: if the option isn't a known stage and a number
+  """
+  stage, _, budget = text.partition("=")
+  if stage not in STAGES:
+    raise argparse.ArgumentTypeError("unknown stage %r, expected one of %s"
+                                     % (stage, ", ".join(STAGES)))
+  try:
+    return stage, float(budget)
+  except ValueError:
+    raise argparse.ArgumentTypeError("budget of %s is not a number: %r" % (stage, budget))
+
+
+def print_results(results):
+  print("%-16s %10s %10s %12s %12s %10s %10s" % ("stage", "size", "points", "peak", "retained",
+                                                "peak B/pt", "kept B/pt"))
+  for result in results:
+    print("%-16s %10d %10d %10.1f MB %10.1f MB %10.1f %10.1f" % (
+        result["stage"], result["size"], result["points"], result["peak_memory"]/1e6,
+        result["retained_memory"]/1e6, result["peak_bytes_per_point"],
+        result["retained_bytes_per_point"]))
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Check the memory footprint of route import.")
+  parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                      help="numbers of track points of the synthetic routes")
+  parser.add_argument("--stages", nargs="+", choices=STAGES, default=None,
+                      help="stages to run, all of them by default")
+  parser.add_argument("--budget", type=parse_budget, action="append", default=[],
+                      metavar="STAGE=BYTES",
+                      help="peak bytes per point a stage may use, replacing its default "
+                           "budget (can be given once per stage)")
+  parser.add_argument("--output", help="path to save the results to as JSON")
+  args = parser.parse_args(argv)
+
+  budgets = dict(DEFAULT_BUDGETS)
+  budgets.update(args.budget)
+  results = run_memory_benchmarks(args.sizes, args.stages)
+  print_results(results)
+  if args.output:
+    with open(args.output, "w") as output_file:
+      json.dump({"environment": get_environment(), "budgets": budgets, "results": results},
+                output_file, indent=2)
+  violations = find_budget_violations(results, budgets)
+  for violation in violations:
+    print("Over budget: %s" % violation)
+  return 1 if violations else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
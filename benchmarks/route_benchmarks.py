@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Offline benchmarks for route generation, conversion, parsing and writing.
+
+Every stage is run on synthetic routes of each requested size, with the Maps
+Directions and Elevation requests answered from the synthetic route instead,
+and its throughput and peak memory are reported. No Maps API key is needed. Results can be saved as JSON and compared with the
+results of an earlier commit, failing if any stage got slower or bigger by
+more than a threshold.
+
+  Typical usage example (from the repository root):
+  python3 -m benchmarks.route_benchmarks --sizes 1000 100000 --output before.json
+  python3 -m benchmarks.route_benchmarks --sizes 1000 100000 --baseline before.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from geobeam.generate_route import Route
+from geobeam.generate_route import TimedRoute
+from geobeam.gps_utils import geodetic_to_cartesian
+from geobeam.gpx_parser import GpxFileParser
+from geobeam.motion_files import scan_motion_file
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.1  # fraction a stage may get slower or bigger by
+# synthetic routes head north from here with a vertex every VERTEX_SPACING
+START_LATITUDE = 37.417747
+START_LONGITUDE = -122.086086
+VERTEX_SPACING = 3.0  # meters
+METERS_PER_DEGREE_LATITUDE = 111320.0
+# upsampled at 1 point per meter, which adds one point between vertices
+SPEED = 10.0  # meters/second
+FREQUENCY = 10.0  # Hz
+STAGES = ["geodetic_to_cartesian", "parse_gpx", "route_from_directions", "upsample_route",
+          "write_route", "scan_motion_file"]
+
+
+def iter_synthetic_locations(point_count):
+  """Yields the (lat, lon, alt) points of a synthetic straight route.
+
+  Args:
+    point_count: int, number of points on the route
+
+  Yields:
+    (latitude, longitude, altitude) tuples
+  """
+  degrees_per_vertex = VERTEX_SPACING/METERS_PER_DEGREE_LATITUDE
+  for point in range(point_count):
+    yield (START_LATITUDE + point*degrees_per_vertex, START_LONGITUDE, 10.0 + point % 7)
+
+
+def write_synthetic_gpx_file(file_path, point_count):
+  """Writes a GPX file with a single track of point_count points.
+
+  Points are written one at a time, so files of millions of points don't
+  have to fit in memory.
+
+  Args:
+    file_path: path of the .gpx file to write
+    point_count: int, number of track points
+  """
+  with open(file_path, "w") as gpx_file:
+    gpx_file.write("<?xml version='1.0' encoding='UTF-8'?>\n"
+                   "<gpx version=\"1.1\" creator=\"geobeam benchmarks\" "
+                   "xmlns=\"http://www.topografix.com/GPX/1/1\">\n<trk>\n<trkseg>\n")
+    for location in iter_synthetic_locations(point_count):
+      gpx_file.write("<trkpt lat=\"%.7f\" lon=\"%.7f\"><ele>%.1f</ele></trkpt>\n" % location)
+    gpx_file.write("</trkseg>\n</trk>\n</gpx>\n")
+
+
+class RouteBenchmark():
+  """The stages of route generation run on synthetic data of one size."""
+
+  def __init__(self, point_count, work_directory, request_directions=None,
+               request_elevations=None):
+    """Initialize benchmark and write its synthetic GPX file.
+
+    Args:
+      point_count: int, number of points of the synthetic route
+      work_directory: path of a directory to write files to
+      request_directions: callable taking the (lat, lon) start and end and
+      returning the points and distances of a route like
+      generate_route.request_directions, by default the synthetic route
+      request_elevations: callable taking points and returning their
+      altitudes like generate_route.request_elevations, by default those of
+      the synthetic route
+    """
+    self.point_count = point_count
+    self._work_directory = work_directory
+    self._request_directions = request_directions or self._request_synthetic_directions
+    self._request_elevations = request_elevations or self._request_synthetic_elevations
+    self._gpx_file_path = os.path.join(work_directory, "synthetic_%d.gpx" % point_count)
+    write_synthetic_gpx_file(self._gpx_file_path, point_count)
+    self._route = None
+    self._timed_route = None
+    self._motion_file_paths = None
+
+  def run_stage(self, stage):
+    """Runs one stage.
+
+    Stages after route_from_directions work on the route the last run of
+    the stage before them made.
+
+    Args:
+      stage: string, one of STAGES
+
+    Returns:
+      int, number of points the stage processed
+    """
+    return getattr(self, "_run_" + stage)()
+
+  def _run_geodetic_to_cartesian(self):
+    for latitude, longitude, altitude in iter_synthetic_locations(self.point_count):
+      geodetic_to_cartesian(latitude, longitude, altitude)
+    return self.point_count
+
+  def _run_parse_gpx(self):
+    return len(GpxFileParser().parse_file(self._gpx_file_path))
+
+  def _run_route_from_directions(self):
+    # as in Route.from_start_and_end, with the requests of this benchmark
+    locations, distances = self._request_directions((START_LATITUDE, START_LONGITUDE),
+                                                    (START_LATITUDE, START_LONGITUDE))
+    elevations = self._request_elevations(locations)
+    self._route = Route.from_directions(locations, distances, elevations)
+    return len(self._route.route)
+
+  def _request_synthetic_directions(self, start_location, end_location):
+    # lists, like the real requests hand Route
+    lat_lon_points = [(latitude, longitude) for latitude, longitude, _
+                      in iter_synthetic_locations(self.point_count)]
+    return lat_lon_points, [VERTEX_SPACING]*(self.point_count-1)
+
+  def _request_synthetic_elevations(self, locations):
+    return [altitude for _, _, altitude in iter_synthetic_locations(len(locations))]
+
+  def _run_upsample_route(self):
+    if not self._route:
+      self._run_route_from_directions()
+    self._timed_route = TimedRoute.from_route(self._route, SPEED, FREQUENCY)
+    return len(self._timed_route.route)
+
+  def _run_write_route(self):
+    if not self._timed_route:
+      self._run_upsample_route()
+    self._motion_file_paths = self._timed_route.write_route(
+        os.path.join(self._work_directory, "synthetic_%d.csv" % self.point_count))
+    return len(self._timed_route.route)
+
+  def _run_scan_motion_file(self):
+    if not self._motion_file_paths:
+      self._run_write_route()
+    return scan_motion_file(self._motion_file_paths[0], max_duration=None).row_count
+
+
+def run_benchmarks(sizes, stages=None, repeat=DEFAULT_REPEAT, measure_memory=True):
+  """Runs every stage on synthetic routes of every size.
+
+  Each stage is timed repeat times and the fastest run is kept. Peak memory
+  is measured in a separate run under tracemalloc, which slows the code it
+  traces.
+
+  Args:
+    sizes: list of ints, numbers of points of the synthetic routes
+    stages: list of stages to run, all STAGES by default
+    repeat: int, number of timed runs of each stage
+    measure_memory: bool, whether to measure peak memory
+
+  Returns:
+    list of result dicts with the stage, size, points processed, seconds,
+    points per second and peak memory in bytes (None if not measured)
+  """
+  stages = stages or STAGES
+  results = []
+  with tempfile.TemporaryDirectory(prefix="geobeam_benchmarks_") as work_directory:
+    for size in sizes:
+      benchmark = RouteBenchmark(size, work_directory)
+      for stage in stages:
+        seconds = math.inf
+        for _ in range(repeat):
+          start = time.perf_counter()
+          points = benchmark.run_stage(stage)
+          seconds = min(seconds, time.perf_counter() - start)
+        peak_memory = _measure_peak_memory(benchmark, stage) if measure_memory else None
+        results.append({"stage": stage,
+                        "size": size,
+                        "points": points,
+                        "seconds": seconds,
+                        "points_per_second": points/seconds if seconds else None,
+                        "peak_memory": peak_memory})
+  return results
+
+
+def _measure_peak_memory(benchmark, stage):
+  """Peak bytes allocated while a stage runs, beyond what was allocated before."""
+  tracemalloc.start()
+  try:
+    baseline, _ = tracemalloc.get_traced_memory()
+    benchmark.run_stage(stage)
+    _, peak = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  return peak - baseline
+
+
+def find_regressions(baseline_results, results, threshold=DEFAULT_THRESHOLD):
+  """Compares results with the results of an earlier run.
+
+  Args:
+    baseline_results: list of result dicts from the earlier run
+    results: list of result dicts from this run
+    threshold: float, fraction by which throughput may drop or peak memory
+    grow before it counts as a regression
+
+  Returns:
+    list of strings describing each regression
+  """
+  baseline = {(result["stage"], result["size"]): result for result in baseline_results}
+  regressions = []
+  for result in results:
+    earlier = baseline.get((result["stage"], result["size"]))
+    if not earlier:
+      continue
+    if (earlier["points_per_second"] and result["points_per_second"] is not None
+        and result["points_per_second"] < earlier["points_per_second"]*(1-threshold)):
+      regressions.append("%s at %d points: %.0f points/s, was %.0f" % (
+          result["stage"], result["size"], result["points_per_second"],
+          earlier["points_per_second"]))
+    if (earlier["peak_memory"] and result["peak_memory"] is not None
+        and result["peak_memory"] > earlier["peak_memory"]*(1+threshold)):
+      regressions.append("%s at %d points: %d bytes peak memory, was %d" % (
+          result["stage"], result["size"], result["peak_memory"], earlier["peak_memory"]))
+  return regressions
+
+
+def get_environment():
+  """Describes where the benchmarks ran, to tell results apart."""
+  try:
+    commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                            check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    commit = None
+  return {"commit": commit,
+          "python": platform.python_version(),
+          "machine": platform.machine(),
+          "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def print_results(results):
+  print("%-22s %10s %10s %16s %14s" % ("stage", "size", "seconds", "points/s", "peak memory"))
+  for result in results:
+    peak_memory = result["peak_memory"]
+    print("%-22s %10d %10.4f %16.0f %14s" % (
+        result["stage"], result["size"], result["seconds"], result["points_per_second"] or 0,
+        "-" if peak_memory is None else "%.1f MB" % (peak_memory/1e6)))
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Benchmark route generation offline.")
+  parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                      help="numbers of points of the synthetic routes (1000 to 10000000)")
+  parser.add_argument("--stages", nargs="+", choices=STAGES, default=None,
+                      help="stages to run, all of them by default")
+  parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                      help="timed runs of each stage, the fastest is kept")
+  parser.add_argument("--no-memory", action="store_true",
+                      help="skip measuring peak memory")
+  parser.add_argument("--output", help="path to save the results to as JSON")
+  parser.add_argument("--baseline", help="path of earlier results to compare with, "
+                                         "exiting with 1 if any stage regressed")
+  parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                      help="fraction throughput may drop or memory grow by in a comparison")
+  args = parser.parse_args(argv)
+
+  results = run_benchmarks(args.sizes, args.stages, args.repeat, not args.no_memory)
+  print_results(results)
+  if args.output:
+    with open(args.output, "w") as output_file:
+      json.dump({"environment": get_environment(), "results": results}, output_file, indent=2)
+  if args.baseline:
+    with open(args.baseline) as baseline_file:
+      baseline = json.load(baseline_file)
+    regressions = find_regressions(baseline["results"], results, args.threshold)
+    for regression in regressions:
+      print("Regression: %s" % regression)
+    if regressions:
+      return 1
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Stand-in for bladeGPS that needs no bladeRF board.
+
+It takes the bladeGPS command line, waits like bladeGPS does while it
+downloads the ephemeris (when run as run_bladerfGPS.sh), loads it and opens
+the board, prints the same start time, duration, satellite table and
+"Time into run" progress, and quits when it reads 'q' on stdin or its run
+duration is over. The delays are options of its own, given before the
+bladeGPS arguments. It only uses the standard library, so it runs without
+geobeam on the path.
+
+install_stub_bladegps writes a bladeGPS directory with run_bladerfGPS.sh and
+bladegps launching the stub, which geobeam can be pointed at through
+simulations.BLADEGPS_DIRECTORY.
+
+  Typical usage example:
+  install_stub_bladegps("/tmp/stub_bladeGPS", startup_delay=1.5)
+  ./stub_bladegps.py --startup-delay 1.5 -T now -l 27.417747,-112.086086 -d 30
+"""
+
+import argparse
+import datetime
+import os
+import stat
+import sys
+import threading
+import time
+
+DEFAULT_DOWNLOAD_DELAY = 2.0  # seconds run_bladerfGPS.sh spends fetching the ephemeris
+DEFAULT_STARTUP_DELAY = 1.0  # seconds to load the ephemeris and open the board
+DEFAULT_QUIT_DELAY = 0.1  # seconds to close the board after 'q'
+DEFAULT_DURATION = 300.0  # seconds, bladeGPS' own default run duration
+PROGRESS_INTERVAL = 0.1  # seconds between "Time into run" updates
+# satellites in view: prn, azimuth, elevation, range, ionospheric delay
+SATELLITES = [(2, 303.5, 27.2, 23727374.8, 5.3),
+              (5, 48.1, 61.7, 20867301.2, 2.7),
+              (12, 110.3, 18.9, 24156893.6, 6.8),
+              (25, 212.6, 44.0, 21903458.1, 3.6)]
+EXECUTABLE_MODE = stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH
+
+
+def install_stub_bladegps(directory, download_delay=DEFAULT_DOWNLOAD_DELAY,
+                          startup_delay=DEFAULT_STARTUP_DELAY, quit_delay=DEFAULT_QUIT_DELAY):
+  """Writes a bladeGPS directory whose launchers run the stub.
+
+  Args:
+    directory: path of the directory to write run_bladerfGPS.sh and bladegps
+    to, created if needed
+    download_delay: float, seconds run_bladerfGPS.sh waits before starting,
+    for the ephemeris download it does on every launch
+    startup_delay: float, seconds from launch until the first progress line
+    quit_delay: float, seconds from reading 'q' until exiting
+  """
+  os.makedirs(directory, exist_ok=True)
+  options = "--startup-delay %r --quit-delay %r" % (startup_delay, quit_delay)
+  for file_name, extra_options in (("run_bladerfGPS.sh", "--download-delay %r " % download_delay),
+                                   ("bladegps", "")):
+    file_path = os.path.join(directory, file_name)
+    with open(file_path, "w") as launcher:
+      launcher.write("#!/bin/sh\nexec \"%s\" \"%s\" %s%s \"$@\"\n"
+                     % (sys.executable, os.path.abspath(__file__), extra_options, options))
+    os.chmod(file_path, EXECUTABLE_MODE)
+
+
+def parse_arguments(argv=None):
+  parser = argparse.ArgumentParser(description="Stand-in for bladeGPS.")
+  parser.add_argument("--download-delay", type=float, default=0.0)
+  parser.add_argument("--startup-delay", type=float, default=DEFAULT_STARTUP_DELAY)
+  parser.add_argument("--quit-delay", type=float, default=DEFAULT_QUIT_DELAY)
+  # the bladeGPS options geobeam uses
+  parser.add_argument("-e", dest="ephemeris_file_path")
+  parser.add_argument("-T", dest="start_time")
+  parser.add_argument("-d", dest="duration", type=float, default=DEFAULT_DURATION)
+  parser.add_argument("-a", dest="gain", type=float)
+  parser.add_argument("-D", dest="device")
+  parser.add_argument("-l", dest="location")
+  parser.add_argument("-u", dest="motion_file_path")
+  return parser.parse_args(argv)
+
+
+def main(argv=None):
+  args = parse_arguments(argv)
+  if args.download_delay:
+    _write("Downloading ephemeris...\n")
+    time.sleep(args.download_delay)
+  if args.motion_file_path:
+    _write("Using user motion file: %s\n" % args.motion_file_path)
+  else:
+    _write("Using static location mode.\n")
+  time.sleep(args.startup_delay)
+  start_time = datetime.datetime.utcnow()
+  _write("Start time = %s (0000:000000)\n" % start_time.strftime("%Y/%m/%d,%H:%M:%S"))
+  _write("Duration = %.1f [sec]\n" % args.duration)
+  for satellite in SATELLITES:
+    _write("%02d %6.1f %5.1f %11.1f %5.1f\n" % satellite)
+  _write("Opening and initializing device...\nRunning...\nPress 'q' to quit.\n")
+
+  quit_event = threading.Event()
+  threading.Thread(target=_wait_for_quit, args=(quit_event,), daemon=True).start()
+  run_start = time.monotonic()
+  elapsed = 0.0
+  while elapsed < args.duration and not quit_event.is_set():
+    _write("\rTime into run = %4.1f" % elapsed)
+    quit_event.wait(PROGRESS_INTERVAL)
+    elapsed = time.monotonic() - run_start
+  _write("\nDone!\nClosing device...\n")
+  time.sleep(args.quit_delay)
+  return 0
+
+
+def _wait_for_quit(quit_event):
+  """Sets quit_event when 'q' is read from stdin, like bladeGPS' key handler."""
+  while True:
+    try:
+      key = os.read(sys.stdin.fileno(), 1)
+    except OSError:
+      return
+    if not key:
+      return
+    if key in (b"q", b"Q"):
+      quit_event.set()
+      return
+
+
+def _write(text):
+  sys.stdout.write(text)
+  sys.stdout.flush()
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Time-to-signal benchmarks of the simulation runner against a stub bladeGPS.
+
+Time to signal is measured up to the first "Time into run" line of the new
+bladeGPS process, which bladeGPS prints once it has started transmitting.
+Two things are measured, without a bladeRF board:
+
+  startup: from launching run.py on a one simulation configuration until
+  the first signal, including the Python start, imports and config parsing
+  switch: SimulationSet driven through a script of switches in process,
+  from each switch until its bladeGPS process was launched (as logged in
+  switch_latency) and until it signalled
+
+The stub's delays are taken from the options, so runner changes can be
+compared on equal terms. Both measurements run in a working directory of
+their own holding the stub as ./bladeGPS, where the runner looks for it as
+run.py does, so nothing of geobeam is patched. Results are reported as
+percentiles in seconds.
+
+  Typical usage example (from the repository root):
+  python3 -m benchmarks.switch_benchmarks --switches 50 --output before.json
+  python3 -m benchmarks.switch_benchmarks --switches 50 --cached-ephemeris
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import math
+import os
+import queue
+import select
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.route_benchmarks import get_environment
+from benchmarks.stub_bladegps import DEFAULT_DOWNLOAD_DELAY
+from benchmarks.stub_bladegps import DEFAULT_QUIT_DELAY
+from benchmarks.stub_bladegps import DEFAULT_STARTUP_DELAY
+from benchmarks.stub_bladegps import install_stub_bladegps
+from geobeam import telemetry
+from geobeam.ephemeris import EphemerisCache
+from geobeam.ephemeris import get_ephemeris_file_name
+from geobeam.simulations import SimulationSetBuilder
+
+DEFAULT_SIMULATIONS = 3
+DEFAULT_SWITCHES = 20
+DEFAULT_STARTUP_RUNS = 3
+PERCENTILES = [50, 90, 99]
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# static simulations of the benchmark set are spread around here
+LATITUDE = 37.417747
+LONGITUDE = -122.086086
+STARTUP_RUN_DURATION = 1  # seconds the run.py simulation transmits for
+SIGNAL_TIMEOUT = 60  # seconds to wait for a launched stub or run.py to signal
+
+
+def get_percentiles(values):
+  """Summarizes latencies by nearest-rank percentiles.
+
+  Args:
+    values: list of floats
+
+  Returns:
+    dict with the count, p50, p90, p99 and max of the values (None if empty)
+  """
+  ordered = sorted(values)
+  summary = {"count": len(ordered)}
+  for percentile in PERCENTILES:
+    rank = max(math.ceil(percentile/100*len(ordered)), 1)
+    summary["p%d" % percentile] = ordered[rank-1] if ordered else None
+  summary["max"] = ordered[-1] if ordered else None
+  return summary
+
+
+def get_switch_script(simulation_count, switches):
+  """Gets the simulation indexes a benchmark switches to.
+
+  Args:
+    simulation_count: int, number of simulations in the set
+    switches: int, number of switches after starting the first simulation
+
+  Returns:
+    list of indexes, starting with 0 and moving to the next simulation on
+    every switch, wrapping around to the first one after the last
+  """
+  return [index % simulation_count for index in range(switches + 1)]
+
+
+def measure_switches(simulation_count=DEFAULT_SIMULATIONS, switches=DEFAULT_SWITCHES,
+                     cached_ephemeris=False, download_delay=DEFAULT_DOWNLOAD_DELAY,
+                     startup_delay=DEFAULT_STARTUP_DELAY, quit_delay=DEFAULT_QUIT_DELAY):
+  """Drives a SimulationSet of static simulations through scripted switches.
+
+  Args:
+    simulation_count: int, number of simulations in the set
+    switches: int, number of switches after starting the first simulation
+    cached_ephemeris: bool, whether to launch the stub bladegps with a cached
+    ephemeris file rather than run_bladerfGPS.sh, which downloads it
+    download_delay: float, seconds the stub run_bladerfGPS.sh takes to download
+    startup_delay: float, seconds the stub takes to start transmitting
+    quit_delay: float, seconds the stub takes to exit after 'q'
+
+  Returns:
+    dict with lists of seconds: "first_signal" for starting the set,
+    "switch_launch" and "switch_to_signal" for each switch
+  """
+  latencies = {"first_signal": [], "switch_launch": [], "switch_to_signal": []}
+  with tempfile.TemporaryDirectory(prefix="geobeam_benchmarks_") as work_directory:
+    install_stub_bladegps(os.path.join(work_directory, "bladeGPS"), download_delay,
+                          startup_delay, quit_delay)
+    builder = SimulationSetBuilder().set_teardown_timeout(max(1.0, 2*quit_delay))
+    if cached_ephemeris:
+      builder.set_ephemeris_cache(_create_ephemeris_cache(work_directory))
+    for index in range(simulation_count):
+      builder.add_static_route(LATITUDE + 0.001*index, LONGITUDE)
+
+    # the stub's output, echoed by the runner as bladeGPS output is, is discarded
+    with _working_directory(work_directory), open(os.devnull, "w") as devnull, \
+         contextlib.redirect_stdout(devnull):
+      simulation_set = builder.build()
+      try:
+        for switch, index in enumerate(get_switch_script(simulation_count, switches)):
+          switch_start = time.monotonic()
+          simulation_set._switch_simulation(index)
+          launched = time.monotonic()
+          signalled = _wait_for_signal(simulation_set._get_current_simulation())
+          if switch == 0:
+            latencies["first_signal"].append(signalled - switch_start)
+          else:
+            latencies["switch_launch"].append(launched - switch_start)
+            latencies["switch_to_signal"].append(signalled - switch_start)
+      finally:
+        current_simulation = simulation_set._get_current_simulation()
+        if current_simulation:
+          current_simulation.end_simulation(simulation_set._teardown_timeout)
+        simulation_set._log_writer.close()
+  return latencies
+
+
+def measure_startup(runs=DEFAULT_STARTUP_RUNS, cached_ephemeris=False,
+                    download_delay=DEFAULT_DOWNLOAD_DELAY, startup_delay=DEFAULT_STARTUP_DELAY,
+                    quit_delay=DEFAULT_QUIT_DELAY):
+  """Times run.py from launch until the first signal of its first simulation.
+
+  run.py is run headless from a working directory holding the stub bladeGPS
+  and a configuration of one short static simulation. A run.py that doesn't
+  signal or exit within SIGNAL_TIMEOUT is killed with the stub it launched.
+
+  Args:
+    runs: int, number of times to launch run.py
+    cached_ephemeris: bool, whether the configuration sets up an
+    EphemerisCache, so the stub bladegps is launched instead of
+    run_bladerfGPS.sh
+    download_delay: float, seconds the stub run_bladerfGPS.sh takes to download
+    startup_delay: float, seconds the stub takes to start transmitting
+    quit_delay: float, seconds the stub takes to exit after 'q'
+
+  Returns:
+    dict with a list of seconds under "run_py_to_signal"
+
+  Raises:
+    RuntimeError: if run.py failed or timed out before signalling
+  """
+  latencies = {"run_py_to_signal": []}
+  with tempfile.TemporaryDirectory(prefix="geobeam_benchmarks_") as work_directory:
+    install_stub_bladegps(os.path.join(work_directory, "bladeGPS"), download_delay,
+                          startup_delay, quit_delay)
+    os.makedirs(os.path.join(work_directory, "simulation_configs"))
+    with open(os.path.join(work_directory, "simulation_configs", "benchmark.ini"),
+              "w") as config_file:
+      if cached_ephemeris:
+        _create_ephemeris_cache(work_directory)
+        config_file.write("[DEFAULT]\nEphemerisCache = ephemeris_cache\n\n")
+      config_file.write("[SimulationOne]\nDynamic = False\nLatitude = %s\nLongitude = %s\n"
+                        "RunDuration = %d\n" % (LATITUDE, LONGITUDE, STARTUP_RUN_DURATION))
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [REPOSITORY_DIRECTORY, environment.get("PYTHONPATH")]))
+    command = [sys.executable, os.path.join(REPOSITORY_DIRECTORY, "run.py"), "benchmark.ini",
+               "--headless"]
+    for _ in range(runs):
+      start = time.monotonic()
+      # in a session of its own, so a timed out run.py is killed with its stub
+      process = subprocess.Popen(command, cwd=work_directory, env=environment,
+                                 stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT, start_new_session=True)
+      signalled, output = _read_until_signal(process.stdout, start + SIGNAL_TIMEOUT)
+      if signalled is None and process.poll() is None:
+        _kill_session(process)
+        raise RuntimeError("run.py didn't signal within %s seconds:\n%s"
+                           % (SIGNAL_TIMEOUT, output.decode("utf-8", "replace")))
+      try:
+        output += process.communicate(timeout=SIGNAL_TIMEOUT)[0]
+      except subprocess.TimeoutExpired:
+        _kill_session(process)
+        raise RuntimeError("run.py didn't exit within %s seconds:\n%s"
+                           % (SIGNAL_TIMEOUT, output.decode("utf-8", "replace")))
+      if process.returncode != 0 or signalled is None:
+        raise RuntimeError("run.py exited with %s before signalling:\n%s"
+                           % (process.returncode, output.decode("utf-8", "replace")))
+      latencies["run_py_to_signal"].append(signalled - start)
+  return latencies
+
+
+def _read_until_signal(stream, deadline):
+  """Reads output until the first progress line, the end of output or a deadline.
+
+  Args:
+    stream: binary file object of the output pipe
+    deadline: float, time.monotonic() to stop waiting at
+
+  Returns:
+    (signalled, output) tuple: time.monotonic() when the progress line was
+    read, or None if it wasn't, and the bytes read
+  """
+  output = b""
+  while b"Time into run" not in output:
+    remaining = deadline - time.monotonic()
+    if remaining <= 0 or not select.select([stream], [], [], remaining)[0]:
+      return None, output
+    chunk = os.read(stream.fileno(), 65536)
+    if not chunk:
+      return None, output
+    output += chunk
+  return time.monotonic(), output
+
+
+def _kill_session(process):
+  """Kills a process started in a new session, with everything it launched."""
+  try:
+    os.killpg(process.pid, signal.SIGKILL)
+  except ProcessLookupError:
+    pass
+  process.communicate()
+
+
+def _create_ephemeris_cache(work_directory):
+  """Creates an EphemerisCache holding placeholder files for today and yesterday."""
+  cache_directory = os.path.join(work_directory, "ephemeris_cache")
+  os.makedirs(cache_directory, exist_ok=True)
+  today = datetime.datetime.utcnow().date()
+  for date in (today, today - datetime.timedelta(days=1)):
+    with open(os.path.join(cache_directory, get_ephemeris_file_name(date)), "w"):
+      pass
+  return EphemerisCache(cache_directory)
+
+
+def _wait_for_signal(simulation):
+  """Waits for the first progress line of a running simulation.
+
+  The telemetry is read on a thread of its own, so a stub that hangs without
+  printing anything can't hold the wait past SIGNAL_TIMEOUT. The thread
+  stops once the simulation is ended.
+
+  Returns:
+    float, time.monotonic() when bladeGPS reported it was transmitting
+  """
+  signals = queue.Queue()
+
+  def watch_telemetry():
+    for event in simulation.iter_telemetry():
+      if event.kind == telemetry.TIME_INTO_RUN:
+        signals.put(event.timestamp)
+        return
+    signals.put(None)
+
+  threading.Thread(target=watch_telemetry, daemon=True).start()
+  try:
+    signalled = signals.get(timeout=SIGNAL_TIMEOUT)
+  except queue.Empty:
+    signalled = None
+  if signalled is None:
+    raise RuntimeError("%s never signalled" % simulation)
+  return signalled
+
+
+@contextlib.contextmanager
+def _working_directory(directory):
+  """Runs the body with directory as the working directory of the process."""
+  previous_directory = os.getcwd()
+  os.chdir(directory)
+  try:
+    yield
+  finally:
+    os.chdir(previous_directory)
+
+
+def print_results(latencies):
+  print("%-20s %6s %9s %9s %9s %9s" % ("measurement", "count", "p50", "p90", "p99", "max"))
+  for measurement, values in latencies.items():
+    summary = get_percentiles(values)
+    if not summary["count"]:
+      continue
+    print("%-20s %6d %9.3f %9.3f %9.3f %9.3f" % (
+        measurement, summary["count"], summary["p50"], summary["p90"], summary["p99"],
+        summary["max"]))
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+      description="Benchmark time to signal of the simulation runner with a stub bladeGPS.")
+  parser.add_argument("--simulations", type=int, default=DEFAULT_SIMULATIONS,
+                      help="number of simulations in the switched set")
+  parser.add_argument("--switches", type=int, default=DEFAULT_SWITCHES,
+                      help="number of switches to the next simulation, 0 to skip")
+  parser.add_argument("--startup-runs", type=int, default=DEFAULT_STARTUP_RUNS,
+                      help="number of times to time run.py to signal, 0 to skip")
+  parser.add_argument("--cached-ephemeris", action="store_true",
+                      help="launch bladegps with a cached ephemeris file instead of "
+                           "run_bladerfGPS.sh")
+  parser.add_argument("--download-delay", type=float, default=DEFAULT_DOWNLOAD_DELAY,
+                      help="seconds the stub run_bladerfGPS.sh takes to download the ephemeris")
+  parser.add_argument("--startup-delay", type=float, default=DEFAULT_STARTUP_DELAY,
+                      help="seconds the stub takes to start transmitting")
+  parser.add_argument("--quit-delay", type=float, default=DEFAULT_QUIT_DELAY,
+                      help="seconds the stub takes to exit after 'q'")
+  parser.add_argument("--output", help="path to save the latencies and percentiles to as JSON")
+  args = parser.parse_args(argv)
+
+  delays = {"download_delay": args.download_delay,
+            "startup_delay": args.startup_delay,
+            "quit_delay": args.quit_delay}
+  latencies = {}
+  if args.startup_runs:
+    latencies.update(measure_startup(args.startup_runs, args.cached_ephemeris, **delays))
+  if args.switches:
+    latencies.update(measure_switches(args.simulations, args.switches, args.cached_ephemeris,
+                                      **delays))
+  print_results(latencies)
+  if args.output:
+    with open(args.output, "w") as output_file:
+      json.dump({"environment": get_environment(),
+                 "options": vars(args),
+                 "latencies": latencies,
+                 "percentiles": {measurement: get_percentiles(values)
+                                 for measurement, values in latencies.items()}},
+                output_file, indent=2)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,141 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local control of a running simulation set through a Unix domain socket.
+
+Clients send one JSON request per line and get one JSON response per line:
+
+  {"command": "next"}              -> {"ok": true, "latency": 0.41, "status": {...}}
+  {"command": "jump", "index": 3}  -> {"ok": true, "latency": 0.39, "status": {...}}
+  {"command": "status"}            -> {"ok": true, "status": {...}}
+  {"command": "oops"}              -> {"ok": false, "error": "unknown command: oops"}
+  {"command": "next"} on the last  -> {"ok": false, "error": "already on last simulation"}
+
+The commands are next, previous, jump, stop and status. latency is the time
+in seconds from the request arriving until the switch it asked for had
+completed, and status is AsyncSimulationSetRunner.get_status().
+
+Anyone who can connect can switch and stop the simulations, so the socket
+has to be in a directory only its user can write to, such as
+$XDG_RUNTIME_DIR, and only its user may connect to it.
+
+  Typical usage example:
+  server = SimulationControlServer(runner, "/run/user/1000/geobeam.sock")
+  await server.start()
+  ...
+  response = send_control_command("/run/user/1000/geobeam.sock", "next")
+"""
+
+import asyncio
+import json
+import os
+import socket
+
+from geobeam.route_service import check_socket_path
+from geobeam.route_service import remove_socket
+
+STATUS = "status"
+
+
+class SimulationControlServer():
+  """Serves control requests for an AsyncSimulationSetRunner.
+
+  Requests are handled on the runner's own event loop, so a command reaches
+  the runner's control loop without any polling in between.
+  """
+
+  def __init__(self, runner, socket_path):
+    """Initialize control server.
+
+    Args:
+      runner: AsyncSimulationSetRunner to control
+      socket_path: path to create the Unix domain socket at
+    """
+    self._runner = runner
+    self._socket_path = socket_path
+    self._server = None
+
+  async def start(self):
+    """Starts listening on the socket, replacing a stale socket file.
+
+    Raises:
+      OSError: if the socket's directory is open to other users or something
+      other than a socket is at its path, see route_service.check_socket_path
+    """
+    check_socket_path(self._socket_path)
+    remove_socket(self._socket_path)
+    self._server = await asyncio.start_unix_server(self._handle_client,
+                                                   path=self._socket_path)
+    os.chmod(self._socket_path, 0o600)
+
+  async def close(self):
+    """Stops listening and removes the socket file."""
+    if self._server:
+      self._server.close()
+      await self._server.wait_closed()
+      self._server = None
+      remove_socket(self._socket_path)
+
+  async def _handle_client(self, reader, writer):
+    try:
+      while True:
+        line = await reader.readline()
+        if not line:
+          break
+        response = await self._handle_request(line)
+        writer.write(json.dumps(response).encode() + b"\n")
+        await writer.drain()
+    except ConnectionError:
+      pass
+    finally:
+      writer.close()
+
+  async def _handle_request(self, line):
+    """Carries out one request.
+
+    Returns:
+      dict response for the client
+    """
+    try:
+      request = json.loads(line)
+      command = request["command"]
+      if command == STATUS:
+        return {"ok": True, "status": self._runner.get_status()}
+      latency = await self._runner.execute(command, request.get("index"))
+      return {"ok": True, "latency": latency, "status": self._runner.get_status()}
+    except (KeyError, TypeError, ValueError, IndexError, RuntimeError) as err:
+      return {"ok": False, "error": str(err)}
+
+
+def send_control_command(socket_path, command, index=None, timeout=None):
+  """Sends a command to a SimulationControlServer and waits for the response.
+
+  Args:
+    socket_path: path of the server's Unix domain socket
+    command: string, one of next, previous, jump, stop or status
+    index: int, index of the simulation to switch to for jump
+    timeout: float, seconds to wait for the response, None to wait forever
+
+  Returns:
+    dict response from the server
+  """
+  request = {"command": command}
+  if index is not None:
+    request["index"] = index
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+    connection.settimeout(timeout)
+    connection.connect(socket_path)
+    connection.sendall(json.dumps(request).encode() + b"\n")
+    with connection.makefile("rb") as response_file:
+      return json.loads(response_file.readline())
@@ -0,0 +1,216 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local cache of the daily broadcast ephemeris files bladeGPS needs.
+
+run_bladerfGPS.sh downloads the day's RINEX navigation file from NASA
+Earthdata every time bladeGPS is started. An EphemerisCache downloads each
+day's file once, ahead of a run, and keeps it in a local directory under its
+RINEX name (brdcDDD0.YYn), so launches can hand bladeGPS the cached file
+and never wait on the network.
+
+  Typical usage example:
+  ephemeris_cache = EphemerisCache("ephemeris_cache/")
+  ephemeris_cache.prefetch()
+  ephemeris_file_path = ephemeris_cache.find_ephemeris()
+"""
+
+import datetime
+import gzip
+import os
+import shutil
+import subprocess
+import tempfile
+
+DEFAULT_CACHE_DIRECTORY = "ephemeris_cache/"
+# daily broadcast ephemeris archive, formatted with the date of the file
+DEFAULT_EPHEMERIS_SOURCE = ("https://cddis.nasa.gov/archive/gnss/data/daily/"
+                            "{year}/brdc/{file_name}.gz")
+# the Earthdata credentials set up for bladeGPS
+WGETRC_PATH = "./bladeGPS/.wgetrc"
+DEFAULT_FETCH_TIMEOUT = 60  # seconds
+# bladeGPS is started with -T now, which moves the ephemeris to the start
+# time, so the file of a recent day serves when today's isn't cached
+DEFAULT_MAX_AGE = 1  # days
+
+
+class EphemerisCache():
+  """A directory of broadcast ephemeris files indexed by date.
+
+  The source is a URL, or a local directory, formatted with the year,
+  day_of_year, short_year and file_name of the day to fetch. Files ending in
+  .gz or .Z are decompressed into the cache.
+  """
+
+  def __init__(self, cache_directory=DEFAULT_CACHE_DIRECTORY, source=DEFAULT_EPHEMERIS_SOURCE,
+               fetch_timeout=DEFAULT_FETCH_TIMEOUT, max_age=DEFAULT_MAX_AGE):
+    """Initialize ephemeris cache.
+
+    Args:
+      cache_directory: path of the directory to keep the files in
+      source: URL or path template of the files to fetch
+      fetch_timeout: float, seconds a download may take
+      max_age: int, days back find_ephemeris looks for a cached file
+    """
+    self._cache_directory = os.path.abspath(cache_directory)
+    self._source = source
+    self._fetch_timeout = fetch_timeout
+    self._max_age = max_age
+
+  def get_cached_path(self, date):
+    """Gets the cached file of a day without fetching it.
+
+    Args:
+      date: datetime.date of the ephemeris
+
+    Returns:
+      absolute path of the file, None if it isn't cached
+    """
+    file_path = os.path.join(self._cache_directory, get_ephemeris_file_name(date))
+    if os.path.exists(file_path):
+      return file_path
+    return None
+
+  def find_ephemeris(self, date=None):
+    """Gets the newest cached file usable on a day, never fetching.
+
+    Args:
+      date: datetime.date to simulate, today (UTC) if not given
+
+    Returns:
+      absolute path of the file for the day, or of an earlier day up to
+      max_age days back, None if none of them is cached
+    """
+    date = date or _utc_today()
+    for age in range(self._max_age + 1):
+      file_path = self.get_cached_path(date - datetime.timedelta(days=age))
+      if file_path:
+        return file_path
+    return None
+
+  def fetch(self, date):
+    """Downloads the file of a day into the cache.
+
+    The file is written under a temporary name and renamed into place, so a
+    partly downloaded file is never used.
+
+    Args:
+      date: datetime.date of the ephemeris
+
+    Returns:
+      absolute path of the cached file
+
+    Raises:
+      OSError: if the file could not be fetched
+    """
+    source = self._format_source(date)
+    os.makedirs(self._cache_directory, exist_ok=True)
+    file_path = os.path.join(self._cache_directory, get_ephemeris_file_name(date))
+    with tempfile.TemporaryDirectory(dir=self._cache_directory) as download_directory:
+      download_path = os.path.join(download_directory, os.path.basename(source))
+      if "://" in source:
+        _download(source, download_path, self._fetch_timeout)
+      else:
+        shutil.copyfile(source, download_path)
+      partial_path = os.path.join(download_directory, "ephemeris")
+      _decompress(download_path, partial_path)
+      os.replace(partial_path, file_path)
+    return file_path
+
+  def prefetch(self, dates=None):
+    """Fetches the days that aren't cached yet, reporting instead of raising errors.
+
+    Args:
+      dates: list of datetime.dates, by default today and yesterday (UTC),
+      yesterday being the fallback while today's file isn't published
+
+    Returns:
+      list of the dates whose file is cached
+    """
+    if dates is None:
+      today = _utc_today()
+      dates = [today, today - datetime.timedelta(days=1)]
+    cached_dates = []
+    for date in dates:
+      if not self.get_cached_path(date):
+        try:
+          self.fetch(date)
+        except OSError as err:
+          print("Could not fetch ephemeris for %s: %s" % (date, err))
+          continue
+      cached_dates.append(date)
+    return cached_dates
+
+  def _format_source(self, date):
+    return self._source.format(year=date.year,
+                               day_of_year=date.timetuple().tm_yday,
+                               short_year=date.year % 100,
+                               file_name=get_ephemeris_file_name(date))
+
+  def __repr__(self):
+    return "EphemerisCache(%s)" % self._cache_directory
+
+
+def get_ephemeris_file_name(date):
+  """Gets the RINEX name of the daily broadcast ephemeris file of a day.
+
+  Args:
+    date: datetime.date of the ephemeris
+
+  Returns:
+    string such as brdc1230.20n
+  """
+  return "brdc%03d0.%02dn" % (date.timetuple().tm_yday, date.year % 100)
+
+
+def _utc_today():
+  return datetime.datetime.utcnow().date()
+
+
+def _download(url, file_path, timeout):
+  """Downloads a file with wget, using the Earthdata credentials if set up.
+
+  Raises:
+    OSError: if wget is missing, fails or times out
+  """
+  environment = dict(os.environ)
+  if os.path.exists(WGETRC_PATH):
+    environment["WGETRC"] = os.path.abspath(WGETRC_PATH)
+  command = ["wget", "--quiet", "--auth-no-challenge", "--output-document", file_path, url]
+  try:
+    subprocess.run(command, env=environment, check=True, timeout=timeout,
+                   stdin=subprocess.DEVNULL)
+  except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as err:
+    raise OSError("could not download %s: %s" % (url, err)) from err
+
+
+def _decompress(source_path, file_path):
+  """Writes the decompressed contents of a .gz or .Z file, or copies any other file.
+
+  Raises:
+    OSError: if the file could not be decompressed
+  """
+  if source_path.endswith(".gz"):
+    with gzip.open(source_path, "rb") as source, open(file_path, "wb") as destination:
+      shutil.copyfileobj(source, destination)
+  elif source_path.endswith(".Z"):
+    # gzip also reads the unix compress format the older archives use
+    with open(file_path, "wb") as destination:
+      try:
+        subprocess.run(["gzip", "--decompress", "--stdout", source_path], check=True,
+                       stdout=destination)
+      except subprocess.CalledProcessError as err:
+        raise OSError("could not decompress %s: %s" % (source_path, err)) from err
+  else:
+    shutil.copyfile(source_path, file_path)
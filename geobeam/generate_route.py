@@ -18,24 +18,57 @@ Classes for Location, Route, and TimedRoute. A Route is a list of points that
 connect a user given start and end location. TimedRoute is a child class of
 Route and incorporates a user specified speed of travel and point frequency,
 which can be used to create a user motion file (10 Hz) with various simulated
-speeds (walking, running, biking)
+speeds (walking, running, biking) or speed profiles from speed_profiles.py
 
   Typical usage example:
   user_motion = TimedRoute.from_start_and_end(location1, location2, TRANSPORT_SPEEDS["walking"], TEN_HZ)
   user_motion = TimedRoute.from_gpx(/path/to/gpx/file, TRANSPORT_SPEEDS["walking"], TEN_HZ)
+  user_motion = TimedRoute.from_gpx(/path/to/gpx/file, 7, TEN_HZ,
+                                    speed_profile=StopAndGoSpeedProfile(7, [(500, 30)]))
   user_motion.write_route("userwalking.csv")
+  stream = MotionFileStream(StreamedTimedRoute(route, 7, TEN_HZ).iter_timed_rows())
+
+  or, several speeds from one route requested once:
+  route = Route.from_start_and_end(location1, location2)
+  write_route_variants(route, [RouteVariant("userwalking.csv", 1.4, TEN_HZ),
+                               RouteVariant("userbiking.csv", 7, TEN_HZ)])
 """
 
+import bisect
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
 import csv
+import itertools
+import math
 import os
 
+from geobeam import instrumentation
 from geobeam.gps_utils import calculate_distance
 from geobeam.gps_utils import Location
 from geobeam.gpx_parser import GpxFileParser
-from geobeam.map_requests import request_directions
-from geobeam.map_requests import request_elevations
+from geobeam.motion_files import get_segment_row_count
+from geobeam.speed_profiles import ConstantSpeedProfile
 
 FILE_FOLDER_PATH = "geobeam/user_motion_files/"
+# number of cycles the starting location is held for at the start of a route
+START_HOLD_CYCLES = 10
+
+
+def request_directions(start_location, end_location):
+  """Requests the points of a route through map_requests.request_directions.
+
+  map_requests is imported on first use, as it needs the API key in
+  geobeam/config.py, so routes from GPX files or already requested points
+  and the benchmarks work without one.
+  """
+  from geobeam import map_requests
+  return map_requests.request_directions(start_location, end_location)
+
+
+def request_elevations(locations):
+  """Requests the altitudes of points through map_requests.request_elevations."""
+  from geobeam import map_requests
+  return map_requests.request_elevations(locations)
 
 
 class Route():
@@ -50,6 +83,7 @@ class Route():
   def __init__(self, route, distances):
     self.route = route
     self.distances = distances
+    self._cumulative_distances = None
 
   @classmethod
   def from_start_and_end(cls, start_location, end_location):
@@ -66,6 +100,20 @@ class Route():
                                                               end_location)
     return cls(route, distances)
 
+  @classmethod
+  def from_directions(cls, locations, distances, elevations):
+    """Creates route from already requested Directions and Elevation responses.
+
+    Args:
+      locations: list of (lat, lon) points from request_directions
+      distances: list of distances between those points (in meters)
+      elevations: list of altitudes of the points from request_elevations
+
+    Returns:
+      initialized Route object
+    """
+    return cls(_create_locations(locations, elevations), list(distances))
+
   @classmethod
   def from_gpx(cls, gpx_source_path):
     """Creates route from GPX file and initializes Route object.
@@ -94,15 +142,10 @@ class Route():
       list of Location objects in order of the points on the route
       a list of distances between those points (in meters)
     """
-    route = []
     locations, distances = request_directions(start_location.get_lat_lon_tuple(),
                                               end_location.get_lat_lon_tuple())
     elevations = request_elevations(locations)
-    for location, altitude in zip(locations, elevations):
-      latitude = location[0]
-      longitude = location[1]
-      route.append(Location(latitude, longitude, altitude))
-    return (route, distances)
+    return (_create_locations(locations, elevations), distances)
 
   def _generate_route_from_gpx(gpx_source_path):
     """Create a route by parsing track points from GPX File.
@@ -114,17 +157,15 @@ class Route():
       list of Location objects in order of the points on the route
       a list of distances between those points (in meters)
     """
-    route = []
-    distances = []
     gpx_file_parser = GpxFileParser()
-    locations = gpx_file_parser.parse_file(gpx_source_path)
-    previous_location = None
+    with instrumentation.timed(instrumentation.GPX_PARSING):
+      locations = gpx_file_parser.parse_file(gpx_source_path)
 
-    for location in locations:
-      route.append(Location(*location))
-      if previous_location:
-        distances.append(calculate_distance(previous_location, location))
-      previous_location = location
+    with instrumentation.timed(instrumentation.ECEF_CONVERSION):
+      route = [Location(*location) for location in locations]
+    with instrumentation.timed(instrumentation.DISTANCE_CALCULATION):
+      distances = [calculate_distance(previous_location[:2], location[:2])
+                   for previous_location, location in zip(locations, locations[1:])]
 
     return (route, distances)
 
@@ -137,6 +178,19 @@ class Route():
     write_array = [location.get_xyz_tuple() for location in self.route]
     _write_to_csv(FILE_FOLDER_PATH+file_name, write_array)
 
+  def _get_cumulative_distances(self):
+    """Distance in meters from the start of the route to each point.
+
+    Computed once and kept until the route is sampled, so timed routes
+    created from this route with from_route share it.
+    """
+    if self._cumulative_distances is None:
+      cumulative_distances = [0.0]
+      for distance in self.distances:
+        cumulative_distances.append(cumulative_distances[-1] + distance)
+      self._cumulative_distances = cumulative_distances
+    return self._cumulative_distances
+
 
 class TimedRoute(Route):
   """An object for a route that has a desired speed and point frequency.
@@ -144,18 +198,22 @@ class TimedRoute(Route):
   Attributes:
     speed: how fast the person moves through the route in meters/second
     frequency: how many points per second the timed route should have (Hz)
+    speed_profile: SpeedProfile used by resample_route, or None to upsample
+    at a constant speed
     route: a list of Location objects for each point on the route
     distances: a list of distances for each pair of consecutive locations
     in meters
   """
 
-  def __init__(self, route, distances, speed, frequency):
+  def __init__(self, route, distances, speed, frequency, speed_profile=None):
     self.speed = speed
     self.frequency = frequency
+    self.speed_profile = speed_profile
     Route.__init__(self, route, distances)
 
   @classmethod
-  def from_start_and_end(cls, start_location, end_location, speed, frequency):
+  def from_start_and_end(cls, start_location, end_location, speed, frequency,
+                         speed_profile=None):
     """Creates route from start and end and initializes TimedRoute object.
 
     Args:
@@ -163,33 +221,70 @@ class TimedRoute(Route):
       end_location: a Location object for the end of the route
       speed: float, speed of route in meters/second
       frequency: float, points per second for timed route (Hz)
+      speed_profile: optional SpeedProfile, if given the route is resampled
+      along it instead of upsampled at a constant speed
 
     Returns:
       initialized and upsampled TimedRoute object
     """
     route, distances = cls._generate_route_from_start_and_end(start_location,
                                                               end_location)
-    timed_route = cls(route, distances, speed, frequency)
-    timed_route.upsample_route()
+    timed_route = cls(route, distances, speed, frequency, speed_profile)
+    timed_route._sample_route()
     return timed_route
 
   @classmethod
-  def from_gpx(cls, gpx_source_path, speed, frequency):
+  def from_gpx(cls, gpx_source_path, speed, frequency, speed_profile=None):
     """Creates route from GPX file and initializes TimedRoute object.
 
     Args:
       gpx_source_path: path to gpx file to parse for route
       speed: float, speed of route in meters/second
       frequency: float, points per second for timed route (Hz)
+      speed_profile: optional SpeedProfile, if given the route is resampled
+      along it instead of upsampled at a constant speed
 
     Returns:
       initialized and upsampled TimedRoute object
     """
     route, distances = cls._generate_route_from_gpx(gpx_source_path)
-    timed_route = cls(route, distances, speed, frequency)
-    timed_route.upsample_route()
+    timed_route = cls(route, distances, speed, frequency, speed_profile)
+    timed_route._sample_route()
+    return timed_route
+
+  @classmethod
+  def from_route(cls, route, speed, frequency, speed_profile=None):
+    """Creates a timed route from an already resolved Route.
+
+    The route is left as it is, so one route, requested or parsed once, can
+    be timed at any number of speeds, frequencies and speed profiles. Its
+    points, with their ECEF coordinates, and its cumulative distances are
+    shared rather than computed again.
+
+    Args:
+      route: Route object to follow
+      speed: float, speed of route in meters/second
+      frequency: float, points per second for timed route (Hz)
+      speed_profile: optional SpeedProfile, if given the route is resampled
+      along it instead of upsampled at a constant speed
+
+    Returns:
+      initialized and upsampled TimedRoute object
+    """
+    timed_route = cls(list(route.route), list(route.distances), speed, frequency,
+                      speed_profile)
+    if speed_profile:
+      timed_route._cumulative_distances = route._get_cumulative_distances()
+    timed_route._sample_route()
     return timed_route
 
+  def _sample_route(self):
+    with instrumentation.timed(instrumentation.SAMPLING):
+      if self.speed_profile:
+        self.resample_route()
+      else:
+        self.upsample_route()
+
   def upsample_route(self):
     """Upsample the TimedRoute to match the desired speed and frequency.
 
@@ -199,18 +294,25 @@ class TimedRoute(Route):
     each of the points in the upsampled route.
     """
     points_per_meter = self.frequency/self.speed
-    new_route = []
+    new_route = list(self._iter_upsampled_locations())
+    self.route = new_route
+    self.distances = [1/points_per_meter for x in range(len(new_route)-1)]
+    self._cumulative_distances = None
+
+  def _iter_upsampled_locations(self):
+    """Generate the points of upsample_route without changing the route."""
+    points_per_meter = self.frequency/self.speed
 
     # TODO(ameles) check if we need to do this for better location fixing
     # fill first 10 cycles with starting location
-    for i in range(10):
-      new_route.append(self.route[0])
+    for i in range(START_HOLD_CYCLES):
+      yield self.route[0]
 
     for i in range(len(self.distances)):
       distance = self.distances[i]
       start_point = self.route[i]
       end_point = self.route[i+1]
-      new_route.append(start_point)
+      yield start_point
 
       points_needed = int(distance*points_per_meter)-1
       if points_needed > 0:
@@ -218,32 +320,301 @@ class TimedRoute(Route):
         longitude_delta = (end_point.longitude-start_point.longitude) / points_needed
         altitude_delta = (end_point.altitude-start_point.altitude) / points_needed
         for j in range(1, points_needed):
-          new_point = Location(start_point.latitude + latitude_delta*j,
-                               start_point.longitude + longitude_delta*j,
-                               start_point.altitude + altitude_delta*j)
-          new_route.append(new_point)
-    new_route.append(self.route[-1])
-    self.route = new_route
-    self.distances = [1/points_per_meter for x in range(len(new_route)-1)]
-
-  def write_route(self, file_name):
+          yield Location(start_point.latitude + latitude_delta*j,
+                         start_point.longitude + longitude_delta*j,
+                         start_point.altitude + altitude_delta*j)
+    yield self.route[-1]
+
+  def resample_route(self):
+    """Resample the TimedRoute by arc length along its speed profile.
+
+    Cumulative distances along the original route are computed once, the
+    speed profile (a ConstantSpeedProfile at self.speed if none was given) is
+    integrated into a distance-vs-time curve, and that curve is sampled at
+    exactly 1/frequency second intervals. Each sample distance is then located
+    on the route with a bisection that resumes from the previous sample, so
+    no fractional distance is dropped between segments and the cost grows
+    linearly with the number of points.
+    """
+    samples = list(self._iter_resampled_points())
+    sample_distances = [distance for _, distance in samples]
+    self.distances = ([0.0]*START_HOLD_CYCLES
+                      + [later - earlier for earlier, later
+                         in zip(sample_distances, sample_distances[1:])])
+    self.route = [self.route[0]]*START_HOLD_CYCLES + [location for location, _ in samples]
+    self._cumulative_distances = None
+
+  def _iter_resampled_points(self):
+    """Generate the samples of resample_route without changing the route.
+
+    Yields:
+      (Location, distance in meters along the route) of each sample in turn,
+      not including the starting location held for START_HOLD_CYCLES
+    """
+    cumulative_distances = self._get_cumulative_distances()
+    total_distance = cumulative_distances[-1]
+    curve = self._get_motion_curve()
+    sample_times = (i/self.frequency for i in range(self._get_sample_count(curve)))
+
+    segment = 0
+    last_segment = len(cumulative_distances) - 2
+    for distance in curve.iter_distances(sample_times):
+      clamped_distance = min(distance, total_distance)
+      segment = min(bisect.bisect_right(cumulative_distances, clamped_distance, lo=segment) - 1,
+                    last_segment)
+      segment = max(segment, 0)
+      yield (self._interpolate(segment, clamped_distance - cumulative_distances[segment]),
+             distance)
+
+  def _get_motion_curve(self):
+    speed_profile = self.speed_profile or ConstantSpeedProfile(self.speed)
+    return speed_profile.get_motion_curve(self._get_cumulative_distances()[-1])
+
+  def _get_sample_count(self, curve):
+    """Number of samples resample_route takes along curve, every 1/frequency seconds."""
+    return int(math.ceil(curve.total_time*self.frequency - 1e-9)) + 1
+
+  def _interpolate(self, segment, offset):
+    """Location offset meters past the start of the given route segment."""
+    start_point = self.route[segment]
+    if len(self.route) == 1:
+      return start_point
+    end_point = self.route[segment+1]
+    length = self.distances[segment]
+    fraction = min(offset/length, 1.0) if length > 0 else 1.0
+    if fraction == 0:
+      return start_point
+    if fraction == 1:
+      return end_point
+    return Location(start_point.latitude + (end_point.latitude-start_point.latitude)*fraction,
+                    start_point.longitude + (end_point.longitude-start_point.longitude)*fraction,
+                    start_point.altitude + (end_point.altitude-start_point.altitude)*fraction)
+
+  def write_route(self, file_name, max_segment_duration=None):
     """write route into csv with each line as time,x,y,z.
 
-    time starts at 0.0 seconds and time values are rounded to one decimal place
+    time starts at 0.0 seconds and time values are rounded to one decimal place.
+    If the route is longer than max_segment_duration, it is split into
+    consecutive segment files <name>_part000.csv, <name>_part001.csv, ...
+    whose times each start at 0.0, so every file fits in bladeGPS's motion
+    buffer and playing them back to back covers the whole route.
 
     Args:
-      file_name: name of file to write route to
+      file_name: name of file to write route to in FILE_FOLDER_PATH, or an
+      absolute path to write it elsewhere
+      max_segment_duration: float, longest file to write in seconds, or None
+      to always write a single file
+
+    Returns:
+      list of paths of the files written, in playing order
+    """
+    rows_per_segment = len(self.route)
+    if max_segment_duration:
+      rows_per_segment = get_segment_row_count(max_segment_duration, self.frequency)
+    if len(self.route) <= rows_per_segment:
+      file_path = os.path.join(FILE_FOLDER_PATH, file_name)
+      _write_to_csv(file_path, self._get_timed_rows(self.route))
+      return [file_path]
+
+    base_name, extension = os.path.splitext(file_name)
+    file_paths = []
+    for segment, start in enumerate(range(0, len(self.route), rows_per_segment)):
+      file_path = os.path.join(FILE_FOLDER_PATH,
+                               "%s_part%03d%s" % (base_name, segment, extension))
+      _write_to_csv(file_path, self._get_timed_rows(self.route[start:start+rows_per_segment]))
+      file_paths.append(file_path)
+    return file_paths
+
+  def iter_timed_rows(self, locations=None):
+    """Generate the time,x,y,z rows of the route one at a time.
+
+    Rows are produced lazily, so a MotionFileStream can feed a very long
+    route to bladeGPS without the whole motion file being built first.
+
+    Args:
+      locations: list of Location objects to generate rows for, defaults to
+      the whole route
+
+    Yields:
+      (time, x, y, z) tuples, with time starting at 0.0 seconds and rounded
+      to one decimal place
     """
-    write_array = []
+    if locations is None:
+      locations = self.route
     time = 0.0
-    for location in self.route:
-      write_array.append(("%.1f" % (time,),)+location.get_xyz_tuple())
+    for location in locations:
+      yield ("%.1f" % (time,),)+location.get_xyz_tuple()
       time = time + (1/self.frequency)
-    _write_to_csv(FILE_FOLDER_PATH+file_name, write_array)
+
+  def _get_timed_rows(self, locations):
+    """Rows of time,x,y,z for locations, with time starting at 0.0 seconds."""
+    return list(self.iter_timed_rows(locations))
+
+
+class StreamedTimedRoute():
+  """The rows of a route timed as TimedRoute.from_route would, generated as they are read.
+
+  The route is never sampled as a whole: every call to iter_timed_rows
+  samples it again point by point, so a MotionFileStream can start feeding
+  bladeGPS at once and a long route takes no more memory than a short one.
+
+  Attributes:
+    frequency: float, points per second (Hz)
+  """
+
+  def __init__(self, route, speed, frequency, speed_profile=None):
+    """Initialize route.
+
+    Args:
+      route: Route object to follow, which is left as it is
+      speed: float, speed of route in meters/second
+      frequency: float, points per second for timed route (Hz)
+      speed_profile: optional SpeedProfile, if given the route is resampled
+      along it instead of upsampled at a constant speed
+    """
+    self._timed_route = TimedRoute(route.route, route.distances, speed, frequency,
+                                   speed_profile)
+    if speed_profile:
+      self._timed_route._cumulative_distances = route._get_cumulative_distances()
+    self.frequency = frequency
+
+  def iter_timed_rows(self):
+    """Generate the time,x,y,z rows of the route as TimedRoute.iter_timed_rows does."""
+    timed_route = self._timed_route
+    if timed_route.speed_profile:
+      locations = itertools.chain(
+          [timed_route.route[0]]*START_HOLD_CYCLES,
+          (location for location, _ in timed_route._iter_resampled_points()))
+    else:
+      locations = timed_route._iter_upsampled_locations()
+    return timed_route.iter_timed_rows(locations)
+
+  def __len__(self):
+    """Number of rows iter_timed_rows generates, counted without sampling the route."""
+    timed_route = self._timed_route
+    if timed_route.speed_profile:
+      return START_HOLD_CYCLES + timed_route._get_sample_count(timed_route._get_motion_curve())
+    points_per_meter = timed_route.frequency/timed_route.speed
+    # the start of every segment, the points added between, and the end point
+    return (START_HOLD_CYCLES + 1
+            + sum(1 + max(int(distance*points_per_meter)-2, 0)
+                  for distance in timed_route.distances))
+
+  def __repr__(self):
+    return "StreamedTimedRoute(speed=%s, frequency=%s)" % (self._timed_route.speed,
+                                                           self.frequency)
+
+
+class RouteVariant():
+  """One timed version of a route for write_route_variants.
+
+  Attributes:
+    file_name: name of file to write the timed route to
+    speed: float, speed of route in meters/second
+    frequency: float, points per second for timed route (Hz)
+    speed_profile: optional SpeedProfile to resample the route along
+    max_segment_duration: float, longest file to write in seconds, or None
+    to always write a single file
+    label: string the stage timings of the variant are recorded under, such
+    as the configuration section it is for, or None for the current label
+  """
+
+  def __init__(self, file_name, speed, frequency, speed_profile=None,
+               max_segment_duration=None, label=None):
+    self.file_name = file_name
+    self.speed = speed
+    self.frequency = frequency
+    self.speed_profile = speed_profile
+    self.max_segment_duration = max_segment_duration
+    self.label = label
+
+  def __repr__(self):
+    return "RouteVariant(%s, speed=%s, frequency=%s)" % (self.file_name, self.speed,
+                                                          self.frequency)
+
+
+def write_route_variants(route, variants, max_workers=None):
+  """Times one route in several ways and writes each version in parallel.
+
+  The route is resolved once by the caller, and each variant is sampled and
+  written in a worker process of its own, since sampling is CPU bound. Stage
+  timings taken in the workers are passed on to the instrumentation sinks
+  of this process.
+
+  Args:
+    route: Route object every variant follows
+    variants: list of RouteVariants to write
+    max_workers: int, most worker processes to use, by default the number
+    of processors
+
+  Returns:
+    list with the paths of the files written for each variant, in the order
+    of variants
+  """
+  if len(variants) <= 1:
+    file_paths = []
+    for variant in variants:
+      with instrumentation.labelled(variant.label or instrumentation.get_label()):
+        file_paths.append(_write_route_variant(route, variant))
+    return file_paths
+  # the cumulative distances are computed once and sent to every worker
+  route._get_cumulative_distances()
+  record_stages = [instrumentation.is_enabled()]*len(variants)
+  file_paths = []
+  with ProcessPoolExecutor(max_workers=max_workers) as executor:
+    for variant, (variant_file_paths, stage_timings) in zip(
+        variants, executor.map(_write_route_variant, [route]*len(variants), variants,
+                               record_stages)):
+      for stage, seconds in stage_timings:
+        instrumentation.record(stage, seconds, variant.label)
+      file_paths.append(variant_file_paths)
+  return file_paths
+
+
+def _write_route_variant(route, variant, record_stages=None):
+  """Samples and writes one variant of a route.
+
+  Args:
+    route: Route object the variant follows
+    variant: RouteVariant to write
+    record_stages: bool, whether to collect and return the stage timings,
+    as in a worker process they can't reach the sinks. None to report them
+    to the sinks directly
+
+  Returns:
+    list of paths of the files written, in playing order, together with a
+    list of (stage, seconds) timings unless record_stages is None
+  """
+  stage_timings = []
+  with contextlib.ExitStack() as stack:
+    if record_stages:
+      stack.enter_context(instrumentation.recording(
+          lambda stage, seconds, label: stage_timings.append((stage, seconds))))
+    timed_route = TimedRoute.from_route(route, variant.speed, variant.frequency,
+                                        variant.speed_profile)
+    file_paths = timed_route.write_route(variant.file_name, variant.max_segment_duration)
+  if record_stages is None:
+    return file_paths
+  return file_paths, stage_timings
+
+
+def _create_locations(locations, elevations):
+  """Adds altitudes and xyz conversion to the (lat, lon) points of a Directions response.
+
+  Returns:
+    list of Location objects in order of the points
+  """
+  route = []
+  with instrumentation.timed(instrumentation.ECEF_CONVERSION):
+    for location, altitude in zip(locations, elevations):
+      latitude = location[0]
+      longitude = location[1]
+      route.append(Location(latitude, longitude, altitude))
+  return route
 
 
 def _write_to_csv(file_name, value_array):
-  if not os.path.exists(FILE_FOLDER_PATH):
-    os.makedirs(FILE_FOLDER_PATH)
-  with open(file_name, "w") as csv_file:
-    csv.writer(csv_file).writerows(value_array)
+  os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+  with instrumentation.timed(instrumentation.CSV_WRITING):
+    with open(file_name, "w") as csv_file:
+      csv.writer(csv_file).writerows(value_array)
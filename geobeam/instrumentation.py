@@ -0,0 +1,187 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Timing of the stages of building a route.
+
+Route building code wraps each stage in timed(stage). When a sink has been
+added, the time the stage took is passed to every sink together with the
+current label (such as the configuration section being built); otherwise
+timed returns a shared context that does nothing, so the hooks cost one
+function call when nobody is listening.
+
+A sink is any callable taking (stage, seconds, label). StageAggregator
+collects the timings in memory and log_stage_timing logs them.
+
+  Typical usage example:
+  aggregator = StageAggregator()
+  with recording(aggregator), labelled("SimulationOne"):
+    TimedRoute.from_start_and_end(location1, location2, 1.4, 10)
+  print(aggregator.format_breakdown("SimulationOne"))
+"""
+
+import contextlib
+import logging
+import time
+
+# stages of building a route
+DIRECTIONS_REQUEST = "directions_request"
+ELEVATION_REQUEST = "elevation_request"
+GPX_PARSING = "gpx_parsing"
+ECEF_CONVERSION = "ecef_conversion"
+DISTANCE_CALCULATION = "distance_calculation"
+SAMPLING = "sampling"
+CSV_WRITING = "csv_writing"
+
+_logger = logging.getLogger(__name__)
+_sinks = []
+_label = None
+
+
+class _NullTimer():
+  """Context used while no sink is listening."""
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer():
+  """Context timing one stage and reporting it to the sinks."""
+
+  def __init__(self, stage):
+    self._stage = stage
+    self._start = None
+
+  def __enter__(self):
+    self._start = time.perf_counter()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    record(self._stage, time.perf_counter() - self._start)
+    return False
+
+
+def timed(stage):
+  """Gets a context that times a stage.
+
+  Args:
+    stage: string naming the stage, such as DIRECTIONS_REQUEST
+
+  Returns:
+    context manager reporting the time spent inside it to the sinks, or
+    doing nothing if there are none
+  """
+  if not _sinks:
+    return _NULL_TIMER
+  return _Timer(stage)
+
+
+def record(stage, seconds, label=None):
+  """Reports a stage timing to every sink.
+
+  Args:
+    stage: string naming the stage
+    seconds: float, time the stage took
+    label: string to report the timing under, the current label by default
+  """
+  label = _label if label is None else label
+  for sink in _sinks:
+    sink(stage, seconds, label)
+
+
+def is_enabled():
+  """Whether any sink is listening."""
+  return bool(_sinks)
+
+
+def add_sink(sink):
+  """Starts reporting stage timings to a sink.
+
+  Args:
+    sink: callable taking (stage, seconds, label)
+  """
+  _sinks.append(sink)
+
+
+def remove_sink(sink):
+  """Stops reporting stage timings to a sink added before."""
+  _sinks.remove(sink)
+
+
+@contextlib.contextmanager
+def recording(sink):
+  """Reports the stage timings inside the context to a sink."""
+  add_sink(sink)
+  try:
+    yield sink
+  finally:
+    remove_sink(sink)
+
+
+@contextlib.contextmanager
+def labelled(label):
+  """Reports the stage timings inside the context under a label."""
+  global _label
+  previous_label = _label
+  _label = label
+  try:
+    yield
+  finally:
+    _label = previous_label
+
+
+def get_label():
+  return _label
+
+
+def log_stage_timing(stage, seconds, label):
+  """Sink logging every stage timing at debug level."""
+  _logger.debug("%s%s took %.6f s", "%s: " % label if label else "", stage, seconds)
+
+
+class StageAggregator():
+  """Sink adding up the time spent in each stage, per label."""
+
+  def __init__(self):
+    self._totals = {}
+
+  def __call__(self, stage, seconds, label):
+    stages = self._totals.setdefault(label, {})
+    count, total = stages.get(stage, (0, 0.0))
+    stages[stage] = (count + 1, total + seconds)
+
+  def get_breakdown(self, label=None):
+    """Gets the timings recorded under a label.
+
+    Returns:
+      dict of stage to (number of times run, total seconds), in the order
+      the stages first ran
+    """
+    return dict(self._totals.get(label, {}))
+
+  def get_labels(self):
+    return list(self._totals)
+
+  def format_breakdown(self, label=None):
+    """Describes the timings recorded under a label on one line."""
+    return ", ".join("%s %.3f s" % (stage, total)
+                     for stage, (count, total) in self.get_breakdown(label).items())
+
+  def reset(self):
+    self._totals = {}
@@ -17,7 +17,8 @@
 import sys
 
 from geobeam.generate_route import Route
-from geobeam.generate_route import TimedRoute
+from geobeam.generate_route import RouteVariant
+from geobeam.generate_route import write_route_variants
 from geobeam.gps_utils import Location
 
 #meters per second
@@ -34,17 +35,14 @@ def main():
   route = Route.from_start_and_end(location1, location2)
   route.write_route("routetestfile.csv")
 
-  # gives 16459 points at 7 points/meter & 10 points/second
-  user_motion = TimedRoute.from_start_and_end(location1, location2, TRANSPORT_SPEEDS["walking"], TEN_HZ)
-  user_motion.write_route("userwalking.csv")
-
-  # gives 9226 points at 4 points/meter & 10 points/second
-  user_motion = TimedRoute.from_start_and_end(location1, location2, TRANSPORT_SPEEDS["running"], TEN_HZ)
-  user_motion.write_route("userrunning.csv")
-
-  # gives 3289 points at 1.4 points/meter & 10 points/second
-  user_motion = TimedRoute.from_start_and_end(location1, location2, TRANSPORT_SPEEDS["biking"], TEN_HZ)
-  user_motion.write_route("userbiking.csv")
+  # the same route timed at each speed, written in parallel:
+  # walking gives 16459 points at 7 points/meter & 10 points/second,
+  # running 9226 points at 4 points/meter & 10 points/second and
+  # biking 3289 points at 1.4 points/meter & 10 points/second
+  write_route_variants(route, [
+      RouteVariant("userwalking.csv", TRANSPORT_SPEEDS["walking"], TEN_HZ),
+      RouteVariant("userrunning.csv", TRANSPORT_SPEEDS["running"], TEN_HZ),
+      RouteVariant("userbiking.csv", TRANSPORT_SPEEDS["biking"], TEN_HZ)])
 
 if __name__ == "__main__":
   sys.exit(main())
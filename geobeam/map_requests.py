@@ -19,6 +19,7 @@ import datetime
 import pprint
 
 from geobeam.config import api_key
+from geobeam import instrumentation
 import googlemaps
 
 # TODO(ameles) wrap map requests in a class so api isn't hard coded in
@@ -37,9 +38,10 @@ def request_directions(start_location, end_location):
     https://developers.google.com/maps/documentation/directions/intro#DirectionsResponses
   """
   now = datetime.datetime.now()
-  directions_response = GMAPS.directions(start_location, end_location,
-                                         mode="walking", departure_time=now)
-  parsed_directions_response = parse_directions_response(directions_response)
+  with instrumentation.timed(instrumentation.DIRECTIONS_REQUEST):
+    directions_response = GMAPS.directions(start_location, end_location,
+                                           mode="walking", departure_time=now)
+    parsed_directions_response = parse_directions_response(directions_response)
   return parsed_directions_response
 
 
@@ -88,8 +90,9 @@ def request_elevations(locations):
     a list of elevation responses in the deserialized Elevation API response
     format in order of input locations
   """
-  elevations_response = GMAPS.elevation(locations)
-  parsed_elevations_response = parse_elevations_response(elevations_response)
+  with instrumentation.timed(instrumentation.ELEVATION_REQUEST):
+    elevations_response = GMAPS.elevation(locations)
+    parsed_elevations_response = parse_elevations_response(elevations_response)
   return parsed_elevations_response
 
 
@@ -0,0 +1,286 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Counters and histograms exported in the Prometheus text format.
+
+Updating a metric only takes a lock and a dictionary update, so it can be
+done from the simulation runner. Rendering and exporting happen on a
+background thread: MetricsFileWriter rewrites a file periodically (for the
+node exporter's textfile collector, for example) and MetricsServer serves
+the metrics over HTTP on a local port.
+
+  Typical usage example:
+  registry = MetricsRegistry()
+  switches = registry.counter("geobeam_switches_total", "Simulation switches.")
+  switches.inc(device="*:serial=f12ce103")
+  writer = MetricsFileWriter(registry, "/var/lib/node_exporter/geobeam.prom")
+  writer.start()
+"""
+
+import bisect
+import http.server
+import math
+import os
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300,
+                   900, 3600)  # seconds
+DEFAULT_WRITE_INTERVAL = 15  # seconds
+DEFAULT_METRICS_HOST = "127.0.0.1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter():
+  """A count that only goes up, kept per set of label values."""
+
+  metric_type = "counter"
+
+  def __init__(self, name, documentation):
+    self.name = name
+    self.documentation = documentation
+    self._lock = threading.Lock()
+    self._values = {}
+
+  def inc(self, amount=1, **labels):
+    """Adds amount to the count for the given label values."""
+    key = tuple(sorted(labels.items()))
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + amount
+
+  def get(self, **labels):
+    """Gets the count for the given label values."""
+    with self._lock:
+      return self._values.get(tuple(sorted(labels.items())), 0)
+
+  def render(self):
+    """Gets the sample lines of this metric.
+
+    Returns:
+      list of strings in the Prometheus text format
+    """
+    with self._lock:
+      values = dict(self._values)
+    return ["%s%s %s" % (self.name, _format_labels(key), _format_value(value))
+            for key, value in sorted(values.items())]
+
+
+class Histogram():
+  """Observations counted into buckets, kept per set of label values."""
+
+  metric_type = "histogram"
+
+  def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+    self.name = name
+    self.documentation = documentation
+    self.buckets = tuple(sorted(buckets))
+    self._lock = threading.Lock()
+    self._values = {}
+
+  def observe(self, value, **labels):
+    """Records one observation for the given label values."""
+    key = tuple(sorted(labels.items()))
+    bucket = bisect.bisect_left(self.buckets, value)
+    with self._lock:
+      counts = self._values.get(key)
+      if counts is None:
+        # a count per bucket, then one for observations above the last bucket
+        counts = self._values[key] = [[0]*(len(self.buckets) + 1), 0.0]
+      counts[0][bucket] += 1
+      counts[1] += value
+
+  def get_count(self, **labels):
+    """Gets the number of observations for the given label values."""
+    with self._lock:
+      counts = self._values.get(tuple(sorted(labels.items())))
+      return sum(counts[0]) if counts else 0
+
+  def render(self):
+    """Gets the sample lines of this metric.
+
+    Returns:
+      list of strings in the Prometheus text format
+    """
+    with self._lock:
+      values = {key: (list(bucket_counts), total)
+                for key, (bucket_counts, total) in self._values.items()}
+    lines = []
+    for key, (bucket_counts, total) in sorted(values.items()):
+      cumulative_count = 0
+      for upper_bound, count in zip(self.buckets + (math.inf,), bucket_counts):
+        cumulative_count += count
+        lines.append("%s_bucket%s %d" % (self.name,
+                                         _format_labels(key + (("le", upper_bound),)),
+                                         cumulative_count))
+      lines.append("%s_sum%s %s" % (self.name, _format_labels(key), _format_value(total)))
+      lines.append("%s_count%s %d" % (self.name, _format_labels(key), cumulative_count))
+    return lines
+
+
+class MetricsRegistry():
+  """A set of metrics rendered together."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._metrics = {}
+
+  def counter(self, name, documentation):
+    """Gets the counter with a name, creating it on first use."""
+    return self._get_metric(Counter, name, documentation)
+
+  def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+    """Gets the histogram with a name, creating it on first use."""
+    return self._get_metric(Histogram, name, documentation, buckets)
+
+  def _get_metric(self, metric_class, name, documentation, *args):
+    with self._lock:
+      metric = self._metrics.get(name)
+      if metric is None:
+        metric = self._metrics[name] = metric_class(name, documentation, *args)
+      elif not isinstance(metric, metric_class):
+        raise ValueError("%s is already registered as a %s" % (name, metric.metric_type))
+      return metric
+
+  def render(self):
+    """Renders every metric in the Prometheus text format.
+
+    Returns:
+      string ending with a newline
+    """
+    with self._lock:
+      metrics = list(self._metrics.values())
+    lines = []
+    for metric in metrics:
+      lines.append("# HELP %s %s" % (metric.name, metric.documentation))
+      lines.append("# TYPE %s %s" % (metric.name, metric.metric_type))
+      lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsFileWriter():
+  """Rewrites a file with the rendered metrics every interval on a background thread.
+
+  Each write goes to a temporary file that is renamed over the target, so
+  readers never see a partly written file.
+  """
+
+  def __init__(self, registry, file_path, interval=DEFAULT_WRITE_INTERVAL):
+    """Initialize writer.
+
+    Args:
+      registry: MetricsRegistry to export
+      file_path: path of the file to write
+      interval: float, seconds between writes
+    """
+    self._registry = registry
+    self._file_path = file_path
+    self._interval = interval
+    self._stop_event = threading.Event()
+    self._thread = None
+
+  def start(self):
+    """Writes the metrics and starts the writer thread."""
+    self.write()
+    self._thread = threading.Thread(target=self._write_periodically, daemon=True)
+    self._thread.start()
+
+  def close(self):
+    """Stops the writer thread after a last write."""
+    if self._thread:
+      self._stop_event.set()
+      self._thread.join()
+      self._thread = None
+      self.write()
+
+  def write(self):
+    """Writes the metrics now."""
+    temporary_path = self._file_path + ".tmp"
+    with open(temporary_path, "w") as metrics_file:
+      metrics_file.write(self._registry.render())
+    os.replace(temporary_path, self._file_path)
+
+  def _write_periodically(self):
+    while not self._stop_event.wait(self._interval):
+      try:
+        self.write()
+      except OSError as err:
+        print("Could not write metrics to %s: %s" % (self._file_path, err))
+
+
+class MetricsServer():
+  """Serves the rendered metrics over HTTP from a background thread."""
+
+  def __init__(self, registry, port, host=DEFAULT_METRICS_HOST):
+    """Initialize server.
+
+    Args:
+      registry: MetricsRegistry to export
+      port: int, port to listen on, 0 for any free port
+      host: string, address to listen on, localhost by default
+    """
+    self._registry = registry
+    self._address = (host, port)
+    self._server = None
+    self._thread = None
+
+  def start(self):
+    """Starts listening and serving requests on the server thread."""
+    registry = self._registry
+
+    class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+
+      def do_GET(self):
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, format, *args):
+        pass  # scrapes are not worth a line on the terminal each
+
+    self._server = http.server.ThreadingHTTPServer(self._address, MetricsRequestHandler)
+    self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    self._thread.start()
+
+  def get_port(self):
+    return self._server.server_address[1] if self._server else None
+
+  def close(self):
+    """Stops serving and closes the socket."""
+    if self._server:
+      self._server.shutdown()
+      self._server.server_close()
+      self._thread.join()
+      self._server = None
+      self._thread = None
+
+
+def _format_labels(key):
+  if not key:
+    return ""
+  return "{%s}" % ",".join('%s="%s"' % (name, _escape_label_value(value))
+                           for name, value in key)
+
+
+def _escape_label_value(value):
+  if isinstance(value, float):
+    return _format_value(value)
+  return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+  if value == math.inf:
+    return "+Inf"
+  return repr(value)
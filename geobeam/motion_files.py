@@ -0,0 +1,801 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities for reading and checking user motion files.
+
+A user motion file is a csv file with a time,x,y,z row for every sample, where
+time is in seconds from zero and x,y,z is an ECEF position in meters, as
+written by TimedRoute.write_route and read by bladeGPS with -u.
+
+  Typical usage example:
+  row_count = validate_motion_file("/path/to/userwalking.csv")
+  rows = read_played_segment(log_record["motion_file"])
+  scan = scan_motion_file("/path/to/userwalking.csv", max_speed=50)
+  write_trimmed_motion_file("/path/to/userwalking.csv", 7200, "/tmp/resume.csv")
+"""
+
+from array import array
+import csv
+import hashlib
+import itertools
+import math
+import operator
+import os
+import shutil
+import tempfile
+import threading
+
+MOTION_FILE_COLUMNS = 4  # time, x, y, z
+DEFAULT_MOTION_FILE_RATE = 10.0  # Hz, the rate bladeGPS expects
+# bladeGPS loads user motion into a fixed size buffer and drops what doesn't fit
+DEFAULT_MAX_SEGMENT_DURATION = 3000  # seconds
+INDEX_SUFFIX = ".idx"
+# steps further than this fraction from the first time step break the rate
+RATE_TOLERANCE = 0.01
+# receivers stop reporting a fix above the COCOM speed limit
+DEFAULT_MAX_SPEED = 515  # meters/sec
+DEFAULT_MAX_ACCELERATION = 100  # meters/sec^2, about 10 g
+# sidecar index layout: native unsigned 64 bit values, first the size and
+# modification time of the indexed file, then the byte offset of every row
+_INDEX_TYPECODE = "Q"
+_INDEX_ITEM_SIZE = array(_INDEX_TYPECODE).itemsize
+_INDEX_HEADER_ITEMS = 2
+
+# lines of a motion file parsed at once by scan_motion_file
+_SCAN_CHUNK_SIZE = 1 << 20  # characters
+
+STREAM_FILE_NAME = "motion_stream.csv"
+STREAM_CLOSE_POLL_INTERVAL = 0.05  # seconds between attempts to release the producer
+
+_motion_file_info_cache = {}
+
+
+def validate_motion_file(file_path):
+  """Reads a whole motion file and checks that bladeGPS can play it.
+
+  Reading the file also leaves it in the page cache, so a bladeGPS process
+  started right after does not have to wait on the disk.
+
+  Args:
+    file_path: path to the user motion csv file
+
+  Returns:
+    the number of rows in the file
+
+  Raises:
+    ValueError: if the file is empty, a row is malformed, or time does not
+    strictly increase from one row to the next
+  """
+  row_count = 0
+  previous_time = None
+  with open(file_path, "r") as motion_file:
+    for line_number, row in enumerate(csv.reader(motion_file), start=1):
+      if len(row) != MOTION_FILE_COLUMNS:
+        raise ValueError("%s:%d: expected %d columns, found %d" % (
+            file_path, line_number, MOTION_FILE_COLUMNS, len(row)))
+      try:
+        time, _, _, _ = (float(value) for value in row)
+      except ValueError:
+        raise ValueError("%s:%d: non numeric value in %s" % (file_path, line_number, row))
+      if previous_time is not None and time <= previous_time:
+        raise ValueError("%s:%d: time %s does not increase" % (file_path, line_number, row[0]))
+      previous_time = time
+      row_count += 1
+  if not row_count:
+    raise ValueError("%s: motion file is empty" % file_path)
+  return row_count
+
+
+class MotionFileScan():
+  """Result of checking a whole motion file before it is played.
+
+  Attributes:
+    file_path: path to the user motion csv file
+    row_count: number of rows in the file
+    rate: float, rows per second from the first time step, None if the file
+    has less than two rows
+    duration: float, seconds from the first row to the last
+    max_speed: float, fastest speed between two rows in meters/second
+    max_acceleration: float, largest change of speed between two time steps
+    in meters/second^2
+    errors: list of strings, problems bladeGPS can't play the file with
+    warnings: list of strings, problems it plays the file through wrongly
+  """
+
+  def __init__(self, file_path):
+    self.file_path = file_path
+    self.row_count = 0
+    self.rate = None
+    self.duration = 0.0
+    self.max_speed = 0.0
+    self.max_acceleration = 0.0
+    self.errors = []
+    self.warnings = []
+
+
+def scan_motion_file(file_path, max_speed=DEFAULT_MAX_SPEED,
+                     max_acceleration=DEFAULT_MAX_ACCELERATION,
+                     max_duration=DEFAULT_MAX_SEGMENT_DURATION):
+  """Reads a whole motion file and reports every check it fails.
+
+  Unlike validate_motion_file, which stops at the first bad row, the whole
+  file is parsed into an array per column and each check runs over a whole
+  column at once, so one pass reports every kind of problem with the first
+  row it occurs on and how often. Files of plain numeric rows are parsed in
+  bulk, chunks of lines at a time; only a file that fails that is read row
+  by row with csv to find its bad rows.
+
+  Args:
+    file_path: path to the user motion csv file
+    max_speed: float, meters/second above which a step is reported
+    max_acceleration: float, meters/second^2 above which a change of speed
+    is reported
+    max_duration: float, longest file in seconds bladeGPS can load, or None
+    if the file is split into segments before it is played
+
+  Returns:
+    MotionFileScan of the file
+  """
+  scan = MotionFileScan(file_path)
+  columns = _read_motion_file_columns(file_path)
+  if columns is not None:
+    times, xs, ys, zs = columns
+    scan.row_count = len(times)
+    if not scan.row_count:
+      scan.errors.append("%s: motion file is empty" % file_path)
+      return scan
+    return _check_motion_file_columns(scan, times, xs, ys, zs, max_speed, max_acceleration,
+                                      max_duration)
+
+  times, xs, ys, zs = columns = (array("d"), array("d"), array("d"), array("d"))
+  # indices and first occurrence of rows with the wrong number of columns
+  # and of rows with a non numeric value
+  bad_length_rows = []
+  bad_value_rows = []
+  first_bad_rows = {}
+  with open(file_path, "r") as motion_file:
+    for index, row in enumerate(csv.reader(motion_file)):
+      scan.row_count += 1
+      if len(row) != MOTION_FILE_COLUMNS:
+        bad_length_rows.append(index)
+        first_bad_rows.setdefault("length", row)
+        continue
+      try:
+        values = [float(value) for value in row]
+      except ValueError:
+        bad_value_rows.append(index)
+        first_bad_rows.setdefault("value", row)
+        continue
+      if not first_bad_rows:
+        for column, value in zip(columns, values):
+          column.append(value)
+  if not scan.row_count:
+    scan.errors.append("%s: motion file is empty" % file_path)
+    return scan
+  if bad_length_rows:
+    scan.errors.append("%s:%d: expected %d columns, found %d%s" % (
+        file_path, bad_length_rows[0] + 1, MOTION_FILE_COLUMNS, len(first_bad_rows["length"]),
+        _get_repeat_note(bad_length_rows)))
+    return scan
+  if bad_value_rows:
+    scan.errors.append("%s:%d: non numeric value in %s%s" % (
+        file_path, bad_value_rows[0] + 1, first_bad_rows["value"],
+        _get_repeat_note(bad_value_rows)))
+    return scan
+  return _check_motion_file_columns(scan, times, xs, ys, zs, max_speed, max_acceleration,
+                                    max_duration)
+
+
+def _read_motion_file_columns(file_path):
+  """Parses a motion file of plain numeric rows in bulk.
+
+  Returns:
+    tuple of an array("d") per column, or None if a row doesn't hold
+    MOTION_FILE_COLUMNS plain numbers and the file has to be read with csv
+    to tell which one
+  """
+  columns = tuple(array("d") for _ in range(MOTION_FILE_COLUMNS))
+  separators = MOTION_FILE_COLUMNS - 1
+  with open(file_path, "r") as motion_file:
+    while True:
+      lines = motion_file.readlines(_SCAN_CHUNK_SIZE)
+      if not lines:
+        return columns
+      # every line must have its own columns, or fields would shift across rows
+      if any(map(separators.__ne__, map(operator.methodcaller("count", ","), lines))):
+        return None
+      try:
+        values = array("d", map(float, ",".join(lines).split(",")))
+      except ValueError:
+        return None
+      for index, column in enumerate(columns):
+        column.extend(values[index::MOTION_FILE_COLUMNS])
+
+
+def _check_motion_file_columns(scan, times, xs, ys, zs, max_speed, max_acceleration,
+                               max_duration):
+  """Runs the checks of scan_motion_file over the columns of a parsed file.
+
+  Returns:
+    scan, with the duration, rate, maximums and problems found added
+  """
+  file_path = scan.file_path
+  scan.duration = times[-1] - times[0]
+  if len(times) < 2:
+    return scan
+
+  steps = array("d", map(operator.sub, times[1:], times[:-1]))
+  bad_steps = _find_above(0.0, map(operator.neg, steps), inclusive=True)
+  if bad_steps:
+    scan.errors.append("%s:%d: time %s does not increase%s" % (
+        file_path, bad_steps[0] + 2, times[bad_steps[0] + 1], _get_repeat_note(bad_steps)))
+    return scan
+  scan.rate = round(1/steps[0], 6)
+  if scan.rate != DEFAULT_MOTION_FILE_RATE:
+    scan.warnings.append("%s: rate is %g Hz, bladeGPS plays rows at %g Hz" % (
+        file_path, scan.rate, DEFAULT_MOTION_FILE_RATE))
+  tolerance = steps[0]*RATE_TOLERANCE
+  bad_steps = _find_above(tolerance, map(abs, map(operator.sub, steps,
+                                                    itertools.repeat(steps[0]))))
+  if bad_steps:
+    scan.warnings.append("%s:%d: time step %g breaks the rate of %g Hz%s" % (
+        file_path, bad_steps[0] + 2, steps[bad_steps[0]], scan.rate,
+        _get_repeat_note(bad_steps)))
+
+  distances = map(math.hypot, map(operator.sub, xs[1:], xs[:-1]),
+                  map(operator.sub, ys[1:], ys[:-1]), map(operator.sub, zs[1:], zs[:-1]))
+  speeds = array("d", map(operator.truediv, distances, steps))
+  scan.max_speed = max(speeds)
+  bad_steps = _find_above(max_speed, speeds)
+  if bad_steps:
+    scan.warnings.append("%s:%d: speed of %.1f m/s is over %g m/s%s" % (
+        file_path, bad_steps[0] + 2, speeds[bad_steps[0]], max_speed,
+        _get_repeat_note(bad_steps)))
+  accelerations = array("d", map(abs, map(operator.truediv,
+                                          map(operator.sub, speeds[1:], speeds[:-1]),
+                                          steps[1:])))
+  if accelerations:
+    scan.max_acceleration = max(accelerations)
+  bad_steps = _find_above(max_acceleration, accelerations)
+  if bad_steps:
+    scan.warnings.append("%s:%d: speed jumps by %.1f m/s^2, over %g m/s^2%s" % (
+        file_path, bad_steps[0] + 3, accelerations[bad_steps[0]], max_acceleration,
+        _get_repeat_note(bad_steps)))
+
+  if max_duration is not None:
+    max_rows = get_segment_row_count(max_duration, DEFAULT_MOTION_FILE_RATE)
+    if scan.row_count > max_rows:
+      scan.errors.append("%s: %d rows overflow the bladeGPS buffer of %d rows "
+                         "(%g seconds)" % (file_path, scan.row_count, max_rows, max_duration))
+  return scan
+
+
+class MotionFileInfo():
+  """Summary of a motion file used to reference it from logs.
+
+  Attributes:
+    sha256: hex digest of the file contents
+    row_count: number of rows in the file
+    rate: float, rows per second, from the time step between the first rows
+  """
+
+  def __init__(self, sha256, row_count, rate):
+    self.sha256 = sha256
+    self.row_count = row_count
+    self.rate = rate
+
+  def __repr__(self):
+    return "MotionFileInfo(sha256=%s, row_count=%s, rate=%s)" % (self.sha256,
+                                                                 self.row_count,
+                                                                 self.rate)
+
+
+class MotionFileReference():
+  """A played segment of a motion file, resolved only when the log is written.
+
+  Resolving the reference hashes the file once (later references to the same
+  unchanged file reuse the cached MotionFileInfo), so the size of the log
+  entry and the time to produce it don't depend on how long the run was.
+
+  Attributes:
+    file_path: path to the user motion csv file
+    start_index: index of the first row played
+    elapsed_seconds: float, how long the segment was played for
+  """
+
+  def __init__(self, file_path, start_index, elapsed_seconds):
+    self.file_path = file_path
+    self.start_index = start_index
+    self.elapsed_seconds = elapsed_seconds
+
+  def to_log_value(self):
+    """Resolves the reference against the current file contents.
+
+    Returns:
+      dict with the file path, its sha256 digest and rate, and the start
+      (inclusive) and end (exclusive) row indices of the played segment
+    """
+    info = get_motion_file_info(self.file_path)
+    end_index = min(self.start_index + int(self.elapsed_seconds*info.rate),
+                    info.row_count)
+    return {"file_path": self.file_path,
+            "sha256": info.sha256,
+            "rate": info.rate,
+            "start_index": self.start_index,
+            "end_index": end_index}
+
+
+def get_motion_file_info(file_path):
+  """Hashes a motion file and finds its row count and rate.
+
+  Results are cached by path, size and modification time, so unchanged files
+  are only read once.
+
+  Args:
+    file_path: path to the user motion csv file
+
+  Returns:
+    MotionFileInfo for the file
+  """
+  stat = os.stat(file_path)
+  cache_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+  if cache_key not in _motion_file_info_cache:
+    digest = hashlib.sha256()
+    row_count = 0
+    first_rows = []
+    with open(file_path, "rb") as motion_file:
+      for line in motion_file:
+        digest.update(line)
+        if len(first_rows) < 2:
+          first_rows.append(line)
+        row_count += 1
+    _motion_file_info_cache[cache_key] = MotionFileInfo(digest.hexdigest(), row_count,
+                                                        _get_rate(first_rows))
+  return _motion_file_info_cache[cache_key]
+
+
+def read_played_segment(motion_file_reference, file_path=None):
+  """Reconstructs the rows played in a logged run of a dynamic simulation.
+
+  Args:
+    motion_file_reference: dict logged for the run, as produced by
+    MotionFileReference.to_log_value
+    file_path: path to read the motion file from, if it has moved since the
+    run was logged
+
+  Returns:
+    list of [time, x, y, z] string lists, in the order they were played
+
+  Raises:
+    ValueError: if the file contents no longer match the logged digest
+  """
+  file_path = file_path or motion_file_reference["file_path"]
+  if get_motion_file_info(file_path).sha256 != motion_file_reference["sha256"]:
+    raise ValueError("%s has changed since the run was logged" % file_path)
+  with open(file_path, "r") as motion_file:
+    rows = itertools.islice(csv.reader(motion_file),
+                            motion_file_reference["start_index"],
+                            motion_file_reference["end_index"])
+    return list(rows)
+
+
+def get_motion_file_rate(file_path):
+  """Finds the rate of a motion file from its first two rows.
+
+  Args:
+    file_path: path to the user motion csv file
+
+  Returns:
+    float, rows per second
+  """
+  with open(file_path, "rb") as motion_file:
+    first_rows = list(itertools.islice(motion_file, 2))
+  return _get_rate(first_rows)
+
+
+def build_motion_file_index(file_path):
+  """Scans a motion file and writes its row-to-byte-offset sidecar index.
+
+  Args:
+    file_path: path to the user motion csv file
+
+  Returns:
+    number of rows in the file
+  """
+  stat = os.stat(file_path)
+  index = array(_INDEX_TYPECODE, [stat.st_size, stat.st_mtime_ns])
+  offset = 0
+  with open(file_path, "rb") as motion_file:
+    for line in motion_file:
+      index.append(offset)
+      offset += len(line)
+  with open(file_path + INDEX_SUFFIX, "wb") as index_file:
+    index.tofile(index_file)
+  return len(index) - _INDEX_HEADER_ITEMS
+
+
+def get_motion_file_row_count(file_path):
+  """Gets the number of rows in a motion file from its index.
+
+  Args:
+    file_path: path to the user motion csv file
+
+  Returns:
+    number of rows in the file
+  """
+  _ensure_index(file_path)
+  index_size = os.path.getsize(file_path + INDEX_SUFFIX)
+  return index_size//_INDEX_ITEM_SIZE - _INDEX_HEADER_ITEMS
+
+
+def has_motion_file_row(file_path, row_index):
+  """Checks if a motion file has a row at row_index.
+
+  An up to date sidecar index answers this directly. Otherwise only the rows
+  up to row_index are read, and no index is built, so this is cheap enough
+  to call while switching simulations.
+
+  Args:
+    file_path: path to the user motion csv file
+    row_index: index of the row, from 0
+
+  Returns:
+    True if the file has more than row_index rows
+  """
+  if row_index < 0:
+    return False
+  if _is_index_current(file_path):
+    return row_index < get_motion_file_row_count(file_path)
+  with open(file_path, "rb") as motion_file:
+    return next(itertools.islice(motion_file, row_index, None), None) is not None
+
+
+def get_row_offset(file_path, row_index):
+  """Gets the byte offset of a row in a motion file.
+
+  Only the single index entry is read, so this takes constant time however
+  long the file is. The index is built first if missing or stale.
+
+  Args:
+    file_path: path to the user motion csv file
+    row_index: index of the row, from 0
+
+  Returns:
+    byte offset of the start of the row
+
+  Raises:
+    IndexError: if the file has no such row
+  """
+  _ensure_index(file_path)
+  if row_index < 0:
+    raise IndexError("row index %d out of range for %s" % (row_index, file_path))
+  with open(file_path + INDEX_SUFFIX, "rb") as index_file:
+    index_file.seek((_INDEX_HEADER_ITEMS + row_index)*_INDEX_ITEM_SIZE)
+    entry = array(_INDEX_TYPECODE)
+    try:
+      entry.fromfile(index_file, 1)
+    except EOFError:
+      raise IndexError("row index %d out of range for %s" % (row_index, file_path))
+  return entry[0]
+
+
+def write_trimmed_motion_file(file_path, start_row, destination_path, max_rows=None):
+  """Writes the rows of a motion file from start_row on, re-timed from zero.
+
+  The start of the row is found through the sidecar index, so only the
+  remaining rows are read. Times keep the precision of the source file.
+
+  Args:
+    file_path: path to the user motion csv file
+    start_row: index of the first row to keep
+    destination_path: path to write the trimmed motion file to
+    max_rows: maximum number of rows to write, or None for all remaining rows
+
+  Returns:
+    number of rows written
+  """
+  offset = get_row_offset(file_path, start_row)
+  row_count = 0
+  with open(file_path, "rb") as motion_file, open(destination_path, "wb") as trimmed_file:
+    motion_file.seek(offset)
+    start_time = None
+    time_format = None
+    for line in itertools.islice(motion_file, max_rows):
+      time_string, position = line.split(b",", 1)
+      if start_time is None:
+        start_time = float(time_string)
+        decimals = len(time_string.partition(b".")[2])
+        time_format = b"%%.%df,%%s" % decimals
+      trimmed_file.write(time_format % (float(time_string) - start_time, position))
+      row_count += 1
+  return row_count
+
+
+def read_motion_file_positions(file_path, start_row=0, max_rows=None):
+  """Reads the positions of a motion file from start_row on, without their times.
+
+  Args:
+    file_path: path to the user motion csv file
+    start_row: index of the first row to read
+    max_rows: maximum number of rows to read, or None for all remaining rows
+
+  Returns:
+    list of (x, y, z) float tuples
+  """
+  offset = get_row_offset(file_path, start_row)
+  with open(file_path, "rb") as motion_file:
+    motion_file.seek(offset)
+    return [tuple(float(value) for value in line.split(b",")[1:MOTION_FILE_COLUMNS])
+            for line in itertools.islice(motion_file, max_rows)]
+
+
+def write_motion_file(file_path, positions, rate=DEFAULT_MOTION_FILE_RATE):
+  """Writes positions as a motion file, timed from zero.
+
+  Args:
+    file_path: path to write the user motion csv file to
+    positions: iterable of (x, y, z) tuples, one for every row
+    rate: float, rows per second
+
+  Returns:
+    number of rows written
+  """
+  row_count = 0
+  with open(file_path, "w", newline="") as motion_file:
+    writer = csv.writer(motion_file)
+    for position in positions:
+      writer.writerow(("%.1f" % (row_count/rate),) + tuple(position))
+      row_count += 1
+  return row_count
+
+
+def split_motion_file(file_path, max_segment_duration, start_row=0):
+  """Splits a motion file that is too long for bladeGPS into segment files.
+
+  Segments are written next to the source as <name>_part000.csv,
+  <name>_part001.csv, ... each re-timed from zero and holding at most
+  max_segment_duration seconds of rows. Played back to back they cover the
+  whole route from start_row on.
+
+  Args:
+    file_path: path to the user motion csv file
+    max_segment_duration: float, longest segment bladeGPS can load in seconds
+    start_row: index of the first row of the first segment
+
+  Returns:
+    list of segment file paths in playing order, just [file_path] if the
+    whole file is short enough already
+
+  Raises:
+    ValueError: if the file has no rows from start_row on
+  """
+  rows_per_segment = get_segment_row_count(max_segment_duration,
+                                           get_motion_file_rate(file_path))
+  row_count = get_motion_file_row_count(file_path)
+  if start_row >= row_count:
+    raise ValueError("%s has %d rows, none left to play from row %d" % (
+        file_path, row_count, start_row))
+  if not start_row and row_count <= rows_per_segment:
+    return [file_path]
+  base_path, extension = os.path.splitext(file_path)
+  if start_row:
+    base_path = "%s_from_row_%d" % (base_path, start_row)
+  segment_paths = []
+  for segment, start_row in enumerate(range(start_row, row_count, rows_per_segment)):
+    segment_path = "%s_part%03d%s" % (base_path, segment, extension)
+    write_trimmed_motion_file(file_path, start_row, segment_path, rows_per_segment)
+    segment_paths.append(segment_path)
+  return segment_paths
+
+
+class MotionFileStream():
+  """Feeds motion rows to a reader through a named pipe as they are generated.
+
+  The pipe is created in a new temporary directory and can be passed to
+  bladeGPS with -u like any motion file. A producer thread opens it for
+  writing (which waits until the reader opens it) and writes one csv row at
+  a time, so rows are generated only as fast as they are read and nothing is
+  stored on disk.
+
+    Typical usage example:
+    stream = MotionFileStream(timed_route.iter_timed_rows())
+    stream.open()
+    process = create_bladeGPS_process(dynamic_file_path=stream.fifo_path)
+    ...
+    stream.close()
+
+  Attributes:
+    fifo_path: path of the named pipe, None until opened
+    rows_written: number of rows written to the pipe so far
+  """
+
+  def __init__(self, rows):
+    """Initialize stream. Nothing is created until open is called.
+
+    Args:
+      rows: iterable of (time, x, y, z) rows, consumed by the producer thread
+    """
+    self._rows = rows
+    self._directory = None
+    self._thread = None
+    self._stop_event = threading.Event()
+    self.fifo_path = None
+    self.rows_written = 0
+
+  def open(self):
+    """Creates the named pipe and starts the producer thread.
+
+    Returns:
+      path of the named pipe
+    """
+    if not self.fifo_path:
+      self._directory = tempfile.mkdtemp(prefix="geobeam_stream_")
+      self.fifo_path = os.path.join(self._directory, STREAM_FILE_NAME)
+      os.mkfifo(self.fifo_path)
+      self._thread = threading.Thread(target=self._write_rows, daemon=True)
+      self._thread.start()
+    return self.fifo_path
+
+  def close(self):
+    """Stops the producer thread and removes the named pipe.
+
+    If no reader ever opened the pipe, it is opened here without blocking so
+    the producer thread is released.
+    """
+    if not self.fifo_path:
+      return
+    self._stop_event.set()
+    while self._thread.is_alive():
+      try:
+        os.close(os.open(self.fifo_path, os.O_RDONLY | os.O_NONBLOCK))
+      except OSError:
+        pass
+      self._thread.join(STREAM_CLOSE_POLL_INTERVAL)
+    shutil.rmtree(self._directory, ignore_errors=True)
+    self._thread = None
+    self._directory = None
+    self.fifo_path = None
+
+  def _write_rows(self):
+    try:
+      with open(self.fifo_path, "w", newline="") as fifo:
+        writer = csv.writer(fifo)
+        for row in self._rows:
+          if self._stop_event.is_set():
+            break
+          writer.writerow(row)
+          self.rows_written += 1
+    except BrokenPipeError:
+      # the reader went away before reading every row
+      pass
+
+
+class MotionStreamSegments():
+  """Splits streamed motion rows into segments played back to back.
+
+  Like split_motion_file does for a motion file, every segment is at most
+  rows_per_segment rows long and its times start at 0.0, so each fits in
+  bladeGPS's motion buffer. Segments are played one at a time and draw from
+  one row iterator while they are played in order; a segment played out of
+  order generates the rows again from the start and skips to its own.
+
+    Typical usage example:
+    segments = MotionStreamSegments(timed_route.iter_timed_rows, 30000)
+    stream = MotionFileStream(segments.iter_segment_rows(1))
+  """
+
+  def __init__(self, row_source, rows_per_segment, rate=DEFAULT_MOTION_FILE_RATE):
+    """Initialize segments.
+
+    Args:
+      row_source: callable returning a new iterable of (time, x, y, z) rows
+      rows_per_segment: int, most rows in a segment
+      rate: float, rows per second the times of a segment are counted at
+    """
+    self._row_source = row_source
+    self._rows_per_segment = rows_per_segment
+    self._rate = rate
+    self._rows = None
+    self._position = 0
+
+  def iter_segment_rows(self, segment):
+    """Generate the rows of one segment, with times starting at 0.0.
+
+    Args:
+      segment: int, index of the segment
+
+    Yields:
+      (time, x, y, z) rows
+    """
+    start_row = segment*self._rows_per_segment
+    if self._rows is None or self._position > start_row:
+      self._rows = iter(self._row_source())
+      self._position = 0
+    rows = self._rows
+    # rows left unread by the segment before, if it was ended early
+    while self._position < start_row:
+      if next(rows, None) is None:
+        return
+      self._position += 1
+    for row_index in range(self._rows_per_segment):
+      row = next(rows, None)
+      if row is None:
+        return
+      self._position += 1
+      yield ("%.1f" % (row_index/self._rate),) + tuple(row[1:])
+
+
+def get_segment_row_count(max_segment_duration, rate):
+  """Number of rows that fit in a segment of max_segment_duration seconds.
+
+  Args:
+    max_segment_duration: float, longest segment in seconds
+    rate: float, rows per second
+
+  Returns:
+    int, at least 1
+  """
+  return max(int(max_segment_duration*rate), 1)
+
+
+def _ensure_index(file_path):
+  """Builds the sidecar index if it is missing or older than the file."""
+  if not _is_index_current(file_path):
+    build_motion_file_index(file_path)
+
+
+def _is_index_current(file_path):
+  """Checks if the sidecar index exists and was built from the file as it is."""
+  stat = os.stat(file_path)
+  header = array(_INDEX_TYPECODE)
+  try:
+    with open(file_path + INDEX_SUFFIX, "rb") as index_file:
+      header.fromfile(index_file, _INDEX_HEADER_ITEMS)
+  except (OSError, EOFError):
+    return False
+  return list(header) == [stat.st_size, stat.st_mtime_ns]
+
+
+def _find(flags):
+  """Indices of the true values of an iterable of flags."""
+  return list(itertools.compress(itertools.count(), flags))
+
+
+def _find_above(limit, values, inclusive=False):
+  """Indices of the values over a limit, compared without a Python loop per value.
+
+  Args:
+    limit: float
+    values: iterable of floats
+    inclusive: bool, whether values equal to the limit count too
+  """
+  compare = operator.le if inclusive else operator.lt
+  return _find(map(compare, itertools.repeat(limit), values))
+
+
+def _get_repeat_note(indices):
+  """Notes how many other rows share a problem, for its first occurrence."""
+  if len(indices) < 2:
+    return ""
+  return " (and %d more rows)" % (len(indices) - 1)
+
+
+def _get_rate(first_rows):
+  """Rows per second from the time column of the first two rows."""
+  if len(first_rows) < 2:
+    return DEFAULT_MOTION_FILE_RATE
+  time_step = float(first_rows[1].split(b",")[0]) - float(first_rows[0].split(b",")[0])
+  if time_step <= 0:
+    return DEFAULT_MOTION_FILE_RATE
+  return round(1/time_step, 6)
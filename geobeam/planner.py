@@ -0,0 +1,345 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Dry run plans of simulation configuration files.
+
+A plan reads every section of a configuration file the way run.py would,
+without requesting routes or launching bladeGPS. Every section is checked,
+so one run reports all the mistakes in a file, and the cost of running it
+is estimated: Maps API calls, route points, route file sizes and run time.
+Existing motion files are scanned with scan_motion_file.
+
+Route estimates use the straight line distance between the start and end
+of a route, a lower bound of the distance by road, or the track of its GPX
+file.
+
+  Typical usage example:
+  plan = plan_config(config, "geobeam/user_motion_files/")
+  for line in format_plan(plan):
+    print(line)
+"""
+
+import configparser
+import os
+
+from geobeam.generate_route import START_HOLD_CYCLES
+from geobeam.gps_utils import calculate_distance
+from geobeam.gpx_parser import GpxFileParser
+from geobeam.motion_files import DEFAULT_MAX_SEGMENT_DURATION
+from geobeam.motion_files import DEFAULT_MOTION_FILE_RATE
+from geobeam.motion_files import scan_motion_file
+from geobeam.process_scheduling import parse_cpu_list
+from geobeam import sweeps
+
+# requests made for every new route from start and end points
+API_CALLS_PER_ROUTE = 2  # directions and elevations
+# size of a time,x,y,z row as written by TimedRoute.write_route
+ESTIMATED_ROW_BYTES = 68
+
+
+class SectionPlan():
+  """What running one configuration file section would take.
+
+  Attributes:
+    name: string, name of the section
+    simulation_count: int, number of simulations the section stands for
+    api_calls: int, Maps API calls made for routes first used by the section
+    point_count: int, rows of the routes the section creates or plays
+    file_size: int, estimated bytes of the route files the section writes
+    run_time: float, seconds its simulations run for, not counting the
+    open ended ones
+    open_ended_count: int, simulations that run until bladeGPS exits
+    errors: list of strings, problems stopping the section from running
+    warnings: list of strings, problems it would run with
+  """
+
+  def __init__(self, name):
+    self.name = name
+    self.simulation_count = 0
+    self.api_calls = 0
+    self.point_count = 0
+    self.file_size = 0
+    self.run_time = 0.0
+    self.open_ended_count = 0
+    self.errors = []
+    self.warnings = []
+
+
+class Plan():
+  """What running a whole configuration file would take.
+
+  Attributes:
+    sections: list of SectionPlans, in the order of the file
+    errors: list of strings, problems with the settings of the whole file
+  """
+
+  def __init__(self):
+    self.sections = []
+    self.errors = []
+
+  def get_total(self, attribute):
+    """Sums a SectionPlan attribute over the sections."""
+    return sum(getattr(section, attribute) for section in self.sections)
+
+  def has_errors(self):
+    return bool(self.errors) or any(section.errors for section in self.sections)
+
+
+def plan_config(config, motion_file_directory, default_run_duration=None):
+  """Checks every section of a configuration file and estimates its cost.
+
+  Args:
+    config: ConfigParser the configuration file was read into
+    motion_file_directory: path of the directory FileName options are in
+    default_run_duration: float, seconds simulations without a RunDuration
+    run for, or None if they run until bladeGPS exits
+
+  Returns:
+    Plan of the file
+  """
+  plan = Plan()
+  plan.errors.extend(_check_default_options(config))
+  plan.errors.extend(_check_devices(config))
+  # route keys to their estimated length, shared like run.py shares routes
+  route_lengths = {}
+  # motion file paths to their scans, so a file played by several sections is read once
+  scans = {}
+  # paths of the route files sections create to their estimated rows and duration
+  created_files = {}
+  sections = config.sections()
+  # run.py writes every route file before the first simulation plays one
+  for simulation in sorted(sections, key=lambda section: _plays_file(config, section)):
+    section_plan = SectionPlan(simulation)
+    try:
+      _plan_section(config, simulation, section_plan, motion_file_directory,
+                    default_run_duration, route_lengths, scans, created_files)
+    except (configparser.NoOptionError, ValueError) as err:
+      section_plan.errors.append(str(err))
+    plan.sections.append(section_plan)
+  plan.sections.sort(key=lambda section_plan: sections.index(section_plan.name))
+  return plan
+
+
+def format_plan(plan):
+  """Formats a plan as a table of sections followed by its problems.
+
+  Returns:
+    list of lines
+  """
+  row_format = "%-24s %6s %9s %10s %10s %10s"
+  lines = [row_format % ("section", "sims", "api calls", "points", "file size", "run time")]
+  for section in plan.sections:
+    lines.append(row_format % (section.name, section.simulation_count, section.api_calls,
+                               section.point_count, _format_size(section.file_size),
+                               _format_run_time(section.run_time, section.open_ended_count)))
+  lines.append(row_format % ("total", plan.get_total("simulation_count"),
+                             plan.get_total("api_calls"), plan.get_total("point_count"),
+                             _format_size(plan.get_total("file_size")),
+                             _format_run_time(plan.get_total("run_time"),
+                                              plan.get_total("open_ended_count"))))
+  for error in plan.errors:
+    lines.append("Error in DEFAULT: %s" % error)
+  for section in plan.sections:
+    for error in section.errors:
+      lines.append("Error in %s: %s" % (section.name, error))
+    for warning in section.warnings:
+      lines.append("Warning in %s: %s" % (section.name, warning))
+  return lines
+
+
+def _plan_section(config, simulation, section_plan, motion_file_directory,
+                  default_run_duration, route_lengths, scans, created_files):
+  """Fills in the plan of one section.
+
+  Raises:
+    configparser.NoOptionError: if a required option is missing
+    ValueError: if an option can't be parsed
+  """
+  points = list(sweeps.iter_sweep_points(config, simulation))
+  section_plan.simulation_count = len(points)
+  dynamic = config.getboolean(simulation, "Dynamic")
+  if not dynamic:
+    latitude = config.getfloat(simulation, "Latitude")
+    longitude = config.getfloat(simulation, "Longitude")
+    _check_location(latitude, longitude)
+    for values in points:
+      _add_run_time(section_plan, values["RunDuration"], default_run_duration)
+    return
+
+  stream = config.getboolean(simulation, "Stream", fallback=False)
+  start_offset = config.getfloat(simulation, "StartOffset", fallback=0)
+  if stream or config.getboolean(simulation, "CreateFile"):
+    file_name = None if stream else config.get(simulation, "FileName")
+    route_key = _get_route_key(config, simulation)
+    if route_key not in route_lengths:
+      route_lengths[route_key] = _estimate_route_length(route_key)
+      if route_key[0] == "directions":
+        section_plan.api_calls += API_CALLS_PER_ROUTE
+    # run.py times a route once per speed
+    speeds = sorted({values["Speed"] for values in points})
+    for speed in speeds:
+      if speed <= 0:
+        raise ValueError("Speed must be positive, got %g" % speed)
+      route_duration = route_lengths[route_key]/speed
+      rows = int(route_duration*DEFAULT_MOTION_FILE_RATE) + START_HOLD_CYCLES
+      section_plan.point_count += rows
+      if not stream:
+        section_plan.file_size += rows*ESTIMATED_ROW_BYTES
+        file_path = _get_file_path(motion_file_directory,
+                                   sweeps.get_sweep_file_name(file_name, speed, len(speeds) > 1))
+        created_files[file_path] = (rows, route_duration)
+    for values in points:
+      route_duration = route_lengths[route_key]/values["Speed"] - start_offset
+      _add_run_time(section_plan, values["RunDuration"], route_duration)
+    return
+
+  file_path = _get_file_path(motion_file_directory, config.get(simulation, "FileName"))
+  if file_path in created_files:
+    # checked once it is written
+    section_plan.point_count, route_duration = created_files[file_path]
+    for values in points:
+      _add_run_time(section_plan, values["RunDuration"], route_duration - start_offset)
+    return
+  if not os.path.exists(file_path):
+    section_plan.errors.append("motion file %s does not exist" % file_path)
+    return
+  max_segment_duration = config.getfloat(simulation, "MaxSegmentDuration", fallback=None)
+  # files are only split into segments bladeGPS can load if MaxSegmentDuration is set
+  max_duration = None if max_segment_duration else DEFAULT_MAX_SEGMENT_DURATION
+  scan_key = (file_path, max_duration)
+  if scan_key not in scans:
+    scans[scan_key] = scan_motion_file(file_path, max_duration=max_duration)
+  scan = scans[scan_key]
+  section_plan.errors.extend(scan.errors)
+  section_plan.warnings.extend(scan.warnings)
+  section_plan.point_count = scan.row_count
+  if max_segment_duration and scan.duration > max_segment_duration:
+    section_plan.warnings.append("%s is played in %d segments of %g seconds" % (
+        file_path, -(-scan.duration//max_segment_duration), max_segment_duration))
+  for values in points:
+    _add_run_time(section_plan, values["RunDuration"], scan.duration - start_offset)
+
+
+def _plays_file(config, simulation):
+  """Whether a section plays a motion file it doesn't create."""
+  try:
+    return (config.getboolean(simulation, "Dynamic")
+            and not config.getboolean(simulation, "Stream", fallback=False)
+            and not config.getboolean(simulation, "CreateFile"))
+  except (configparser.NoOptionError, ValueError):
+    return False
+
+
+def _get_file_path(motion_file_directory, file_name):
+  return os.path.abspath(os.path.join(motion_file_directory, file_name))
+
+
+def _add_run_time(section_plan, run_duration, default_run_duration):
+  """Adds the run time of one simulation, the shorter of its run and route durations."""
+  if run_duration is not None and run_duration <= 0:
+    raise ValueError("RunDuration must be positive, got %d" % run_duration)
+  durations = [duration for duration in (run_duration, default_run_duration)
+               if duration is not None]
+  if durations:
+    section_plan.run_time += max(min(durations), 0)
+  else:
+    section_plan.open_ended_count += 1
+
+
+def _check_default_options(config):
+  """Checks the set-wide options of the DEFAULT section.
+
+  Returns:
+    list of strings, one for every option that can't be parsed
+  """
+  defaults = config["DEFAULT"]
+  checks = [(option, defaults.getfloat) for option in ("TeardownTimeout", "TransitSpeed")]
+  checks += [(option, defaults.getboolean)
+             for option in ("Prefetch", "Resume", "Fuse", "FuseDynamic")]
+  checks += [(option, defaults.getint) for option in ("Nice", "RealtimePriority")]
+  errors = []
+  for option, get in checks:
+    try:
+      get(option, fallback=None)
+    except ValueError as err:
+      errors.append("%s: %s" % (option, err))
+  cpus = defaults.get("Cpus", fallback=None)
+  if cpus:
+    try:
+      parse_cpu_list(cpus)
+    except ValueError as err:
+      errors.append("Cpus: %s" % err)
+  return errors
+
+
+def _check_devices(config):
+  """Checks that sections are either all bound to a board or none are, as run.py requires.
+
+  Returns:
+    list of strings, with an error if some sections set Device and others don't
+  """
+  devices = {config.get(section, "Device", fallback=None) for section in config.sections()}
+  if None in devices and len(devices) > 1:
+    return ["Device has to be set in every section or in none of them"]
+  return []
+
+
+def _check_location(latitude, longitude):
+  if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+    raise ValueError("location %g,%g is out of range" % (latitude, longitude))
+
+
+def _get_route_key(config, simulation):
+  """Gets what identifies the route of a section, as run.py does."""
+  route_key = sweeps.get_route_key(config, simulation)
+  if route_key[0] == "gpx":
+    return route_key
+  _check_location(*route_key[1:3])
+  _check_location(*route_key[3:5])
+  return route_key
+
+
+def _estimate_route_length(route_key):
+  """Estimates the length of a route in meters without requesting it.
+
+  Raises:
+    ValueError: if the GPX file of the route can't be read or has no points
+  """
+  if route_key[0] == "directions":
+    return calculate_distance(route_key[1:3], route_key[3:5])
+  try:
+    locations = GpxFileParser().parse_file(route_key[1])
+  except (OSError, SyntaxError) as err:
+    raise ValueError("could not read GPX file %s: %s" % (route_key[1], err))
+  if not locations:
+    raise ValueError("GPX file %s has no track points" % route_key[1])
+  return sum(calculate_distance(previous[:2], location[:2])
+             for previous, location in zip(locations, locations[1:]))
+
+
+def _format_size(size):
+  for unit in ("B", "kB", "MB"):
+    if size < 1000:
+      return "%.0f %s" % (size, unit) if unit == "B" else "%.1f %s" % (size, unit)
+    size /= 1000
+  return "%.1f GB" % size
+
+
+def _format_run_time(seconds, open_ended_count):
+  minutes, seconds = divmod(int(round(seconds)), 60)
+  hours, minutes = divmod(minutes, 60)
+  run_time = "%d:%02d:%02d" % (hours, minutes, seconds)
+  if open_ended_count:
+    run_time += "+%d" % open_ended_count
+  return run_time
@@ -0,0 +1,221 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""CPU affinity and priority for bladeGPS processes.
+
+bladeGPS has to hand samples to the bladeRF board in real time and underruns
+when it doesn't get the CPU in time. A ProcessScheduling pins the bladeGPS
+process to chosen cores, raises its priority, or gives it a real-time
+scheduling policy, and can move geobeam's own threads off those cores.
+Settings the operating system doesn't permit are reported and skipped.
+
+  Typical usage example:
+  scheduling = ProcessScheduling(cpus=parse_cpu_list("2-3"), nice=-10)
+  scheduling.isolate_current_process()
+  process = scheduling.launch(lambda: subprocess.Popen(command))
+"""
+
+import os
+import resource
+
+
+class ProcessScheduling():
+  """Scheduling settings for bladeGPS processes.
+
+  Attributes:
+    cpus: set of ints, cores the process may run on, or None for any
+    nice: int, niceness to give the process (negative is higher
+    priority), or None to leave it
+    realtime_priority: int, SCHED_FIFO priority to run the process with
+    (1-99), or None for the default policy
+  """
+
+  def __init__(self, cpus=None, nice=None, realtime_priority=None):
+    self.cpus = set(cpus) if cpus else None
+    self.nice = nice
+    self.realtime_priority = realtime_priority
+
+  def apply(self, pid):
+    """Applies the settings to a process that is already running.
+
+    Processes it starts afterwards (bladeGPS itself, when the process is
+    run_bladerfGPS.sh) inherit them.
+
+    Args:
+      pid: int, process id, or 0 for the calling thread
+
+    Returns:
+      list of strings describing the settings that could not be applied
+    """
+    failures = []
+    if self.cpus:
+      try:
+        os.sched_setaffinity(pid, self.cpus)
+      except (AttributeError, OSError) as err:
+        failures.append("cpu affinity %s: %s" % (sorted(self.cpus), err))
+    if self.nice is not None:
+      try:
+        os.setpriority(os.PRIO_PROCESS, pid, self.nice)
+      except (AttributeError, OSError) as err:
+        failures.append("nice %s: %s" % (self.nice, err))
+    if self.realtime_priority is not None:
+      try:
+        os.sched_setscheduler(pid, os.SCHED_FIFO, os.sched_param(self.realtime_priority))
+      except (AttributeError, OSError) as err:
+        failures.append("real-time priority %s: %s" % (self.realtime_priority, err))
+    for failure in failures:
+      print("Could not set bladeGPS %s" % failure)
+    return failures
+
+  def launch(self, start):
+    """Starts a process that inherits the settings from the calling thread.
+
+    Affinity, niceness and scheduling policy belong to each thread on Linux,
+    and a child process starts with those of the thread that forked it, so
+    the process runs with the settings from its first instruction instead
+    of from whenever apply reaches it. A preexec_fn would do the same in the
+    child, but isn't safe in a threaded program. The thread gets its own
+    settings back once start returns, so threads it starts afterwards stay
+    off the reserved cores.
+
+    A thread without CAP_SYS_NICE couldn't get its niceness back after a
+    higher one, so that niceness is applied to the process once it started
+    instead.
+
+    Args:
+      start: callable starting the process and returning an object with
+      its pid, such as subprocess.Popen
+
+    Returns:
+      what start returned
+    """
+    saved_settings = _get_thread_settings()
+    thread_scheduling = self
+    deferred_nice = None
+    saved_nice = saved_settings[1]
+    if (self.nice is not None and saved_nice is not None and self.nice > saved_nice
+        and not _can_lower_nice_to(saved_nice)):
+      print("Setting bladeGPS nice %s after it started, as geobeam couldn't get nice %s back"
+            % (self.nice, saved_nice))
+      thread_scheduling = ProcessScheduling(self.cpus, None, self.realtime_priority)
+      deferred_nice = ProcessScheduling(nice=self.nice)
+    try:
+      thread_scheduling.apply(0)
+      process = start()
+    finally:
+      _restore_thread_settings(saved_settings)
+    if deferred_nice:
+      deferred_nice.apply(process.pid)
+    return process
+
+  def isolate_current_process(self):
+    """Moves every thread of this process off the cores reserved for bladeGPS.
+
+    Threads started afterwards inherit the affinity of the thread starting
+    them, so they stay off those cores too. Does nothing if no cores would
+    be left.
+    """
+    if not self.cpus:
+      return
+    try:
+      allowed_cpus = os.sched_getaffinity(0) - self.cpus
+      if not allowed_cpus:
+        return
+      for thread_id in os.listdir("/proc/self/task"):
+        try:
+          os.sched_setaffinity(int(thread_id), allowed_cpus)
+        except ProcessLookupError:
+          pass  # the thread has exited
+    except (AttributeError, OSError) as err:
+      print("Could not move geobeam off cores %s: %s" % (sorted(self.cpus), err))
+
+  def __repr__(self):
+    return "ProcessScheduling(cpus=%s, nice=%s, realtime_priority=%s)" % (
+        sorted(self.cpus) if self.cpus else None, self.nice, self.realtime_priority)
+
+
+def _get_thread_settings():
+  """Gets the affinity, niceness and scheduling policy of the calling thread.
+
+  Returns:
+    (cpus, nice, (policy, priority)) tuple, with None for a setting the
+    system doesn't report
+  """
+  settings = []
+  for get in (lambda: os.sched_getaffinity(0),
+              lambda: os.getpriority(os.PRIO_PROCESS, 0),
+              lambda: (os.sched_getscheduler(0), os.sched_getparam(0).sched_priority)):
+    try:
+      settings.append(get())
+    except (AttributeError, OSError):
+      settings.append(None)
+  return tuple(settings)
+
+
+def _can_lower_nice_to(nice):
+  """Whether the calling thread may lower its niceness to nice.
+
+  Root is taken to have CAP_SYS_NICE. Other users may go as low as their
+  RLIMIT_NICE allows.
+  """
+  if os.geteuid() == 0:
+    return True
+  try:
+    limit = resource.getrlimit(resource.RLIMIT_NICE)[0]
+  except (AttributeError, ValueError, OSError):
+    return False
+  return limit == resource.RLIM_INFINITY or nice >= 20 - limit
+
+
+def _restore_thread_settings(settings):
+  """Gives the calling thread back the settings from _get_thread_settings.
+
+  The policy goes first, as leaving a real-time policy is always allowed
+  and a thread may not be able to change its niceness while it has one.
+  """
+  cpus, nice, policy = settings
+  restores = []
+  if policy is not None:
+    restores.append(lambda: os.sched_setscheduler(0, policy[0], os.sched_param(policy[1])))
+  if nice is not None:
+    restores.append(lambda: os.setpriority(os.PRIO_PROCESS, 0, nice))
+  if cpus is not None:
+    restores.append(lambda: os.sched_setaffinity(0, cpus))
+  for restore in restores:
+    try:
+      restore()
+    except OSError as err:
+      print("Could not restore the scheduling of the launching thread: %s" % err)
+
+
+def parse_cpu_list(cpu_list):
+  """Parses a list of cores such as "2,3" or "0-1,4".
+
+  Args:
+    cpu_list: string of comma separated core numbers and ranges
+
+  Returns:
+    set of ints
+
+  Raises:
+    ValueError: if the list is malformed
+  """
+  cpus = set()
+  for part in cpu_list.split(","):
+    part = part.strip()
+    if not part:
+      continue
+    first, _, last = part.partition("-")
+    cpus.update(range(int(first), int(last or first) + 1))
+  return cpus
@@ -0,0 +1,531 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Long-running route generation service with warm caches.
+
+The service keeps the interpreter, the Maps client and the routes it made
+in memory between runs. Directions and Elevation responses, resolved Routes
+and TimedRoutes are kept in LRU caches, so a route asked for again is
+neither requested nor upsampled again. run.py uses the service when its
+socket is there and generates routes itself otherwise.
+
+Clients send one JSON request per line on a Unix domain socket and get one
+JSON response per line, as with the control server:
+
+  {"command": "write_route", "route": ["directions", 37.4, -122.0, 37.5, -122.1],
+   "directory": "/.../geobeam/user_motion_files",
+   "variants": [{"file_name": "walk.csv", "speed": 1.4, "frequency": 10}]}
+      -> {"ok": true, "file_paths": [["/.../geobeam/user_motion_files/walk.csv"]]}
+  {"command": "timed_route", "route": ["gpx", "/home/user/run.gpx"], "speed": 2.5,
+   "frequency": 10}
+      -> {"ok": true, "frequency": 10, "xyz_size": 48000}
+         followed by xyz_size bytes of little endian float64 x, y, z triples
+  {"command": "status"}
+      -> {"ok": true, "cache_sizes": {...}, "cache_hits": {...}}
+
+Motion files are written to the absolute directory the client sends, its
+own FILE_FOLDER_PATH, wherever the service was started. The socket is kept
+in a directory only its user can write to, so another user can't serve
+routes in the service's place.
+
+  Typical usage example:
+  python3 -m geobeam.route_service &
+  client = RouteServiceClient()
+  file_paths = client.write_route_variants(("gpx", "/home/user/run.gpx"),
+                                           [RouteVariant("run.csv", 2.5, 10)])
+"""
+
+import argparse
+import array
+import collections
+import contextlib
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+
+from geobeam import generate_route
+from geobeam.generate_route import Route
+from geobeam.generate_route import RouteVariant
+from geobeam.generate_route import TimedRoute
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), "geobeam-%d" % os.getuid(),
+                                   "route_service.sock")
+XYZ_CHUNK_POINTS = 4096  # points of a timed route packed and sent at a time
+DEFAULT_RESPONSE_CACHE_SIZE = 256  # Directions or Elevation responses
+DEFAULT_ROUTE_CACHE_SIZE = 32  # Routes, and TimedRoutes
+DEFAULT_CLIENT_TIMEOUT = 300  # seconds, generation may wait on the Maps API
+WRITE_ROUTE = "write_route"
+TIMED_ROUTE = "timed_route"
+STATUS = "status"
+DIRECTIONS = "directions"
+GPX = "gpx"
+
+
+class RouteServiceError(Exception):
+  """The route service could not carry out a request."""
+
+
+class LruCache():
+  """A dictionary keeping the most recently used max_size entries."""
+
+  def __init__(self, max_size):
+    self._max_size = max_size
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def get_or_create(self, key, create):
+    """Gets the value of key, calling create() for it if it isn't cached.
+
+    Args:
+      key: hashable key of the value
+      create: callable making the value
+
+    Returns:
+      the cached or created value
+    """
+    with self._lock:
+      if key in self._entries:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._entries[key]
+      self.misses += 1
+    value = create()
+    with self._lock:
+      self._entries[key] = value
+      self._entries.move_to_end(key)
+      while len(self._entries) > self._max_size:
+        self._entries.popitem(last=False)
+    return value
+
+  def __len__(self):
+    return len(self._entries)
+
+
+class RouteGenerator():
+  """Generates routes through LRU caches of Maps responses and routes."""
+
+  def __init__(self, response_cache_size=DEFAULT_RESPONSE_CACHE_SIZE,
+               route_cache_size=DEFAULT_ROUTE_CACHE_SIZE):
+    self._directions = LruCache(response_cache_size)
+    self._elevations = LruCache(response_cache_size)
+    self._routes = LruCache(route_cache_size)
+    self._timed_routes = LruCache(route_cache_size)
+
+  def get_route(self, route_key):
+    """Gets the route with a key.
+
+    Args:
+      route_key: tuple of ("directions", start lat, start lon, end lat, end
+      lon) or of ("gpx", path of the GPX file)
+
+    Returns:
+      Route object
+
+    Raises:
+      ValueError: if the key is malformed or no route is found
+      OSError: if the GPX file can't be read
+    """
+    return self._routes.get_or_create(self._get_cache_key(route_key),
+                                      lambda: self._create_route(route_key))
+
+  def get_timed_route(self, route_key, speed, frequency):
+    """Gets the route with a key timed at a speed and frequency.
+
+    Returns:
+      TimedRoute object, shared with later requests, so it must not be changed
+    """
+    route = self.get_route(route_key)
+    return self._timed_routes.get_or_create(
+        (self._get_cache_key(route_key), speed, frequency),
+        lambda: TimedRoute.from_route(route, speed, frequency))
+
+  def write_route_variants(self, route_key, variants):
+    """Writes timed versions of the route with a key, each timed through the cache.
+
+    A variant asked for again is written from its cached TimedRoute instead
+    of being sampled again, and a streamed run of the same variant is
+    served from it too.
+
+    Args:
+      route_key: key of the route as for get_route
+      variants: list of RouteVariants without speed profiles to write
+
+    Returns:
+      list with the paths of the files written for each variant, in the order
+      of variants
+    """
+    return [self.get_timed_route(route_key, variant.speed, variant.frequency)
+            .write_route(variant.file_name, variant.max_segment_duration)
+            for variant in variants]
+
+  def get_status(self):
+    """Gets the size and hit count of every cache."""
+    caches = {"directions": self._directions, "elevations": self._elevations,
+              "routes": self._routes, "timed_routes": self._timed_routes}
+    return {"cache_sizes": {name: len(cache) for name, cache in caches.items()},
+            "cache_hits": {name: cache.hits for name, cache in caches.items()},
+            "cache_misses": {name: cache.misses for name, cache in caches.items()}}
+
+  def _get_cache_key(self, route_key):
+    if route_key[0] == GPX:
+      # an edited file is a new route
+      return route_key + (os.path.getmtime(route_key[1]),)
+    return route_key
+
+  def _create_route(self, route_key):
+    if route_key[0] == GPX and len(route_key) == 2:
+      return Route.from_gpx(route_key[1])
+    if route_key[0] != DIRECTIONS or len(route_key) != 5:
+      raise ValueError("unknown route: %s" % (route_key,))
+    start = (float(route_key[1]), float(route_key[2]))
+    end = (float(route_key[3]), float(route_key[4]))
+    locations, distances = self._directions.get_or_create(
+        (start, end), lambda: generate_route.request_directions(start, end))
+    elevations = self._elevations.get_or_create(
+        tuple(locations), lambda: generate_route.request_elevations(locations))
+    return Route.from_directions(locations, distances, elevations)
+
+
+class RouteServiceServer():
+  """Serves route generation requests on a Unix domain socket.
+
+  Each connection is handled on a thread of its own. Generation is done one
+  request at a time, so two clients asking for the same route don't both
+  request it from the Maps API.
+  """
+
+  def __init__(self, socket_path=DEFAULT_SOCKET_PATH, generator=None):
+    """Initialize server.
+
+    Args:
+      socket_path: path to create the Unix domain socket at
+      generator: RouteGenerator to serve, a new one by default
+    """
+    self._socket_path = socket_path
+    self._generator = generator or RouteGenerator()
+    self._generation_lock = threading.Lock()
+    self._server = None
+    self._thread = None
+
+  def start(self):
+    """Starts listening and serving on a background thread."""
+    self._listen()
+    self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    self._thread.start()
+
+  def serve_forever(self):
+    """Listens and serves requests on this thread until close is called."""
+    self._listen()
+    self._server.serve_forever()
+
+  def close(self):
+    """Stops serving and removes the socket file."""
+    if self._server:
+      self._server.shutdown()
+      self._server.server_close()
+      if self._thread:
+        self._thread.join()
+        self._thread = None
+      self._server = None
+      remove_socket(self._socket_path)
+
+  def _listen(self):
+    """Binds the socket, replacing a stale socket file."""
+    socket_directory = os.path.dirname(os.path.abspath(self._socket_path))
+    os.makedirs(socket_directory, mode=0o700, exist_ok=True)
+    check_socket_path(self._socket_path)
+    remove_socket(self._socket_path)
+    service = self
+
+    class RouteRequestHandler(socketserver.StreamRequestHandler):
+
+      def handle(self):
+        for line in self.rfile:
+          response, payload = service.handle_request(line)
+          self.wfile.write(json.dumps(response).encode() + b"\n")
+          for chunk in payload:
+            self.wfile.write(chunk)
+          self.wfile.flush()
+
+    self._server = socketserver.ThreadingUnixStreamServer(self._socket_path,
+                                                          RouteRequestHandler)
+    self._server.daemon_threads = True
+
+  def handle_request(self, line):
+    """Carries out one request.
+
+    Returns:
+      (dict response for the client, iterable of the bytes sent after it)
+    """
+    try:
+      request = json.loads(line)
+      command = request["command"]
+      if command == STATUS:
+        return dict(self._generator.get_status(), ok=True), ()
+      route_key = tuple(request["route"])
+      with self._generation_lock:
+        if command == WRITE_ROUTE:
+          # a client without a directory gets FILE_FOLDER_PATH of the service
+          directory = request.get("directory", "")
+          variants = [RouteVariant(os.path.join(directory, variant["file_name"]),
+                                   float(variant["speed"]), float(variant["frequency"]),
+                                   max_segment_duration=variant.get("max_segment_duration"))
+                      for variant in request["variants"]]
+          file_paths = self._generator.write_route_variants(route_key, variants)
+          return {"ok": True,
+                  "file_paths": [[os.path.abspath(file_path) for file_path in variant_paths]
+                                 for variant_paths in file_paths]}, ()
+        if command == TIMED_ROUTE:
+          frequency = float(request["frequency"])
+          timed_route = self._generator.get_timed_route(route_key, float(request["speed"]),
+                                                        frequency)
+          return ({"ok": True, "frequency": frequency,
+                   "xyz_size": len(timed_route.route)*3*array.array("d").itemsize},
+                  _iter_packed_xyz(timed_route.route))
+      raise ValueError("unknown command: %s" % command)
+    except (KeyError, TypeError, ValueError, OSError) as err:
+      return {"ok": False, "error": str(err)}, ()
+
+
+class ServedTimedRoute():
+  """The rows of a TimedRoute received from the route service.
+
+  Only the ECEF coordinates are sent, so it can be streamed to bladeGPS but
+  not changed or resampled.
+  """
+
+  def __init__(self, xyz, frequency):
+    """Initialize route.
+
+    Args:
+      xyz: array of float x, y, z coordinates of every point in turn
+      frequency: float, points per second (Hz)
+    """
+    self._xyz = xyz
+    self.frequency = frequency
+
+  def iter_timed_rows(self):
+    """Generate the time,x,y,z rows of the route as TimedRoute.iter_timed_rows does."""
+    time = 0.0
+    xyz = self._xyz
+    for index in range(0, len(xyz), 3):
+      yield ("%.1f" % (time,), xyz[index], xyz[index+1], xyz[index+2])
+      time = time + (1/self.frequency)
+
+  def __len__(self):
+    return len(self._xyz)//3
+
+
+class RouteServiceClient():
+  """Sends route generation requests to a RouteServiceServer."""
+
+  def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=DEFAULT_CLIENT_TIMEOUT):
+    """Initialize client.
+
+    Args:
+      socket_path: path of the service's Unix domain socket
+      timeout: float, seconds to wait for a response
+    """
+    self._socket_path = socket_path
+    self._timeout = timeout
+
+  def is_available(self):
+    """Checks whether a service is listening on the socket."""
+    try:
+      self.get_status()
+    except (OSError, ValueError, RouteServiceError):
+      return False
+    return True
+
+  def get_status(self):
+    """Gets the cache sizes and hit counts of the service."""
+    return self._send({"command": STATUS})
+
+  def write_route_variants(self, route_key, variants):
+    """Has the service time one route at several speeds and write the files.
+
+    Args:
+      route_key: tuple of ("directions", start lat, start lon, end lat, end
+      lon) or of ("gpx", path of the GPX file)
+      variants: list of RouteVariant objects without speed profiles
+
+    Returns:
+      list with the list of absolute file paths written for each variant
+
+    Raises:
+      OSError: if the service can't be reached
+      RouteServiceError: if the service couldn't write the routes
+    """
+    response = self._send({"command": WRITE_ROUTE,
+                           "route": _serialize_route_key(route_key),
+                           "directory": os.path.abspath(generate_route.FILE_FOLDER_PATH),
+                           "variants": [{"file_name": variant.file_name,
+                                         "speed": variant.speed,
+                                         "frequency": variant.frequency,
+                                         "max_segment_duration": variant.max_segment_duration}
+                                        for variant in variants]})
+    return response["file_paths"]
+
+  def get_timed_route(self, route_key, speed, frequency):
+    """Gets a route timed at a speed and frequency from the service.
+
+    Returns:
+      ServedTimedRoute
+
+    Raises:
+      OSError: if the service can't be reached
+      RouteServiceError: if the service couldn't create the route
+    """
+    request = {"command": TIMED_ROUTE,
+               "route": _serialize_route_key(route_key),
+               "speed": speed,
+               "frequency": frequency}
+    with self._connect(request) as (response, response_file):
+      xyz = array.array("d")
+      chunk_size = XYZ_CHUNK_POINTS*3*xyz.itemsize
+      remaining = response["xyz_size"]
+      while remaining:
+        chunk = response_file.read(min(remaining, chunk_size))
+        if not chunk:
+          raise ConnectionError("route service closed the connection")
+        xyz.frombytes(chunk)
+        remaining -= len(chunk)
+    if sys.byteorder != "little":
+      xyz.byteswap()
+    return ServedTimedRoute(xyz, response["frequency"])
+
+  def _send(self, request):
+    with self._connect(request) as (response, _):
+      return response
+
+  @contextlib.contextmanager
+  def _connect(self, request):
+    """Sends a request and yields the response with the file the rest is read from."""
+    check_socket_directory(os.path.dirname(os.path.abspath(self._socket_path)))
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+      connection.settimeout(self._timeout)
+      connection.connect(self._socket_path)
+      connection.sendall(json.dumps(request).encode() + b"\n")
+      with connection.makefile("rb") as response_file:
+        line = response_file.readline()
+        if not line:
+          raise ConnectionError("route service closed the connection")
+        response = json.loads(line)
+        if not response["ok"]:
+          raise RouteServiceError(response["error"])
+        yield response, response_file
+
+
+def check_socket_directory(directory):
+  """Checks that only the current user can put a socket in a directory.
+
+  Args:
+    directory: path of the directory holding a service socket
+
+  Raises:
+    FileNotFoundError: if the directory doesn't exist
+    PermissionError: if the directory is owned by another user, or other
+    users may write to it
+  """
+  status = os.lstat(directory)
+  if not stat.S_ISDIR(status.st_mode):
+    raise PermissionError("%s is not a directory" % directory)
+  if status.st_uid != os.getuid():
+    raise PermissionError("%s is owned by another user" % directory)
+  if status.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+    raise PermissionError("%s is writable by other users" % directory)
+
+
+def check_socket_path(socket_path):
+  """Checks that a socket can be served at a path without harm to others.
+
+  Args:
+    socket_path: path of a Unix domain socket to listen on
+
+  Raises:
+    FileNotFoundError: if the directory of the socket doesn't exist
+    PermissionError: if only the current user can't put a socket there
+    FileExistsError: if something other than a socket is at the path
+  """
+  check_socket_directory(os.path.dirname(os.path.abspath(socket_path)))
+  try:
+    mode = os.lstat(socket_path).st_mode
+  except FileNotFoundError:
+    return
+  if not stat.S_ISSOCK(mode):
+    raise FileExistsError("%s exists and is not a socket" % socket_path)
+
+
+def remove_socket(socket_path):
+  """Removes the socket at a path, leaving anything else there in place."""
+  try:
+    if stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+      os.unlink(socket_path)
+  except FileNotFoundError:
+    pass
+
+
+def _serialize_route_key(route_key):
+  if route_key[0] == GPX:
+    # the service may run from another directory
+    return [GPX, os.path.abspath(route_key[1])]
+  return list(route_key)
+
+
+def _iter_packed_xyz(locations):
+  """Packs the ECEF coordinates of locations as little endian float64 x, y, z triples.
+
+  Yields:
+    bytes of the coordinates of XYZ_CHUNK_POINTS locations at a time
+  """
+  for start in range(0, len(locations), XYZ_CHUNK_POINTS):
+    xyz = array.array("d")
+    for location in locations[start:start+XYZ_CHUNK_POINTS]:
+      xyz.extend(location.get_xyz_tuple())
+    if sys.byteorder != "little":
+      xyz.byteswap()
+    yield xyz.tobytes()
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Serve route generation with warm caches.")
+  parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH,
+                      help="path of the Unix domain socket to listen on")
+  parser.add_argument("--response-cache-size", type=int, default=DEFAULT_RESPONSE_CACHE_SIZE,
+                      help="Directions and Elevation responses to keep")
+  parser.add_argument("--route-cache-size", type=int, default=DEFAULT_ROUTE_CACHE_SIZE,
+                      help="routes and timed routes to keep")
+  args = parser.parse_args(argv)
+
+  server = RouteServiceServer(args.socket, RouteGenerator(args.response_cache_size,
+                                                          args.route_cache_size))
+  print("Serving routes on %s" % args.socket)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.close()
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
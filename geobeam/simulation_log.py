@@ -0,0 +1,114 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Structured simulation run logs written on a background thread.
+
+Each log is a JSON Lines file: one JSON object per simulation run or event,
+so a whole directory of logs can be loaded back with read_simulation_log.
+Values that are expensive to produce (such as references into motion
+files, which hash the file) can be passed as objects with a to_log_value()
+method; they are evaluated on the writer thread rather than by the caller.
+
+  Typical usage example:
+  log_writer = SimulationLogWriter("simulation_logs/GPSSIM-2020-08-15_05-00-00.jsonl")
+  log_writer.write({"event": "simulation", "gain": -2})
+  log_writer.close()
+  records = read_simulation_log("simulation_logs/GPSSIM-2020-08-15_05-00-00.jsonl")
+"""
+
+import json
+import os
+import queue
+import threading
+
+_STOP = object()
+
+
+class SimulationLogWriter():
+  """Appends JSON records to a log file from a background thread.
+
+  write() only enqueues the record, so callers never wait on the disk. The
+  file is opened once and flushed whenever the queue runs empty.
+  """
+
+  def __init__(self, file_path):
+    """Initialize log writer. The thread is started on the first write.
+
+    Args:
+      file_path: path to the JSON Lines log file to append to
+    """
+    self._file_path = file_path
+    self._queue = queue.Queue()
+    self._thread = None
+
+  def write(self, record):
+    """Queues a record to be appended to the log.
+
+    Args:
+      record: dict of JSON serializable values, or objects that have a
+      to_log_value() method returning one
+    """
+    if not self._thread:
+      self._thread = threading.Thread(target=self._write_records, daemon=True)
+      self._thread.start()
+    self._queue.put(record)
+
+  def flush(self):
+    """Waits until every queued record has been written."""
+    if self._thread:
+      self._queue.join()
+
+  def close(self):
+    """Writes the remaining records and stops the writer thread."""
+    if self._thread:
+      self._queue.put(_STOP)
+      self._thread.join()
+      self._thread = None
+
+  def _write_records(self):
+    log_directory = os.path.dirname(self._file_path)
+    if log_directory:
+      os.makedirs(log_directory, exist_ok=True)
+    with open(self._file_path, "a") as log_file:
+      while True:
+        record = self._queue.get()
+        try:
+          if record is _STOP:
+            break
+          log_file.write(json.dumps(record, default=_encode_log_value) + "\n")
+          if self._queue.empty():
+            log_file.flush()
+        except (OSError, TypeError, ValueError) as err:
+          print("Error writing simulation log record: %s" % err)
+        finally:
+          self._queue.task_done()
+
+
+def read_simulation_log(file_path):
+  """Reads every record from a JSON Lines simulation log.
+
+  Args:
+    file_path: path to the log file
+
+  Returns:
+    list of dicts in the order they were logged
+  """
+  with open(file_path, "r") as log_file:
+    return [json.loads(line) for line in log_file if line.strip()]
+
+
+def _encode_log_value(value):
+  if hasattr(value, "to_log_value"):
+    return value.to_log_value()
+  raise TypeError("%r is not JSON serializable" % (value,))
@@ -19,19 +19,97 @@
     .add_dynamic_route(file_path, gain=-2)
     .add_dynamic_route(file_path, run_duration=30, gain=-2)
     .add_static_route(27.417747, -112.086086, run_duration=10, gain=-2)
+    .add_streamed_route(timed_route.iter_timed_rows, gain=-2)
     .build())
   simulation_set.run_simulations()
+
+  or, event driven without polling:
+  asyncio.run(AsyncSimulationSetRunner(simulation_set).run())
 """
 
-import csv
+import asyncio
 import datetime
+import functools
+import io
+import math
+import os
+import re
+import select
 import subprocess
+import sys
+import tempfile
+import threading
 import time
 
+from geobeam.gps_utils import geodetic_to_cartesian
+from geobeam.metrics import MetricsRegistry
+from geobeam.motion_files import DEFAULT_MAX_SEGMENT_DURATION
+from geobeam.motion_files import DEFAULT_MOTION_FILE_RATE
+from geobeam.motion_files import get_motion_file_rate
+from geobeam.motion_files import get_motion_file_row_count
+from geobeam.motion_files import get_segment_row_count
+from geobeam.motion_files import has_motion_file_row
+from geobeam.motion_files import INDEX_SUFFIX
+from geobeam.motion_files import MotionFileReference
+from geobeam.motion_files import MotionFileStream
+from geobeam.motion_files import MotionStreamSegments
+from geobeam.motion_files import read_motion_file_positions
+from geobeam.motion_files import split_motion_file
+from geobeam.motion_files import validate_motion_file
+from geobeam.motion_files import write_motion_file
+from geobeam.motion_files import write_trimmed_motion_file
+from geobeam.simulation_log import SimulationLogWriter
+from geobeam.telemetry import TelemetryReader
 from tools import kbhit
 
-KEYBOARD = kbhit.KBHit()
-ONE_SEC = 1
+# created by get_keyboard on first use, as it switches the terminal to unbuffered input
+KEYBOARD = None
+DEFAULT_TEARDOWN_TIMEOUT = 1.0  # seconds to wait before escalating quit -> terminate -> kill
+BLADEGPS_DIRECTORY = "./bladeGPS"
+SIMULATION_LOG_DIRECTORY = "simulation_logs/"
+# where trimmed copies of motion files are written for runs resumed mid-route
+RESUME_FILE_DIRECTORY = os.path.join(tempfile.gettempdir(), "geobeam_resume")
+# where the motion files of fused simulations are written
+FUSED_FILE_DIRECTORY = os.path.join(tempfile.gettempdir(), "geobeam_fused")
+# extra time given to bladeGPS to honour its own run duration before it is quit
+RUN_DURATION_GRACE = 5  # seconds
+# seconds between checks of the keyboard where stdin can't be watched, and of
+# the current bladeGPS process while SimulationSet.run_simulations waits for a key
+KEYBOARD_POLL_INTERVAL = 0.1
+# exit codes of HeadlessSimulationSetRunner.run
+EXIT_SUCCESS = 0
+EXIT_SIMULATION_FAILED = 1
+# default bladeGPS option selecting the bladeRF board by its device identifier.
+# Upstream bladeGPS always opens the first board found; builds that can pick
+# one differ in the option they take, so SimulationSetBuilder.set_device can
+# be given another
+DEVICE_OPTION = "-D"
+# run directly with a cached ephemeris file instead of through
+# run_bladerfGPS.sh, which downloads the file on every launch
+BLADEGPS_BINARY = "./bladegps"
+EPHEMERIS_OPTION = "-e"
+
+# runner metrics, labelled by device, exported with metrics.MetricsFileWriter
+# or metrics.MetricsServer
+METRICS = MetricsRegistry()
+SIMULATIONS_STARTED = METRICS.counter("geobeam_simulations_started_total",
+                                      "bladeGPS processes started, by simulation type.")
+SIMULATION_RESTARTS = METRICS.counter("geobeam_simulation_restarts_total",
+                                      "Simulations started again after an earlier run.")
+SIMULATION_FAILURES = METRICS.counter("geobeam_simulation_failures_total",
+                                      "bladeGPS processes that exited on their own with an error.")
+TEARDOWN_ESCALATIONS = METRICS.counter("geobeam_teardown_escalations_total",
+                                       "bladeGPS processes that did not quit in time, by the "
+                                       "step (terminate or kill) they were ended with.")
+UNDERRUNS = METRICS.counter("geobeam_underruns_total", "TX underruns reported by bladeGPS.")
+SIMULATION_DURATION = METRICS.histogram("geobeam_simulation_duration_seconds",
+                                        "Time each simulation ran for.")
+SWITCH_LATENCY = METRICS.histogram("geobeam_switch_latency_seconds",
+                                   "Time from starting to end a simulation until the next "
+                                   "bladeGPS process was launched.")
+COMMAND_LATENCY = METRICS.histogram("geobeam_command_latency_seconds",
+                                    "Time from a control command being issued until it took "
+                                    "effect, by command.")
 
 
 class Simulation():
@@ -51,37 +129,261 @@ class Simulation():
     self._process = None
     self._start_time = None
     self._end_time = None
+    self._start_monotonic = None
+    self._end_monotonic = None
+    self._prepared_command = None
+    self._telemetry_listeners = []
+    self._device = None
+    self._device_option = DEVICE_OPTION
+    self._return_code = None
+    self._stopped = False
+    self._scheduling = None
+    self._telemetry = None
+    self._ephemeris_cache = None
+    self._preparation_error = None
+
+  def prepare(self):
+    """Does the work needed before launch so run_simulation only starts bladeGPS.
+
+    Stages the launch command. Subclasses extend this to pre-read and check
+    their inputs. The staged command is used by the next run_simulation call.
+
+    Raises:
+      ValueError: if the simulation inputs are invalid
+    """
+    self._prepared_command = build_bladeGPS_command(**self.get_process_arguments())
+    self._preparation_error = None
+
+  def set_preparation_error(self, error):
+    """Marks the simulation as failed, so it is skipped instead of launched.
+
+    The mark is cleared by the next prepare call that succeeds.
+
+    Args:
+      error: exception the last prepare call raised
+    """
+    self._prepared_command = None
+    self._preparation_error = error
 
   def run_simulation(self):
     """Starts bladeGPS subprocess using given simulation process arguments.
     """
+    if self._start_time:
+      SIMULATION_RESTARTS.inc(device=self._device or "")
     self._start_time = datetime.datetime.utcnow()
-    self._process = create_bladeGPS_process(run_duration=self._run_duration, gain=self._gain)
+    self._start_monotonic = time.monotonic()
+    if self._preparation_error:
+      # bladeGPS would be handed inputs already known to be bad
+      print("\nSkipping simulation %s: %s" % (self, self._preparation_error))
+      self._process = None
+      self._telemetry = None
+      return
+    if self._prepared_command:
+      self._process = start_bladeGPS_process(self._prepared_command,
+                                             scheduling=self._scheduling)
+      self._prepared_command = None
+    else:
+      self._process = create_bladeGPS_process(scheduling=self._scheduling,
+                                              **self.get_process_arguments())
+    SIMULATIONS_STARTED.inc(device=self._device or "", simulation_type=self.__class__.__name__)
+    self._telemetry = self._process.telemetry
+    for callback in self._telemetry_listeners:
+      self._telemetry.add_listener(callback)
+    return
+
+  def add_telemetry_listener(self, callback):
+    """Calls callback with every status event bladeGPS reports while running.
+
+    The callback runs on a thread of its own for each run, so a slow
+    callback never holds up bladeGPS.
+
+    Args:
+      callback: callable taking a telemetry.TelemetryEvent
+    """
+    self._telemetry_listeners.append(callback)
+
+  def iter_telemetry(self):
+    """Iterates over the status events of the current run until bladeGPS exits.
+
+    Yields:
+      telemetry.TelemetryEvents, starting with the recent events already read
+    """
+    if not self._process:
+      return
+    yield from self._process.telemetry.events()
+
+  def get_telemetry_status(self):
+    """Gets the latest progress reported by bladeGPS for the current run.
+
+    Returns:
+      dict with elapsed_seconds, satellite_count and underruns, or None if
+      the simulation isn't running
+    """
+    if not self._process:
+      return None
+    return dict(self._process.telemetry.status)
+
+  def get_process_arguments(self):
+    """Gets the keyword arguments used to launch this simulation.
+
+    Returns:
+      dict of keyword arguments for create_bladeGPS_process
+    """
+    process_arguments = {"run_duration": self._run_duration, "gain": self._gain}
+    if self._device:
+      process_arguments["device"] = self._device
+      process_arguments["device_option"] = self._device_option
+    if self._ephemeris_cache:
+      ephemeris_file_path = self._ephemeris_cache.find_ephemeris()
+      if ephemeris_file_path:
+        process_arguments["ephemeris_file_path"] = ephemeris_file_path
+    return process_arguments
+
+  def set_scheduling(self, scheduling):
+    """Sets the CPU affinity and priority bladeGPS is run with.
+
+    Args:
+      scheduling: process_scheduling.ProcessScheduling, or None for the
+      defaults
+    """
+    self._scheduling = scheduling
+
+  def set_device(self, device, device_option=DEVICE_OPTION):
+    """Sets the bladeRF board this simulation is broadcast from.
+
+    Args:
+      device: string, bladeRF device identifier, or None for the first board
+      found
+      device_option: string, bladeGPS option the identifier is passed with
+    """
+    self._device = device
+    self._device_option = device_option
+
+  def set_ephemeris_cache(self, ephemeris_cache):
+    """Sets where the ephemeris file bladeGPS is given is looked up.
+
+    Args:
+      ephemeris_cache: ephemeris.EphemerisCache, or None to have
+      run_bladerfGPS.sh download the file on launch
+    """
+    self._ephemeris_cache = ephemeris_cache
+
+  def get_run_duration(self):
+    return self._run_duration
+
+  def get_gain(self):
+    return self._gain
+
+  def save_resume_point(self):
+    """Records where the last run stopped so the next run continues from there.
+
+    Only routes can be resumed, so this does nothing for other simulations.
+    """
     return
 
-  def end_simulation(self):
+  def is_chained(self):
+    """Checks if this simulation continues the one before it in its set.
+
+    Returns:
+      True if it should start as soon as the previous simulation ends
+    """
+    return False
+
+  def create_inputs(self):
+    """Creates the inputs that are only made on first use.
+
+    Called during a switch while the current simulation still transmits.
+    Only deferred simulations create anything, so this does nothing for
+    other simulations.
+
+    Raises:
+      OSError, ValueError: if an input can't be created
+    """
+    return
+
+  def release(self):
+    """Frees what prepare set up for a run that never came, when the set ends.
+
+    Only streamed simulations hold anything open while prepared, and only
+    fused simulations write files for the set alone, so this does nothing
+    for other simulations.
+    """
+    return
+
+  async def wait_for_exit(self):
+    """Waits without polling until the bladeGPS subprocess exits.
+
+    Returns:
+      the return code of the subprocess, or None if it was never started
+    """
+    if not self._process:
+      return None
+    return await wait_for_process_exit(self._process)
+
+  def end_simulation(self, teardown_timeout=DEFAULT_TEARDOWN_TIMEOUT):
     """Ends the bladeGPS subprocess.
 
     Checks if the process is still running, and then attempts to quit (via
-    keyboard signal), terminate, and then kill the subprocess in that order
+    keyboard signal), terminate, and then kill the subprocess in that order.
+    Each step waits on the process itself rather than sleeping, so it returns
+    as soon as the process exits and escalates after teardown_timeout seconds.
+
+    Args:
+      teardown_timeout: float, seconds to wait for the process to exit after
+      quitting and after terminating before escalating
     """
     self._end_time = datetime.datetime.utcnow()
-    while self.is_running():
-      self._process.communicate(input="q".encode())
+    self._end_monotonic = time.monotonic()
+    self._stopped = self.is_running()
+    if self._stopped:
       print("Quitting simulation...")
-      time.sleep(ONE_SEC)
-      if self._process.poll() is None:
+      try:
+        self._process.communicate(input="q".encode(), timeout=teardown_timeout)
+      except subprocess.TimeoutExpired:
         print("Terminating subprocess...")
+        TEARDOWN_ESCALATIONS.inc(device=self._device or "", step="terminate")
         self._process.terminate()
-        time.sleep(ONE_SEC)
-      if self._process.poll() is None:
-        print("Killing subprocess...")
-        self._process.kill()
-        time.sleep(ONE_SEC)
+        try:
+          self._process.wait(timeout=teardown_timeout)
+        except subprocess.TimeoutExpired:
+          print("Killing subprocess...")
+          TEARDOWN_ESCALATIONS.inc(device=self._device or "", step="kill")
+          self._process.kill()
+          self._process.wait()
+    self._return_code = self._process.returncode if self._process else None
     self._process = None
+    if self._telemetry:
+      # let the reader count what bladeGPS reported before it exited
+      self._telemetry.join(teardown_timeout)
+    self._record_metrics()
     print("Subprocess closed.")
     print("------------------------------------------------")
 
+  def _record_metrics(self):
+    """Adds the run that just ended to the runner metrics."""
+    device = self._device or ""
+    if self._start_time:
+      SIMULATION_DURATION.observe(self._get_elapsed_seconds(), device=device)
+    if self.has_failed():
+      SIMULATION_FAILURES.inc(device=device)
+    if self._telemetry:
+      UNDERRUNS.inc(self._telemetry.status["underruns"], device=device)
+
+  def has_failed(self):
+    """Checks if bladeGPS exited with an error on its own in the last run.
+
+    Returns:
+      True if it was skipped because it failed preparation, or if the
+      process ended before it was stopped with a non zero return code, False
+      otherwise
+    """
+    if self._preparation_error:
+      return True
+    return not self._stopped and self._return_code not in (None, 0)
+
+  def get_return_code(self):
+    return self._return_code
+
   def is_running(self):
     """Checks if there is bladeGPS subprocess currently running.
 
@@ -90,23 +392,30 @@ class Simulation():
     """
     return bool(self._process and self._process.poll() is None)
 
-  def log_run(self, log_file_object):
-    """Log start time, end time, type of simulation, and points.
-
-    Logs timestamped file to open file_object with Simulation object string,
-    start time, and end time
+  def get_log_record(self):
+    """Gets the log record for the last run of this simulation.
 
-    Args:
-      log_file_object: open file object to write to
+    Returns:
+      dict with the type of simulation, its arguments, and its start and
+      end time
     """
-    start_time_string = self._start_time.isoformat()
-    end_time_string = self._end_time.isoformat()
-    fields = ["simulation_type", "run_duration", "gain", "start_time", "end_time"]
-    values = [self.__class__.__name__, self._run_duration, self._gain, start_time_string, end_time_string]
-    log_file_object.write("\n")
-    csvwriter = csv.writer(log_file_object, delimiter=",")
-    csvwriter.writerow(fields)
-    csvwriter.writerow(values)
+    log_record = {"event": "simulation",
+                  "simulation_type": self.__class__.__name__,
+                  "run_duration": self._run_duration,
+                  "gain": self._gain,
+                  "start_time": self._start_time.isoformat(),
+                  "end_time": self._end_time.isoformat(),
+                  "return_code": self._return_code,
+                  "telemetry": dict(self._telemetry.status) if self._telemetry else None}
+    if self._preparation_error:
+      log_record["preparation_error"] = str(self._preparation_error)
+    return log_record
+
+  def _get_elapsed_seconds(self):
+    """Seconds between start and end of the last run, from the monotonic clock if recorded."""
+    if self._start_monotonic is not None and self._end_monotonic is not None:
+      return self._end_monotonic - self._start_monotonic
+    return (self._end_time-self._start_time).total_seconds()
 
   def __repr__(self):
     return "Simulation(run_duration=%s, gain=%s)" % (self._run_duration, self._gain)
@@ -130,34 +439,30 @@ class StaticSimulation(Simulation):
     self._latitude = latitude
     self._longitude = longitude
 
-  def run_simulation(self):
-    """Starts bladeGPS subprocess using given simulation process arguments.
+  def get_process_arguments(self):
+    """Gets the keyword arguments used to launch this simulation.
+
+    Returns:
+      dict of keyword arguments for create_bladeGPS_process
     """
-    self._start_time = datetime.datetime.utcnow()
-    location = "%s,%s" % (self._latitude, self._longitude)
-    self._process = create_bladeGPS_process(run_duration=self._run_duration,
-                                            gain=self._gain,
-                                            location=location)
-    return
+    process_arguments = Simulation.get_process_arguments(self)
+    process_arguments["location"] = "%s,%s" % (self._latitude, self._longitude)
+    return process_arguments
 
-  def log_run(self, log_file_object):
-    """Log start time, end time, type of simulation, and points.
+  def get_location(self):
+    return (self._latitude, self._longitude)
 
-    Logs timestamped file to open file_object with Simulation object string,
-    start time, and end time
+  def get_log_record(self):
+    """Gets the log record for the last run of this simulation.
 
-    Args:
-      log_file_object: open file object to write to
-    """
-    start_time_string = self._start_time.isoformat()
-    end_time_string = self._end_time.isoformat()
-    fields = ["simulation_type", "latitude", "longitude", "run_duration", "gain", "start_time", "end_time"]
-    values = [self.__class__.__name__, self._latitude, self._longitude,
-              self._run_duration, self._gain, start_time_string, end_time_string]
-    log_file_object.write("\n")
-    csvwriter = csv.writer(log_file_object, delimiter=",")
-    csvwriter.writerow(fields)
-    csvwriter.writerow(values)
+    Returns:
+      dict with the type of simulation, its location and arguments, and its
+      start and end time
+    """
+    log_record = Simulation.get_log_record(self)
+    log_record["latitude"] = self._latitude
+    log_record["longitude"] = self._longitude
+    return log_record
 
   def __repr__(self):
     return "StaticSimulation(latitude=%s, longitude=%s, run_duration=%s, gain=%s)" % (self._latitude,
@@ -171,7 +476,8 @@ class DynamicSimulation(Simulation):
 
   """
 
-  def __init__(self, file_path, run_duration=None, gain=None):
+  def __init__(self, file_path, run_duration=None, gain=None, start_offset=0,
+               chained=False):
     """An object for a single GPS Simulation for a static location.
 
     Args:
@@ -179,53 +485,419 @@ class DynamicSimulation(Simulation):
       gain: float, signal gain for the broadcast by bladeRF board
       file_path: absolute file path to user motion csv file for
       dynamic route simulation
+      start_offset: float, seconds into the route to start the simulation at
+      chained: bool, whether the motion file is the next segment of the route
+      played by the previous simulation
     """
     Simulation.__init__(self, run_duration, gain)
     self._file_path = file_path
+    self._start_offset = start_offset
+    self._chained = chained
+
+  def is_chained(self):
+    return self._chained
+
+  def set_start_offset(self, start_offset):
+    """Sets how far into the route the next run starts.
+
+    Args:
+      start_offset: float, seconds from the start of the motion file
+    """
+    self._start_offset = start_offset
+
+  def get_start_offset(self):
+    return self._start_offset
+
+  def get_file_path(self):
+    return self._file_path
+
+  def save_resume_point(self):
+    """Makes the next run continue the route where the last run stopped.
+
+    Starts over from the beginning once the whole route has been played.
+    """
+    rate = get_motion_file_rate(self._file_path)
+    resume_row = self._get_start_row() + int(self._get_elapsed_seconds()*rate)
+    # only reads up to the resume row, as this runs while switching
+    if not has_motion_file_row(self._file_path, resume_row):
+      resume_row = 0
+    self._start_offset = resume_row/rate
+
+  def prepare(self):
+    """Reads and validates the motion file and stages the launch command.
+
+    For a run that starts mid-route, the trimmed copy bladeGPS plays is
+    written here too.
+
+    Raises:
+      ValueError: if the user motion file can't be played by bladeGPS
+    """
+    validate_motion_file(self._file_path)
+    self._write_playback_file()
+    Simulation.prepare(self)
 
   def run_simulation(self):
-    """Starts bladeGPS subprocess using simulation process arguments.
+    """Starts bladeGPS, first writing the file it plays if it wasn't prepared."""
+    if not self._prepared_command and not self._preparation_error:
+      self._write_playback_file()
+    Simulation.run_simulation(self)
+
+  def get_process_arguments(self):
+    """Gets the keyword arguments used to launch this simulation.
+
+    Nothing is written: for a run that starts mid-route, the file path is
+    that of the trimmed copy written by prepare or run_simulation.
+
+    Returns:
+      dict of keyword arguments for create_bladeGPS_process
     """
-    self._start_time = datetime.datetime.utcnow()
-    self._process = create_bladeGPS_process(run_duration=self._run_duration,
-                                            gain=self._gain,
-                                            dynamic_file_path=self._file_path)
-    return
+    process_arguments = Simulation.get_process_arguments(self)
+    process_arguments["dynamic_file_path"] = self._get_playback_file_path()
+    return process_arguments
+
+  def _get_start_row(self):
+    if not self._start_offset:
+      return 0
+    return int(round(self._start_offset*get_motion_file_rate(self._file_path)))
+
+  def _get_playback_file_path(self):
+    """Gets the motion file bladeGPS should play for the current start offset.
+
+    Returns:
+      path to the motion file to pass to bladeGPS, a re-timed copy in
+      RESUME_FILE_DIRECTORY for a non zero start offset
+    """
+    start_row = self._get_start_row()
+    if not start_row:
+      return self._file_path
+    file_name = os.path.splitext(os.path.basename(self._file_path))[0]
+    return os.path.join(RESUME_FILE_DIRECTORY, "%s_from_row_%d.csv" % (file_name, start_row))
+
+  def _write_playback_file(self):
+    """Writes the rows from the start offset on to the playback file, if it is a copy.
+
+    The motion file's sidecar index is used to seek straight to the first
+    row, so this takes time in proportion to the remaining rows only.
+    """
+    start_row = self._get_start_row()
+    if not start_row:
+      return
+    os.makedirs(RESUME_FILE_DIRECTORY, exist_ok=True)
+    write_trimmed_motion_file(self._file_path, start_row, self._get_playback_file_path())
+
+  def get_log_record(self):
+    """Gets the log record for the last run of this simulation.
+
+    Besides the simulation arguments and start and end time, the record
+    references the segment of the user motion file played in that time
+    frame by the file's sha256 digest and the start and end row indices,
+    which read_played_segment can turn back into rows. The reference is
+    resolved by the log writer, not by the caller.
+
+    Returns:
+      dict describing the run
+    """
+    log_record = Simulation.get_log_record(self)
+    log_record["file_path"] = self._file_path
+    log_record["start_offset"] = self._start_offset
+    log_record["motion_file"] = MotionFileReference(self._file_path,
+                                                    self._get_start_row(),
+                                                    self._get_elapsed_seconds())
+    return log_record
+
+  def __repr__(self):
+    return "DynamicSimulation(file_path=%s, run_duration=%s, gain=%s, start_offset=%s, chained=%s)" % (
+        self._file_path, self._run_duration, self._gain, self._start_offset, self._chained)
 
-  def log_run(self, log_file_object):
-    """Log start time, end time, type of simulation, and points.
 
-    Logs timestamped file to open file_object with Simulation object string,
-    start and end time, and copy of the corresponding lines for that time frame
-    from the user motion file used as input
+class DeferredDynamicSimulation(DynamicSimulation):
+  """A Dynamic Simulation whose motion file is created just before its first use.
+
+  The file is created when the simulation is first prepared or launched,
+  not when it is built, so a set of many simulations starts without waiting
+  for all of their files. Simulations playing the same file share one
+  create_file callable, which writes it once.
+  """
+
+  def __init__(self, create_file, run_duration=None, gain=None, start_offset=0):
+    """Initialize Deferred Dynamic Simulation.
 
     Args:
-      log_file_object: open file object to write log to
-    """
-    start_time_string = self._start_time.isoformat()
-    end_time_string = self._end_time.isoformat()
-    fields = ["simulation_type", "file_path", "run_duration", "gain", "start_time", "end_time"]
-    values = [self.__class__.__name__, self._file_path, self._run_duration,
-              self._gain, start_time_string, end_time_string]
-    log_file_object.write("\n")
-    csvwriter = csv.writer(log_file_object, delimiter=",")
-    csvwriter.writerow(fields)
-    csvwriter.writerow(values)
-
-    csvwriter.writerow(["time_from_zero", "x", "y", "z"])
-    total_time = (self._end_time-self._start_time).total_seconds()
-    route_file_path = self._file_path
-    with open(route_file_path, "r") as route_file:
-      lines_to_read = int(total_time*10)  # 10 points per second
-      for _ in range(lines_to_read):
-        try:
-          log_file_object.write(next(route_file))
-        except StopIteration:
-          # reached end of source file
-          break
+      create_file: callable creating the user motion csv file if it doesn't
+      exist yet and returning its absolute path
+      run_duration: int, simulation duration in seconds
+      gain: float, signal gain for the broadcast by bladeRF board
+      start_offset: float, seconds into the route to start the simulation at
+    """
+    DynamicSimulation.__init__(self, None, run_duration, gain, start_offset)
+    self._create_file = create_file
+    self._creation_error = None
+
+  def get_file_path(self):
+    """Gets the path of the motion file, creating the file on first use.
+
+    Raises:
+      OSError, ValueError: if the file can't be created. It is created again
+      on the next call
+    """
+    if self._file_path is None:
+      try:
+        self._file_path = str(self._create_file())
+      except (OSError, ValueError) as err:
+        self._creation_error = err
+        raise
+      self._creation_error = None
+    return self._file_path
+
+  def create_inputs(self):
+    """Creates the motion file if it wasn't created yet.
+
+    A simulation marked by a failed creation is cleared once the file is
+    created, as nothing else was checked yet.
+    """
+    if self._file_path is None:
+      self.get_file_path()
+      self._preparation_error = None
+
+  def prepare(self):
+    """Creates the motion file if needed, then validates it and stages the launch."""
+    self.get_file_path()
+    DynamicSimulation.prepare(self)
+
+  def _write_playback_file(self):
+    self.get_file_path()
+    DynamicSimulation._write_playback_file(self)
+
+  def get_process_arguments(self):
+    """Gets the keyword arguments used to launch this simulation.
+
+    Returns:
+      dict of keyword arguments for create_bladeGPS_process
+    """
+    self.get_file_path()
+    return DynamicSimulation.get_process_arguments(self)
+
+  def get_log_record(self):
+    """Gets the log record for the last run of this simulation.
+
+    Returns:
+      dict describing the run as for a dynamic simulation. If the motion file
+      couldn't be created, motion_file is None and creation_error tells why
+    """
+    if self._file_path is not None:
+      return DynamicSimulation.get_log_record(self)
+    log_record = Simulation.get_log_record(self)
+    log_record["file_path"] = None
+    log_record["start_offset"] = self._start_offset
+    log_record["motion_file"] = None
+    if self._creation_error:
+      log_record["creation_error"] = str(self._creation_error)
+    return log_record
+
+  def __repr__(self):
+    return "DeferredDynamicSimulation(file_path=%s, run_duration=%s, gain=%s, start_offset=%s)" % (
+        self._file_path, self._run_duration, self._gain, self._start_offset)
+
+
+class StreamedDynamicSimulation(Simulation):
+  """An object for a GPS Simulation of a dynamic route streamed to bladeGPS.
+
+  Instead of reading a motion file written beforehand, bladeGPS reads the
+  route from a named pipe that a MotionFileStream fills as rows are
+  generated, so the route doesn't need to be written out before the run and
+  takes no disk space however long it is.
+  """
+
+  def __init__(self, row_source, run_duration=None, gain=None, chained=False):
+    """Initialize Streamed Dynamic Simulation.
+
+    Args:
+      row_source: callable returning a new iterable of (time, x, y, z) rows
+      for every run, such as StreamedTimedRoute.iter_timed_rows
+      run_duration: int, simulation duration in seconds
+      gain: float, signal gain for the broadcast by bladeRF board
+      chained: bool, whether the rows are the next segment of the route
+      streamed by the previous simulation
+    """
+    Simulation.__init__(self, run_duration, gain)
+    self._row_source = row_source
+    self._chained = chained
+    self._stream = None
+    self._rows_streamed = None
+
+  def is_chained(self):
+    return self._chained
+
+  def get_process_arguments(self):
+    """Gets the keyword arguments used to launch this simulation.
+
+    Opens the stream for the next run if it isn't open yet.
+
+    Returns:
+      dict of keyword arguments for create_bladeGPS_process
+    """
+    process_arguments = Simulation.get_process_arguments(self)
+    process_arguments["dynamic_file_path"] = self._open_stream()
+    return process_arguments
+
+  def end_simulation(self, teardown_timeout=DEFAULT_TEARDOWN_TIMEOUT):
+    """Ends the bladeGPS subprocess and closes the stream feeding it.
+
+    Args:
+      teardown_timeout: float, seconds to wait for the process to exit after
+      quitting and after terminating before escalating
+    """
+    Simulation.end_simulation(self, teardown_timeout)
+    self._close_stream()
+
+  def release(self):
+    """Closes the stream a prefetch opened for a run that never came.
+
+    The producer thread would otherwise wait on the named pipe for a reader
+    until geobeam exits, and its temporary directory would be left behind.
+    """
+    if not self.is_running():
+      self._prepared_command = None
+      self._close_stream()
+
+  def _open_stream(self):
+    if not self._stream:
+      self._stream = MotionFileStream(self._row_source())
+    return self._stream.open()
+
+  def _close_stream(self):
+    if self._stream:
+      self._rows_streamed = self._stream.rows_written
+      self._stream.close()
+      self._stream = None
+
+  def get_log_record(self):
+    """Gets the log record for the last run of this simulation.
+
+    Returns:
+      dict with the simulation arguments, its start and end time, and the
+      number of rows streamed to bladeGPS
+    """
+    log_record = Simulation.get_log_record(self)
+    log_record["rows_streamed"] = self._rows_streamed
+    return log_record
 
   def __repr__(self):
-    return "DynamicSimulation(file_path=%s, run_duration=%s, gain=%s)" % (self._file_path, self._run_duration, self._gain)
+    return "StreamedDynamicSimulation(row_source=%s, run_duration=%s, gain=%s, chained=%s)" % (
+        self._row_source, self._run_duration, self._gain, self._chained)
+
+
+class FusedSimulation(DynamicSimulation):
+  """Consecutive simulations played by a single bladeGPS process.
+
+  The simulations are written into one motion file: a static simulation
+  becomes a segment dwelling at its location for its run duration, and a
+  dynamic simulation is copied in from its start offset for its run
+  duration. Positions are either jumped between or joined by a straight
+  transit, so a sweep over many positions pays for one bladeGPS start and
+  ephemeris load instead of one each.
+  """
+
+  def __init__(self, segments, gain=None, transit_speed=None):
+    """Initialize Fused Simulation and write its motion file.
+
+    Args:
+      segments: list of (simulation, positions) pairs in playing order, the
+      positions being what _get_fused_positions returned for the simulation
+      gain: float, signal gain for the broadcast by bladeRF board
+      transit_speed: float, meters/second to move between positions at, or
+      None to jump to the next position
+    """
+    self._transit_speed = transit_speed
+    self._segments = []
+    parts = []
+    row_count = 0
+    last_position = None
+    for simulation, positions in segments:
+      transit_positions = _get_transit_positions(last_position, positions[0], transit_speed)
+      if transit_positions:
+        self._segments.append(self._describe_segment("transit", row_count,
+                                                     len(transit_positions)))
+        parts.append(transit_positions)
+        row_count += len(transit_positions)
+      segment = self._describe_segment(simulation.__class__.__name__, row_count, len(positions))
+      segment.update(_get_segment_arguments(simulation))
+      self._segments.append(segment)
+      parts.append(positions)
+      row_count += len(positions)
+      last_position = positions[-1]
+    os.makedirs(FUSED_FILE_DIRECTORY, exist_ok=True)
+    file_descriptor, file_path = tempfile.mkstemp(prefix="fused_", suffix=".csv",
+                                                  dir=FUSED_FILE_DIRECTORY)
+    os.close(file_descriptor)
+    write_motion_file(file_path, (position for part in parts for position in part))
+    DynamicSimulation.__init__(self, file_path, row_count/DEFAULT_MOTION_FILE_RATE, gain)
+
+  def release(self):
+    """Removes the fused motion file, its index and playback copy once the set ends.
+
+    The file is written anew for every set built, so it would otherwise be
+    left in FUSED_FILE_DIRECTORY after every run.
+    """
+    if self.is_running():
+      return
+    self._prepared_command = None
+    file_paths = {self._file_path, self._file_path + INDEX_SUFFIX}
+    if os.path.exists(self._file_path):
+      playback_file_path = self._get_playback_file_path()
+      file_paths.update([playback_file_path, playback_file_path + INDEX_SUFFIX])
+    for file_path in file_paths:
+      try:
+        os.remove(file_path)
+      except FileNotFoundError:
+        pass
+
+  def _describe_segment(self, segment_type, start_row, row_count):
+    return {"segment_type": segment_type,
+            "segment_start": start_row/DEFAULT_MOTION_FILE_RATE,
+            "segment_duration": row_count/DEFAULT_MOTION_FILE_RATE}
+
+  def get_segments(self):
+    """Gets the segments of the fused motion file.
+
+    Returns:
+      list of dicts with the type of each segment, its start and duration
+      in seconds from the start of the run and the arguments of the
+      simulation it was fused from. Transits between positions are segments
+      of type transit
+    """
+    return self._segments
+
+  def get_log_record(self):
+    """Gets the log record for the last run of this simulation.
+
+    Besides what is logged for a dynamic simulation, the record lists the
+    segments, each with the time it started and ended in this run if it
+    was reached.
+
+    Returns:
+      dict describing the run
+    """
+    log_record = DynamicSimulation.get_log_record(self)
+    played_seconds = self._get_elapsed_seconds()
+    segments = []
+    for segment in self._segments:
+      segment = dict(segment)
+      segment_start = segment["segment_start"] - self._start_offset
+      if segment_start + segment["segment_duration"] > 0 and segment_start < played_seconds:
+        segment_start = max(segment_start, 0)
+        segment_end = min(segment_start + segment["segment_duration"], played_seconds)
+        segment["start_time"] = (self._start_time
+                                 + datetime.timedelta(seconds=segment_start)).isoformat()
+        segment["end_time"] = (self._start_time
+                               + datetime.timedelta(seconds=segment_end)).isoformat()
+      segments.append(segment)
+    log_record["segments"] = segments
+    return log_record
+
+  def __repr__(self):
+    return "FusedSimulation(segments=%d, run_duration=%s, gain=%s, transit_speed=%s)" % (
+        len(self._segments), self._run_duration, self._gain, self._transit_speed)
 
 
 class SimulationSet():
@@ -233,7 +905,9 @@ class SimulationSet():
 
   """
 
-  def __init__(self, simulations):
+  def __init__(self, simulations, teardown_timeout=DEFAULT_TEARDOWN_TIMEOUT,
+               prefetch=False, resume=False, device=None, scheduling=None,
+               ephemeris_cache=None, device_option=DEVICE_OPTION):
     """An object for a set of GPS simulations (that can be dynamic or static).
 
     Set current_simulation_index to None and create unique log file name
@@ -241,43 +915,101 @@ class SimulationSet():
 
     Args:
       simulations: list of simulation objects in order of desired execution
+      teardown_timeout: float, seconds each teardown step may take before
+      end_simulation escalates to the next one
+      prefetch: bool, whether to prepare the next simulation in the
+      background while the current one runs
+      resume: bool, whether a dynamic simulation that is switched back to
+      continues its route where it was left instead of from the start
+      device: string, bladeRF device identifier every simulation in the set
+      is broadcast from, or None for the first board found. It is also
+      added to the log file name, so sets on different boards log apart
+      scheduling: process_scheduling.ProcessScheduling every bladeGPS process
+      is run with, or None for the defaults. geobeam moves its own threads
+      off the cores it reserves when the set starts
+      ephemeris_cache: ephemeris.EphemerisCache every simulation takes its
+      ephemeris file from, or None to download it on every launch. The cache
+      has to be prefetched before the set runs
+      device_option: string, bladeGPS option the device identifier is
+      passed with
     """
     self._simulations = simulations
+    self._device = device
+    self._scheduling = scheduling
+    for simulation in simulations:
+      if device:
+        simulation.set_device(device, device_option)
+      if scheduling:
+        simulation.set_scheduling(scheduling)
+      if ephemeris_cache:
+        simulation.set_ephemeris_cache(ephemeris_cache)
+    self._teardown_timeout = teardown_timeout
+    self._prefetch = prefetch
+    self._resume = resume
+    self._prefetch_thread = None
     self._current_simulation_index = None
     now = datetime.datetime.utcnow()
-    self._log_filename = now.strftime("GPSSIM-%Y-%m-%d_%H-%M-%S.csv")
+    log_prefix = "GPSSIM-"
+    if device:
+      log_prefix += re.sub(r"[^\w.-]", "_", device) + "-"
+    self._log_filename = now.strftime(log_prefix + "%Y-%m-%d_%H-%M-%S.jsonl")
+    self._log_writer = SimulationLogWriter(SIMULATION_LOG_DIRECTORY + self._log_filename)
 
   def run_simulations(self):
     """Starts simulations and navigates through according to user key press.
 
-    Starts the first simulation, and then continuously checks if the current
-    simulation is running, and switches to the next or previous based on
-    keyboard input. If user presses q or last simulation finishes, it ends
-    the simulation set
+    Starts the first simulation, and then checks if the current simulation is
+    running whenever a key is pressed or KEYBOARD_POLL_INTERVAL has passed,
+    and switches to the next or previous based on keyboard input. If user
+    presses q or last simulation finishes, it ends the simulation set
     """
     print("------------------------------------------------")
     print("Press 'n' to go to next sim, 'p' to go to previous sim, or 'q' to quit")
     print("------------------------------------------------")
 
-    self._switch_simulation(0)
-    while True:
-      current_simulation = self._get_current_simulation()
-      simulation_running = current_simulation.is_running()
-      key_hit = key_pressed()
-      #  quit via "q" press or end of last simulation
-      if (key_hit == "q" or key_hit == "Q" or
-          (not simulation_running and self._current_simulation_index >= len(self._simulations)-1)):
-        current_simulation.end_simulation()
-        self._log_current_simulation()
-        break
-      #  go to next simulation if "n" press or current sim ended
-      elif key_hit == "n" or key_hit == "N" or not simulation_running:
-        self._switch_simulation(self._current_simulation_index+1)
-      # go to previous simulation if "p" press
-      elif key_hit == "p" or key_hit == "P":
-        self._switch_simulation(self._current_simulation_index-1)
+    try:
+      self._switch_simulation(0)
+      while True:
+        current_simulation = self._get_current_simulation()
+        simulation_running = current_simulation.is_running()
+        key_hit = key_pressed()
+        #  quit via "q" press or end of last simulation
+        if (key_hit == "q" or key_hit == "Q" or
+            (not simulation_running and self._current_simulation_index >= len(self._simulations)-1)):
+          current_simulation.end_simulation(self._teardown_timeout)
+          self._log_current_simulation()
+          break
+        #  go to next route if "n" press
+        elif key_hit == "n" or key_hit == "N":
+          self._switch_simulation(self._get_next_route_index())
+        #  go to next simulation (or segment of the route) if current sim ended
+        elif not simulation_running:
+          self._switch_simulation(self._current_simulation_index+1)
+        # go to previous route if "p" press
+        elif key_hit == "p" or key_hit == "P":
+          self._switch_simulation(self._get_previous_route_index())
+        elif key_hit is None:
+          # sleep until a key is pressed rather than spinning on the keyboard
+          wait_for_key(KEYBOARD_POLL_INTERVAL)
+    finally:
+      self._end_set()
+
+  def _end_set(self):
+    """Releases the simulations and closes the log once the set has ended.
+
+    A simulation prefetched for a switch that never came may still hold a
+    stream open, so every simulation is released after the prefetch is done.
+    """
     print("Simulation set ending...")
+    self._wait_for_prefetch()
+    for simulation in self._simulations:
+      simulation.release()
     self._current_simulation_index = None
+    # the writer thread is a daemon, so queued records would be lost on exit
+    self._log_writer.close()
+
+  def get_device(self):
+    return self._device
 
   def _get_current_simulation(self):
     """Gets current simulation object.
@@ -290,40 +1022,611 @@ class SimulationSet():
     else:
       return None
 
+  def _get_next_route_index(self):
+    """Gets the index of the next simulation that doesn't continue the current route.
+
+    Switching by hand skips the remaining segments of a route split by
+    add_dynamic_route, so 'n' steps through routes rather than segments.
+
+    Returns:
+      int, index of the simulation, len(simulations) if there is none
+    """
+    index = self._current_simulation_index + 1
+    while index < len(self._simulations) and self._simulations[index].is_chained():
+      index += 1
+    return index
+
+  def _get_previous_route_index(self):
+    """Gets the index of the first simulation of the route before the current one.
+
+    Returns:
+      int, index of the simulation, -1 if the current route is the first
+    """
+    index = self._current_simulation_index
+    # back to the first segment of the current route, then to the one before it
+    while index > 0 and self._simulations[index].is_chained():
+      index -= 1
+    index -= 1
+    while index > 0 and self._simulations[index].is_chained():
+      index -= 1
+    return index
+
   def _switch_simulation(self, new_simulation_index):
     """Switch to another simulation from the current simulation.
 
-    Ends and logs current simulation, and then begins the new simulation
-    and updates current simulation attributes
+    Ends the current simulation, begins the new simulation and then logs the
+    ended simulation and the measured switch latency, so no log I/O happens
+    while nothing is being transmitted. Finally updates current simulation
+    attributes.
 
     Args:
       new_simulation_index: int for index desired simulation to be run
     """
     if new_simulation_index < len(self._simulations) and new_simulation_index >= 0:
+      switch_start = time.monotonic()
       current_simulation = self._get_current_simulation()
-      if (current_simulation):
-        current_simulation.end_simulation()
-        self._log_current_simulation()
+      if not current_simulation and self._scheduling:
+        self._scheduling.isolate_current_process()
       new_simulation = self._simulations[new_simulation_index]
+      self._wait_for_prefetch()
+      # a deferred motion file that wasn't prefetched is created while the
+      # current simulation still transmits
+      _create_simulation_inputs(new_simulation)
+      if (current_simulation):
+        current_simulation.end_simulation(self._teardown_timeout)
       new_simulation.run_simulation()
+      switch_latency = time.monotonic() - switch_start
+      if (current_simulation):
+        self._log_current_simulation()
+        if self._resume:
+          current_simulation.save_resume_point()
+      self._log_transition(self._current_simulation_index, new_simulation_index,
+                           switch_latency)
       self._current_simulation_index = new_simulation_index
+      if new_simulation_index+1 < len(self._simulations):
+        next_simulation = self._simulations[new_simulation_index+1]
+        # segments of a chained route are always prepared to keep the gap short
+        if self._prefetch or next_simulation.is_chained():
+          self._start_prefetch(next_simulation)
     elif new_simulation_index < 0:
       print("\nAlready on first simulation")
     else:
       print("\nAlready on last simulation")
 
+  def _start_prefetch(self, simulation):
+    """Prepares a simulation on a background thread.
+
+    Args:
+      simulation: simulation object that is expected to run next
+    """
+    self._prefetch_thread = threading.Thread(target=_prepare_simulation,
+                                             args=(simulation,), daemon=True)
+    self._prefetch_thread.start()
+
+  def _wait_for_prefetch(self):
+    """Waits for a running prefetch so its staged launch is used."""
+    if self._prefetch_thread:
+      self._prefetch_thread.join()
+      self._prefetch_thread = None
+
   def _log_current_simulation(self):
     """Log start time, end time, type of simulation, and points (if dynamic).
 
-    Logs timestamped file to simulation_logs directory with start and end time,
-    whether the simulation was dynamic or static and the initialization arguments.
-    If Dynamic, it copies the corresponding lines for that time frame from
-    the user motion file used as input
+    Queues a record with start and end time, whether the simulation was
+    dynamic or static and the initialization arguments for the timestamped
+    JSON Lines file in the simulation_logs directory. The record is written
+    by a background thread, so this never waits on the disk.
     """
-    log_file_path = "simulation_logs/" + self._log_filename
-    with open(log_file_path, "a") as logfile:
-      current_simulation = self._get_current_simulation()
-      current_simulation.log_run(logfile)
+    current_simulation = self._get_current_simulation()
+    self._log_writer.write(current_simulation.get_log_record())
+
+  def _log_command(self, command, command_latency):
+    """Log how long a command from a controller took to take effect.
+
+    Args:
+      command: string, the command that was issued
+      command_latency: float, seconds from the command being issued until
+      the switch it asked for had completed
+    """
+    COMMAND_LATENCY.observe(command_latency, device=self._device or "", command=command)
+    self._log_writer.write({"event": "command",
+                            "command": command,
+                            "command_latency": command_latency})
+
+  def _log_transition(self, from_index, to_index, switch_latency):
+    """Log how long switching between two simulations took.
+
+    Args:
+      from_index: int, index of the simulation that was ended, None if the set
+      was just started
+      to_index: int, index of the simulation that was started
+      switch_latency: float, seconds from starting to end the previous
+      simulation until the new bladeGPS process was launched
+    """
+    SWITCH_LATENCY.observe(switch_latency, device=self._device or "")
+    self._log_writer.write({"event": "switch",
+                            "from_index": from_index,
+                            "to_index": to_index,
+                            "switch_latency": switch_latency})
+
+
+class AsyncSimulationSetRunner():
+  """Event driven runner for a SimulationSet.
+
+  Unlike SimulationSet.run_simulations, the runner never polls. Its control
+  loop sleeps until the current bladeGPS process exits, a key is pressed, one
+  of the awaitable commands is issued, or the run duration of the current
+  simulation (plus RUN_DURATION_GRACE) expires. Blocking work such as ending
+  and logging a simulation runs in the default executor so the event loop
+  stays free for other services it is embedded in.
+
+    Typical usage example:
+    runner = AsyncSimulationSetRunner(simulation_set)
+    await runner.start()
+    await runner.next()
+    await runner.stop()
+  """
+
+  NEXT = "next"
+  PREVIOUS = "previous"
+  JUMP = "jump"
+  STOP = "stop"
+  _ADVANCE = "advance"  # current simulation finished on its own
+  _KEY_COMMANDS = {"n": NEXT, "p": PREVIOUS, "q": STOP}
+
+  def __init__(self, simulation_set, interactive=True):
+    """Initialize runner for a simulation set.
+
+    Args:
+      simulation_set: SimulationSet object to run
+      interactive: bool, whether to listen for 'n', 'p' and 'q' key presses
+    """
+    self._simulation_set = simulation_set
+    self._interactive = interactive
+    self._commands = None
+    self._control_task = None
+    self._keyboard_listener = None
+    self._deadline = None
+
+  async def start(self):
+    """Starts the first simulation and the control loop."""
+    if self._control_task:
+      return
+    self._commands = asyncio.Queue()
+    if self._interactive:
+      print("------------------------------------------------")
+      print("Press 'n' to go to next sim, 'p' to go to previous sim, or 'q' to quit")
+      print("------------------------------------------------")
+    await self._switch_simulation(0)
+    if self._interactive:
+      self._start_keyboard_listener()
+    self._control_task = asyncio.ensure_future(self._control_loop())
+
+  async def next(self):
+    """Switches to the next simulation once the switch has completed.
+
+    Raises:
+      IndexError: if the current simulation is the last one, which then
+      keeps running
+    """
+    await self._send_command(self.NEXT)
+
+  async def previous(self):
+    """Switches to the previous simulation once the switch has completed.
+
+    Raises:
+      IndexError: if the current simulation is the first one, which then
+      keeps running
+    """
+    await self._send_command(self.PREVIOUS)
+
+  async def jump(self, index):
+    """Switches to the simulation at index once the switch has completed.
+
+    Raises:
+      IndexError: if the simulation set has no simulation at index
+    """
+    if not 0 <= index < len(self._simulation_set._simulations):
+      raise IndexError("no simulation at index %s" % index)
+    await self._send_command(self.JUMP, index)
+
+  async def stop(self):
+    """Ends the current simulation and waits for the runner to finish."""
+    if self._control_task and not self._control_task.done():
+      await self._send_command(self.STOP)
+    await self.wait()
+
+  async def wait(self):
+    """Waits until the simulation set has ended."""
+    if self._control_task:
+      await self._control_task
+
+  async def run(self):
+    """Runs the simulation set to completion."""
+    await self.start()
+    await self.wait()
+
+  def is_running(self):
+    """Checks if the control loop is running.
+
+    Returns:
+      True between start and the end of the simulation set, False otherwise
+    """
+    return bool(self._control_task and not self._control_task.done())
+
+  async def execute(self, command, index=None):
+    """Issues a command and measures how long it took to take effect.
+
+    Switches are logged with their latency, from the command being issued
+    until the new bladeGPS process was started.
+
+    Args:
+      command: one of NEXT, PREVIOUS, JUMP or STOP
+      index: int, index of the simulation to switch to for JUMP
+
+    Returns:
+      float, seconds until the command was handled
+
+    Raises:
+      IndexError: if there is no simulation to switch to
+    """
+    command_start = time.monotonic()
+    if command == self.JUMP:
+      await self.jump(index)
+    elif command in (self.NEXT, self.PREVIOUS, self.STOP):
+      # commands are named after the methods that issue them
+      await getattr(self, command)()
+    else:
+      raise ValueError("unknown command: %s" % command)
+    command_latency = time.monotonic() - command_start
+    if command != self.STOP:
+      self._simulation_set._log_command(command, command_latency)
+    return command_latency
+
+  def get_status(self):
+    """Gets the state of the simulation set.
+
+    Returns:
+      dict with the index and description of the current simulation, whether
+      its bladeGPS process is running, its latest telemetry, and the number
+      of simulations in the set
+    """
+    simulation = self._simulation_set._get_current_simulation()
+    status = {"running": self.is_running(),
+              "simulation_count": len(self._simulation_set._simulations),
+              "index": self._simulation_set._current_simulation_index,
+              "simulation": None,
+              "simulation_running": False,
+              "telemetry": None}
+    if simulation:
+      status["simulation"] = repr(simulation)
+      status["simulation_running"] = simulation.is_running()
+      status["telemetry"] = simulation.get_telemetry_status()
+    return status
+
+  async def _send_command(self, command, argument=None):
+    if not self.is_running():
+      raise RuntimeError("simulation set runner is not running")
+    handled = asyncio.get_running_loop().create_future()
+    await self._commands.put((command, argument, handled))
+    await handled
+
+  async def _control_loop(self):
+    try:
+      while True:
+        command, argument, handled = await self._wait_for_event()
+        try:
+          finished = await self._handle_command(command, argument)
+        except IndexError as err:
+          # nothing to switch to, so the current simulation keeps running.
+          # The caller gets a copy, as the traceback of err holds the frame
+          # of this loop and clearing it would close the loop
+          finished = False
+          if handled and not handled.done():
+            handled.set_exception(IndexError(*err.args))
+        finally:
+          if handled and not handled.done():
+            handled.set_result(None)
+        if finished:
+          break
+    finally:
+      self._stop_keyboard_listener()
+      self._fail_pending_commands()
+      await self._run_blocking(self._simulation_set._end_set)
+
+  async def _wait_for_event(self):
+    """Sleeps until a command arrives, the child exits or the timer expires.
+
+    Returns:
+      (command, argument, future) tuple, where future is resolved once the
+      command has been handled (None for events that nobody awaits)
+    """
+    simulation = self._simulation_set._get_current_simulation()
+    exit_task = asyncio.ensure_future(simulation.wait_for_exit())
+    command_task = asyncio.ensure_future(self._commands.get())
+    timeout = None
+    if self._deadline is not None:
+      timeout = max(0, self._deadline - asyncio.get_running_loop().time())
+    done, pending = await asyncio.wait({exit_task, command_task}, timeout=timeout,
+                                       return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+      task.cancel()
+    if command_task in done:
+      return command_task.result()
+    return (self._ADVANCE, None, None)
+
+  async def _handle_command(self, command, argument=None):
+    """Acts on a command.
+
+    Returns:
+      True if the simulation set has ended, False otherwise
+
+    Raises:
+      IndexError: if NEXT or PREVIOUS had no simulation to switch to
+    """
+    index = self._simulation_set._current_simulation_index
+    last_index = len(self._simulation_set._simulations) - 1
+    if command == self.STOP or (command == self._ADVANCE and index >= last_index):
+      await self._run_blocking(self._end_current_simulation)
+      return True
+    if command == self._ADVANCE:
+      await self._switch_simulation(index + 1)
+    elif command == self.NEXT:
+      if not await self._switch_simulation(self._simulation_set._get_next_route_index()):
+        raise IndexError("already on last simulation")
+    elif command == self.PREVIOUS:
+      if not await self._switch_simulation(self._simulation_set._get_previous_route_index()):
+        raise IndexError("already on first simulation")
+    elif command == self.JUMP:
+      await self._switch_simulation(argument)
+    return False
+
+  async def _switch_simulation(self, new_simulation_index):
+    """Switches simulation and restarts the timer of its run duration.
+
+    Returns:
+      True if the simulation was switched, False if there is no simulation
+      at new_simulation_index and the current one keeps running
+    """
+    await self._run_blocking(self._simulation_set._switch_simulation, new_simulation_index)
+    if not 0 <= new_simulation_index < len(self._simulation_set._simulations):
+      # the current simulation keeps what is left of its run duration
+      return False
+    time_limit = self._get_time_limit(self._simulation_set._get_current_simulation())
+    if time_limit is not None:
+      self._deadline = asyncio.get_running_loop().time() + time_limit
+    else:
+      self._deadline = None
+    return True
+
+  def _get_time_limit(self, simulation):
+    """Seconds after which a simulation is ended if it hasn't exited, or None."""
+    run_duration = simulation.get_run_duration()
+    if run_duration:
+      return run_duration + RUN_DURATION_GRACE
+    return None
+
+  def _end_current_simulation(self):
+    self._simulation_set._get_current_simulation().end_simulation(
+        self._simulation_set._teardown_timeout)
+    self._simulation_set._log_current_simulation()
+
+  async def _run_blocking(self, function, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+  def _start_keyboard_listener(self):
+    self._keyboard_listener = _KeyboardListener(self._queue_key_command)
+    self._keyboard_listener.start()
+
+  def _stop_keyboard_listener(self):
+    if self._keyboard_listener:
+      self._keyboard_listener.stop()
+      self._keyboard_listener = None
+
+  def _queue_key_command(self, key):
+    if key and key.lower() in self._KEY_COMMANDS:
+      self._commands.put_nowait((self._KEY_COMMANDS[key.lower()], None, None))
+
+  def _fail_pending_commands(self):
+    while not self._commands.empty():
+      _, _, handled = self._commands.get_nowait()
+      if handled and not handled.done():
+        handled.set_exception(RuntimeError("simulation set runner has stopped"))
+
+
+class HeadlessSimulationSetRunner(AsyncSimulationSetRunner):
+  """Runs a SimulationSet unattended as a timed queue.
+
+  The terminal and keyboard are never touched, so the set can run under cron
+  or in a container without a TTY. Simulations start back to back in order,
+  each running until bladeGPS exits or its run duration (default_run_duration
+  for simulations without one) is over, and run returns an exit code.
+
+    Typical usage example:
+    exit_code = asyncio.run(HeadlessSimulationSetRunner(simulation_set, 600).run())
+  """
+
+  def __init__(self, simulation_set, default_run_duration=None):
+    """Initialize headless runner for a simulation set.
+
+    Args:
+      simulation_set: SimulationSet object to run
+      default_run_duration: float, seconds to run simulations that have no
+      run duration of their own, or None to run them until bladeGPS exits
+    """
+    AsyncSimulationSetRunner.__init__(self, simulation_set, interactive=False)
+    self._default_run_duration = default_run_duration
+
+  async def run(self):
+    """Runs the simulation set to completion.
+
+    Returns:
+      EXIT_SUCCESS if every bladeGPS process ran until it was stopped or
+      exited cleanly, EXIT_SIMULATION_FAILED if any exited with an error
+    """
+    await AsyncSimulationSetRunner.run(self)
+    exit_code = EXIT_SUCCESS
+    for simulation in self._simulation_set._simulations:
+      if simulation.has_failed():
+        print("%s failed with return code %s" % (simulation, simulation.get_return_code()))
+        exit_code = EXIT_SIMULATION_FAILED
+    return exit_code
+
+  def _get_time_limit(self, simulation):
+    time_limit = AsyncSimulationSetRunner._get_time_limit(self, simulation)
+    if time_limit is None:
+      return self._default_run_duration
+    return time_limit
+
+
+class MultiDeviceSimulationRunner():
+  """Runs simulation sets on several bladeRF boards at the same time.
+
+  Each simulation set is bound to its own board (see SimulationSet's device)
+  and runs in an AsyncSimulationSetRunner of its own, so every board steps
+  through its queue independently and writes its own log. All of them share
+  one event loop and one control loop: 'n', 'p' and 'q' key presses, and the
+  awaitable commands without a device, apply to every board still running.
+
+    Typical usage example:
+    runner = MultiDeviceSimulationRunner([simulation_set_1, simulation_set_2])
+    asyncio.run(runner.run())
+  """
+
+  _KEY_COMMANDS = AsyncSimulationSetRunner._KEY_COMMANDS
+
+  def __init__(self, simulation_sets, interactive=True):
+    """Initialize runner for simulation sets on different boards.
+
+    Args:
+      simulation_sets: list of SimulationSet objects, each with a distinct
+      device
+      interactive: bool, whether to listen for 'n', 'p' and 'q' key presses
+
+    Raises:
+      ValueError: if two simulation sets are bound to the same device, or a
+      set without a device, which broadcasts from the first board found, is
+      run alongside sets bound to named boards
+    """
+    devices = [simulation_set.get_device() for simulation_set in simulation_sets]
+    if len(set(devices)) != len(devices):
+      raise ValueError("each simulation set needs its own device, received: %s" % devices)
+    if None in devices and len(devices) > 1:
+      raise ValueError("a simulation set without a device may use the same board as "
+                       "another, received: %s" % devices)
+    self._runners = {simulation_set.get_device(): AsyncSimulationSetRunner(simulation_set,
+                                                                           interactive=False)
+                     for simulation_set in simulation_sets}
+    self._interactive = interactive
+    self._keyboard_listener = None
+    self._started = False
+
+  async def start(self):
+    """Starts the first simulation of every set."""
+    if self._started:
+      return
+    self._started = True
+    if self._interactive:
+      print("------------------------------------------------")
+      print("Press 'n' to go to next sims, 'p' to go to previous sims, or 'q' to quit")
+      print("------------------------------------------------")
+    await asyncio.gather(*(runner.start() for runner in self._runners.values()))
+    if self._interactive:
+      self._keyboard_listener = _KeyboardListener(self._on_key)
+      self._keyboard_listener.start()
+
+  async def next(self, device=None):
+    """Switches to the next simulation on one board, or on all of them."""
+    await self._send_command(AsyncSimulationSetRunner.NEXT, device)
+
+  async def previous(self, device=None):
+    """Switches to the previous simulation on one board, or on all of them."""
+    await self._send_command(AsyncSimulationSetRunner.PREVIOUS, device)
+
+  async def stop(self, device=None):
+    """Ends the simulation sets on one board, or on all of them."""
+    await self._send_command(AsyncSimulationSetRunner.STOP, device)
+    if device is None:
+      await self.wait()
+
+  async def wait(self):
+    """Waits until the simulation sets on every board have ended."""
+    try:
+      await asyncio.gather(*(runner.wait() for runner in self._runners.values()))
+    finally:
+      if self._keyboard_listener:
+        self._keyboard_listener.stop()
+        self._keyboard_listener = None
+
+  async def run(self):
+    """Runs the simulation sets on every board to completion."""
+    await self.start()
+    await self.wait()
+
+  async def _send_command(self, command, device):
+    if device is not None:
+      runners = [self._runners[device]]
+    else:
+      runners = [runner for runner in self._runners.values() if runner.is_running()]
+    # commands are named after the runner methods that issue them, and are
+    # carried out on every board before an error from one of them is raised
+    results = await asyncio.gather(*(getattr(runner, command)() for runner in runners),
+                                   return_exceptions=True)
+    for result in results:
+      if isinstance(result, Exception):
+        raise result
+
+  def _on_key(self, key):
+    if key and key.lower() in self._KEY_COMMANDS:
+      asyncio.ensure_future(self._send_key_command(self._KEY_COMMANDS[key.lower()]))
+
+  async def _send_key_command(self, command):
+    try:
+      await self._send_command(command, None)
+    except IndexError:
+      # boards with nothing to switch to have said so on the terminal
+      pass
+
+
+class _KeyboardListener():
+  """Calls on_key with each key pressed, without blocking the event loop.
+
+  stdin is watched by the running event loop where it supports readers, and
+  polled every KEYBOARD_POLL_INTERVAL seconds elsewhere.
+  """
+
+  def __init__(self, on_key):
+    self._on_key = on_key
+    self._poll_task = None
+    self._reading = False
+
+  def start(self):
+    loop = asyncio.get_running_loop()
+    try:
+      loop.add_reader(sys.stdin.fileno(), self._on_key_press)
+      self._reading = True
+    except (NotImplementedError, ValueError, OSError):
+      # event loops without reader support (e.g. Windows) fall back to polling
+      self._poll_task = asyncio.ensure_future(self._poll_keyboard())
+
+  def stop(self):
+    if self._poll_task:
+      self._poll_task.cancel()
+      self._poll_task = None
+    elif self._reading:
+      try:
+        asyncio.get_running_loop().remove_reader(sys.stdin.fileno())
+      except (NotImplementedError, ValueError, OSError):
+        pass
+      self._reading = False
+
+  def _on_key_press(self):
+    self._on_key(get_keyboard().getch())
+
+  async def _poll_keyboard(self):
+    while True:
+      self._on_key(key_pressed())
+      await asyncio.sleep(KEYBOARD_POLL_INTERVAL)
 
 
 class SimulationSetBuilder():
@@ -335,6 +1638,98 @@ class SimulationSetBuilder():
 
   def __init__(self):
     self._simulations = []
+    self._teardown_timeout = DEFAULT_TEARDOWN_TIMEOUT
+    self._prefetch = False
+    self._resume = False
+    self._device = None
+    self._device_option = DEVICE_OPTION
+    self._scheduling = None
+    self._ephemeris_cache = None
+    self._fuse = False
+    self._fuse_dynamic = False
+    self._transit_speed = None
+
+  def set_teardown_timeout(self, teardown_timeout):
+    """Sets how long each step of ending a simulation may take.
+
+    Returns:
+      self object
+    """
+    self._teardown_timeout = teardown_timeout
+    return self
+
+  def set_prefetch(self, prefetch):
+    """Sets whether the next simulation is prepared while the current one runs.
+
+    Returns:
+      self object
+    """
+    self._prefetch = prefetch
+    return self
+
+  def set_resume(self, resume):
+    """Sets whether routes switched back to continue where they were left.
+
+    Returns:
+      self object
+    """
+    self._resume = resume
+    return self
+
+  def set_device(self, device, device_option=DEVICE_OPTION):
+    """Sets the bladeRF board the simulations are broadcast from.
+
+    Args:
+      device: string, bladeRF device identifier, or None for the first board
+      found
+      device_option: string, bladeGPS option the identifier is passed with
+
+    Returns:
+      self object
+    """
+    self._device = device
+    self._device_option = device_option
+    return self
+
+  def set_scheduling(self, scheduling):
+    """Sets the CPU affinity and priority bladeGPS processes are run with.
+
+    Returns:
+      self object
+    """
+    self._scheduling = scheduling
+    return self
+
+  def set_ephemeris_cache(self, ephemeris_cache):
+    """Sets the local cache the ephemeris files are taken from.
+
+    Returns:
+      self object
+    """
+    self._ephemeris_cache = ephemeris_cache
+    return self
+
+  def set_fuse(self, fuse, fuse_dynamic=False, transit_speed=None):
+    """Sets whether consecutive simulations are fused into one bladeGPS run.
+
+    When set, build joins each run of consecutive static simulations that
+    have a run duration and the same gain into a FusedSimulation, up to the
+    longest motion file bladeGPS can load. Previous, next and jump then move
+    between the fused simulations.
+
+    Args:
+      fuse: bool, whether to fuse static simulations
+      fuse_dynamic: bool, whether to fuse dynamic simulations with them too
+      transit_speed: float, meters/second to move between positions at, or
+      None to jump to the next position
+
+    Returns:
+      self object
+    """
+    self._fuse = fuse
+    self._fuse_dynamic = fuse_dynamic
+    self._transit_speed = transit_speed
+    return self
 
   def add_static_route(self, latitude, longitude, run_duration=None, gain=None):
     """Creates a Static Simulation with correct arguments and adds to list.
@@ -345,13 +1740,79 @@ class SimulationSetBuilder():
     self._simulations.append(StaticSimulation(latitude, longitude, run_duration, gain))
     return self
 
-  def add_dynamic_route(self, file_path, run_duration=None, gain=None):
+  def add_dynamic_route(self, file_path, run_duration=None, gain=None, start_offset=0,
+                        max_segment_duration=None):
     """Creates a Dynamic Simulation with correct arguments and adds to list.
 
+    If max_segment_duration is given and the motion file is longer, the file
+    is split into segments and a chained Dynamic Simulation is added for each
+    one, so the route plays in full back to back. A run_duration then limits
+    the total time across the segments.
+
+    Returns:
+      self object
+    """
+    if not max_segment_duration:
+      self._simulations.append(DynamicSimulation(str(file_path), run_duration, gain,
+                                                 start_offset))
+      return self
+
+    start_row = int(round(start_offset*get_motion_file_rate(str(file_path))))
+    segment_paths = split_motion_file(str(file_path), max_segment_duration, start_row)
+    segment_durations = _get_segment_durations(len(segment_paths), run_duration,
+                                               max_segment_duration)
+    for segment, segment_duration in enumerate(segment_durations):
+      self._simulations.append(DynamicSimulation(segment_paths[segment], segment_duration,
+                                                 gain, chained=segment > 0))
+    return self
+
+  def add_deferred_dynamic_route(self, create_file, run_duration=None, gain=None,
+                                 start_offset=0):
+    """Creates a Deferred Dynamic Simulation with correct arguments and adds to list.
+
+    Args:
+      create_file: callable creating the motion file just before it is
+      first used and returning its absolute path
+
+    Returns:
+      self object
+    """
+    self._simulations.append(DeferredDynamicSimulation(create_file, run_duration, gain,
+                                                       start_offset))
+    return self
+
+  def add_streamed_route(self, row_source, run_duration=None, gain=None,
+                         max_segment_duration=None, row_count=None):
+    """Creates a Streamed Dynamic Simulation with correct arguments and adds to list.
+
+    If max_segment_duration and row_count are given and the route is longer,
+    it is streamed in segments by chained Streamed Dynamic Simulations, as
+    add_dynamic_route does for a motion file.
+
+    Args:
+      row_source: callable returning a new iterable of (time, x, y, z) rows
+      for every run, such as StreamedTimedRoute.iter_timed_rows
+      max_segment_duration: float, longest segment to stream in seconds
+      row_count: int, number of rows row_source generates
+
     Returns:
       self object
     """
-    self._simulations.append(DynamicSimulation(str(file_path), run_duration, gain))
+    rows_per_segment = None
+    if max_segment_duration and row_count:
+      rows_per_segment = get_segment_row_count(max_segment_duration, DEFAULT_MOTION_FILE_RATE)
+    if not rows_per_segment or row_count <= rows_per_segment:
+      self._simulations.append(StreamedDynamicSimulation(row_source, run_duration, gain))
+      return self
+
+    segments = MotionStreamSegments(row_source, rows_per_segment)
+    segment_count = math.ceil(row_count/rows_per_segment)
+    segment_durations = _get_segment_durations(segment_count, run_duration,
+                                               max_segment_duration)
+    for segment, segment_duration in enumerate(segment_durations):
+      self._simulations.append(StreamedDynamicSimulation(
+          functools.partial(segments.iter_segment_rows, segment), segment_duration, gain,
+          chained=segment > 0))
     return self
 
   def build(self):
@@ -360,10 +1821,17 @@ class SimulationSetBuilder():
     Returns:
       A Simulation Set Object instantiated with current list of simulations
     """
-    return SimulationSet(self._simulations)
+    simulations = self._simulations
+    if self._fuse:
+      simulations = _fuse_simulations(simulations, self._fuse_dynamic, self._transit_speed)
+    return SimulationSet(simulations, self._teardown_timeout, self._prefetch,
+                         self._resume, self._device, self._scheduling,
+                         self._ephemeris_cache, self._device_option)
 
 
-def create_bladeGPS_process(run_duration=None, gain=None, location=None, dynamic_file_path=None):
+def create_bladeGPS_process(run_duration=None, gain=None, location=None, dynamic_file_path=None,
+                            device=None, ephemeris_file_path=None,
+                            device_option=DEVICE_OPTION, scheduling=None):
   """Opens and returns the specified bladeGPS process based on arguments.
   Args:
     run_duration: int, time in seconds for how long simulation should run
@@ -371,24 +1839,348 @@ def create_bladeGPS_process(run_duration=None, gain=None, location=None, dynamic
     location: string, "%s,%s" % (latitude, longitude)
     dynamic_file_path: string, absolute file path to user motion csv file for
     dynamic route simulation
+    device: string, bladeRF device identifier of the board to broadcast from
+    ephemeris_file_path: string, absolute path of a RINEX navigation file
+    to run bladeGPS with instead of downloading the day's file
+    device_option: string, bladeGPS option the device identifier is passed with
+    scheduling: ProcessScheduling bladeGPS starts with, or None
   Returns:
     subprocess called with command built from function inputs
   """
-  command = ["./run_bladerfGPS.sh", "-T", "now"]
+  command = build_bladeGPS_command(run_duration=run_duration, gain=gain,
+                                   location=location,
+                                   dynamic_file_path=dynamic_file_path,
+                                   device=device,
+                                   ephemeris_file_path=ephemeris_file_path,
+                                   device_option=device_option)
+  return start_bladeGPS_process(command, scheduling)
+
+
+def start_bladeGPS_process(command, scheduling=None):
+  """Starts bladeGPS with an already built command.
+
+  Args:
+    command: list of command line arguments from build_bladeGPS_command
+    scheduling: ProcessScheduling bladeGPS inherits from the launching
+    thread, or None
+
+  Returns:
+    BladeGPSProcess running the command from the bladeGPS directory, with a
+    started TelemetryReader for its output
+  """
+  def start():
+    return subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, cwd=BLADEGPS_DIRECTORY)
+  popen = scheduling.launch(start) if scheduling else start()
+  # started once the launching thread has its own scheduling back, so the
+  # reader stays off the cores reserved for bladeGPS
+  telemetry = TelemetryReader(popen.stdout, echo=_echo_bladeGPS_output)
+  telemetry.start()
+  return BladeGPSProcess(popen, telemetry)
+
+
+class BladeGPSProcess():
+  """A bladeGPS subprocess and the TelemetryReader draining its output.
+
+  It offers the parts of the subprocess.Popen interface geobeam uses. The
+  reader owns the output pipe, so communicate only writes to stdin and waits
+  instead of reading stdout as Popen.communicate would.
+
+  Attributes:
+    popen: subprocess.Popen object of the process
+    telemetry: started TelemetryReader for the output of the process
+  """
+
+  def __init__(self, popen, telemetry):
+    self.popen = popen
+    self.telemetry = telemetry
+
+  @property
+  def pid(self):
+    return self.popen.pid
+
+  @property
+  def returncode(self):
+    return self.popen.returncode
+
+  def poll(self):
+    return self.popen.poll()
+
+  def wait(self, timeout=None):
+    return self.popen.wait(timeout=timeout)
+
+  def terminate(self):
+    self.popen.terminate()
+
+  def kill(self):
+    self.popen.kill()
+
+  def communicate(self, input=None, timeout=None):
+    """Sends input to bladeGPS, closes its stdin and waits for it to exit.
+
+    Args:
+      input: bytes to write to stdin, or None
+      timeout: float, seconds to wait for the process to exit
+
+    Returns:
+      (None, None), as the output is read by the telemetry reader
+
+    Raises:
+      subprocess.TimeoutExpired: if the process is still running after timeout
+    """
+    stdin = self.popen.stdin
+    if stdin and not stdin.closed:
+      try:
+        if input:
+          stdin.write(input)
+        stdin.close()
+      except BrokenPipeError:
+        # bladeGPS already exited
+        pass
+    self.popen.wait(timeout=timeout)
+    return (None, None)
+
+
+def _echo_bladeGPS_output(chunk):
+  """Shows bladeGPS output on the terminal as it did before it was captured."""
+  sys.stdout.write(chunk.decode("utf-8", "replace"))
+  sys.stdout.flush()
+
+
+def build_bladeGPS_command(run_duration=None, gain=None, location=None, dynamic_file_path=None,
+                           device=None, ephemeris_file_path=None, device_option=DEVICE_OPTION):
+  """Builds the bladeGPS command line for the given arguments.
+
+  Args:
+    run_duration: int, time in seconds for how long simulation should run
+    gain: float, signal gain for the broadcast by bladeRF board
+    location: string, "%s,%s" % (latitude, longitude)
+    dynamic_file_path: string, absolute file path to user motion csv file for
+    dynamic route simulation
+    device: string, bladeRF device identifier of the board to broadcast from
+    ephemeris_file_path: string, absolute path of a RINEX navigation file
+    to run bladeGPS with instead of downloading the day's file
+    device_option: string, bladeGPS option the device identifier is passed with
+  Returns:
+    list of command line arguments
+  """
+  if ephemeris_file_path:
+    command = [BLADEGPS_BINARY, EPHEMERIS_OPTION, ephemeris_file_path, "-T", "now"]
+  else:
+    command = ["./run_bladerfGPS.sh", "-T", "now"]
   if run_duration:
     command.append("-d")
     command.append(str(run_duration))
   if gain:
     command.append("-a")
     command.append(str(gain))
+  if device:
+    command.append(device_option)
+    command.append(device)
   if location:
     command.append("-l")
     command.append(location)
   elif dynamic_file_path:
     command.append("-u")
     command.append(dynamic_file_path)
-  process = subprocess.Popen(command, stdin=subprocess.PIPE, cwd="./bladeGPS")
-  return process
+  return command
+
+
+def _fuse_simulations(simulations, fuse_dynamic=False, transit_speed=None,
+                      max_duration=DEFAULT_MAX_SEGMENT_DURATION):
+  """Replaces runs of consecutive simulations that can be fused with FusedSimulations.
+
+  Args:
+    simulations: list of simulation objects in order of desired execution
+    fuse_dynamic: bool, whether dynamic simulations can be fused
+    transit_speed: float, meters/second to move between positions at, or
+    None to jump to the next position
+    max_duration: float, longest motion file to write in seconds
+
+  Returns:
+    list of simulation objects, with a FusedSimulation in place of each run
+    of two or more simulations that were fused
+  """
+  max_rows = get_segment_row_count(max_duration, DEFAULT_MOTION_FILE_RATE)
+  fused_simulations = []
+  group = []
+  group_rows = 0
+
+  def end_group():
+    if len(group) > 1:
+      fused_simulations.append(FusedSimulation(group, group[0][0].get_gain(), transit_speed))
+    else:
+      fused_simulations.extend(simulation for simulation, _ in group)
+    group.clear()
+
+  for simulation in simulations:
+    positions = _get_fused_positions(simulation, fuse_dynamic)
+    if not positions or len(positions) > max_rows:
+      end_group()
+      fused_simulations.append(simulation)
+      group_rows = 0
+      continue
+    if group:
+      transit_rows = None
+      if simulation.get_gain() == group[0][0].get_gain():
+        transit_rows = _get_transit_row_count(group[-1][1][-1], positions[0], transit_speed)
+      if transit_rows is None or group_rows + transit_rows + len(positions) > max_rows:
+        end_group()
+        group_rows = 0
+      else:
+        group_rows += transit_rows
+    group.append((simulation, positions))
+    group_rows += len(positions)
+  end_group()
+  return fused_simulations
+
+
+def _get_fused_positions(simulation, fuse_dynamic=False):
+  """Gets the positions a simulation adds to a fused motion file.
+
+  Args:
+    simulation: simulation object
+    fuse_dynamic: bool, whether dynamic simulations can be fused
+
+  Returns:
+    list of (x, y, z) tuples at DEFAULT_MOTION_FILE_RATE, None if the
+    simulation can't be fused
+  """
+  run_duration = simulation.get_run_duration()
+  row_count = int(round(run_duration*DEFAULT_MOTION_FILE_RATE)) if run_duration else None
+  if type(simulation) is StaticSimulation:
+    if not row_count:
+      return None
+    return [geodetic_to_cartesian(*simulation.get_location(), 0)]*row_count
+  if fuse_dynamic and type(simulation) is DynamicSimulation:
+    file_path = simulation.get_file_path()
+    if get_motion_file_rate(file_path) != DEFAULT_MOTION_FILE_RATE:
+      return None
+    start_row = int(round(simulation.get_start_offset()*DEFAULT_MOTION_FILE_RATE))
+    if start_row >= get_motion_file_row_count(file_path):
+      return None
+    return read_motion_file_positions(file_path, start_row, row_count)
+  return None
+
+
+def _get_transit_positions(start, end, transit_speed):
+  """Gets the positions of a straight transit between two positions.
+
+  Args:
+    start: (x, y, z) tuple to leave from, or None at the start of the run
+    end: (x, y, z) tuple to arrive at
+    transit_speed: float, meters/second, or None to jump
+
+  Returns:
+    list of (x, y, z) tuples at DEFAULT_MOTION_FILE_RATE, excluding start
+    and end
+  """
+  row_count = _get_transit_row_count(start, end, transit_speed) + 1
+  return [tuple(start_value + (end_value-start_value)*row/row_count
+                for start_value, end_value in zip(start, end))
+          for row in range(1, row_count)]
+
+
+def _get_transit_row_count(start, end, transit_speed):
+  """Gets the number of positions _get_transit_positions returns, without creating them."""
+  if not transit_speed or start is None:
+    return 0
+  return max(int(math.dist(start, end)/transit_speed*DEFAULT_MOTION_FILE_RATE) - 1, 0)
+
+
+def _get_segment_durations(segment_count, run_duration, max_segment_duration):
+  """Run durations of the segments of a route split every max_segment_duration seconds.
+
+  Args:
+    segment_count: int, number of segments of the route
+    run_duration: int, total time to play the route for, or None for all of it
+    max_segment_duration: float, longest segment in seconds
+
+  Returns:
+    list of the run duration of each segment to play, None for a segment
+    played in full, leaving out segments run_duration doesn't reach
+  """
+  segment_durations = []
+  remaining_duration = run_duration
+  for segment in range(segment_count):
+    segment_duration = None
+    if remaining_duration is not None:
+      if remaining_duration <= 0:
+        break
+      if remaining_duration < max_segment_duration:
+        segment_duration = remaining_duration
+      remaining_duration -= max_segment_duration
+    segment_durations.append(segment_duration)
+  return segment_durations
+
+
+def _get_segment_arguments(simulation):
+  """Gets the arguments logged for a simulation fused into a FusedSimulation."""
+  if type(simulation) is StaticSimulation:
+    latitude, longitude = simulation.get_location()
+    return {"latitude": latitude, "longitude": longitude}
+  return {"file_path": simulation.get_file_path(),
+          "start_offset": simulation.get_start_offset()}
+
+
+def _create_simulation_inputs(simulation):
+  """Creates the inputs of a simulation, reporting instead of raising errors.
+
+  A simulation that fails is marked so it is skipped when its turn comes.
+
+  Args:
+    simulation: simulation object to create the inputs of
+  """
+  try:
+    simulation.create_inputs()
+  except (OSError, ValueError) as err:
+    print("\nSimulation %s could not be created: %s" % (simulation, err))
+    simulation.set_preparation_error(err)
+
+
+def _prepare_simulation(simulation):
+  """Prepares a simulation, reporting instead of raising validation errors.
+
+  A simulation that fails is marked so it is skipped when its turn comes.
+
+  Args:
+    simulation: simulation object to prepare
+  """
+  try:
+    simulation.prepare()
+  except (OSError, ValueError) as err:
+    print("\nNext simulation %s failed preparation: %s" % (simulation, err))
+    simulation.set_preparation_error(err)
+
+
+async def wait_for_process_exit(process):
+  """Waits for a subprocess to exit without polling it.
+
+  On Linux the process is watched through a pidfd registered with the running
+  event loop, so nothing runs until the child exits. Elsewhere the blocking
+  wait() is handed to the default executor.
+
+  Args:
+    process: subprocess.Popen object
+
+  Returns:
+    the return code of the process
+  """
+  if process.poll() is not None:
+    return process.returncode
+  loop = asyncio.get_running_loop()
+  try:
+    pidfd = os.pidfd_open(process.pid)
+  except (AttributeError, OSError):
+    return await loop.run_in_executor(None, process.wait)
+  exited = loop.create_future()
+  loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+  try:
+    await exited
+  finally:
+    loop.remove_reader(pidfd)
+    os.close(pidfd)
+  return process.wait()
 
 
 def key_pressed():
@@ -397,8 +2189,39 @@ def key_pressed():
   Returns:
     a character (string) if a key has been pressed, None otherwise
   """
+  keyboard = get_keyboard()
   pressed_char = None
-  if KEYBOARD.kbhit():
-    pressed_char = KEYBOARD.getch()
+  if keyboard.kbhit():
+    pressed_char = keyboard.getch()
   return pressed_char
 
+
+def wait_for_key(timeout):
+  """Blocks until stdin has input or timeout seconds have passed.
+
+  Where stdin can't be waited on (e.g. on Windows or when it isn't a file),
+  this just sleeps for timeout seconds.
+
+  Args:
+    timeout: float, longest time to wait in seconds
+  """
+  try:
+    select.select([sys.stdin], [], [], timeout)
+  except (OSError, ValueError, io.UnsupportedOperation):
+    time.sleep(timeout)
+
+
+def get_keyboard():
+  """Gets the keyboard poller, creating it on first use.
+
+  Creating it sets the terminal to unbuffered input without echo until the
+  program exits, so this is only called in interactive mode.
+
+  Returns:
+    kbhit.KBHit object
+  """
+  global KEYBOARD
+  if KEYBOARD is None:
+    KEYBOARD = kbhit.KBHit()
+  return KEYBOARD
+
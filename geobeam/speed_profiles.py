@@ -0,0 +1,277 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Speed profiles describing how a route is traversed over time.
+
+A speed profile turns the total length of a route into a MotionCurve: a list
+of phases of constant acceleration that together give the distance travelled
+along the route at any point in time. TimedRoute.resample_route samples that
+curve at the output frequency.
+
+  Typical usage example:
+  profile = StopAndGoSpeedProfile(7, stops=[(500, 30)], acceleration=1.5)
+  curve = profile.get_motion_curve(total_distance)
+  distances = curve.get_distances([0.0, 0.1, 0.2])
+"""
+
+import abc
+import bisect
+import math
+
+
+class MotionCurve():
+  """Position along a route as a piecewise quadratic function of time.
+
+  Attributes:
+    start_times: list of floats, time in seconds at which each phase starts
+    start_distances: list of floats, distance in meters at the start of each phase
+    start_speeds: list of floats, speed in meters/second at the start of each phase
+    accelerations: list of floats, constant acceleration of each phase in m/s^2
+    total_time: float, time in seconds at which the route is completed
+    total_distance: float, length of the route in meters
+  """
+
+  def __init__(self, phases):
+    """Accumulate phases into absolute start times and distances.
+
+    Args:
+      phases: list of (start_speed, acceleration, duration) tuples in order
+    """
+    self.start_times = []
+    self.start_distances = []
+    self.start_speeds = []
+    self.accelerations = []
+    time = 0.0
+    distance = 0.0
+    for start_speed, acceleration, duration in phases:
+      if duration <= 0:
+        continue
+      self.start_times.append(time)
+      self.start_distances.append(distance)
+      self.start_speeds.append(start_speed)
+      self.accelerations.append(acceleration)
+      time += duration
+      distance += start_speed*duration + 0.5*acceleration*duration**2
+    self.total_time = time
+    self.total_distance = distance
+
+  def get_distances(self, times):
+    """Evaluate distance along the route for a sorted sequence of times.
+
+    The phase containing each time is found with a bisection that starts from
+    the previous result, so evaluating n sorted times over m phases costs
+    O(n + m) rather than rescanning the phases for every sample. Times past
+    the end of the curve are clamped to the total distance.
+
+    Args:
+      times: sorted sequence of times in seconds
+
+    Returns:
+      list of distances in meters, one per time
+    """
+    return list(self.iter_distances(times))
+
+  def iter_distances(self, times):
+    """Evaluate distance along the route for sorted times as get_distances does.
+
+    Args:
+      times: sorted iterable of times in seconds, consumed lazily
+
+    Yields:
+      distance in meters for each time in turn
+    """
+    phase = 0
+    for time in times:
+      if time >= self.total_time:
+        yield self.total_distance
+        continue
+      phase = bisect.bisect_right(self.start_times, time, lo=phase) - 1
+      phase = max(phase, 0)
+      elapsed = time - self.start_times[phase]
+      yield (self.start_distances[phase]
+             + self.start_speeds[phase]*elapsed
+             + 0.5*self.accelerations[phase]*elapsed**2)
+
+
+class SpeedProfile(abc.ABC):
+  """Base class for speed profiles.
+
+  Subclasses implement _get_phases, returning the list of constant
+  acceleration phases that cover exactly total_distance meters.
+  """
+
+  def get_motion_curve(self, total_distance):
+    """Build the MotionCurve for a route of the given length.
+
+    Args:
+      total_distance: float, length of the route in meters
+
+    Returns:
+      MotionCurve covering the whole route
+    """
+    return MotionCurve(self._get_phases(total_distance))
+
+  @abc.abstractmethod
+  def _get_phases(self, total_distance):
+    """Gets the (start_speed, acceleration, duration) phases covering the route."""
+
+
+class ConstantSpeedProfile(SpeedProfile):
+  """Traverse the route at a single constant speed.
+
+  Attributes:
+    speed: float, speed in meters/second
+  """
+
+  def __init__(self, speed):
+    _check_positive("speed", speed)
+    self.speed = speed
+
+  def _get_phases(self, total_distance):
+    return [(self.speed, 0.0, total_distance/self.speed)]
+
+  def __repr__(self):
+    return "ConstantSpeedProfile(speed=%s)" % self.speed
+
+
+class PiecewiseConstantSpeedProfile(SpeedProfile):
+  """Traverse the route at speeds that change instantly at given distances.
+
+  Attributes:
+    speeds: list of (start_distance, speed) tuples sorted by start_distance,
+    where speed in meters/second applies from start_distance meters along the
+    route until the next entry. The first entry must start at 0.
+  """
+
+  def __init__(self, speeds):
+    speeds = sorted(speeds)
+    if not speeds or speeds[0][0] != 0:
+      raise ValueError("piecewise speeds must start at distance 0")
+    for _, speed in speeds:
+      _check_positive("speed", speed)
+    self.speeds = speeds
+
+  def _get_phases(self, total_distance):
+    phases = []
+    boundaries = [start for start, _ in self.speeds[1:]] + [math.inf]
+    for (start, speed), end in zip(self.speeds, boundaries):
+      if start >= total_distance:
+        break
+      length = min(end, total_distance) - start
+      phases.append((speed, 0.0, length/speed))
+    return phases
+
+  def __repr__(self):
+    return "PiecewiseConstantSpeedProfile(speeds=%s)" % (self.speeds,)
+
+
+class AccelerationLimitedSpeedProfile(SpeedProfile):
+  """Start and finish at rest, cruising at speed in between.
+
+  The route is driven with a trapezoidal speed profile. If the route is too
+  short to reach the cruise speed the profile becomes triangular.
+
+  Attributes:
+    speed: float, cruise speed in meters/second
+    acceleration: float, acceleration from rest in m/s^2
+    deceleration: float, deceleration to rest in m/s^2
+  """
+
+  def __init__(self, speed, acceleration, deceleration=None):
+    _check_positive("speed", speed)
+    _check_positive("acceleration", acceleration)
+    self.speed = speed
+    self.acceleration = acceleration
+    self.deceleration = deceleration if deceleration else acceleration
+    _check_positive("deceleration", self.deceleration)
+
+  def _get_phases(self, total_distance):
+    return _trapezoid_phases(total_distance, self.speed, self.acceleration,
+                             self.deceleration)
+
+  def __repr__(self):
+    return "AccelerationLimitedSpeedProfile(speed=%s, acceleration=%s, deceleration=%s)" % (
+        self.speed, self.acceleration, self.deceleration)
+
+
+class StopAndGoSpeedProfile(SpeedProfile):
+  """Travel at a cruise speed and come to a halt for a while at given stops.
+
+  Attributes:
+    speed: float, cruise speed in meters/second
+    stops: list of (distance, dwell_time) tuples sorted by distance, where the
+    route halts distance meters along it for dwell_time seconds
+    acceleration: float, acceleration in m/s^2 used to leave and approach each
+    stop, or None to change speed instantly
+  """
+
+  def __init__(self, speed, stops, acceleration=None):
+    _check_positive("speed", speed)
+    if acceleration is not None:
+      _check_positive("acceleration", acceleration)
+    self.speed = speed
+    self.stops = sorted(stops)
+    self.acceleration = acceleration
+
+  def _get_phases(self, total_distance):
+    phases = []
+    previous_stop = 0.0
+    for stop_distance, dwell_time in self.stops + [(total_distance, 0.0)]:
+      stop_distance = min(stop_distance, total_distance)
+      phases.extend(self._get_leg_phases(stop_distance - previous_stop))
+      phases.append((0.0, 0.0, dwell_time))
+      previous_stop = stop_distance
+    return phases
+
+  def _get_leg_phases(self, distance):
+    if distance <= 0:
+      return []
+    if self.acceleration is None:
+      return [(self.speed, 0.0, distance/self.speed)]
+    return _trapezoid_phases(distance, self.speed, self.acceleration,
+                             self.acceleration)
+
+  def __repr__(self):
+    return "StopAndGoSpeedProfile(speed=%s, stops=%s, acceleration=%s)" % (
+        self.speed, self.stops, self.acceleration)
+
+
+def _trapezoid_phases(distance, speed, acceleration, deceleration):
+  """Phases to cover distance from rest to rest with a speed limit.
+
+  Args:
+    distance: float, meters to travel
+    speed: float, maximum speed in meters/second
+    acceleration: float, m/s^2 used to reach speed
+    deceleration: float, m/s^2 used to come back to rest
+
+  Returns:
+    list of (start_speed, acceleration, duration) tuples, empty for no distance
+  """
+  if distance <= 0:
+    return []
+  ramp_distance = speed**2/(2*acceleration) + speed**2/(2*deceleration)
+  if ramp_distance > distance:
+    # triangular profile: peak speed reached halfway through the ramps
+    speed = math.sqrt(2*distance*acceleration*deceleration/(acceleration+deceleration))
+    ramp_distance = distance
+  cruise_time = (distance - ramp_distance)/speed
+  return [(0.0, acceleration, speed/acceleration),
+          (speed, 0.0, cruise_time),
+          (speed, -deceleration, speed/deceleration)]
+
+
+def _check_positive(name, value):
+  if value is None or value <= 0:
+    raise ValueError("%s must be positive, received: %s" % (name, value))
@@ -0,0 +1,148 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Parameter sweeps in simulation configuration files.
+
+Instead of a single value, Gain, Speed and RunDuration can be given a list
+of values or an inclusive range in a section:
+
+  Gain = -10, -6, -2          (a list)
+  Gain = -20:0:5              (start:stop:step, -20, -15, -10, -5 and 0)
+
+The section then stands for one simulation per combination of the swept
+values. Combinations are generated one at a time, with Gain varying fastest
+and Speed slowest, so the sweep points that play the same route at the same
+speed come one after another. run.py and the planner also share here the
+route key and the file name a section's routes are written under.
+
+  Typical usage example:
+  for values in iter_sweep_points(config, "GainSweep"):
+    gain = values["Gain"]
+"""
+
+import itertools
+import math
+import os
+
+# swept options, slowest varying first, with the type of their values
+SWEEP_OPTIONS = [("Speed", float), ("RunDuration", int), ("Gain", int)]
+LIST_SEPARATOR = ","
+RANGE_SEPARATOR = ":"
+
+
+def parse_sweep_values(value, convert=float):
+  """Parses the values an option is swept over.
+
+  Args:
+    value: string, a single value, a comma separated list of values or a
+    start:stop:step range including stop if it falls on a step
+    convert: int or float, type of the values
+
+  Returns:
+    list of values, a single one if the option isn't swept
+
+  Raises:
+    ValueError: if a value can't be converted, the list is empty or the
+    range's step is not a positive number
+  """
+  value = value.strip()
+  if LIST_SEPARATOR in value:
+    values = [convert(item) for item in value.split(LIST_SEPARATOR) if item.strip()]
+    if not values:
+      raise ValueError("empty list of values: %r" % value)
+    return values
+  if RANGE_SEPARATOR in value:
+    try:
+      start, stop, step = [convert(item) for item in value.split(RANGE_SEPARATOR)]
+    except ValueError:
+      raise ValueError("expected start:stop:step, got %r" % value)
+    if step <= 0:
+      raise ValueError("step of %r must be positive" % value)
+    # tolerate rounding, so 0:1:0.1 includes 1
+    count = int(math.floor((stop - start)/step + 1e-9)) + 1
+    return [convert(round(start + index*step, 9)) for index in range(max(count, 0))]
+  return [convert(value)]
+
+
+def is_sweep(config, section):
+  """Whether a configuration file section sweeps any option."""
+  return any(len(_get_sweep_values(config, section, option, convert)) > 1
+             for option, convert in SWEEP_OPTIONS)
+
+
+def iter_sweep_points(config, section):
+  """Generates the option values of every simulation a section stands for.
+
+  Args:
+    config: ConfigParser the configuration file was read into
+    section: string, name of the section
+
+  Yields:
+    dicts of Speed, RunDuration and Gain to their value (None if not set),
+    with Gain varying fastest
+
+  Raises:
+    ValueError: if a swept option can't be parsed
+  """
+  options = [option for option, _ in SWEEP_OPTIONS]
+  values = [_get_sweep_values(config, section, option, convert)
+            for option, convert in SWEEP_OPTIONS]
+  for point in itertools.product(*values):
+    yield dict(zip(options, point))
+
+
+def count_sweep_points(config, section):
+  """Gets the number of simulations a section stands for."""
+  return math.prod(len(_get_sweep_values(config, section, option, convert))
+                   for option, convert in SWEEP_OPTIONS)
+
+
+def get_sweep_file_name(file_name, speed, speed_swept):
+  """Gets the route file name of the sweep points of a section at one speed.
+
+  Returns:
+    file_name, with the speed added before the extension if it is swept
+  """
+  if not speed_swept:
+    return file_name
+  base_name, extension = os.path.splitext(file_name)
+  return "%s_%gmps%s" % (base_name, speed, extension)
+
+
+def get_route_key(config, section):
+  """Gets what identifies the route of a configuration file section.
+
+  Returns:
+    tuple of ("gpx", GPX file path), or of ("directions", start latitude,
+    start longitude, end latitude, end longitude)
+
+  Raises:
+    configparser.NoOptionError: if the section has neither a GPX file nor
+    start and end points
+    ValueError: if a coordinate isn't a number
+  """
+  if config.has_option(section, "GpxSourcePath"):
+    return ("gpx", config.get(section, "GpxSourcePath"))
+  return ("directions",
+          config.getfloat(section, "StartLatitude"),
+          config.getfloat(section, "StartLongitude"),
+          config.getfloat(section, "EndLatitude"),
+          config.getfloat(section, "EndLongitude"))
+
+
+def _get_sweep_values(config, section, option, convert):
+  value = config.get(section, option, fallback=None)
+  if value is None:
+    return [None]
+  return parse_sweep_values(value, convert)
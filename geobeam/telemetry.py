@@ -0,0 +1,294 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Live telemetry parsed from the output of a running bladeGPS process.
+
+bladeGPS reports its progress on stdout: the start time and duration of the
+run, a table of the satellites in view, a "Time into run" counter updated in
+place with carriage returns, and errors, underruns or late buffers reported by
+libbladeRF.
+TelemetryReader drains that output on a background thread and turns the known
+lines into TelemetryEvents.
+
+  Typical usage example:
+  reader = TelemetryReader(process.stdout)
+  reader.start()
+  reader.add_listener(lambda event: print(event.kind, event.values))
+  for event in reader.events():
+    ...
+"""
+
+import collections
+import os
+import queue
+import re
+import threading
+import time
+
+# event kinds
+START_TIME = "start_time"
+DURATION = "duration"
+SATELLITE = "satellite"
+TIME_INTO_RUN = "time_into_run"
+UNDERRUN = "underrun"
+LATE_BUFFER = "late_buffer"
+TX_ERROR = "tx_error"
+DONE = "done"
+
+READ_SIZE = 65536  # bytes read from the pipe at a time
+HISTORY_LENGTH = 1000  # recent events replayed to listeners added late
+# events queued for an iterator or listener before its oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = 4*HISTORY_LENGTH
+
+_LINE_SEPARATOR = re.compile(rb"[\r\n]")
+_TIME_INTO_RUN = re.compile(r"Time into run\s*=\s*([\d.]+)")
+_START_TIME = re.compile(r"Start time\s*=\s*(\S+)")
+_DURATION = re.compile(r"Duration\s*=\s*([\d.]+)")
+_SATELLITE = re.compile(r"^\s*(\d{2})\s+(-?[\d.]+)\s+(-?[\d.]+)\s+([\d.]+)\s+([\d.]+)\s*$")
+# libbladeRF's warning for a buffer it drops, and its message for
+# BLADERF_ERR_TIME_PAST that bladeGPS prints after "Failed to TX samples:"
+_LATE_BUFFER = re.compile(r"Discarding late (?:TX )?buffer|Requested timestamp is in the past")
+_TX_ERROR = re.compile(r"(?:Failed to TX samples|TX failed):?\s*(.*)")
+# bladeGPS rewrites the progress line in place without ending it, so a
+# progress line with its one decimal place is handled without waiting for
+# the next line separator
+_COMPLETE_PROGRESS_LINE = re.compile(rb"Time into run\s*=\s*\d+\.\d$")
+_END = object()
+
+
+class TelemetryEvent():
+  """A status line from bladeGPS.
+
+  Attributes:
+    kind: string, one of the event kinds defined in this module
+    values: dict of the values parsed from the line
+    line: string, the line the event was parsed from
+    timestamp: float, time.monotonic() when the line was read
+  """
+
+  def __init__(self, kind, values, line, timestamp=None):
+    self.kind = kind
+    self.values = values
+    self.line = line
+    self.timestamp = time.monotonic() if timestamp is None else timestamp
+
+  def __repr__(self):
+    return "TelemetryEvent(kind=%s, values=%s)" % (self.kind, self.values)
+
+
+def parse_bladeGPS_line(line):
+  """Parses one line of bladeGPS output.
+
+  Args:
+    line: string without its line separator
+
+  Returns:
+    TelemetryEvent if the line is a known status line, None otherwise
+  """
+  if "Time into run" in line:
+    match = _TIME_INTO_RUN.search(line)
+    if match:
+      return TelemetryEvent(TIME_INTO_RUN, {"seconds": float(match.group(1))}, line)
+  match = _SATELLITE.match(line)
+  if match:
+    prn, azimuth, elevation, distance, iono_delay = match.groups()
+    return TelemetryEvent(SATELLITE, {"prn": int(prn),
+                                      "azimuth": float(azimuth),
+                                      "elevation": float(elevation),
+                                      "range": float(distance),
+                                      "iono_delay": float(iono_delay)}, line)
+  if "nderrun" in line:
+    return TelemetryEvent(UNDERRUN, {}, line)
+  if _LATE_BUFFER.search(line):
+    return TelemetryEvent(LATE_BUFFER, {}, line)
+  match = _TX_ERROR.search(line)
+  if match:
+    return TelemetryEvent(TX_ERROR, {"message": match.group(1)}, line)
+  match = _START_TIME.match(line)
+  if match:
+    return TelemetryEvent(START_TIME, {"start_time": match.group(1)}, line)
+  match = _DURATION.match(line)
+  if match:
+    return TelemetryEvent(DURATION, {"seconds": float(match.group(1))}, line)
+  if line.startswith("Done!"):
+    return TelemetryEvent(DONE, {}, line)
+  return None
+
+
+class TelemetryReader():
+  """Drains a bladeGPS output pipe and publishes the status events in it.
+
+  The reader thread only reads large chunks, splits them into lines and
+  parses them, so the child never blocks on a full pipe. Listeners run on
+  threads of their own and iterators read from bounded queues, so a slow
+  consumer only falls behind, losing its oldest events once its queue is
+  full, rather than stall the reader or hold every event in memory.
+
+  Attributes:
+    status: dict with the latest elapsed seconds, the number of satellites
+    in view and the number of underruns and late buffers seen so far
+  """
+
+  def __init__(self, pipe, echo=None):
+    """Initialize reader.
+
+    Args:
+      pipe: readable binary file object connected to the bladeGPS output
+      echo: optional callable given every chunk of raw output, for example to
+      keep showing it on the terminal
+    """
+    self._pipe = pipe
+    self._echo = echo
+    self._thread = None
+    self._lock = threading.Lock()
+    self._subscribers = []
+    self._history = collections.deque(maxlen=HISTORY_LENGTH)
+    self._finished = False
+    self._satellites = {}
+    self._previous_kind = None
+    self.status = {"elapsed_seconds": None, "satellite_count": 0, "underruns": 0,
+                   "late_buffers": 0}
+
+  def start(self):
+    """Starts the reader thread."""
+    if not self._thread:
+      self._thread = threading.Thread(target=self._read_output, daemon=True)
+      self._thread.start()
+
+  def join(self, timeout=None):
+    """Waits for the output pipe to close and the reader thread to end."""
+    if self._thread:
+      self._thread.join(timeout)
+
+  def _subscribe(self):
+    """Creates a queue that receives every event from now on.
+
+    The queue starts with the recent events already read, and ends with
+    _END once the output pipe closes.
+    """
+    subscriber = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+    with self._lock:
+      for event in self._history:
+        _put_dropping_oldest(subscriber, event)
+      if self._finished:
+        _put_dropping_oldest(subscriber, _END)
+      else:
+        self._subscribers.append(subscriber)
+    return subscriber
+
+  def _unsubscribe(self, subscriber):
+    with self._lock:
+      if subscriber in self._subscribers:
+        self._subscribers.remove(subscriber)
+
+  def events(self):
+    """Iterates over the events until the output pipe closes.
+
+    An iterator that is closed or dropped before the end stops receiving
+    events.
+
+    Yields:
+      TelemetryEvents, starting with the recent events already read
+    """
+    subscriber = self._subscribe()
+    try:
+      while True:
+        event = subscriber.get()
+        if event is _END:
+          return
+        yield event
+    finally:
+      self._unsubscribe(subscriber)
+
+  def add_listener(self, callback):
+    """Calls callback with every event on a thread of its own.
+
+    Args:
+      callback: callable taking a TelemetryEvent
+    """
+    def dispatch(events):
+      for event in events:
+        callback(event)
+    threading.Thread(target=dispatch, args=(self.events(),), daemon=True).start()
+
+  def _read_output(self):
+    file_descriptor = self._pipe.fileno()
+    partial_line = b""
+    try:
+      while True:
+        try:
+          chunk = os.read(file_descriptor, READ_SIZE)
+        except OSError:
+          break
+        if not chunk:
+          break
+        if self._echo:
+          self._echo(chunk)
+        lines = _LINE_SEPARATOR.split(partial_line + chunk)
+        partial_line = lines.pop()
+        for line in lines:
+          self._handle_line(line)
+        if _COMPLETE_PROGRESS_LINE.search(partial_line):
+          self._handle_line(partial_line)
+          partial_line = b""
+      if partial_line:
+        self._handle_line(partial_line)
+    finally:
+      self._pipe.close()
+      with self._lock:
+        self._finished = True
+        for subscriber in self._subscribers:
+          _put_dropping_oldest(subscriber, _END)
+        self._subscribers = []
+
+  def _handle_line(self, line):
+    if not line:
+      return
+    event = parse_bladeGPS_line(line.decode("utf-8", "replace"))
+    previous_kind = self._previous_kind
+    self._previous_kind = event.kind if event else None
+    if not event:
+      return
+    if event.kind == SATELLITE and previous_kind != SATELLITE:
+      # a new satellite table replaces the last one
+      self._satellites = {}
+    self._update_status(event)
+    with self._lock:
+      self._history.append(event)
+      for subscriber in self._subscribers:
+        _put_dropping_oldest(subscriber, event)
+
+  def _update_status(self, event):
+    if event.kind == TIME_INTO_RUN:
+      self.status["elapsed_seconds"] = event.values["seconds"]
+    elif event.kind == SATELLITE:
+      self._satellites[event.values["prn"]] = event
+      self.status["satellite_count"] = len(self._satellites)
+    elif event.kind == UNDERRUN:
+      self.status["underruns"] += 1
+    elif event.kind == LATE_BUFFER:
+      self.status["late_buffers"] += 1
+
+
+def _put_dropping_oldest(subscriber, item):
+  """Queues item without blocking, dropping the oldest queued items to make room."""
+  while True:
+    try:
+      subscriber.put_nowait(item)
+      return
+    except queue.Full:
+      try:
+        subscriber.get_nowait()
+      except queue.Empty:
+        pass
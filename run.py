@@ -1,66 +1,146 @@
 #!/usr/bin/env python3
 
+import argparse
+import asyncio
 import configparser
 import os
 import sys
+import threading
 
+from geobeam.control_server import SimulationControlServer
+from geobeam.ephemeris import DEFAULT_EPHEMERIS_SOURCE
+from geobeam.ephemeris import EphemerisCache
+from geobeam.metrics import MetricsFileWriter
+from geobeam.metrics import MetricsServer
+from geobeam.planner import format_plan
+from geobeam.planner import plan_config
+from geobeam.process_scheduling import parse_cpu_list
+from geobeam.process_scheduling import ProcessScheduling
+from geobeam.route_service import check_socket_path
+from geobeam.route_service import DEFAULT_SOCKET_PATH as DEFAULT_ROUTE_SERVICE_SOCKET
+from geobeam.route_service import RouteServiceClient
+from geobeam.route_service import RouteServiceError
+from geobeam.simulations import AsyncSimulationSetRunner
+from geobeam.simulations import DEFAULT_TEARDOWN_TIMEOUT
+from geobeam.simulations import DEVICE_OPTION
+from geobeam.simulations import EXIT_SUCCESS
+from geobeam.simulations import HeadlessSimulationSetRunner
+from geobeam.simulations import METRICS
+from geobeam.simulations import MultiDeviceSimulationRunner
 from geobeam.simulations import SimulationSetBuilder
-from geobeam.generate_route import TimedRoute
+from geobeam.generate_route import Route
+from geobeam.generate_route import RouteVariant
+from geobeam.generate_route import StreamedTimedRoute
+from geobeam.generate_route import write_route_variants
 from geobeam import gps_utils
+from geobeam import instrumentation
+from geobeam import sweeps
 
 # speed used as default config parser value if not specified by the user
 DEFAULT_SPEED = "1.4"  # meters/sec
 DEFAULT_FREQUENCY = 10  # Hz
+MOTION_FILE_DIRECTORY = "geobeam/user_motion_files/"
 
 
-def main(config_file_name):
+def main(config_file_name, headless=False, default_run_duration=None, control_socket=None,
+         metrics_file=None, metrics_port=None, route_service_socket=None, plan=False):
   """Create and run simulation set based on user specified config file.
 
   Args:
     config_file_name: string, name of file in simulation_configs folder
     to read from
+    headless: bool, whether to run the simulations unattended as a timed
+    queue instead of controlling them from the keyboard
+    default_run_duration: float, seconds to run simulations without a
+    RunDuration for in headless mode, None to run them until bladeGPS exits
+    control_socket: path of a Unix domain socket to accept control commands
+    on, or None
+    metrics_file: path of a file to write runner metrics to periodically in
+    the Prometheus text format, or None
+    metrics_port: int, localhost port to serve runner metrics on, or None
+    route_service_socket: path of the socket of a route service to generate
+    routes with if it is running, or None to always generate them here
+    plan: bool, whether to only check the configuration file and print what
+    running it would take, without requesting routes or launching bladeGPS
+
+  Returns:
+    exit code for the program
   """
   config = configparser.ConfigParser()
   config['DEFAULT']['Speed'] = DEFAULT_SPEED
   config_file_path = os.path.abspath("simulation_configs/" + config_file_name)
   config.read(config_file_path)
 
+  if plan:
+    config_plan = plan_config(config, MOTION_FILE_DIRECTORY,
+                              default_run_duration if headless else None)
+    print("Plan for %s" % config_file_path)
+    for line in format_plan(config_plan):
+      print(line)
+    return 2 if config_plan.has_errors() else 0
+
   sections = config.sections()
+  ephemeris_cache = _create_ephemeris_cache(config)
+  # routes resolved so far, shared by sections with the same endpoints or GPX file
+  routes = {}
+  route_service = None
+  if route_service_socket and os.path.exists(route_service_socket):
+    print("Generating routes with the route service at %s" % route_service_socket)
+    route_service = RouteServiceClient(route_service_socket)
+  route_timings = instrumentation.StageAggregator()
+  instrumentation.add_sink(route_timings)
 
-  simulation_set_builder = SimulationSetBuilder()
+  try:
+    _write_created_routes(config, sections, routes, route_service)
+  except (configparser.NoOptionError, ValueError) as err:
+    print("Error in reading value from configuration file: %s" % err)
+    return 2
+  finally:
+    instrumentation.remove_sink(route_timings)
+
+  # one simulation set per bladeRF board, in order of first use
+  simulation_set_builders = {}
 
   for simulation in sections:
     try:
+      device = config.get(simulation, "Device", fallback=None)
+      if device not in simulation_set_builders:
+        simulation_set_builders[device] = _create_simulation_set_builder(config, device)
+        simulation_set_builders[device].set_ephemeris_cache(ephemeris_cache)
+      simulation_set_builder = simulation_set_builders[device]
+
+      if sweeps.is_sweep(config, simulation):
+        _add_sweep(config, simulation, simulation_set_builder, routes, route_service)
+        continue
       run_duration = config.getint(simulation, "RunDuration", fallback=None)
       gain = config.getint(simulation, "Gain", fallback=None)
 
       # Dynamic Simulation
       if config.getboolean(simulation, "Dynamic"):
 
+        # Streaming New Route straight to bladeGPS without a file
+        if config.getboolean(simulation, "Stream", fallback=False):
+          with instrumentation.recording(route_timings):
+            user_motion = _create_streamed_route(config, simulation, routes, route_service)
+          max_segment_duration = config.getfloat(simulation, "MaxSegmentDuration", fallback=None)
+          simulation_set_builder.add_streamed_route(user_motion.iter_timed_rows,
+                                                    run_duration=run_duration,
+                                                    gain=gain,
+                                                    max_segment_duration=max_segment_duration,
+                                                    row_count=len(user_motion))
+          continue
+
+        # New Route Files were created by _write_created_routes
         file_name = config.get(simulation, "FileName")
-        file_path = os.path.abspath("geobeam/user_motion_files/" + file_name)
-
-        # Creating New Route File
-        if config.getboolean(simulation, "CreateFile"):
-          speed = config.getfloat(simulation, "Speed")
-          frequency = DEFAULT_FREQUENCY
-          if config.has_option(simulation, "GpxSourcePath"):
-            gpx_source_path = config.get(simulation, "GpxSourcePath")
-            user_motion = TimedRoute.from_gpx(gpx_source_path, speed, frequency)
-          else:
-            start_latitude = config.getfloat(simulation, "StartLatitude")
-            start_longitude = config.getfloat(simulation, "StartLongitude")
-            end_latitude = config.getfloat(simulation, "EndLatitude")
-            end_longitude = config.getfloat(simulation, "EndLongitude")
-            location1 = gps_utils.Location(start_latitude, start_longitude)
-            location2 = gps_utils.Location(end_latitude, end_longitude)
-
-            user_motion = TimedRoute.from_start_and_end(location1, location2, speed, frequency)
-          user_motion.write_route(file_name)
+        file_path = os.path.abspath(MOTION_FILE_DIRECTORY + file_name)
 
+        start_offset = config.getfloat(simulation, "StartOffset", fallback=0)
+        max_segment_duration = config.getfloat(simulation, "MaxSegmentDuration", fallback=None)
         simulation_set_builder.add_dynamic_route(file_path,
                                                  run_duration=run_duration,
-                                                 gain=gain)
+                                                 gain=gain,
+                                                 start_offset=start_offset,
+                                                 max_segment_duration=max_segment_duration)
       # Static Simulation
       else:
         latitude = config.getfloat(simulation, "Latitude")
@@ -69,12 +149,371 @@ def main(config_file_name):
                                                 longitude,
                                                 run_duration=run_duration,
                                                 gain=gain)
-    except configparser.NoOptionError as err:
+    except (configparser.NoOptionError, ValueError) as err:
       print("Error in reading value from configuration file: %s" % err)
+      return 2
+    except OSError as err:
+      print("Error in reading motion file of %s: %s" % (simulation, err))
+      return 2
+
+  for label in route_timings.get_labels():
+    print("Route for %s: %s" % (label, route_timings.format_breakdown(label)))
+
+  if None in simulation_set_builders and len(simulation_set_builders) > 1:
+    # the first board found could be one of the named boards
+    print("Device has to be set in every section or in none of them")
+    return 2
+  simulation_sets = [builder.build() for builder in simulation_set_builders.values()]
+  if not simulation_sets:
+    print("No simulations found in configuration file: %s" % config_file_path)
+    return 2
+  if control_socket and len(simulation_sets) > 1:
+    print("A control socket can only be used with simulations on a single board")
+    return 2
+  if control_socket:
+    try:
+      check_socket_path(control_socket)
+    except OSError as err:
+      print("Can't serve control commands at %s: %s" % (control_socket, err))
+      return 2
+  if ephemeris_cache:
+    # fetch ahead of the run so no launch waits on the network
+    ephemeris_cache.prefetch()
+  if headless:
+    runners = [HeadlessSimulationSetRunner(simulation_set, default_run_duration)
+               for simulation_set in simulation_sets]
+  elif len(simulation_sets) == 1:
+    runners = [AsyncSimulationSetRunner(simulation_sets[0])]
+  else:
+    runners = [MultiDeviceSimulationRunner(simulation_sets)]
+  exporters = []
+  if metrics_file:
+    exporters.append(MetricsFileWriter(METRICS, metrics_file))
+  if metrics_port is not None:
+    exporters.append(MetricsServer(METRICS, metrics_port))
+  try:
+    for exporter in exporters:
+      exporter.start()
+    return max(asyncio.run(_run(runners, control_socket)))
+  finally:
+    for exporter in exporters:
+      exporter.close()
+
+
+async def _run(runners, control_socket=None):
+  """Run runners for every board at the same time.
+
+  Args:
+    runners: list of runners to run to completion
+    control_socket: path to serve control commands for the first runner on,
+    or None
+
+  Returns:
+    list of exit codes, EXIT_SUCCESS for runners that don't report one
+  """
+  control_server = None
+  if control_socket:
+    await runners[0].start()
+    control_server = SimulationControlServer(runners[0], control_socket)
+    await control_server.start()
+  try:
+    exit_codes = await asyncio.gather(*(runner.run() for runner in runners))
+  finally:
+    if control_server:
+      await control_server.close()
+  return [EXIT_SUCCESS if exit_code is None else exit_code for exit_code in exit_codes]
+
+
+def _create_simulation_set_builder(config, device):
+  """Create a builder with the set-wide settings for simulations on one board.
+
+  Args:
+    config: ConfigParser the configuration file was read into
+    device: string, bladeRF device identifier, or None for the first board found
+
+  Returns:
+    SimulationSetBuilder
+  """
+  simulation_set_builder = SimulationSetBuilder()
+  teardown_timeout = config["DEFAULT"].getfloat("TeardownTimeout",
+                                                fallback=DEFAULT_TEARDOWN_TIMEOUT)
+  simulation_set_builder.set_teardown_timeout(teardown_timeout)
+  simulation_set_builder.set_prefetch(config["DEFAULT"].getboolean("Prefetch", fallback=False))
+  simulation_set_builder.set_resume(config["DEFAULT"].getboolean("Resume", fallback=False))
+  simulation_set_builder.set_device(device, config["DEFAULT"].get("DeviceOption",
+                                                                 fallback=DEVICE_OPTION))
+  transit_speed = config["DEFAULT"].getfloat("TransitSpeed", fallback=None)
+  simulation_set_builder.set_fuse(config["DEFAULT"].getboolean("Fuse", fallback=False),
+                                  config["DEFAULT"].getboolean("FuseDynamic", fallback=False),
+                                  transit_speed)
+  cpus = config["DEFAULT"].get("Cpus", fallback=None)
+  nice = config["DEFAULT"].getint("Nice", fallback=None)
+  realtime_priority = config["DEFAULT"].getint("RealtimePriority", fallback=None)
+  if cpus or nice is not None or realtime_priority is not None:
+    simulation_set_builder.set_scheduling(ProcessScheduling(
+        cpus=parse_cpu_list(cpus) if cpus else None,
+        nice=nice,
+        realtime_priority=realtime_priority))
+  return simulation_set_builder
+
+
+def _create_ephemeris_cache(config):
+  """Create the ephemeris cache set up in the configuration file.
+
+  Args:
+    config: ConfigParser the configuration file was read into
+
+  Returns:
+    EphemerisCache, or None if the file doesn't set an EphemerisCache directory
+  """
+  cache_directory = config["DEFAULT"].get("EphemerisCache", fallback=None)
+  if not cache_directory:
+    return None
+  source = config["DEFAULT"].get("EphemerisSource", fallback=DEFAULT_EPHEMERIS_SOURCE)
+  return EphemerisCache(cache_directory, source)
+
+
+def _write_created_routes(config, sections, routes, route_service=None):
+  """Write the route files of the sections with CreateFile set.
+
+  Sections with the same endpoints or GPX file share one route request, and
+  the speeds of a route are timed and written in parallel.
+
+  Args:
+    config: ConfigParser the configuration file was read into
+    sections: list of section names
+    routes: dict of the routes resolved so far, updated with new ones
+    route_service: RouteServiceClient to write the routes with, or None to
+    write them here. Routes it fails to write are written here
+  """
+  variants = {}
+  for simulation in sections:
+    if (not config.getboolean(simulation, "Dynamic")
+        or config.getboolean(simulation, "Stream", fallback=False)
+        or not config.getboolean(simulation, "CreateFile")
+        or sweeps.is_sweep(config, simulation)):
+      continue
+    variant = RouteVariant(config.get(simulation, "FileName"),
+                           config.getfloat(simulation, "Speed"),
+                           DEFAULT_FREQUENCY,
+                           label=simulation)
+    variants.setdefault(sweeps.get_route_key(config, simulation), []).append(variant)
+  for route_variants in variants.values():
+    _write_routes(config, route_variants[0].label, route_variants, routes, route_service)
+
+
+def _write_routes(config, simulation, variants, routes, route_service=None):
+  """Write timed versions of the route of a configuration file section.
+
+  Args:
+    config: ConfigParser the configuration file was read into
+    simulation: string, name of the section
+    variants: list of RouteVariants to write
+    routes: dict of the routes resolved so far, updated with new ones
+    route_service: RouteServiceClient to write the routes with, or None to
+    write them here. They are written here if the service fails
+  """
+  if route_service:
+    try:
+      route_service.write_route_variants(sweeps.get_route_key(config, simulation), variants)
       return
+    except (OSError, RouteServiceError) as err:
+      print("Route service could not write %s, writing it here: %s" % (simulation, err))
+  write_route_variants(_get_route(config, simulation, routes), variants)
+
+
+def _add_sweep(config, simulation, simulation_set_builder, routes, route_service=None):
+  """Add a simulation for every point of a section sweeping Gain, Speed or RunDuration.
+
+  Routes of dynamic sweeps are created just before their first use, once
+  per speed, so the sweep starts without waiting for them and sweep points
+  that only differ in gain or run duration share them. A route longer than
+  MaxSegmentDuration, written or streamed, is not split into segments, as
+  its length is only known once it has been created.
+
+  Args:
+    config: ConfigParser the configuration file was read into
+    simulation: string, name of the section
+    simulation_set_builder: SimulationSetBuilder to add the simulations to
+    routes: dict of the routes resolved so far, updated with new ones
+    route_service: RouteServiceClient to create routes with, or None
+  """
+  dynamic = config.getboolean(simulation, "Dynamic")
+  stream = dynamic and config.getboolean(simulation, "Stream", fallback=False)
+  create_file = dynamic and not stream and config.getboolean(simulation, "CreateFile")
+  start_offset = config.getfloat(simulation, "StartOffset", fallback=0)
+  speed_swept = len(sweeps.parse_sweep_values(config.get(simulation, "Speed"))) > 1
+  if stream or create_file:
+    # report a missing route option now rather than when the route is first used
+    sweeps.get_route_key(config, simulation)
+  # callables creating the route or route file of each speed on first use
+  route_sources = {}
+
+  for values in sweeps.iter_sweep_points(config, simulation):
+    speed = values["Speed"]
+    run_duration = values["RunDuration"]
+    gain = values["Gain"]
+    if not dynamic:
+      simulation_set_builder.add_static_route(config.getfloat(simulation, "Latitude"),
+                                              config.getfloat(simulation, "Longitude"),
+                                              run_duration=run_duration,
+                                              gain=gain)
+    elif stream:
+      if speed not in route_sources:
+        route_sources[speed] = _create_once(
+            lambda speed=speed: _create_streamed_route(config, simulation, routes,
+                                                    route_service, speed))
+      simulation_set_builder.add_streamed_route(
+          lambda create_route=route_sources[speed]: _iter_sweep_rows(create_route, simulation),
+          run_duration=run_duration,
+          gain=gain)
+    elif create_file:
+      if speed not in route_sources:
+        file_name = sweeps.get_sweep_file_name(config.get(simulation, "FileName"), speed,
+                                         speed_swept)
+        route_sources[speed] = _create_once(
+            lambda file_name=file_name, speed=speed: _write_sweep_route(
+                config, simulation, routes, route_service, file_name, speed))
+      simulation_set_builder.add_deferred_dynamic_route(route_sources[speed],
+                                                        run_duration=run_duration,
+                                                        gain=gain,
+                                                        start_offset=start_offset)
+    else:
+      file_path = os.path.abspath(MOTION_FILE_DIRECTORY + config.get(simulation, "FileName"))
+      simulation_set_builder.add_dynamic_route(file_path,
+                                               run_duration=run_duration,
+                                               gain=gain,
+                                               start_offset=start_offset)
+
+
+def _write_sweep_route(config, simulation, routes, route_service, file_name, speed):
+  """Write the route file of the sweep points of a section at one speed.
+
+  Failures are raised and not cached by _create_once, so the simulation
+  reports and skips the sweep point, and the file is written again when a
+  later sweep point needs it.
+
+  Returns:
+    absolute path of the route file
+
+  Raises:
+    OSError, ValueError: if the route can't be created or written
+  """
+  variant = RouteVariant(file_name, speed, DEFAULT_FREQUENCY, label=simulation)
+  _write_routes(config, simulation, [variant], routes, route_service)
+  return os.path.abspath(MOTION_FILE_DIRECTORY + file_name)
+
+
+def _iter_sweep_rows(create_route, simulation):
+  """Iterate over the rows of a streamed sweep route, creating it on first use.
+
+  Failures are reported rather than raised, and stream no rows.
+  """
+  try:
+    return create_route().iter_timed_rows()
+  except (OSError, ValueError, RouteServiceError) as err:
+    print("\nCould not create route for %s: %s" % (simulation, err))
+    return iter(())
+
+
+def _create_once(create):
+  """Get a callable calling create on its first call and returning the same result after.
+
+  Calls from several threads wait for the first one to finish. A call that
+  raises caches nothing, so the next call tries again.
+  """
+  lock = threading.Lock()
+  results = []
+
+  def create_once():
+    with lock:
+      if not results:
+        results.append(create())
+      return results[0]
+  return create_once
+
+
+def _create_streamed_route(config, simulation, routes, route_service=None, speed=None):
+  """Create the timed route of a configuration file section for streaming.
+
+  The route is resolved here, but its points are only sampled as they are
+  streamed, so bladeGPS can start without waiting for the whole route.
+
+  Args:
+    config: ConfigParser the configuration file was read into
+    simulation: string, name of the section
+    routes: dict of the routes resolved so far, updated with new ones
+    route_service: RouteServiceClient to get the route from, or None to
+    create it here. It is created here if the service fails
+    speed: float, meters/second to time the route at, the section's Speed
+    by default
+
+  Returns:
+    StreamedTimedRoute from the section's GPX file or start and end points,
+    or the ServedTimedRoute the route service sent for it
+  """
+  if speed is None:
+    speed = config.getfloat(simulation, "Speed")
+  if route_service:
+    try:
+      return route_service.get_timed_route(sweeps.get_route_key(config, simulation), speed,
+                                           DEFAULT_FREQUENCY)
+    except (OSError, RouteServiceError) as err:
+      print("Route service could not create %s, creating it here: %s" % (simulation, err))
+  return StreamedTimedRoute(_get_route(config, simulation, routes), speed, DEFAULT_FREQUENCY)
+
+
+def _get_route(config, simulation, routes):
+  """Get the route of a configuration file section, resolving it on first use.
+
+  Args:
+    config: ConfigParser the configuration file was read into
+    simulation: string, name of the section
+    routes: dict of the routes resolved so far, updated with new ones
+
+  Returns:
+    Route from the section's GPX file or start and end points
+  """
+  route_key = sweeps.get_route_key(config, simulation)
+  if route_key not in routes:
+    with instrumentation.labelled(simulation):
+      if config.has_option(simulation, "GpxSourcePath"):
+        routes[route_key] = Route.from_gpx(route_key[1])
+      else:
+        location1 = gps_utils.Location(*route_key[1:3])
+        location2 = gps_utils.Location(*route_key[3:5])
+        routes[route_key] = Route.from_start_and_end(location1, location2)
+  return routes[route_key]
 
-  simulation_set = simulation_set_builder.build()
-  simulation_set.run_simulations()
 
 if __name__ == "__main__":
-  sys.exit(main(sys.argv[1]))
+  parser = argparse.ArgumentParser(description="Run a set of GPS simulations.")
+  parser.add_argument("config_file_name",
+                      help="name of the configuration file in simulation_configs")
+  parser.add_argument("--headless", action="store_true",
+                      help="run the simulations back to back without keyboard control, "
+                           "exiting with a non zero code if any of them fails")
+  parser.add_argument("--default-run-duration", type=float, default=None,
+                      help="seconds to run simulations without a RunDuration for "
+                           "in headless mode")
+  parser.add_argument("--control-socket", default=None,
+                      help="path of a Unix domain socket to accept next, previous, jump, "
+                           "stop and status commands on")
+  parser.add_argument("--metrics-file", default=None,
+                      help="path of a file to write runner metrics to every 15 seconds "
+                           "in the Prometheus text format")
+  parser.add_argument("--metrics-port", type=int, default=None,
+                      help="localhost port to serve runner metrics on over HTTP")
+  parser.add_argument("--route-service", default=DEFAULT_ROUTE_SERVICE_SOCKET,
+                      help="socket of the route service to generate routes with when it "
+                           "is running (python3 -m geobeam.route_service)")
+  parser.add_argument("--no-route-service", action="store_true",
+                      help="always generate routes in this process")
+  parser.add_argument("--plan", action="store_true",
+                      help="check every section and existing motion file, print the API "
+                           "calls, route points, file sizes and run time the configuration "
+                           "would take, and exit without running it")
+  args = parser.parse_args()
+  sys.exit(main(args.config_file_name, args.headless, args.default_run_duration,
+                args.control_socket, args.metrics_file, args.metrics_port,
+                None if args.no_route_service else args.route_service, args.plan))
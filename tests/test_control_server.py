@@ -0,0 +1,143 @@
+import asyncio
+import os
+import socket
+import tempfile
+import unittest
+from unittest.mock import call
+from unittest.mock import create_autospec
+from unittest.mock import patch
+
+import geobeam
+from geobeam.control_server import send_control_command
+from geobeam.control_server import SimulationControlServer
+from geobeam.simulations import DynamicSimulation
+from geobeam.simulations import Simulation
+from geobeam.simulations import StaticSimulation
+
+
+class SimulationControlServerTest(unittest.IsolatedAsyncioTestCase):
+
+  async def asyncSetUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.socket_path = os.path.join(self.temp_dir.name, "control.sock")
+    self.simulations = [create_autospec(Simulation),
+                        create_autospec(StaticSimulation),
+                        create_autospec(DynamicSimulation)]
+    for simulation in self.simulations:
+      simulation.wait_for_exit.side_effect = asyncio.Event().wait
+      simulation.get_run_duration.return_value = None
+      simulation.is_running.return_value = True
+      simulation.is_chained.return_value = False
+      simulation.get_telemetry_status.return_value = {"elapsed_seconds": 1.5,
+                                                      "satellite_count": 8,
+                                                      "underruns": 0}
+    self.simulation_set = geobeam.simulations.SimulationSet(self.simulations)
+    self.patchers = [patch('geobeam.simulations.SimulationSet._switch_simulation',
+                           side_effect=self.update_index),
+                     patch('geobeam.simulations.SimulationSet._log_current_simulation'),
+                     patch('geobeam.simulations.SimulationSet._log_command'),
+                     patch('builtins.print')]
+    self.mock_switch_simulation, _, self.mock_log_command, _ = [
+        patcher.start() for patcher in self.patchers]
+    self.runner = geobeam.simulations.AsyncSimulationSetRunner(self.simulation_set,
+                                                               interactive=False)
+    await self.runner.start()
+    self.server = SimulationControlServer(self.runner, self.socket_path)
+    await self.server.start()
+
+  async def asyncTearDown(self):
+    await self.runner.stop()
+    await self.server.close()
+    for patcher in self.patchers:
+      patcher.stop()
+    self.temp_dir.cleanup()
+
+  def update_index(self, index):
+    if 0 <= index < len(self.simulations):
+      self.simulation_set._current_simulation_index = index
+
+  async def send(self, command, index=None):
+    return await asyncio.get_running_loop().run_in_executor(
+        None, send_control_command, self.socket_path, command, index, 5)
+
+  async def test_switch_commands(self):
+    next_response = await self.send("next")
+    jump_response = await self.send("jump", 2)
+    previous_response = await self.send("previous")
+
+    self.assertTrue(next_response["ok"])
+    self.assertEqual(next_response["status"]["index"], 1)
+    self.assertEqual(jump_response["status"]["index"], 2)
+    self.assertEqual(previous_response["status"]["index"], 1)
+    self.assertGreaterEqual(next_response["latency"], 0)
+    self.mock_switch_simulation.assert_has_calls([call(0), call(1), call(2), call(1)])
+    self.assertEqual([command_call[0][0] for command_call in self.mock_log_command.call_args_list],
+                     ["next", "jump", "previous"])
+
+  async def test_switch_with_nothing_to_switch_to(self):
+    previous_response = await self.send("previous")
+    await self.send("jump", 2)
+    next_response = await self.send("next")
+
+    self.assertEqual(previous_response, {"ok": False, "error": "already on first simulation"})
+    self.assertEqual(next_response, {"ok": False, "error": "already on last simulation"})
+    self.assertEqual(self.simulation_set._current_simulation_index, 2)
+    self.assertEqual([command_call[0][0] for command_call in self.mock_log_command.call_args_list],
+                     ["jump"])
+
+  async def test_status(self):
+    response = await self.send("status")
+
+    self.assertEqual(response["status"]["index"], 0)
+    self.assertEqual(response["status"]["simulation_count"], 3)
+    self.assertTrue(response["status"]["running"])
+    self.assertEqual(response["status"]["telemetry"]["satellite_count"], 8)
+
+  async def test_stop(self):
+    response = await self.send("stop")
+
+    self.assertTrue(response["ok"])
+    self.assertFalse(response["status"]["running"])
+    self.simulations[0].end_simulation.assert_called_once()
+
+  async def test_invalid_requests(self):
+    unknown_response = await self.send("sideways")
+    jump_response = await self.send("jump", 7)
+
+    self.assertEqual(unknown_response, {"ok": False, "error": "unknown command: sideways"})
+    self.assertFalse(jump_response["ok"])
+    self.assertEqual(self.simulation_set._current_simulation_index, 0)
+
+  async def test_socket_only_open_to_user(self):
+    self.assertEqual(os.stat(self.socket_path).st_mode & 0o777, 0o600)
+
+  async def test_keeps_file_that_is_not_socket(self):
+    file_path = os.path.join(self.temp_dir.name, "notes.txt")
+    with open(file_path, "w") as notes:
+      notes.write("keep")
+    server = SimulationControlServer(self.runner, file_path)
+
+    with self.assertRaises(FileExistsError):
+      await server.start()
+    with open(file_path) as notes:
+      self.assertEqual(notes.read(), "keep")
+
+  async def test_socket_directory_writable_by_others(self):
+    os.chmod(self.temp_dir.name, 0o777)
+    server = SimulationControlServer(self.runner, os.path.join(self.temp_dir.name, "other.sock"))
+
+    with self.assertRaises(PermissionError):
+      await server.start()
+    self.assertFalse(os.path.exists(os.path.join(self.temp_dir.name, "other.sock")))
+
+  async def test_replaces_stale_socket(self):
+    await self.server.close()
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(self.socket_path)
+    stale.close()
+    self.server = SimulationControlServer(self.runner, self.socket_path)
+    await self.server.start()
+
+    response = await self.send("status")
+
+    self.assertTrue(response["ok"])
@@ -0,0 +1,111 @@
+import datetime
+import gzip
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from geobeam import ephemeris
+
+TEST_DATE = datetime.date(2020, 5, 2)
+TEST_NAVIGATION_DATA = b"     2.10           N: GPS NAV DATA                         RINEX VERSION / TYPE\n"
+
+
+class EphemerisFileNameTest(unittest.TestCase):
+
+  def test_get_ephemeris_file_name(self):
+    self.assertEqual(ephemeris.get_ephemeris_file_name(TEST_DATE), "brdc1230.20n")
+    self.assertEqual(ephemeris.get_ephemeris_file_name(datetime.date(2021, 1, 1)),
+                     "brdc0010.21n")
+
+
+class EphemerisCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    # local directory standing in for the remote archive
+    self.source_directory = os.path.join(self.temp_dir.name, "archive")
+    os.makedirs(os.path.join(self.source_directory, "2020"))
+    self.cache_directory = os.path.join(self.temp_dir.name, "cache")
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def _publish(self, date, compressed=False):
+    file_path = os.path.join(self.source_directory, str(date.year),
+                             ephemeris.get_ephemeris_file_name(date))
+    if compressed:
+      with gzip.open(file_path + ".gz", "wb") as published_file:
+        published_file.write(TEST_NAVIGATION_DATA)
+    else:
+      with open(file_path, "wb") as published_file:
+        published_file.write(TEST_NAVIGATION_DATA)
+
+  def _create_cache(self, suffix=""):
+    source = os.path.join(self.source_directory, "{year}", "{file_name}" + suffix)
+    return ephemeris.EphemerisCache(self.cache_directory, source)
+
+  def test_fetch(self):
+    self._publish(TEST_DATE)
+    ephemeris_cache = self._create_cache()
+
+    self.assertIsNone(ephemeris_cache.get_cached_path(TEST_DATE))
+    file_path = ephemeris_cache.fetch(TEST_DATE)
+
+    self.assertEqual(file_path, os.path.join(self.cache_directory, "brdc1230.20n"))
+    self.assertEqual(ephemeris_cache.get_cached_path(TEST_DATE), file_path)
+    with open(file_path, "rb") as cached_file:
+      self.assertEqual(cached_file.read(), TEST_NAVIGATION_DATA)
+    self.assertEqual(os.listdir(self.cache_directory), ["brdc1230.20n"])
+
+  def test_fetch_compressed(self):
+    self._publish(TEST_DATE, compressed=True)
+    ephemeris_cache = self._create_cache(".gz")
+
+    file_path = ephemeris_cache.fetch(TEST_DATE)
+
+    with open(file_path, "rb") as cached_file:
+      self.assertEqual(cached_file.read(), TEST_NAVIGATION_DATA)
+
+  def test_fetch_missing(self):
+    ephemeris_cache = self._create_cache()
+
+    with self.assertRaises(OSError):
+      ephemeris_cache.fetch(TEST_DATE)
+    self.assertIsNone(ephemeris_cache.get_cached_path(TEST_DATE))
+
+  @patch('builtins.print')
+  def test_prefetch(self, mock_print):
+    previous_date = TEST_DATE - datetime.timedelta(days=1)
+    self._publish(previous_date)
+    ephemeris_cache = self._create_cache()
+
+    cached_dates = ephemeris_cache.prefetch([TEST_DATE, previous_date])
+
+    self.assertEqual(cached_dates, [previous_date])
+    mock_print.assert_called_once()
+    # cached days are not fetched again
+    os.remove(os.path.join(self.source_directory, "2020",
+                           ephemeris.get_ephemeris_file_name(previous_date)))
+    self.assertEqual(ephemeris_cache.prefetch([previous_date]), [previous_date])
+
+  def test_find_ephemeris(self):
+    previous_date = TEST_DATE - datetime.timedelta(days=1)
+    self._publish(previous_date)
+    ephemeris_cache = self._create_cache()
+
+    self.assertIsNone(ephemeris_cache.find_ephemeris(TEST_DATE))
+    ephemeris_cache.fetch(previous_date)
+    # yesterday's file serves until today's is cached
+    self.assertEqual(ephemeris_cache.find_ephemeris(TEST_DATE),
+                     ephemeris_cache.get_cached_path(previous_date))
+    self.assertIsNone(ephemeris_cache.find_ephemeris(TEST_DATE + datetime.timedelta(days=1)))
+
+    self._publish(TEST_DATE)
+    ephemeris_cache.fetch(TEST_DATE)
+    self.assertEqual(ephemeris_cache.find_ephemeris(TEST_DATE),
+                     ephemeris_cache.get_cached_path(TEST_DATE))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,9 +1,12 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import Mock
 from unittest.mock import mock_open
 from unittest.mock import patch
 
 import geobeam
+from geobeam.speed_profiles import ConstantSpeedProfile
 
 
 class RouteTest(unittest.TestCase):
@@ -52,6 +55,8 @@ class RouteTest(unittest.TestCase):
       self.assertEqual((point.latitude, point.longitude, point.altitude), test_point)
     self.assertEqual(len(route.route), 3)
     self.assertEqual(route.distances, self.distances)
+    # distances are measured over the ground, whatever the altitudes
+    mock_calculate_distance.assert_any_call(self.location1, self.location2)
 
   @patch('geobeam.generate_route._write_to_csv')
   @patch('geobeam.generate_route.Location.get_xyz_tuple')
@@ -168,6 +173,60 @@ class TimedRouteTest(unittest.TestCase):
 
     self.assertEqual(len(route.route), test_point_count)
 
+  def test_resample_route_exact_speed(self):
+    speed = 3  # meters per second
+    frequency = 10  # Hz
+    test_route = [geobeam.gps_utils.Location(*self.location1),
+                  geobeam.gps_utils.Location(*self.location2),
+                  geobeam.gps_utils.Location(*self.location3)]
+    route = geobeam.generate_route.TimedRoute(test_route, [5, 10], speed, frequency)
+
+    route.resample_route()
+
+    # 10 held start cycles, then 15 m at 0.3 m per point plus the starting point
+    self.assertEqual(len(route.route), 10 + 51)
+    self.assertEqual(len(route.distances), len(route.route)-1)
+    for distance in route.distances[10:]:
+      self.assertAlmostEqual(distance, 0.3)
+    self.assertIs(route.route[10], test_route[0])
+    self.assertIs(route.route[-1], test_route[2])
+
+  def test_resample_route_interpolates_across_segments(self):
+    test_route = [geobeam.gps_utils.Location(0.0, 0.0, 0.0),
+                  geobeam.gps_utils.Location(1.0, 0.0, 10.0),
+                  geobeam.gps_utils.Location(1.0, 2.0, 10.0)]
+    route = geobeam.generate_route.TimedRoute(test_route, [10, 20], 4, 1)
+
+    route.resample_route()
+
+    # samples at 0, 4, 8, 12, 16, 20, 24, 28 and 30 meters
+    points = route.route[10:]
+    self.assertEqual(len(points), 9)
+    self.assertAlmostEqual(points[1].latitude, 0.4)
+    self.assertAlmostEqual(points[1].altitude, 4.0)
+    self.assertAlmostEqual(points[3].latitude, 1.0)
+    self.assertAlmostEqual(points[3].longitude, 0.2)
+    self.assertAlmostEqual(route.distances[-1], 2.0)
+
+  @patch('geobeam.generate_route.TimedRoute.upsample_route')
+  @patch('geobeam.generate_route.TimedRoute.resample_route')
+  @patch('geobeam.generate_route.calculate_distance')
+  @patch('geobeam.gpx_parser.GpxFileParser.parse_file')
+  def test_route_init_from_gpx_with_speed_profile(self, mock_gpx_file_parser,
+                                                  mock_calculate_distance,
+                                                  mock_resample_route,
+                                                  mock_upsample_route):
+    mock_gpx_file_parser.return_value = self.test_points
+    mock_calculate_distance.side_effect = self.distances
+    speed_profile = geobeam.speed_profiles.ConstantSpeedProfile(7)
+
+    route = geobeam.generate_route.TimedRoute.from_gpx(Mock(), 7, 10,
+                                                       speed_profile=speed_profile)
+
+    self.assertIs(route.speed_profile, speed_profile)
+    mock_resample_route.assert_called_once()
+    mock_upsample_route.assert_not_called()
+
   @patch('geobeam.generate_route._write_to_csv')
   def test_write_route(self, mock_write_to_csv):
     filename = "writeroutetest.csv"
@@ -191,6 +250,116 @@ class TimedRouteTest(unittest.TestCase):
     mock_write_to_csv.assert_called_once_with("geobeam/user_motion_files/writeroutetest.csv", expected_write_array)
 
 
+  @patch('geobeam.generate_route._write_to_csv')
+  def test_write_route_in_segments(self, mock_write_to_csv):
+    self.mock_get_xyz_tuple.return_value = (1.0, 2.0, 3.0)
+    test_route = [geobeam.gps_utils.Location(*self.location1)]*25
+    route = geobeam.generate_route.TimedRoute(test_route, [0]*24, 10, 10)
+
+    file_paths = route.write_route("segmented.csv", max_segment_duration=1)
+
+    self.assertEqual(file_paths, ["geobeam/user_motion_files/segmented_part000.csv",
+                                  "geobeam/user_motion_files/segmented_part001.csv",
+                                  "geobeam/user_motion_files/segmented_part002.csv"])
+    segments = [write_call[0][1] for write_call in mock_write_to_csv.call_args_list]
+    self.assertEqual([len(segment) for segment in segments], [10, 10, 5])
+    self.assertEqual(segments[1][0], ('0.0', 1.0, 2.0, 3.0))
+    self.assertEqual(segments[2][-1], ('0.4', 1.0, 2.0, 3.0))
+
+  def test_iter_timed_rows(self):
+    self.mock_get_xyz_tuple.return_value = (1.0, 2.0, 3.0)
+    test_route = [geobeam.gps_utils.Location(*self.location1)]*3
+    route = geobeam.generate_route.TimedRoute(test_route, [0]*2, 10, 10)
+
+    rows = route.iter_timed_rows()
+
+    self.assertEqual(self.mock_get_xyz_tuple.call_count, 0)
+    self.assertEqual(list(rows), [('0.0', 1.0, 2.0, 3.0),
+                                  ('0.1', 1.0, 2.0, 3.0),
+                                  ('0.2', 1.0, 2.0, 3.0)])
+
+  def test_from_route(self):
+    test_route = [geobeam.gps_utils.Location(*self.location1),
+                  geobeam.gps_utils.Location(*self.location2),
+                  geobeam.gps_utils.Location(*self.location3)]
+    route = geobeam.generate_route.Route(test_route, [5, 10])
+    speed_profile = geobeam.speed_profiles.ConstantSpeedProfile(3)
+
+    walking_route = geobeam.generate_route.TimedRoute.from_route(route, 1.5, 10)
+    profiled_route = geobeam.generate_route.TimedRoute.from_route(route, 3, 10,
+                                                                  speed_profile=speed_profile)
+
+    expected_route = geobeam.generate_route.TimedRoute(list(test_route), [5, 10], 1.5, 10)
+    expected_route.upsample_route()
+    self.assertEqual([location.get_lat_lon_tuple() for location in walking_route.route],
+                     [location.get_lat_lon_tuple() for location in expected_route.route])
+    self.assertEqual(len(profiled_route.route), 10 + 51)
+    self.assertIs(profiled_route.route[-1], test_route[2])
+    # the base route is left as it is for further variants
+    self.assertEqual(route.route, test_route)
+    self.assertEqual(route.distances, [5, 10])
+    self.assertEqual(route._get_cumulative_distances(), [0.0, 5.0, 15.0])
+
+  def test_streamed_timed_route(self):
+    # real ECEF coordinates, so rows of different points differ
+    self.patcher.stop()
+    test_route = [geobeam.gps_utils.Location(*self.location1),
+                  geobeam.gps_utils.Location(*self.location2),
+                  geobeam.gps_utils.Location(*self.location3)]
+    route = geobeam.generate_route.Route(test_route, [5, 10])
+    speed_profile = geobeam.speed_profiles.AccelerationLimitedSpeedProfile(3, 1)
+
+    for speed, profile in [(1.5, None), (3, speed_profile)]:
+      streamed_route = geobeam.generate_route.StreamedTimedRoute(route, speed, 10, profile)
+      timed_route = geobeam.generate_route.TimedRoute.from_route(route, speed, 10, profile)
+
+      rows = list(streamed_route.iter_timed_rows())
+
+      self.assertEqual(rows, list(timed_route.iter_timed_rows()))
+      self.assertEqual(len(streamed_route), len(rows))
+    # the base route is left as it is
+    self.assertEqual(route.route, test_route)
+    self.assertEqual(route.distances, [5, 10])
+
+
+class RouteVariantsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.working_directory = os.getcwd()
+    # route files are written relative to the working directory
+    os.chdir(self.temp_dir.name)
+    self.route = geobeam.generate_route.Route([geobeam.gps_utils.Location(0.0, 0.0, 0.0),
+                                               geobeam.gps_utils.Location(0.001, 0.0, 0.0)],
+                                              [110.6])
+
+  def tearDown(self):
+    os.chdir(self.working_directory)
+    self.temp_dir.cleanup()
+
+  def test_write_route_variants(self):
+    variants = [geobeam.generate_route.RouteVariant("walking.csv", 1.4, 10),
+                geobeam.generate_route.RouteVariant("biking.csv", 7, 10,
+                                                    max_segment_duration=10),
+                geobeam.generate_route.RouteVariant("running.csv", 2.5, 10,
+                                                    speed_profile=ConstantSpeedProfile(2.5))]
+
+    file_paths = geobeam.generate_route.write_route_variants(self.route, variants,
+                                                             max_workers=2)
+
+    self.assertEqual(file_paths[0], ["geobeam/user_motion_files/walking.csv"])
+    self.assertEqual(file_paths[1], ["geobeam/user_motion_files/biking_part000.csv",
+                                     "geobeam/user_motion_files/biking_part001.csv"])
+    for variant, variant_file_paths in zip(variants, file_paths):
+      expected_route = geobeam.generate_route.TimedRoute.from_route(
+          self.route, variant.speed, variant.frequency, variant.speed_profile)
+      row_count = 0
+      for file_path in variant_file_paths:
+        with open(file_path) as route_file:
+          row_count += len(route_file.readlines())
+      self.assertEqual(row_count, len(expected_route.route))
+
+
 class CSVWriterTest(unittest.TestCase):
 
   @patch('geobeam.generate_route.csv')
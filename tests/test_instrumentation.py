@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import geobeam
+from geobeam import instrumentation
+
+
+class InstrumentationTest(unittest.TestCase):
+
+  def test_timed_without_sinks(self):
+    self.assertFalse(instrumentation.is_enabled())
+    self.assertIs(instrumentation.timed(instrumentation.SAMPLING),
+                  instrumentation.timed(instrumentation.CSV_WRITING))
+
+  def test_timed_reports_to_sinks(self):
+    sink = MagicMock()
+    with instrumentation.recording(sink), instrumentation.labelled("SimulationOne"):
+      with instrumentation.timed(instrumentation.SAMPLING):
+        pass
+
+    stage, seconds, label = sink.call_args[0]
+    self.assertEqual(stage, instrumentation.SAMPLING)
+    self.assertGreaterEqual(seconds, 0)
+    self.assertEqual(label, "SimulationOne")
+    self.assertFalse(instrumentation.is_enabled())
+    self.assertIsNone(instrumentation.get_label())
+
+  def test_stage_aggregator(self):
+    aggregator = instrumentation.StageAggregator()
+    aggregator(instrumentation.DIRECTIONS_REQUEST, 0.5, "SimulationOne")
+    aggregator(instrumentation.CSV_WRITING, 0.25, "SimulationOne")
+    aggregator(instrumentation.CSV_WRITING, 0.5, "SimulationOne")
+    aggregator(instrumentation.CSV_WRITING, 1.0, "SimulationTwo")
+
+    self.assertEqual(aggregator.get_labels(), ["SimulationOne", "SimulationTwo"])
+    self.assertEqual(aggregator.get_breakdown("SimulationOne"),
+                     {instrumentation.DIRECTIONS_REQUEST: (1, 0.5),
+                      instrumentation.CSV_WRITING: (2, 0.75)})
+    self.assertEqual(aggregator.format_breakdown("SimulationOne"),
+                     "directions_request 0.500 s, csv_writing 0.750 s")
+
+
+class RouteInstrumentationTest(unittest.TestCase):
+
+  @patch('geobeam.map_requests.GMAPS')
+  @patch('geobeam.map_requests.parse_elevations_response')
+  @patch('geobeam.map_requests.parse_directions_response')
+  @patch('geobeam.generate_route._write_to_csv')
+  def test_route_stages_recorded(self, mock_write_to_csv, mock_parse_directions_response,
+                                 mock_parse_elevations_response, mock_gmaps):
+    mock_parse_directions_response.return_value = ([(26.1, 86.1), (26.1001, 86.1)], [11.1])
+    mock_parse_elevations_response.return_value = [5.0, 5.0]
+    aggregator = instrumentation.StageAggregator()
+
+    with instrumentation.recording(aggregator):
+      route = geobeam.generate_route.TimedRoute.from_start_and_end(
+          geobeam.gps_utils.Location(26.1, 86.1), geobeam.gps_utils.Location(26.1001, 86.1),
+          1.4, 10)
+
+    self.assertEqual(list(aggregator.get_breakdown()),
+                     [instrumentation.DIRECTIONS_REQUEST, instrumentation.ELEVATION_REQUEST,
+                      instrumentation.ECEF_CONVERSION, instrumentation.SAMPLING])
+
+  @patch('geobeam.gpx_parser.GpxFileParser.parse_file')
+  def test_gpx_route_stages_recorded(self, mock_parse_file):
+    mock_parse_file.return_value = [(26.1, 86.1, 5.0), (26.1001, 86.1, 5.0)]
+    aggregator = instrumentation.StageAggregator()
+
+    with instrumentation.recording(aggregator):
+      route = geobeam.generate_route.Route.from_gpx("route.gpx")
+
+    self.assertEqual(list(aggregator.get_breakdown()),
+                     [instrumentation.GPX_PARSING, instrumentation.ECEF_CONVERSION,
+                      instrumentation.DISTANCE_CALCULATION])
+    self.assertEqual(len(route.distances), 1)
+
+  def test_route_variant_stages_recorded_from_workers(self):
+    route = geobeam.generate_route.Route([geobeam.gps_utils.Location(0.0, 0.0, 0.0),
+                                          geobeam.gps_utils.Location(0.001, 0.0, 0.0)],
+                                         [110.6])
+    variants = [geobeam.generate_route.RouteVariant("walking.csv", 1.4, 10, label="Walk"),
+                geobeam.generate_route.RouteVariant("biking.csv", 7, 10, label="Bike")]
+    aggregator = instrumentation.StageAggregator()
+
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+      # route files are written relative to the working directory
+      os.chdir(temp_dir)
+      try:
+        with instrumentation.recording(aggregator):
+          geobeam.generate_route.write_route_variants(route, variants, max_workers=2)
+      finally:
+        os.chdir(working_directory)
+
+    for label in ["Walk", "Bike"]:
+      self.assertEqual(list(aggregator.get_breakdown(label)),
+                       [instrumentation.SAMPLING, instrumentation.CSV_WRITING])
+
+
+if __name__ == '__main__':
+  unittest.main()
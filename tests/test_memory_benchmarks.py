@@ -0,0 +1,46 @@
+import argparse
+import unittest
+
+from benchmarks import memory_benchmarks
+
+
+class MemoryBenchmarksTest(unittest.TestCase):
+
+  def test_run_memory_benchmarks(self):
+    results = memory_benchmarks.run_memory_benchmarks([200])
+
+    self.assertEqual([result["stage"] for result in results], memory_benchmarks.STAGES)
+    for result in results:
+      self.assertEqual(result["size"], 200)
+      self.assertGreater(result["peak_memory"], 0)
+      self.assertGreaterEqual(result["peak_memory"], result["retained_memory"])
+      self.assertEqual(result["peak_bytes_per_point"], result["peak_memory"]/result["points"])
+    imported = results[0]
+    # the imported route is kept, so most of what it took is still allocated
+    self.assertGreater(imported["retained_memory"], 200*100)
+
+  def test_find_budget_violations(self):
+    results = [{"stage": "route_from_gpx", "size": 1000, "peak_bytes_per_point": 900.0},
+               {"stage": "upsample_route", "size": 1000, "peak_bytes_per_point": 200.0},
+               {"stage": "write_route", "size": 1000, "peak_bytes_per_point": 5000.0}]
+
+    violations = memory_benchmarks.find_budget_violations(
+        results, {"route_from_gpx": 1000, "upsample_route": 100})
+
+    self.assertEqual(len(violations), 1)
+    self.assertTrue(violations[0].startswith("upsample_route at 1000 points"))
+
+  def test_parse_budget(self):
+    self.assertEqual(memory_benchmarks.parse_budget("write_route=256"), ("write_route", 256.0))
+    with self.assertRaises(argparse.ArgumentTypeError):
+      memory_benchmarks.parse_budget("resample_route=256")
+    with self.assertRaises(argparse.ArgumentTypeError):
+      memory_benchmarks.parse_budget("write_route=lots")
+
+  def test_main_fails_over_budget(self):
+    self.assertEqual(memory_benchmarks.main(["--sizes", "100", "--stages", "upsample_route",
+                                             "--budget", "upsample_route=1"]), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
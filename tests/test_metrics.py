@@ -0,0 +1,99 @@
+import os
+import subprocess
+import tempfile
+import unittest
+import urllib.request
+from unittest.mock import Mock
+from unittest.mock import patch
+
+import geobeam
+from geobeam import metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+  def test_counter_render(self):
+    registry = metrics.MetricsRegistry()
+    counter = registry.counter("geobeam_test_total", "Things counted.")
+    counter.inc(device="a")
+    counter.inc(2, device="a")
+    counter.inc(device='say "b"')
+
+    self.assertEqual(counter.get(device="a"), 3)
+    self.assertEqual(registry.render(),
+                     "# HELP geobeam_test_total Things counted.\n"
+                     "# TYPE geobeam_test_total counter\n"
+                     "geobeam_test_total{device=\"a\"} 3\n"
+                     "geobeam_test_total{device=\"say \\\"b\\\"\"} 1\n")
+
+  def test_histogram_render(self):
+    histogram = metrics.Histogram("geobeam_test_seconds", "Things timed.", buckets=(1, 0.5))
+    histogram.observe(0.25)
+    histogram.observe(0.75)
+    histogram.observe(2)
+
+    self.assertEqual(histogram.get_count(), 3)
+    self.assertEqual(histogram.render(),
+                     ["geobeam_test_seconds_bucket{le=\"0.5\"} 1",
+                      "geobeam_test_seconds_bucket{le=\"1\"} 2",
+                      "geobeam_test_seconds_bucket{le=\"+Inf\"} 3",
+                      "geobeam_test_seconds_sum 3.0",
+                      "geobeam_test_seconds_count 3"])
+
+  def test_registry_reuses_metrics(self):
+    registry = metrics.MetricsRegistry()
+    counter = registry.counter("geobeam_test_total", "Things counted.")
+    self.assertIs(registry.counter("geobeam_test_total", "Things counted."), counter)
+    with self.assertRaises(ValueError):
+      registry.histogram("geobeam_test_total", "Things timed.")
+
+  def test_file_writer(self):
+    registry = metrics.MetricsRegistry()
+    counter = registry.counter("geobeam_test_total", "Things counted.")
+    with tempfile.TemporaryDirectory() as directory:
+      file_path = os.path.join(directory, "geobeam.prom")
+      writer = metrics.MetricsFileWriter(registry, file_path, interval=60)
+      writer.start()
+      counter.inc()
+      writer.close()
+
+      with open(file_path) as metrics_file:
+        self.assertIn("geobeam_test_total 1\n", metrics_file.read())
+      self.assertEqual(os.listdir(directory), ["geobeam.prom"])
+
+  def test_server(self):
+    registry = metrics.MetricsRegistry()
+    registry.counter("geobeam_test_total", "Things counted.").inc()
+    server = metrics.MetricsServer(registry, 0)
+    server.start()
+    try:
+      url = "http://127.0.0.1:%d/metrics" % server.get_port()
+      with urllib.request.urlopen(url, timeout=5) as response:
+        self.assertEqual(response.headers["Content-Type"], metrics.CONTENT_TYPE)
+        self.assertIn("geobeam_test_total 1\n", response.read().decode())
+    finally:
+      server.close()
+    self.assertIsNone(server.get_port())
+
+  @patch('builtins.print')
+  def test_simulation_teardown_metrics(self, mock_print):
+    mock_process = Mock()
+    mock_process.communicate.side_effect = subprocess.TimeoutExpired("bladeGPS", 0.5)
+    mock_process.wait.side_effect = [subprocess.TimeoutExpired("bladeGPS", 0.5), 0]
+    mock_process.returncode = -9
+    test_simulation = geobeam.simulations.Simulation()
+    test_simulation.set_device("test_teardown")
+    test_simulation._process = mock_process
+    test_simulation.is_running = Mock(return_value=True)
+    escalations = geobeam.simulations.TEARDOWN_ESCALATIONS
+
+    test_simulation.end_simulation(teardown_timeout=0.5)
+
+    self.assertEqual(escalations.get(device="test_teardown", step="terminate"), 1)
+    self.assertEqual(escalations.get(device="test_teardown", step="kill"), 1)
+    # stopped on purpose, so not a failure
+    self.assertEqual(geobeam.simulations.SIMULATION_FAILURES.get(device="test_teardown"), 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,350 @@
+import hashlib
+import os
+import subprocess
+import tempfile
+import unittest
+
+from geobeam import motion_files
+
+
+class ValidateMotionFileTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def write_motion_file(self, contents):
+    file_path = os.path.join(self.temp_dir.name, "motion.csv")
+    with open(file_path, "w") as motion_file:
+      motion_file.write(contents)
+    return file_path
+
+  def test_valid_file(self):
+    file_path = self.write_motion_file("0.0,1,2,3\n0.1,1,2,3\n0.2,1,2,4\n")
+
+    self.assertEqual(motion_files.validate_motion_file(file_path), 3)
+
+  def test_empty_file(self):
+    file_path = self.write_motion_file("")
+
+    with self.assertRaises(ValueError):
+      motion_files.validate_motion_file(file_path)
+
+  def test_wrong_column_count(self):
+    file_path = self.write_motion_file("0.0,1,2,3\n0.1,1,2\n")
+
+    with self.assertRaisesRegex(ValueError, ":2: expected 4 columns"):
+      motion_files.validate_motion_file(file_path)
+
+  def test_non_numeric_value(self):
+    file_path = self.write_motion_file("0.0,1,x,3\n")
+
+    with self.assertRaisesRegex(ValueError, "non numeric"):
+      motion_files.validate_motion_file(file_path)
+
+  def test_time_not_increasing(self):
+    file_path = self.write_motion_file("0.0,1,2,3\n0.1,1,2,3\n0.1,1,2,3\n")
+
+    with self.assertRaisesRegex(ValueError, ":3: time 0.1 does not increase"):
+      motion_files.validate_motion_file(file_path)
+
+
+class ScanMotionFileTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.file_path = os.path.join(self.temp_dir.name, "motion.csv")
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def write_rows(self, rows):
+    with open(self.file_path, "w") as motion_file:
+      for row in rows:
+        motion_file.write("%s,%s,%s,%s\n" % row)
+
+  def test_valid_file(self):
+    self.write_rows([("%.1f" % (i/10), i*0.5, 0, 0) for i in range(20)])
+
+    scan = motion_files.scan_motion_file(self.file_path)
+
+    self.assertEqual((scan.errors, scan.warnings), ([], []))
+    self.assertEqual((scan.row_count, scan.rate), (20, 10.0))
+    self.assertAlmostEqual(scan.duration, 1.9)
+    self.assertAlmostEqual(scan.max_speed, 5.0)
+    self.assertAlmostEqual(scan.max_acceleration, 0.0)
+
+  def test_reports_every_kind_of_problem(self):
+    rows = [("%.1f" % (i/10), 0, 0, 0) for i in range(10)]
+    rows[4] = ("0.45", 0, 0, 0)  # breaks the rate twice
+    rows[7] = ("0.7", 100, 0, 0)  # jumps out and back
+    self.write_rows(rows)
+
+    scan = motion_files.scan_motion_file(self.file_path, max_speed=50, max_acceleration=200,
+                                         max_duration=0.5)
+
+    self.assertEqual(len(scan.errors), 1)
+    self.assertIn("10 rows overflow the bladeGPS buffer of 5 rows", scan.errors[0])
+    self.assertEqual(len(scan.warnings), 3)
+    self.assertIn(":5: time step 0.15 breaks the rate of 10 Hz (and 1 more rows)",
+                  scan.warnings[0])
+    self.assertIn(":8: speed of 1000.0 m/s is over 50 m/s (and 1 more rows)", scan.warnings[1])
+    self.assertIn(":8: speed jumps by 10000.0 m/s^2", scan.warnings[2])
+    self.assertAlmostEqual(scan.max_speed, 1000.0)
+
+  def test_time_not_increasing(self):
+    self.write_rows([("0.0", 1, 2, 3), ("0.1", 1, 2, 3), ("0.1", 1, 2, 3), ("0.0", 1, 2, 3)])
+
+    scan = motion_files.scan_motion_file(self.file_path)
+
+    self.assertEqual(len(scan.errors), 1)
+    self.assertIn(":3: time 0.1 does not increase (and 1 more rows)", scan.errors[0])
+
+  def test_malformed_rows(self):
+    with open(self.file_path, "w") as motion_file:
+      motion_file.write("0.0,1,2,3\n0.1,1,x,3\n")
+
+    self.assertIn(":2: non numeric value",
+                  motion_files.scan_motion_file(self.file_path).errors[0])
+
+    with open(self.file_path, "w") as motion_file:
+      motion_file.write("")
+
+    self.assertIn("empty", motion_files.scan_motion_file(self.file_path).errors[0])
+
+  def test_rows_not_lined_up(self):
+    # the blank row and the long row together have as many values as two rows
+    with open(self.file_path, "w") as motion_file:
+      motion_file.write("0.0,1,2,3\n\n0.1,1,2,3,0.2,1,2\n")
+
+    self.assertIn(":2: expected 4 columns, found 0 (and 1 more rows)",
+                  motion_files.scan_motion_file(self.file_path).errors[0])
+
+  def test_quoted_values(self):
+    with open(self.file_path, "w") as motion_file:
+      motion_file.write('0.0,"1",2,3\n0.1,1,2,3\n')
+
+    scan = motion_files.scan_motion_file(self.file_path)
+
+    self.assertEqual((scan.errors, scan.row_count), ([], 2))
+
+  def test_rate_other_than_bladegps(self):
+    self.write_rows([("%.1f" % (i/5), 0, 0, 0) for i in range(5)])
+
+    scan = motion_files.scan_motion_file(self.file_path)
+
+    self.assertEqual(scan.rate, 5.0)
+    self.assertIn("rate is 5 Hz", scan.warnings[0])
+
+
+class MotionFileReferenceTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.file_path = os.path.join(self.temp_dir.name, "motion.csv")
+    with open(self.file_path, "w") as motion_file:
+      for i in range(50):
+        motion_file.write("%.1f,%d,2,3\n" % (i*0.2, i))
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def test_get_motion_file_info(self):
+    info = motion_files.get_motion_file_info(self.file_path)
+
+    with open(self.file_path, "rb") as motion_file:
+      self.assertEqual(info.sha256, hashlib.sha256(motion_file.read()).hexdigest())
+    self.assertEqual(info.row_count, 50)
+    self.assertEqual(info.rate, 5)
+
+  def test_reference_resolves_played_rows(self):
+    reference = motion_files.MotionFileReference(self.file_path, 10, 2.1)
+
+    log_value = reference.to_log_value()
+    rows = motion_files.read_played_segment(log_value)
+
+    self.assertEqual(log_value["start_index"], 10)
+    self.assertEqual(log_value["end_index"], 20)
+    self.assertEqual(log_value["rate"], 5)
+    self.assertEqual(rows[0], ["2.0", "10", "2", "3"])
+    self.assertEqual(len(rows), 10)
+
+  def test_reference_clamped_to_file_length(self):
+    reference = motion_files.MotionFileReference(self.file_path, 0, 3600)
+
+    self.assertEqual(reference.to_log_value()["end_index"], 50)
+
+  def test_read_played_segment_changed_file(self):
+    log_value = motion_files.MotionFileReference(self.file_path, 0, 1).to_log_value()
+    with open(self.file_path, "a") as motion_file:
+      motion_file.write("10.0,1,2,3\n")
+
+    with self.assertRaises(ValueError):
+      motion_files.read_played_segment(log_value)
+
+  def test_read_played_segment_moved_file(self):
+    log_value = motion_files.MotionFileReference(self.file_path, 0, 1).to_log_value()
+    moved_file_path = os.path.join(self.temp_dir.name, "moved.csv")
+    os.rename(self.file_path, moved_file_path)
+
+    rows = motion_files.read_played_segment(log_value, moved_file_path)
+
+    self.assertEqual(len(rows), 5)
+
+
+class MotionFileIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.file_path = os.path.join(self.temp_dir.name, "motion.csv")
+    with open(self.file_path, "w", newline="") as motion_file:
+      for i in range(100):
+        motion_file.write("%.1f,%d,2,3\r\n" % (i/10, i))
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def test_row_offsets(self):
+    self.assertEqual(motion_files.build_motion_file_index(self.file_path), 100)
+
+    self.assertEqual(motion_files.get_row_offset(self.file_path, 0), 0)
+    self.assertEqual(motion_files.get_row_offset(self.file_path, 1), len("0.0,0,2,3\r\n"))
+    self.assertEqual(motion_files.get_motion_file_row_count(self.file_path), 100)
+    with self.assertRaises(IndexError):
+      motion_files.get_row_offset(self.file_path, 100)
+
+  def test_has_motion_file_row(self):
+    self.assertTrue(motion_files.has_motion_file_row(self.file_path, 99))
+    self.assertFalse(motion_files.has_motion_file_row(self.file_path, 100))
+    # answered without building the index
+    self.assertFalse(os.path.exists(self.file_path + motion_files.INDEX_SUFFIX))
+
+    motion_files.build_motion_file_index(self.file_path)
+    self.assertTrue(motion_files.has_motion_file_row(self.file_path, 99))
+    self.assertFalse(motion_files.has_motion_file_row(self.file_path, 100))
+    self.assertFalse(motion_files.has_motion_file_row(self.file_path, -1))
+
+  def test_index_built_on_demand_and_rebuilt_when_stale(self):
+    self.assertEqual(motion_files.get_motion_file_row_count(self.file_path), 100)
+    self.assertTrue(os.path.exists(self.file_path + motion_files.INDEX_SUFFIX))
+
+    with open(self.file_path, "a") as motion_file:
+      motion_file.write("10.0,100,2,3\n")
+
+    self.assertEqual(motion_files.get_motion_file_row_count(self.file_path), 101)
+
+  def test_write_trimmed_motion_file(self):
+    trimmed_path = os.path.join(self.temp_dir.name, "trimmed.csv")
+
+    row_count = motion_files.write_trimmed_motion_file(self.file_path, 95, trimmed_path)
+
+    self.assertEqual(row_count, 5)
+    with open(trimmed_path, "r", newline="") as trimmed_file:
+      self.assertEqual(trimmed_file.readline(), "0.0,95,2,3\r\n")
+      self.assertEqual(trimmed_file.readlines()[-1], "0.4,99,2,3\r\n")
+
+  def test_get_motion_file_rate(self):
+    self.assertEqual(motion_files.get_motion_file_rate(self.file_path), 10)
+
+  def test_split_motion_file(self):
+    segment_paths = motion_files.split_motion_file(self.file_path, 4)
+
+    self.assertEqual([os.path.basename(path) for path in segment_paths],
+                     ["motion_part000.csv", "motion_part001.csv", "motion_part002.csv"])
+    with open(segment_paths[1], "r") as segment_file:
+      rows = segment_file.readlines()
+    self.assertEqual(len(rows), 40)
+    self.assertEqual(rows[0], "0.0,40,2,3\n")
+    self.assertEqual(motion_files.get_motion_file_row_count(segment_paths[2]), 20)
+
+  def test_split_motion_file_short_enough(self):
+    self.assertEqual(motion_files.split_motion_file(self.file_path, 10), [self.file_path])
+
+  def test_split_motion_file_from_start_row(self):
+    segment_paths = motion_files.split_motion_file(self.file_path, 10, start_row=30)
+
+    self.assertEqual([os.path.basename(path) for path in segment_paths],
+                     ["motion_from_row_30_part000.csv"])
+    self.assertEqual(motion_files.get_motion_file_row_count(segment_paths[0]), 70)
+
+  def test_split_motion_file_past_the_end(self):
+    with self.assertRaisesRegex(ValueError, "none left to play from row 100"):
+      motion_files.split_motion_file(self.file_path, 10, start_row=100)
+
+
+class MotionFileStreamTest(unittest.TestCase):
+
+  def test_rows_streamed_to_reader(self):
+    rows = (("%.1f" % (i*0.1), i, 2, 3) for i in range(1000))
+    stream = motion_files.MotionFileStream(rows)
+    fifo_path = stream.open()
+
+    # stub consumer standing in for bladeGPS
+    reader = subprocess.run(["cat", fifo_path], stdout=subprocess.PIPE, timeout=5)
+    stream.close()
+
+    lines = reader.stdout.decode().splitlines()
+    self.assertEqual(len(lines), 1000)
+    self.assertEqual(lines[1], "0.1,1,2,3")
+    self.assertEqual(stream.rows_written, 1000)
+    self.assertFalse(os.path.exists(fifo_path))
+
+  def test_close_without_reader(self):
+    stream = motion_files.MotionFileStream(iter([("0.0", 1, 2, 3)]))
+    fifo_path = stream.open()
+
+    stream.close()
+
+    self.assertEqual(stream.rows_written, 0)
+    self.assertIsNone(stream.fifo_path)
+    self.assertFalse(os.path.exists(fifo_path))
+
+  def test_reader_leaving_early(self):
+    rows = (("%.1f" % (i*0.1), i, 2, 3) for i in range(10**6))
+    stream = motion_files.MotionFileStream(rows)
+    fifo_path = stream.open()
+
+    reader = subprocess.run("head -n 5 " + fifo_path, shell=True,
+                            stdout=subprocess.PIPE, timeout=5)
+    stream.close()
+
+    self.assertEqual(len(reader.stdout.splitlines()), 5)
+    self.assertLess(stream.rows_written, 10**6)
+
+
+class MotionStreamSegmentsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.sources_created = 0
+
+  def row_source(self):
+    self.sources_created += 1
+    return (("%.1f" % (i*0.1), i, 2, 3) for i in range(25))
+
+  def test_segments_in_order_share_rows(self):
+    segments = motion_files.MotionStreamSegments(self.row_source, 10)
+
+    played = [list(segments.iter_segment_rows(segment)) for segment in range(3)]
+
+    self.assertEqual([len(rows) for rows in played], [10, 10, 5])
+    self.assertEqual(played[1][0], ("0.0", 10, 2, 3))
+    self.assertEqual(played[2][-1], ("0.4", 24, 2, 3))
+    self.assertEqual(self.sources_created, 1)
+
+  def test_segment_ended_early_or_replayed(self):
+    segments = motion_files.MotionStreamSegments(self.row_source, 10)
+
+    first_segment = segments.iter_segment_rows(0)
+    next(first_segment)
+    second_segment = list(segments.iter_segment_rows(1))
+    replayed_segment = list(segments.iter_segment_rows(0))
+
+    self.assertEqual(second_segment[0], ("0.0", 10, 2, 3))
+    self.assertEqual(replayed_segment[0], ("0.0", 0, 2, 3))
+    self.assertEqual(self.sources_created, 2)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,162 @@
+import configparser
+import os
+import tempfile
+import unittest
+
+from geobeam import planner
+
+TEST_GPX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_gpx_file.gpx")
+
+
+class PlanConfigTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.config = configparser.ConfigParser()
+    self.config["DEFAULT"]["Speed"] = "1.4"
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def read_config(self, text):
+    self.config.read_string(text)
+    return planner.plan_config(self.config, self.temp_dir.name)
+
+  def write_motion_file(self, file_name, row_count, step=1.0):
+    with open(os.path.join(self.temp_dir.name, file_name), "w") as motion_file:
+      for i in range(row_count):
+        motion_file.write("%.1f,%s,0,0\n" % (i/10, i*step))
+
+  def test_reports_errors_of_every_section(self):
+    plan = self.read_config("""
+[DEFAULT]
+Nice = low
+[Static]
+Dynamic = False
+Latitude = 27.4
+[Created]
+Dynamic = True
+CreateFile = True
+FileName = created.csv
+StartLatitude = 37.417747
+StartLongitude = -122.086086
+EndLatitude = 37.421624
+EndLongitude = north
+[Missing]
+Dynamic = True
+CreateFile = False
+FileName = missing.csv
+""")
+
+    self.assertTrue(plan.has_errors())
+    self.assertEqual(len(plan.errors), 1)
+    self.assertIn("Nice", plan.errors[0])
+    errors = {section.name: section.errors for section in plan.sections}
+    self.assertIn("longitude", errors["Static"][0])
+    self.assertIn("north", errors["Created"][0])
+    self.assertIn("missing.csv does not exist", errors["Missing"][0])
+
+  def test_estimates_routes(self):
+    self.write_motion_file("walk.csv", 50)
+    plan = self.read_config("""
+[Sweep]
+Dynamic = True
+CreateFile = True
+FileName = sweep.csv
+StartLatitude = 37.417747
+StartLongitude = -122.086086
+EndLatitude = 37.421624
+EndLongitude = -122.096472
+Speed = 5, 10
+Gain = -4, -2
+[Stream]
+Dynamic = True
+Stream = True
+StartLatitude = 37.417747
+StartLongitude = -122.086086
+EndLatitude = 37.421624
+EndLongitude = -122.096472
+RunDuration = 30
+[Gpx]
+Dynamic = True
+CreateFile = True
+FileName = gpx.csv
+GpxSourcePath = %s
+[PlaysCreated]
+Dynamic = True
+CreateFile = False
+FileName = sweep_10mps.csv
+[PlaysExisting]
+Dynamic = True
+CreateFile = False
+FileName = walk.csv
+RunDuration = 2
+[Static]
+Dynamic = False
+Latitude = 27.4
+Longitude = -112.1
+""" % TEST_GPX_FILE)
+
+    self.assertFalse(plan.has_errors())
+    sections = {section.name: section for section in plan.sections}
+    self.assertEqual([section.name for section in plan.sections],
+                     ["Sweep", "Stream", "Gpx", "PlaysCreated", "PlaysExisting", "Static"])
+    length = planner.calculate_distance((37.417747, -122.086086), (37.421624, -122.096472))
+    self.assertEqual(sections["Sweep"].simulation_count, 4)
+    self.assertEqual(sections["Sweep"].api_calls, 2)
+    self.assertEqual(sections["Sweep"].point_count, int(length*2) + int(length) + 2*10)
+    self.assertEqual(sections["Sweep"].file_size,
+                     sections["Sweep"].point_count*planner.ESTIMATED_ROW_BYTES)
+    self.assertAlmostEqual(sections["Sweep"].run_time, 2*(length/5 + length/10))
+    self.assertEqual(sections["Stream"].api_calls, 0)
+    self.assertEqual(sections["Stream"].file_size, 0)
+    self.assertEqual(sections["Stream"].run_time, 30)
+    self.assertGreater(sections["Gpx"].point_count, 0)
+    self.assertEqual(sections["PlaysCreated"].point_count, int(length) + 10)
+    self.assertEqual((sections["PlaysExisting"].point_count,
+                      sections["PlaysExisting"].run_time), (50, 2))
+    self.assertEqual(sections["Static"].open_ended_count, 1)
+    self.assertEqual(plan.get_total("api_calls"), 2)
+    lines = planner.format_plan(plan)
+    self.assertTrue(lines[-1].startswith("total"))
+
+  def test_device_set_in_some_sections(self):
+    plan = self.read_config("""
+[Board1]
+Dynamic = False
+Latitude = 27.4
+Longitude = -112.1
+Device = *:serial=f12ce103
+[FirstFound]
+Dynamic = False
+Latitude = 27.4
+Longitude = -112.1
+""")
+
+    self.assertTrue(plan.has_errors())
+    self.assertIn("Device", plan.errors[0])
+
+  def test_scans_motion_files(self):
+    self.write_motion_file("fast.csv", 40, step=100)
+    self.write_motion_file("long.csv", 40)
+    plan = self.read_config("""
+[Fast]
+Dynamic = True
+CreateFile = False
+FileName = fast.csv
+[Long]
+Dynamic = True
+CreateFile = False
+FileName = long.csv
+MaxSegmentDuration = 2
+""")
+
+    sections = {section.name: section for section in plan.sections}
+    self.assertFalse(plan.has_errors())
+    self.assertIn("speed of 1000.0 m/s", sections["Fast"].warnings[0])
+    self.assertIn("played in 2 segments", sections["Long"].warnings[0])
+    self.assertAlmostEqual(sections["Long"].run_time, 3.9)
+
+
+if __name__ == '__main__':
+  unittest.main()
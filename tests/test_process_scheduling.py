@@ -0,0 +1,101 @@
+import os
+import subprocess
+import sys
+import unittest
+from unittest.mock import call
+from unittest.mock import patch
+
+from geobeam.process_scheduling import parse_cpu_list
+from geobeam.process_scheduling import ProcessScheduling
+
+
+class ParseCpuListTest(unittest.TestCase):
+
+  def test_parse_cpu_list(self):
+    self.assertEqual(parse_cpu_list("2,3"), {2, 3})
+    self.assertEqual(parse_cpu_list("0-2, 5"), {0, 1, 2, 5})
+
+  def test_parse_malformed_cpu_list(self):
+    with self.assertRaises(ValueError):
+      parse_cpu_list("two")
+
+
+class ProcessSchedulingTest(unittest.TestCase):
+
+  def setUp(self):
+    self.process = subprocess.Popen([sys.executable, "-c", "input()"], stdin=subprocess.PIPE)
+
+  def tearDown(self):
+    self.process.communicate(b"q")
+
+  def test_apply(self):
+    cpu = min(os.sched_getaffinity(0))
+    scheduling = ProcessScheduling(cpus=[cpu], nice=5)
+
+    failures = scheduling.apply(self.process.pid)
+
+    self.assertEqual(failures, [])
+    self.assertEqual(os.sched_getaffinity(self.process.pid), {cpu})
+    self.assertEqual(os.getpriority(os.PRIO_PROCESS, self.process.pid), 5)
+
+  @patch('builtins.print')
+  @patch('geobeam.process_scheduling.os.sched_setscheduler')
+  def test_apply_not_permitted(self, mock_sched_setscheduler, mock_print):
+    mock_sched_setscheduler.side_effect = PermissionError("Operation not permitted")
+    scheduling = ProcessScheduling(realtime_priority=50)
+
+    failures = scheduling.apply(self.process.pid)
+
+    self.assertEqual(len(failures), 1)
+    self.assertIn("real-time priority 50", failures[0])
+    mock_print.assert_called_once()
+
+  def test_launch(self):
+    cpus = os.sched_getaffinity(0)
+    scheduling = ProcessScheduling(cpus=[min(cpus)])
+
+    process = scheduling.launch(
+        lambda: subprocess.Popen([sys.executable, "-c", "input()"], stdin=subprocess.PIPE))
+
+    self.assertEqual(os.sched_getaffinity(process.pid), {min(cpus)})
+    self.assertEqual(os.sched_getaffinity(0), cpus)
+    process.communicate(b"q")
+
+  @patch('builtins.print')
+  @patch('geobeam.process_scheduling._can_lower_nice_to', return_value=False)
+  def test_launch_defers_nice_launcher_cannot_undo(self, mock_can_lower_nice_to, mock_print):
+    nice = os.getpriority(os.PRIO_PROCESS, 0)
+    launcher_nices = []
+
+    def start():
+      launcher_nices.append(os.getpriority(os.PRIO_PROCESS, 0))
+      return subprocess.Popen([sys.executable, "-c", "input()"], stdin=subprocess.PIPE)
+    process = ProcessScheduling(nice=nice + 5).launch(start)
+
+    self.assertEqual(launcher_nices, [nice])
+    self.assertEqual(os.getpriority(os.PRIO_PROCESS, process.pid), nice + 5)
+    self.assertIn("after it started", mock_print.call_args_list[0][0][0])
+    process.communicate(b"q")
+
+class IsolateCurrentProcessTest(unittest.TestCase):
+
+  @patch('geobeam.process_scheduling.os.listdir')
+  @patch('geobeam.process_scheduling.os.sched_setaffinity')
+  @patch('geobeam.process_scheduling.os.sched_getaffinity')
+  def test_isolate_current_process(self, mock_sched_getaffinity, mock_sched_setaffinity,
+                                   mock_listdir):
+    mock_sched_getaffinity.return_value = {0, 1, 2, 3}
+    mock_listdir.return_value = ["100", "101"]
+
+    ProcessScheduling(cpus=[2, 3]).isolate_current_process()
+
+    mock_sched_setaffinity.assert_has_calls([call(100, {0, 1}), call(101, {0, 1})])
+
+  @patch('geobeam.process_scheduling.os.sched_setaffinity')
+  @patch('geobeam.process_scheduling.os.sched_getaffinity')
+  def test_isolate_keeps_last_cores(self, mock_sched_getaffinity, mock_sched_setaffinity):
+    mock_sched_getaffinity.return_value = {2, 3}
+
+    ProcessScheduling(cpus=[2, 3]).isolate_current_process()
+
+    mock_sched_setaffinity.assert_not_called()
@@ -0,0 +1,81 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from benchmarks import route_benchmarks
+from geobeam.gpx_parser import GpxFileParser
+
+
+class RouteBenchmarksTest(unittest.TestCase):
+
+  def test_synthetic_gpx_file(self):
+    with tempfile.TemporaryDirectory() as temp_dir:
+      file_path = os.path.join(temp_dir, "synthetic.gpx")
+      route_benchmarks.write_synthetic_gpx_file(file_path, 25)
+
+      points = GpxFileParser().parse_file(file_path)
+
+    self.assertEqual(len(points), 25)
+    self.assertAlmostEqual(points[0][0], route_benchmarks.START_LATITUDE)
+
+  def test_run_benchmarks(self):
+    results = route_benchmarks.run_benchmarks([50], repeat=1)
+
+    self.assertEqual([result["stage"] for result in results], route_benchmarks.STAGES)
+    for result in results:
+      self.assertEqual(result["size"], 50)
+      self.assertGreater(result["points"], 0)
+      self.assertIsNotNone(result["peak_memory"])
+    upsampled = next(result for result in results if result["stage"] == "upsample_route")
+    self.assertGreater(upsampled["points"], 50)
+
+  def test_injected_requests(self):
+    requested = []
+
+    def request_directions(start_location, end_location):
+      requested.append((start_location, end_location))
+      return [(26.1, 86.1), (26.1001, 86.1)], [11.1]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+      benchmark = route_benchmarks.RouteBenchmark(
+          5, temp_dir, request_directions=request_directions,
+          request_elevations=lambda locations: [7.0]*len(locations))
+
+      points = benchmark.run_stage("route_from_directions")
+
+    self.assertEqual(points, 2)
+    self.assertEqual(len(requested), 1)
+
+  def test_runs_without_api_key(self):
+    # a None module makes importing geobeam.config fail, as without config.py
+    completed = subprocess.run(
+        [sys.executable, "-c", "import sys; sys.modules['geobeam.config'] = None; "
+         "from benchmarks import route_benchmarks; "
+         "route_benchmarks.run_benchmarks([20], repeat=1, measure_memory=False)"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True, timeout=60)
+
+    self.assertEqual(completed.returncode, 0, completed.stderr)
+
+  def test_find_regressions(self):
+    baseline = [{"stage": "parse_gpx", "size": 1000, "points_per_second": 1000.0,
+                 "peak_memory": 1000},
+                {"stage": "write_route", "size": 1000, "points_per_second": 1000.0,
+                 "peak_memory": 1000}]
+    results = [{"stage": "parse_gpx", "size": 1000, "points_per_second": 950.0,
+                "peak_memory": 1050},
+               {"stage": "write_route", "size": 1000, "points_per_second": 800.0,
+                "peak_memory": 1200},
+               {"stage": "upsample_route", "size": 1000, "points_per_second": 1.0,
+                "peak_memory": 1}]
+
+    regressions = route_benchmarks.find_regressions(baseline, results, threshold=0.1)
+
+    self.assertEqual(len(regressions), 2)
+    self.assertTrue(all(regression.startswith("write_route") for regression in regressions))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,150 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from geobeam.generate_route import RouteVariant
+from geobeam.generate_route import TimedRoute
+from geobeam.route_service import LruCache
+from geobeam.route_service import RouteGenerator
+from geobeam.route_service import RouteServiceClient
+from geobeam.route_service import RouteServiceError
+from geobeam.route_service import RouteServiceServer
+
+TEST_GPX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_gpx_file.gpx")
+
+
+class LruCacheTest(unittest.TestCase):
+
+  def test_evicts_least_recently_used(self):
+    cache = LruCache(2)
+    cache.get_or_create("a", lambda: 1)
+    cache.get_or_create("b", lambda: 2)
+    cache.get_or_create("a", lambda: 3)
+    cache.get_or_create("c", lambda: 4)
+
+    self.assertEqual(len(cache), 2)
+    self.assertEqual(cache.get_or_create("a", lambda: 5), 1)
+    self.assertEqual(cache.get_or_create("b", lambda: 6), 6)
+    self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+
+@patch('geobeam.generate_route.request_elevations')
+@patch('geobeam.generate_route.request_directions')
+class RouteServiceTest(unittest.TestCase):
+
+  def setUp(self):
+    self.route_key = ("directions", 37.417747, -122.086086, 37.421624, -122.096472)
+    self.locations = [(37.417747, -122.086086), (37.418, -122.087), (37.421624, -122.096472)]
+    self.distances = [90, 850]
+    self.elevations = [10.0, 12.0, 11.0]
+
+  def set_up_requests(self, mock_directions, mock_elevations):
+    mock_directions.return_value = (self.locations, self.distances)
+    mock_elevations.return_value = self.elevations
+
+  def test_generator_caches_routes(self, mock_directions, mock_elevations):
+    self.set_up_requests(mock_directions, mock_elevations)
+    generator = RouteGenerator()
+
+    route = generator.get_route(self.route_key)
+    timed_route = generator.get_timed_route(self.route_key, 1.4, 10)
+
+    self.assertIs(generator.get_route(self.route_key), route)
+    self.assertIs(generator.get_timed_route(self.route_key, 1.4, 10), timed_route)
+    self.assertIsNot(generator.get_timed_route(self.route_key, 2.5, 10), timed_route)
+    mock_directions.assert_called_once_with((37.417747, -122.086086), (37.421624, -122.096472))
+    mock_elevations.assert_called_once_with(self.locations)
+    self.assertEqual([location.altitude for location in route.route], self.elevations)
+    self.assertEqual(generator.get_status()["cache_sizes"]["timed_routes"], 2)
+
+  def test_generator_writes_cached_timed_routes(self, mock_directions, mock_elevations):
+    self.set_up_requests(mock_directions, mock_elevations)
+    generator = RouteGenerator()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+      walk_path = os.path.join(temp_dir, "walk.csv")
+      generator.write_route_variants(self.route_key, [RouteVariant(walk_path, 1.4, 10)])
+      with open(walk_path) as walk_file:
+        first_rows = walk_file.read()
+      os.remove(walk_path)
+      file_paths = generator.write_route_variants(self.route_key,
+                                                  [RouteVariant(walk_path, 1.4, 10)])
+      with open(walk_path) as walk_file:
+        self.assertEqual(walk_file.read(), first_rows)
+    timed_route = generator.get_timed_route(self.route_key, 1.4, 10)
+
+    self.assertEqual(file_paths, [[walk_path]])
+    self.assertEqual(generator.get_status()["cache_misses"]["timed_routes"], 1)
+    self.assertEqual(generator.get_status()["cache_hits"]["timed_routes"], 2)
+    self.assertEqual(len(timed_route.route), len(first_rows.splitlines()))
+
+  def test_generator_caches_api_responses(self, mock_directions, mock_elevations):
+    self.set_up_requests(mock_directions, mock_elevations)
+    generator = RouteGenerator(route_cache_size=1)
+
+    generator.get_route(self.route_key)
+    generator.get_route(("gpx", TEST_GPX_FILE))
+    generator.get_route(self.route_key)
+
+    mock_directions.assert_called_once()
+    self.assertEqual(generator.get_status()["cache_misses"]["routes"], 3)
+
+  def test_timed_route_round_trip(self, mock_directions, mock_elevations):
+    self.set_up_requests(mock_directions, mock_elevations)
+    with tempfile.TemporaryDirectory() as temp_dir:
+      socket_path = os.path.join(temp_dir, "routes.sock")
+      server = RouteServiceServer(socket_path)
+      server.start()
+      try:
+        client = RouteServiceClient(socket_path, timeout=10)
+        self.assertTrue(client.is_available())
+        served_route = client.get_timed_route(self.route_key, 1.4, 10)
+        with self.assertRaises(RouteServiceError):
+          client.get_timed_route(("nowhere",), 1.4, 10)
+      finally:
+        server.close()
+      self.assertFalse(os.path.exists(socket_path))
+
+    local_route = TimedRoute.from_route(RouteGenerator().get_route(self.route_key), 1.4, 10)
+    self.assertEqual(list(served_route.iter_timed_rows()), list(local_route.iter_timed_rows()))
+    self.assertEqual(len(served_route), len(local_route.route))
+
+  def test_write_route_variants(self, mock_directions, mock_elevations):
+    self.set_up_requests(mock_directions, mock_elevations)
+    with tempfile.TemporaryDirectory() as temp_dir:
+      motion_directory = os.path.join(temp_dir, "motion")
+      server = RouteServiceServer(os.path.join(temp_dir, "routes.sock"))
+      server.start()
+      try:
+        client = RouteServiceClient(os.path.join(temp_dir, "routes.sock"), timeout=30)
+        with patch('geobeam.generate_route.FILE_FOLDER_PATH', motion_directory + os.sep):
+          file_paths = client.write_route_variants(self.route_key,
+                                                   [RouteVariant("walk.csv", 1.4, 10),
+                                                    RouteVariant("run.csv", 2.5, 10)])
+        self.assertEqual(file_paths, [[os.path.join(motion_directory, "walk.csv")],
+                                      [os.path.join(motion_directory, "run.csv")]])
+        for (file_path,) in file_paths:
+          self.assertTrue(os.path.exists(file_path))
+      finally:
+        server.close()
+
+  def test_socket_directory_writable_by_others(self, mock_directions, mock_elevations):
+    with tempfile.TemporaryDirectory() as temp_dir:
+      os.chmod(temp_dir, 0o777)
+      socket_path = os.path.join(temp_dir, "routes.sock")
+
+      with self.assertRaises(PermissionError):
+        RouteServiceServer(socket_path).start()
+      self.assertFalse(RouteServiceClient(socket_path, timeout=10).is_available())
+
+  def test_client_without_service(self, mock_directions, mock_elevations):
+    client = RouteServiceClient(os.path.join(tempfile.gettempdir(), "no_geobeam_service.sock"))
+
+    self.assertFalse(client.is_available())
+    with self.assertRaises(OSError):
+      client.get_timed_route(self.route_key, 1.4, 10)
+
+
+if __name__ == '__main__':
+  unittest.main()
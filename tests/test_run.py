@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock
+from unittest.mock import patch
+
+import run
+
+
+class MainTest(unittest.TestCase):
+
+  def setUp(self):
+    self.working_directory = os.getcwd()
+    self.temp_dir = tempfile.TemporaryDirectory()
+    os.chdir(self.temp_dir.name)
+    os.makedirs("simulation_configs")
+    os.makedirs(run.MOTION_FILE_DIRECTORY)
+
+  def tearDown(self):
+    os.chdir(self.working_directory)
+    self.temp_dir.cleanup()
+
+  @patch('run._run', new_callable=AsyncMock, return_value=[0])
+  @patch('run.AsyncSimulationSetRunner')
+  @patch('builtins.print')
+  def test_plain_dynamic_section_not_indexed(self, mock_print, mock_runner, mock_run):
+    # longer than bladeGPS loads at once
+    motion_file_path = os.path.join(run.MOTION_FILE_DIRECTORY, "walk.csv")
+    with open(motion_file_path, "w") as motion_file:
+      for row in range(31000):
+        motion_file.write("%.1f,1,2,3\n" % (row/10))
+    with open(os.path.join("simulation_configs", "walk.ini"), "w") as config_file:
+      config_file.write("[Walk]\nDynamic = True\nCreateFile = False\nFileName = walk.csv\n")
+
+    self.assertEqual(run.main("walk.ini"), 0)
+
+    simulation_set = mock_runner.call_args[0][0]
+    self.assertEqual(len(simulation_set._simulations), 1)
+    self.assertEqual(os.listdir(run.MOTION_FILE_DIRECTORY), ["walk.csv"])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from geobeam import simulation_log
+
+
+class LazyValue():
+
+  def __init__(self, value):
+    self.value = value
+
+  def to_log_value(self):
+    return self.value
+
+
+class SimulationLogWriterTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.log_file_path = os.path.join(self.temp_dir.name, "logs", "test.jsonl")
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def test_write_and_read_back(self):
+    log_writer = simulation_log.SimulationLogWriter(self.log_file_path)
+
+    log_writer.write({"event": "simulation", "gain": -2})
+    log_writer.write({"event": "switch", "rows": LazyValue([[0.0, 1.0]])})
+    log_writer.close()
+
+    self.assertEqual(simulation_log.read_simulation_log(self.log_file_path),
+                     [{"event": "simulation", "gain": -2},
+                      {"event": "switch", "rows": [[0.0, 1.0]]}])
+
+  def test_flush_keeps_writer_running(self):
+    log_writer = simulation_log.SimulationLogWriter(self.log_file_path)
+
+    log_writer.write({"index": 0})
+    log_writer.flush()
+    self.assertEqual(simulation_log.read_simulation_log(self.log_file_path), [{"index": 0}])
+    log_writer.write({"index": 1})
+    log_writer.close()
+
+    self.assertEqual(len(simulation_log.read_simulation_log(self.log_file_path)), 2)
+
+  def test_close_without_writes_creates_nothing(self):
+    log_writer = simulation_log.SimulationLogWriter(self.log_file_path)
+
+    log_writer.close()
+
+    self.assertFalse(os.path.exists(self.log_file_path))
+
+  def test_unserializable_record_skipped(self):
+    log_writer = simulation_log.SimulationLogWriter(self.log_file_path)
+
+    with patch('builtins.print') as mock_print:
+      log_writer.write({"value": object()})
+      log_writer.write({"value": 1})
+      log_writer.close()
+
+    mock_print.assert_called_once()
+    self.assertEqual(simulation_log.read_simulation_log(self.log_file_path), [{"value": 1}])
+
+
+if __name__ == '__main__':
+  unittest.main()
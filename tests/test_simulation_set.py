@@ -1,8 +1,15 @@
+import asyncio
 from datetime import datetime
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
+from unittest.mock import ANY
 from unittest.mock import call
 from unittest.mock import create_autospec
 from unittest.mock import MagicMock
+from unittest.mock import Mock
 from unittest.mock import mock_open
 from unittest.mock import patch
 
@@ -19,6 +26,8 @@ class SimulationSetRunTests(unittest.TestCase):
     simulation_two = create_autospec(StaticSimulation)
     simulation_three = create_autospec(DynamicSimulation)
     self.simulations = [simulation_one, simulation_two, simulation_three]
+    for simulation in self.simulations:
+      simulation.is_chained.return_value = False
     self.simulation_set = None
     self.mock_now = datetime(2020, 8, 15, 5, 0, 0)
 
@@ -32,7 +41,7 @@ class SimulationSetRunTests(unittest.TestCase):
 
     self.simulation_set = geobeam.simulations.SimulationSet(self.simulations)
 
-    self.assertEqual(self.simulation_set._log_filename, "GPSSIM-2020-08-15_05-00-00.csv")
+    self.assertEqual(self.simulation_set._log_filename, "GPSSIM-2020-08-15_05-00-00.jsonl")
 
   @patch('geobeam.simulations.SimulationSet._get_current_simulation')
   @patch('geobeam.simulations.SimulationSet._log_current_simulation')
@@ -100,6 +109,41 @@ class SimulationSetRunTests(unittest.TestCase):
     self.assertEqual(self.simulations[2].is_running.call_count, 0)
 
 
+  @patch('geobeam.simulations.SimulationSet._log_current_simulation')
+  @patch('geobeam.simulations.SimulationSet._switch_simulation')
+  @patch('geobeam.simulations.wait_for_key')
+  @patch('geobeam.simulations.key_pressed')
+  @patch('builtins.print')
+  def test_run_simulations_waits_for_keys(self, mock_print, mock_key_pressed, mock_wait_for_key,
+                                          mock_switch_simulation, mock_log_current_simulation):
+    mock_key_pressed.side_effect = [None, None, "q"]
+    self.simulations[0].is_running.return_value = True
+    mock_switch_simulation.side_effect = self.update_index
+    self.simulation_set = geobeam.simulations.SimulationSet(self.simulations)
+
+    self.simulation_set.run_simulations()
+
+    self.assertEqual(mock_wait_for_key.call_count, 2)
+
+  @patch('geobeam.simulations.SimulationSet._switch_simulation')
+  @patch('geobeam.simulations.key_pressed')
+  @patch('builtins.print')
+  def test_run_simulations_closes_log(self, mock_print, mock_key_pressed,
+                                      mock_switch_simulation):
+    mock_key_pressed.return_value = "q"
+    mock_switch_simulation.side_effect = self.update_index
+    self.simulation_set = geobeam.simulations.SimulationSet(self.simulations)
+    self.simulations[0].get_log_record.return_value = {"event": "simulation"}
+
+    with patch.object(self.simulation_set, "_log_writer") as mock_log_writer:
+      self.simulation_set.run_simulations()
+
+    mock_log_writer.write.assert_called_once_with({"event": "simulation"})
+    mock_log_writer.close.assert_called_once()
+    for simulation in self.simulations:
+      simulation.release.assert_called_once_with()
+
+
 class SimulationSetTest(unittest.TestCase):
 
   def setUp(self):
@@ -124,25 +168,37 @@ class SimulationSetTest(unittest.TestCase):
 
     self.assertEqual(result, self.simulations[1])
 
+  @patch('geobeam.simulations.SimulationLogWriter')
   @patch('geobeam.simulations.SimulationSet._get_current_simulation')
   @patch('geobeam.simulations.datetime.datetime')
-  def test_log_current_simulation(self, mock_datetime, mock_get_current_simulation):
+  def test_log_current_simulation(self, mock_datetime, mock_get_current_simulation,
+                                  mock_log_writer):
     mock_now = datetime(2020, 8, 15, 5, 0, 0)
     mock_datetime.utcnow.return_value = mock_now
     simulation_set = geobeam.simulations.SimulationSet(self.simulations)
     mock_get_current_simulation.return_value = self.simulations[1]
-    open_mock = mock_open()
 
-    with patch("geobeam.simulations.open", open_mock, create=True):
-      open_mock.return_value = MagicMock()
-      simulation_set._log_current_simulation()
+    simulation_set._log_current_simulation()
 
-    self.simulations[1].log_run.assert_called_once()
-    open_mock.assert_called_with("simulation_logs/GPSSIM-2020-08-15_05-00-00.csv", "a")
+    mock_log_writer.assert_called_once_with("simulation_logs/GPSSIM-2020-08-15_05-00-00.jsonl")
+    self.simulations[1].get_log_record.assert_called_once()
+    mock_log_writer().write.assert_called_once_with(self.simulations[1].get_log_record())
 
+  @patch('geobeam.simulations.SimulationLogWriter')
+  def test_log_transition(self, mock_log_writer):
+    simulation_set = geobeam.simulations.SimulationSet(self.simulations)
+
+    simulation_set._log_transition(0, 1, 0.25)
+
+    mock_log_writer().write.assert_called_once_with({"event": "switch",
+                                                     "from_index": 0,
+                                                     "to_index": 1,
+                                                     "switch_latency": 0.25})
+
+  @patch('geobeam.simulations.SimulationSet._log_transition')
   @patch('geobeam.simulations.SimulationSet._get_current_simulation')
   @patch('geobeam.simulations.SimulationSet._log_current_simulation')
-  def test_switch_simulation_from_start(self, mock_log_current_simulation, mock_get_current_simulation):
+  def test_switch_simulation_from_start(self, mock_log_current_simulation, mock_get_current_simulation, mock_log_transition):
     simulation_set = geobeam.simulations.SimulationSet(self.simulations)
     mock_get_current_simulation.return_value = None
     simulation_set._current_simulation_index = None
@@ -150,12 +206,14 @@ class SimulationSetTest(unittest.TestCase):
     simulation_set._switch_simulation(0)
 
     mock_log_current_simulation.assert_not_called()
+    mock_log_transition.assert_called_once_with(None, 0, ANY)
     self.simulations[0].run_simulation.assert_called_once()
     self.assertEqual(simulation_set._current_simulation_index, 0)
 
+  @patch('geobeam.simulations.SimulationSet._log_transition')
   @patch('geobeam.simulations.SimulationSet._get_current_simulation')
   @patch('geobeam.simulations.SimulationSet._log_current_simulation')
-  def test_switch_simulation_next(self, mock_log_current_simulation, mock_get_current_simulation):
+  def test_switch_simulation_next(self, mock_log_current_simulation, mock_get_current_simulation, mock_log_transition):
     simulation_set = geobeam.simulations.SimulationSet(self.simulations)
     mock_get_current_simulation.return_value = self.simulations[0]
     simulation_set._current_simulation_index = 0
@@ -163,14 +221,48 @@ class SimulationSetTest(unittest.TestCase):
     simulation_set._switch_simulation(1)
 
     mock_log_current_simulation.assert_called_once()
-    self.simulations[0].end_simulation.assert_called_once()
+    mock_log_transition.assert_called_once_with(0, 1, ANY)
+    self.simulations[0].end_simulation.assert_called_once_with(
+        geobeam.simulations.DEFAULT_TEARDOWN_TIMEOUT)
     self.simulations[1].run_simulation.assert_called_once()
     self.assertEqual(simulation_set._current_simulation_index, 1)
 
+  @patch('geobeam.simulations.SimulationSet._log_transition')
+  @patch('geobeam.simulations.SimulationSet._log_current_simulation')
+  @patch('builtins.print')
+  def test_switch_simulation_creates_inputs_first(self, mock_print, mock_log_current_simulation,
+                                                  mock_log_transition):
+    manager = Mock()
+    manager.attach_mock(self.simulations[0].end_simulation, "end_simulation")
+    manager.attach_mock(self.simulations[1].create_inputs, "create_inputs")
+    self.simulations[1].create_inputs.side_effect = OSError("no route")
+    simulation_set = geobeam.simulations.SimulationSet(self.simulations)
+    simulation_set._current_simulation_index = 0
+
+    simulation_set._switch_simulation(1)
+
+    self.assertEqual([name for name, _, _ in manager.mock_calls],
+                     ["create_inputs", "end_simulation"])
+    self.simulations[1].set_preparation_error.assert_called_once()
+    self.assertIn("could not be created", mock_print.call_args[0][0])
+
+  @patch('geobeam.simulations.SimulationSet._log_transition')
+  @patch('geobeam.simulations.SimulationSet._log_current_simulation')
+  def test_switch_simulation_saves_resume_point(self, mock_log_current_simulation,
+                                                mock_log_transition):
+    simulation_set = geobeam.simulations.SimulationSet(self.simulations, resume=True)
+    simulation_set._current_simulation_index = 2
+
+    simulation_set._switch_simulation(1)
+
+    self.simulations[2].save_resume_point.assert_called_once()
+    self.simulations[1].save_resume_point.assert_not_called()
+
+  @patch('geobeam.simulations.SimulationSet._log_transition')
   @patch('geobeam.simulations.SimulationSet._get_current_simulation')
   @patch('geobeam.simulations.SimulationSet._log_current_simulation')
   @patch('builtins.print')
-  def test_switch_simulation_after_last(self, mock_print, mock_log_current_simulation, mock_get_current_simulation):
+  def test_switch_simulation_after_last(self, mock_print, mock_log_current_simulation, mock_get_current_simulation, mock_log_transition):
     simulation_set = geobeam.simulations.SimulationSet(self.simulations)
     mock_get_current_simulation.return_value = self.simulations[2]
     simulation_set._current_simulation_index = 2
@@ -183,10 +275,11 @@ class SimulationSetTest(unittest.TestCase):
     self.assertEqual(simulation_set._current_simulation_index, 2)
     mock_print.assert_called_once_with("\nAlready on last simulation")
 
+  @patch('geobeam.simulations.SimulationSet._log_transition')
   @patch('geobeam.simulations.SimulationSet._get_current_simulation')
   @patch('geobeam.simulations.SimulationSet._log_current_simulation')
   @patch('builtins.print')
-  def test_switch_simulation_before_first(self, mock_print, mock_log_current_simulation, mock_get_current_simulation):
+  def test_switch_simulation_before_first(self, mock_print, mock_log_current_simulation, mock_get_current_simulation, mock_log_transition):
     simulation_set = geobeam.simulations.SimulationSet(self.simulations)
     mock_get_current_simulation.return_value = self.simulations[0]
     simulation_set._current_simulation_index = 0
@@ -218,3 +311,498 @@ class SimulationSetTest(unittest.TestCase):
 
     self.assertEqual(result, 'n')
     mock_keyboard.getch.assert_called_once()
+
+
+class AsyncSimulationSetRunnerTest(unittest.IsolatedAsyncioTestCase):
+
+  def setUp(self):
+    self.simulations = [create_autospec(Simulation),
+                        create_autospec(StaticSimulation),
+                        create_autospec(DynamicSimulation)]
+    self.exits = []
+    for simulation in self.simulations:
+      exited = asyncio.Event()
+      self.exits.append(exited)
+      simulation.wait_for_exit.side_effect = exited.wait
+      simulation.get_run_duration.return_value = None
+      simulation.is_chained.return_value = False
+    self.simulation_set = geobeam.simulations.SimulationSet(self.simulations)
+    self.switch_patcher = patch('geobeam.simulations.SimulationSet._switch_simulation',
+                                side_effect=self.update_index)
+    self.log_patcher = patch('geobeam.simulations.SimulationSet._log_current_simulation')
+    self.print_patcher = patch('builtins.print')
+    self.mock_switch_simulation = self.switch_patcher.start()
+    self.mock_log_current_simulation = self.log_patcher.start()
+    self.print_patcher.start()
+
+  def tearDown(self):
+    self.switch_patcher.stop()
+    self.log_patcher.stop()
+    self.print_patcher.stop()
+
+  def update_index(self, index):
+    if 0 <= index < len(self.simulations):
+      self.simulation_set._current_simulation_index = index
+
+  async def test_commands(self):
+    runner = geobeam.simulations.AsyncSimulationSetRunner(self.simulation_set,
+                                                          interactive=False)
+
+    await runner.start()
+    await runner.next()
+    self.assertEqual(self.simulation_set._current_simulation_index, 1)
+    await runner.previous()
+    self.assertEqual(self.simulation_set._current_simulation_index, 0)
+    await runner.stop()
+
+    self.mock_switch_simulation.assert_has_calls([call(0), call(1), call(0)])
+    self.simulations[0].end_simulation.assert_called_once()
+    self.mock_log_current_simulation.assert_called_once()
+    self.assertIsNone(self.simulation_set._current_simulation_index)
+
+  async def test_commands_skip_route_segments(self):
+    self.simulations.append(create_autospec(DynamicSimulation))
+    self.simulations[2].is_chained.return_value = True
+    self.simulations[3].is_chained.return_value = False
+    self.simulations[3].get_run_duration.return_value = None
+    self.simulations[3].wait_for_exit.side_effect = asyncio.Event().wait
+    runner = geobeam.simulations.AsyncSimulationSetRunner(self.simulation_set,
+                                                          interactive=False)
+
+    await runner.start()
+    await runner.jump(1)
+    await runner.next()
+    self.assertEqual(self.simulation_set._current_simulation_index, 3)
+    await runner.jump(2)
+    await runner.previous()
+    self.assertEqual(self.simulation_set._current_simulation_index, 0)
+    await runner.stop()
+
+  async def test_advances_when_simulation_exits(self):
+    runner = geobeam.simulations.AsyncSimulationSetRunner(self.simulation_set,
+                                                          interactive=False)
+    for exited in self.exits:
+      exited.set()
+
+    await asyncio.wait_for(runner.run(), timeout=5)
+
+    self.mock_switch_simulation.assert_has_calls([call(0), call(1), call(2)])
+    self.simulations[2].end_simulation.assert_called_once()
+    self.assertIsNone(self.simulation_set._current_simulation_index)
+
+  @patch('geobeam.simulations.RUN_DURATION_GRACE', 0)
+  async def test_advances_when_run_duration_expires(self):
+    self.simulations[0].get_run_duration.return_value = 0.05
+    runner = geobeam.simulations.AsyncSimulationSetRunner(self.simulation_set,
+                                                          interactive=False)
+
+    await runner.start()
+    await asyncio.sleep(0.2)
+
+    self.assertEqual(self.simulation_set._current_simulation_index, 1)
+    await runner.stop()
+
+  @patch('geobeam.simulations.RUN_DURATION_GRACE', 0)
+  async def test_next_on_last_simulation_keeps_run_duration(self):
+    self.simulations[2].get_run_duration.return_value = 0.3
+    runner = geobeam.simulations.AsyncSimulationSetRunner(self.simulation_set,
+                                                          interactive=False)
+
+    await runner.start()
+    await runner.jump(2)
+    await asyncio.sleep(0.15)
+    with self.assertRaisesRegex(IndexError, "already on last simulation"):
+      await runner.next()
+
+    await asyncio.wait_for(runner.wait(), timeout=0.25)
+    self.simulations[2].end_simulation.assert_called_once()
+
+  async def test_command_after_stop_raises(self):
+    runner = geobeam.simulations.AsyncSimulationSetRunner(self.simulation_set,
+                                                          interactive=False)
+    await runner.start()
+    await runner.stop()
+
+    with self.assertRaises(RuntimeError):
+      await runner.next()
+
+
+class WaitForProcessExitTest(unittest.IsolatedAsyncioTestCase):
+
+  async def test_wait_for_process_exit(self):
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(0.1)"])
+
+    return_code = await asyncio.wait_for(geobeam.simulations.wait_for_process_exit(process),
+                                         timeout=5)
+
+    self.assertEqual(return_code, 0)
+
+
+class SimulationSetPrefetchTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    # stub bladeGPS launcher that records its arguments and runs until quit
+    launcher_path = os.path.join(self.temp_dir.name, "run_bladerfGPS.sh")
+    with open(launcher_path, "w") as launcher:
+      launcher.write("#!/bin/sh\necho \"$@\" >> launches.txt\nread line\n")
+    os.chmod(launcher_path, 0o755)
+    self.motion_file_path = os.path.join(self.temp_dir.name, "motion.csv")
+    with open(self.motion_file_path, "w") as motion_file:
+      motion_file.write("0.0,1,2,3\n0.1,1,2,3\n")
+    self.directory_patcher = patch('geobeam.simulations.BLADEGPS_DIRECTORY',
+                                   self.temp_dir.name)
+    self.directory_patcher.start()
+
+  def tearDown(self):
+    self.directory_patcher.stop()
+    self.temp_dir.cleanup()
+
+  @patch('geobeam.simulations.SimulationSet._log_transition')
+  @patch('geobeam.simulations.SimulationSet._log_current_simulation')
+  @patch('builtins.print')
+  def test_next_simulation_prepared_while_current_runs(self, mock_print, mock_log_current_simulation,
+                                                       mock_log_transition):
+    simulation_set = (geobeam.simulations.SimulationSetBuilder()
+                      .add_static_route(27.1, -37.4)
+                      .add_dynamic_route(self.motion_file_path, gain=-2)
+                      .set_prefetch(True)
+                      .build())
+    next_simulation = simulation_set._simulations[1]
+
+    simulation_set._switch_simulation(0)
+    simulation_set._wait_for_prefetch()
+
+    self.assertEqual(next_simulation._prepared_command,
+                     ["./run_bladerfGPS.sh", "-T", "now", "-a", "-2", "-u", self.motion_file_path])
+    simulation_set._switch_simulation(1)
+    self.assertIsNone(next_simulation._prepared_command)
+    self.assertTrue(next_simulation.is_running())
+    next_simulation.end_simulation()
+
+    with open(os.path.join(self.temp_dir.name, "launches.txt")) as launches:
+      self.assertEqual(launches.read().splitlines(),
+                       ["-T now -l 27.1,-37.4", "-T now -a -2 -u " + self.motion_file_path])
+
+  @patch('geobeam.simulations.SimulationSet._log_transition')
+  @patch('builtins.print')
+  def test_invalid_next_simulation_reported(self, mock_print, mock_log_transition):
+    with open(self.motion_file_path, "w") as motion_file:
+      motion_file.write("0.0,1,2\n")
+    simulation_set = geobeam.simulations.SimulationSet(
+        [StaticSimulation(27.1, -37.4), DynamicSimulation(self.motion_file_path)],
+        prefetch=True)
+
+    simulation_set._switch_simulation(0)
+    simulation_set._wait_for_prefetch()
+    simulation_set._simulations[0].end_simulation()
+
+    self.assertIsNone(simulation_set._simulations[1]._prepared_command)
+    self.assertIn("failed preparation", mock_print.call_args_list[0][0][0])
+
+  @patch('geobeam.simulations.SimulationSet._log_transition')
+  @patch('geobeam.simulations.SimulationSet._log_current_simulation')
+  @patch('builtins.print')
+  def test_invalid_next_simulation_skipped(self, mock_print, mock_log_current_simulation,
+                                           mock_log_transition):
+    with open(self.motion_file_path, "w") as motion_file:
+      motion_file.write("0.0,1,2\n")
+    simulation_set = geobeam.simulations.SimulationSet(
+        [StaticSimulation(27.1, -37.4), DynamicSimulation(self.motion_file_path)],
+        prefetch=True)
+    invalid_simulation = simulation_set._simulations[1]
+
+    simulation_set._switch_simulation(0)
+    simulation_set._wait_for_prefetch()
+    simulation_set._switch_simulation(1)
+
+    self.assertFalse(invalid_simulation.is_running())
+    invalid_simulation.end_simulation()
+    self.assertTrue(invalid_simulation.has_failed())
+    self.assertIn("expected 4 columns", invalid_simulation.get_log_record()["preparation_error"])
+    with open(os.path.join(self.temp_dir.name, "launches.txt")) as launches:
+      self.assertEqual(launches.read().splitlines(), ["-T now -l 27.1,-37.4"])
+
+
+class SimulationSetBuilderTest(unittest.TestCase):
+
+  @patch('geobeam.simulations.get_motion_file_rate')
+  @patch('geobeam.simulations.split_motion_file')
+  def test_add_dynamic_route_in_segments(self, mock_split_motion_file,
+                                         mock_get_motion_file_rate):
+    mock_get_motion_file_rate.return_value = 10.0
+    mock_split_motion_file.return_value = ["route_part000.csv", "route_part001.csv",
+                                           "route_part002.csv"]
+
+    simulation_set = (geobeam.simulations.SimulationSetBuilder()
+                      .add_dynamic_route("route.csv", run_duration=4500, gain=-2,
+                                         max_segment_duration=3000)
+                      .build())
+
+    mock_split_motion_file.assert_called_once_with("route.csv", 3000, 0)
+    simulations = simulation_set._simulations
+    self.assertEqual(len(simulations), 2)
+    self.assertEqual(simulations[0].get_process_arguments(),
+                     {"run_duration": None, "gain": -2, "dynamic_file_path": "route_part000.csv"})
+    self.assertEqual(simulations[1].get_process_arguments(),
+                     {"run_duration": 1500, "gain": -2, "dynamic_file_path": "route_part001.csv"})
+    self.assertFalse(simulations[0].is_chained())
+    self.assertTrue(simulations[1].is_chained())
+
+  def test_add_streamed_route_in_segments(self):
+    def row_source():
+      return (("%.1f" % (i*0.1), i, 2, 3) for i in range(250))
+
+    simulation_set = (geobeam.simulations.SimulationSetBuilder()
+                      .add_streamed_route(row_source, run_duration=15, gain=-2,
+                                          max_segment_duration=10, row_count=250)
+                      .add_streamed_route(row_source, max_segment_duration=30, row_count=250)
+                      .build())
+
+    simulations = simulation_set._simulations
+    self.assertEqual(len(simulations), 3)
+    self.assertEqual([simulation.get_run_duration() for simulation in simulations],
+                     [None, 5, None])
+    self.assertEqual([simulation.is_chained() for simulation in simulations],
+                     [False, True, False])
+    second_segment = list(simulations[1]._row_source())
+    self.assertEqual(len(second_segment), 100)
+    self.assertEqual(second_segment[0], ("0.0", 100, 2, 3))
+
+  @patch('geobeam.simulations.SimulationSet._start_prefetch')
+  @patch('geobeam.simulations.SimulationSet._log_transition')
+  def test_chained_segment_always_prefetched(self, mock_log_transition, mock_start_prefetch):
+    first_segment = create_autospec(DynamicSimulation)
+    second_segment = create_autospec(DynamicSimulation)
+    second_segment.is_chained.return_value = True
+    simulation_set = geobeam.simulations.SimulationSet([first_segment, second_segment])
+
+    simulation_set._switch_simulation(0)
+
+    mock_start_prefetch.assert_called_once_with(second_segment)
+
+
+class FusedSimulationTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.patcher = patch('geobeam.simulations.FUSED_FILE_DIRECTORY', self.temp_dir.name)
+    self.patcher.start()
+    self.route_path = os.path.join(self.temp_dir.name, "route.csv")
+    with open(self.route_path, "w") as route_file:
+      for row in range(30):
+        route_file.write("%.1f,%d.0,2.0,3.0\n" % (row/10, row))
+
+  def tearDown(self):
+    self.patcher.stop()
+    self.temp_dir.cleanup()
+
+  def _read_rows(self, file_path):
+    with open(file_path) as motion_file:
+      return [line.rstrip().split(",") for line in motion_file]
+
+  def test_static_simulations_fused(self):
+    simulation_set = (geobeam.simulations.SimulationSetBuilder()
+                      .add_static_route(27.1, -112.1, run_duration=2, gain=-2)
+                      .add_static_route(27.2, -112.2, run_duration=3, gain=-2)
+                      .add_static_route(27.3, -112.3, gain=-2)
+                      .add_static_route(27.4, -112.4, run_duration=1, gain=-2)
+                      .add_dynamic_route(self.route_path, run_duration=1, gain=-2)
+                      .set_fuse(True)
+                      .build())
+
+    simulations = simulation_set._simulations
+    self.assertEqual([type(simulation).__name__ for simulation in simulations],
+                     ["FusedSimulation", "StaticSimulation", "StaticSimulation",
+                      "DynamicSimulation"])
+    fused_simulation = simulations[0]
+    self.assertEqual(fused_simulation.get_run_duration(), 5)
+    self.assertEqual(fused_simulation.get_segments(),
+                     [{"segment_type": "StaticSimulation", "segment_start": 0,
+                       "segment_duration": 2, "latitude": 27.1, "longitude": -112.1},
+                      {"segment_type": "StaticSimulation", "segment_start": 2,
+                       "segment_duration": 3, "latitude": 27.2, "longitude": -112.2}])
+    rows = self._read_rows(fused_simulation.get_file_path())
+    self.assertEqual(len(rows), 50)
+    self.assertEqual(rows[0][0], "0.0")
+    self.assertEqual(rows[-1][0], "4.9")
+    self.assertEqual(rows[19][1:], rows[0][1:])
+    self.assertNotEqual(rows[20][1:], rows[19][1:])
+
+  def test_dynamic_simulations_fused_with_transit(self):
+    simulation_set = (geobeam.simulations.SimulationSetBuilder()
+                      .add_dynamic_route(self.route_path, run_duration=1, gain=-2,
+                                         start_offset=1)
+                      .add_dynamic_route(self.route_path, gain=-2)
+                      .add_static_route(27.4, -112.4, run_duration=1, gain=-1)
+                      .set_fuse(True, fuse_dynamic=True, transit_speed=10)
+                      .build())
+
+    simulations = simulation_set._simulations
+    self.assertEqual(len(simulations), 2)
+    segments = simulations[0].get_segments()
+    # 1 s of the route from 1 s in, a transit back from x=19 to x=0, and the whole route
+    self.assertEqual([segment["segment_type"] for segment in segments],
+                     ["DynamicSimulation", "transit", "DynamicSimulation"])
+    self.assertEqual(segments[1]["segment_duration"], 1.8)
+    self.assertEqual(segments[2]["segment_start"], 2.8)
+    rows = self._read_rows(simulations[0].get_file_path())
+    self.assertEqual(len(rows), 10 + 18 + 30)
+    self.assertEqual(rows[0][1], "10.0")
+    self.assertEqual(float(rows[10][1]), 19 - 19/19)
+    self.assertEqual(rows[28][1], "0.0")
+
+  def test_fused_segments_logged(self):
+    fused_simulation = geobeam.simulations._fuse_simulations(
+        [StaticSimulation(27.1, -112.1, run_duration=2),
+         StaticSimulation(27.2, -112.2, run_duration=3)])[0]
+    fused_simulation._start_time = datetime(2020, 8, 15, 5, 0, 0)
+    fused_simulation._end_time = datetime(2020, 8, 15, 5, 0, 1)
+
+    segments = fused_simulation.get_log_record()["segments"]
+
+    self.assertEqual(segments[0]["start_time"], "2020-08-15T05:00:00")
+    self.assertEqual(segments[0]["end_time"], "2020-08-15T05:00:01")
+    self.assertNotIn("start_time", segments[1])
+
+  def test_fused_files_removed_on_release(self):
+    fused_simulation = geobeam.simulations._fuse_simulations(
+        [StaticSimulation(27.1, -112.1, run_duration=2),
+         StaticSimulation(27.2, -112.2, run_duration=3)])[0]
+    fused_simulation.set_start_offset(1)
+    with patch('geobeam.simulations.RESUME_FILE_DIRECTORY', self.temp_dir.name):
+      fused_simulation.prepare()
+      self.assertTrue(os.path.exists(fused_simulation._get_playback_file_path()))
+
+      fused_simulation.release()
+
+    self.assertEqual(os.listdir(self.temp_dir.name), ["route.csv"])
+
+
+class MultiDeviceSimulationRunnerTest(unittest.IsolatedAsyncioTestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    # stub bladeGPS launcher that records its arguments and runs until quit
+    launcher_path = os.path.join(self.temp_dir.name, "run_bladerfGPS.sh")
+    with open(launcher_path, "w") as launcher:
+      launcher.write("#!/bin/sh\necho \"$@\" >> launches.txt\nread line\n")
+    os.chmod(launcher_path, 0o755)
+    self.log_directory = os.path.join(self.temp_dir.name, "logs/")
+    self.patchers = [patch('geobeam.simulations.BLADEGPS_DIRECTORY', self.temp_dir.name),
+                     patch('geobeam.simulations.SIMULATION_LOG_DIRECTORY', self.log_directory),
+                     patch('builtins.print')]
+    for patcher in self.patchers:
+      patcher.start()
+
+  def tearDown(self):
+    for patcher in self.patchers:
+      patcher.stop()
+    self.temp_dir.cleanup()
+
+  def build_simulation_set(self, device):
+    return (geobeam.simulations.SimulationSetBuilder()
+            .set_device(device)
+            .add_static_route(27.1, -37.4, gain=-2)
+            .add_static_route(27.2, -37.5, gain=-2)
+            .build())
+
+  def read_launches(self):
+    with open(os.path.join(self.temp_dir.name, "launches.txt")) as launches:
+      return sorted(launches.read().splitlines())
+
+  async def test_sets_run_concurrently_on_their_devices(self):
+    simulation_sets = [self.build_simulation_set("board1"), self.build_simulation_set("board2")]
+    runner = geobeam.simulations.MultiDeviceSimulationRunner(simulation_sets,
+                                                             interactive=False)
+
+    await runner.start()
+    self.assertTrue(all(simulation_set._get_current_simulation().is_running()
+                        for simulation_set in simulation_sets))
+    await runner.next(device="board2")
+    await runner.stop()
+
+    self.assertEqual(self.read_launches(),
+                     ["-T now -a -2 -D board1 -l 27.1,-37.4",
+                      "-T now -a -2 -D board2 -l 27.1,-37.4",
+                      "-T now -a -2 -D board2 -l 27.2,-37.5"])
+    log_files = sorted(os.listdir(self.log_directory))
+    self.assertEqual(len(log_files), 2)
+    self.assertTrue(log_files[0].startswith("GPSSIM-board1-"))
+    self.assertTrue(log_files[1].startswith("GPSSIM-board2-"))
+
+  def test_same_device_twice(self):
+    simulation_sets = [self.build_simulation_set("board1"), self.build_simulation_set("board1")]
+
+    with self.assertRaises(ValueError):
+      geobeam.simulations.MultiDeviceSimulationRunner(simulation_sets)
+
+  def test_first_board_found_with_named_device(self):
+    simulation_sets = [self.build_simulation_set(None), self.build_simulation_set("board1")]
+
+    with self.assertRaises(ValueError):
+      geobeam.simulations.MultiDeviceSimulationRunner(simulation_sets)
+
+  def test_device_option(self):
+    simulation_set = (geobeam.simulations.SimulationSetBuilder()
+                      .set_device("board1", device_option="--device")
+                      .add_static_route(27.1, -37.4)
+                      .build())
+
+    self.assertEqual(simulation_set._simulations[0].get_process_arguments()["device_option"],
+                     "--device")
+
+
+class HeadlessSimulationSetRunnerTest(unittest.IsolatedAsyncioTestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    # stub bladeGPS launcher that fails for latitude 27.3 and otherwise runs until quit
+    launcher_path = os.path.join(self.temp_dir.name, "run_bladerfGPS.sh")
+    with open(launcher_path, "w") as launcher:
+      launcher.write("#!/bin/sh\necho \"$@\" >> launches.txt\n"
+                     "case \"$*\" in *27.3*) exit 3;; esac\nread line\n")
+    os.chmod(launcher_path, 0o755)
+    self.patchers = [patch('geobeam.simulations.BLADEGPS_DIRECTORY', self.temp_dir.name),
+                     patch('geobeam.simulations.SIMULATION_LOG_DIRECTORY',
+                           os.path.join(self.temp_dir.name, "logs/")),
+                     patch('geobeam.simulations.KEYBOARD', None),
+                     patch('builtins.print')]
+    for patcher in self.patchers:
+      patcher.start()
+
+  def tearDown(self):
+    for patcher in self.patchers:
+      patcher.stop()
+    self.temp_dir.cleanup()
+
+  async def test_runs_queue_back_to_back(self):
+    simulation_set = (geobeam.simulations.SimulationSetBuilder()
+                      .add_static_route(27.1, -37.4)
+                      .add_static_route(27.2, -37.5)
+                      .build())
+    runner = geobeam.simulations.HeadlessSimulationSetRunner(simulation_set,
+                                                             default_run_duration=0.1)
+
+    exit_code = await asyncio.wait_for(runner.run(), timeout=5)
+
+    self.assertEqual(exit_code, geobeam.simulations.EXIT_SUCCESS)
+    with open(os.path.join(self.temp_dir.name, "launches.txt")) as launches:
+      self.assertEqual(launches.read().splitlines(),
+                       ["-T now -l 27.1,-37.4", "-T now -l 27.2,-37.5"])
+    self.assertIsNone(geobeam.simulations.KEYBOARD)
+
+  async def test_failed_simulation_exit_code(self):
+    simulation_set = (geobeam.simulations.SimulationSetBuilder()
+                      .add_static_route(27.3, -37.4)
+                      .add_static_route(27.2, -37.5)
+                      .build())
+    runner = geobeam.simulations.HeadlessSimulationSetRunner(simulation_set,
+                                                             default_run_duration=0.1)
+
+    exit_code = await asyncio.wait_for(runner.run(), timeout=5)
+
+    self.assertEqual(exit_code, geobeam.simulations.EXIT_SIMULATION_FAILED)
+    self.assertTrue(simulation_set._simulations[0].has_failed())
+    self.assertEqual(simulation_set._simulations[0].get_return_code(), 3)
+    self.assertFalse(simulation_set._simulations[1].has_failed())
@@ -1,4 +1,9 @@
 from datetime import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
 from unittest.mock import call
 from unittest.mock import MagicMock
@@ -7,6 +12,7 @@ from unittest.mock import mock_open
 from unittest.mock import patch
 
 import geobeam
+import geobeam.process_scheduling
 
 
 class SimulationTest(unittest.TestCase):
@@ -29,101 +35,98 @@ class SimulationTest(unittest.TestCase):
     test_simulation.run_simulation()
     self.assertEqual(test_simulation._start_time, self.start_time)
     mock_datetime.utcnow.assert_called_once()
-    mock_create_bladeGPS_process.assert_called_once_with(run_duration=self.run_duration, gain=self.gain)
+    mock_create_bladeGPS_process.assert_called_once_with(run_duration=self.run_duration, gain=self.gain,
+                                                         scheduling=None)
 
-  @patch('geobeam.simulations.time')
   @patch('builtins.print')
   @patch('geobeam.simulations.datetime.datetime')
-  @patch('geobeam.simulations.subprocess')
-  def test_end_simulation_running_quit(self, mock_subprocess, mock_datetime,
-                                       mock_print, mock_time):
+  def test_end_simulation_running_quit(self, mock_datetime, mock_print):
     mock_datetime.utcnow.return_value = self.end_time
-    mock_subprocess.poll.side_effect = [0, 0]
+    mock_process = Mock()
 
     test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
-    test_simulation._process = mock_subprocess
-    test_simulation.is_running = Mock(side_effect=[True, False])
-    test_simulation.end_simulation()
+    test_simulation._process = mock_process
+    test_simulation.is_running = Mock(return_value=True)
+    test_simulation.end_simulation(teardown_timeout=0.5)
 
     self.assertIsNone(test_simulation._process)
     self.assertEqual(test_simulation._end_time, self.end_time)
 
-    mock_subprocess.communicate.assert_called_once()
-    mock_subprocess.terminate.assert_not_called()
-    mock_subprocess.kill.assert_not_called()
-    self.assertEqual(mock_subprocess.poll.call_count, 2)
+    mock_process.communicate.assert_called_once_with(input=b"q", timeout=0.5)
+    mock_process.terminate.assert_not_called()
+    mock_process.kill.assert_not_called()
 
-    self.assertEqual(mock_time.sleep.call_count, 1)
-
-  @patch('geobeam.simulations.time')
   @patch('builtins.print')
   @patch('geobeam.simulations.datetime.datetime')
-  @patch('geobeam.simulations.subprocess')
-  def test_end_simulation_running_terminate(self, mock_subprocess, mock_datetime,
-                                            mock_print, mock_time):
+  def test_end_simulation_running_terminate(self, mock_datetime, mock_print):
     mock_datetime.utcnow.return_value = self.end_time
-    mock_subprocess.poll.side_effect = [None, 0]
+    mock_process = Mock()
+    mock_process.communicate.side_effect = subprocess.TimeoutExpired("bladeGPS", 0.5)
 
     test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
-    test_simulation._process = mock_subprocess
-    test_simulation.is_running = Mock(side_effect=[True, False])
-    test_simulation.end_simulation()
+    test_simulation._process = mock_process
+    test_simulation.is_running = Mock(return_value=True)
+    test_simulation.end_simulation(teardown_timeout=0.5)
 
     self.assertIsNone(test_simulation._process)
     self.assertEqual(test_simulation._end_time, self.end_time)
 
-    mock_subprocess.communicate.assert_called_once()
-    mock_subprocess.terminate.assert_called_once()
-    mock_subprocess.kill.assert_not_called()
-    self.assertEqual(mock_subprocess.poll.call_count, 2)
+    mock_process.communicate.assert_called_once()
+    mock_process.terminate.assert_called_once()
+    mock_process.wait.assert_called_once_with(timeout=0.5)
+    mock_process.kill.assert_not_called()
 
-    self.assertEqual(mock_time.sleep.call_count, 2)
-
-  @patch('geobeam.simulations.time')
   @patch('builtins.print')
   @patch('geobeam.simulations.datetime.datetime')
-  @patch('geobeam.simulations.subprocess')
-  def test_end_simulation_running_terminate_and_kill(self, mock_subprocess, 
-                                                     mock_datetime, mock_print, mock_time):
+  def test_end_simulation_running_terminate_and_kill(self, mock_datetime, mock_print):
     mock_datetime.utcnow.return_value = self.end_time
-    mock_subprocess.poll.side_effect = [None, None]
+    mock_process = Mock()
+    mock_process.communicate.side_effect = subprocess.TimeoutExpired("bladeGPS", 0.5)
+    mock_process.wait.side_effect = [subprocess.TimeoutExpired("bladeGPS", 0.5), 0]
 
     test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
-    test_simulation._process = mock_subprocess
-    test_simulation.is_running = Mock(side_effect=[True, False])
-    test_simulation.end_simulation()
+    test_simulation._process = mock_process
+    test_simulation.is_running = Mock(return_value=True)
+    test_simulation.end_simulation(teardown_timeout=0.5)
 
     self.assertIsNone(test_simulation._process)
     self.assertEqual(test_simulation._end_time, self.end_time)
 
-    mock_subprocess.communicate.assert_called_once()
-    mock_subprocess.terminate.assert_called_once()
-    mock_subprocess.kill.assert_called_once()
-    self.assertEqual(mock_subprocess.poll.call_count, 2)
+    mock_process.communicate.assert_called_once()
+    mock_process.terminate.assert_called_once()
+    mock_process.kill.assert_called_once()
+    self.assertEqual(mock_process.wait.call_args_list, [call(timeout=0.5), call()])
 
-    self.assertEqual(mock_time.sleep.call_count, 3)
-
-  @patch('geobeam.simulations.time')
   @patch('builtins.print')
   @patch('geobeam.simulations.datetime.datetime')
-  @patch('geobeam.simulations.subprocess')
-  def test_end_simulation_done_running(self, mock_subprocess, mock_datetime, 
-                                       mock_print, mock_time):
+  def test_end_simulation_done_running(self, mock_datetime, mock_print):
     mock_datetime.utcnow.return_value = self.end_time
+    mock_process = Mock()
 
     test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
-    test_simulation._process = mock_subprocess
+    test_simulation._process = mock_process
     test_simulation.is_running = Mock(return_value=False)
     test_simulation.end_simulation()
 
     self.assertIsNone(test_simulation._process)
     self.assertEqual(test_simulation._end_time, self.end_time)
 
-    mock_subprocess.communicate.assert_not_called()
-    mock_subprocess.terminate.assert_not_called()
-    mock_subprocess.kill.assert_not_called()
-    mock_subprocess.poll.assert_not_called()
-    mock_time.sleep.assert_not_called()
+    mock_process.communicate.assert_not_called()
+    mock_process.terminate.assert_not_called()
+    mock_process.kill.assert_not_called()
+    mock_process.wait.assert_not_called()
+
+  @patch('builtins.print')
+  def test_end_simulation_real_process_quits_without_delay(self, mock_print):
+    process = subprocess.Popen([sys.executable, "-c", "input()"], stdin=subprocess.PIPE)
+    test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
+    test_simulation._process = process
+
+    start = time.monotonic()
+    test_simulation.end_simulation(teardown_timeout=5)
+
+    self.assertLess(time.monotonic() - start, 2)
+    self.assertEqual(process.returncode, 0)
 
   @patch('geobeam.simulations.datetime.datetime')
   @patch('geobeam.simulations.subprocess')
@@ -173,22 +176,21 @@ class SimulationTest(unittest.TestCase):
 
     self.assertFalse(result)
 
-  @patch('geobeam.simulations.csv')
-  def test_log_run(self, mock_csv):
-    mock_logfile = Mock()
-    mock_logfile.write = Mock()
+  def test_get_log_record(self):
     test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
     test_simulation._start_time = self.start_time
     test_simulation._end_time = self.end_time
-    fields = ["simulation_type", "run_duration", "gain", "start_time", "end_time"]
-    values = ["Simulation", self.run_duration, self.gain, "2020-08-15T05:00:00", "2020-08-15T05:01:10"]
-    csv_calls = [call(fields), call(values)]
 
-    test_simulation.log_run(mock_logfile)
+    log_record = test_simulation.get_log_record()
 
-    mock_logfile.write.assert_called_once_with('\n')
-    mock_csv.writer.assert_called_once()
-    mock_csv.writer().writerow.assert_has_calls(csv_calls)
+    self.assertEqual(log_record, {"event": "simulation",
+                                  "simulation_type": "Simulation",
+                                  "run_duration": self.run_duration,
+                                  "gain": self.gain,
+                                  "start_time": "2020-08-15T05:00:00",
+                                  "end_time": "2020-08-15T05:01:10",
+                                  "return_code": None,
+                                  "telemetry": None})
 
   @patch('geobeam.simulations.datetime.datetime')
   @patch('geobeam.simulations.create_bladeGPS_process')
@@ -203,27 +205,29 @@ class SimulationTest(unittest.TestCase):
     mock_datetime.utcnow.assert_called_once()
     mock_create_bladeGPS_process.assert_called_once_with(run_duration=self.run_duration,
                                                          gain=self.gain,
-                                                         location=self.location)
+                                                         location=self.location,
+                                                         scheduling=None)
   
-  @patch('geobeam.simulations.csv')
-  def test_log_static_run(self, mock_csv):
-    mock_logfile = Mock()
-    mock_logfile.write = Mock()
+  def test_get_static_log_record(self):
     test_simulation = geobeam.simulations.StaticSimulation(self.latitude,
                                                            self.longitude,
                                                            self.run_duration,
                                                            self.gain)
     test_simulation._start_time = self.start_time
     test_simulation._end_time = self.end_time
-    fields = ["simulation_type", "latitude", "longitude", "run_duration", "gain", "start_time", "end_time"]
-    values = ["StaticSimulation", self.latitude, self.longitude, self.run_duration, self.gain, "2020-08-15T05:00:00", "2020-08-15T05:01:10"]
-    csv_calls = [call(fields), call(values)]
 
-    test_simulation.log_run(mock_logfile)
+    log_record = test_simulation.get_log_record()
 
-    mock_logfile.write.assert_called_once_with('\n')
-    mock_csv.writer.assert_called_once()
-    mock_csv.writer().writerow.assert_has_calls(csv_calls)
+    self.assertEqual(log_record, {"event": "simulation",
+                                  "simulation_type": "StaticSimulation",
+                                  "latitude": self.latitude,
+                                  "longitude": self.longitude,
+                                  "run_duration": self.run_duration,
+                                  "gain": self.gain,
+                                  "start_time": "2020-08-15T05:00:00",
+                                  "end_time": "2020-08-15T05:01:10",
+                                  "return_code": None,
+                                  "telemetry": None})
 
   @patch('geobeam.simulations.datetime.datetime')
   @patch('geobeam.simulations.create_bladeGPS_process')
@@ -239,39 +243,189 @@ class SimulationTest(unittest.TestCase):
     mock_datetime.utcnow.assert_called_once()
     mock_create_bladeGPS_process.assert_called_once_with(run_duration=self.run_duration,
                                                          gain=self.gain,
-                                                         dynamic_file_path=self.file_path)
+                                                         dynamic_file_path=self.file_path,
+                                                         scheduling=None)
   
-  @patch('geobeam.simulations.csv')
-  def test_log_dynamic_run(self, mock_csv):
-    mock_logfile = Mock()
-    mock_logfile.write = Mock()
+  @patch('geobeam.simulations.create_bladeGPS_process')
+  def test_run_deferred_dynamic_simulation(self, mock_create_bladeGPS_process):
+    create_file = Mock(return_value=self.file_path)
+    test_simulation = geobeam.simulations.DeferredDynamicSimulation(create_file,
+                                                                    self.run_duration,
+                                                                    self.gain)
+    create_file.assert_not_called()
+
+    test_simulation.run_simulation()
+    test_simulation.run_simulation()
+
+    create_file.assert_called_once_with()
+    self.assertEqual(test_simulation.get_file_path(), self.file_path)
+    mock_create_bladeGPS_process.assert_called_with(run_duration=self.run_duration,
+                                                    gain=self.gain,
+                                                    dynamic_file_path=self.file_path,
+                                                    scheduling=None)
+
+  def test_deferred_dynamic_simulation_created_again_after_failure(self):
+    create_file = Mock(side_effect=[OSError("no route"), self.file_path])
+    test_simulation = geobeam.simulations.DeferredDynamicSimulation(create_file)
+
+    with self.assertRaises(OSError):
+      test_simulation.create_inputs()
+    test_simulation.set_preparation_error(OSError("no route"))
+    test_simulation.create_inputs()
+
+    self.assertEqual(create_file.call_count, 2)
+    self.assertEqual(test_simulation.get_file_path(), self.file_path)
+    self.assertFalse(test_simulation.has_failed())
+
+  @patch('builtins.print')
+  def test_deferred_dynamic_log_record_after_failure(self, mock_print):
+    test_simulation = geobeam.simulations.DeferredDynamicSimulation(
+        Mock(side_effect=ValueError("no route")), self.run_duration, self.gain)
+    geobeam.simulations._create_simulation_inputs(test_simulation)
+    test_simulation.run_simulation()
+    test_simulation._start_time = self.start_time
+    test_simulation._end_time = self.start_time
+
+    log_record = test_simulation.get_log_record()
+
+    self.assertIsNone(log_record["motion_file"])
+    self.assertIsNone(log_record["file_path"])
+    self.assertEqual(log_record["creation_error"], "no route")
+    self.assertEqual(log_record["preparation_error"], "no route")
+
+  @patch('geobeam.simulations.validate_motion_file')
+  def test_prepare_deferred_dynamic_simulation(self, mock_validate_motion_file):
+    create_file = Mock(return_value=self.file_path)
+    test_simulation = geobeam.simulations.DeferredDynamicSimulation(create_file)
+
+    test_simulation.prepare()
+
+    create_file.assert_called_once_with()
+    mock_validate_motion_file.assert_called_once_with(self.file_path)
+
+  @patch('geobeam.simulations.MotionFileReference')
+  def test_get_dynamic_log_record(self, mock_motion_file_reference):
     test_simulation = geobeam.simulations.DynamicSimulation(self.file_path,
                                                             self.run_duration,
                                                             self.gain)
-    self.start_time = datetime(2020, 8, 15, 5, 0, 0)
-    self.end_time = datetime(2020, 8, 15, 5, 0, 10)
-    test_simulation._start_time = self.start_time
-    test_simulation._end_time = self.end_time
+    test_simulation._start_time = datetime(2020, 8, 15, 5, 0, 0)
+    test_simulation._end_time = datetime(2020, 8, 15, 5, 0, 10)
+    test_simulation._start_monotonic = 100.0
+    test_simulation._end_monotonic = 109.95
+
+    log_record = test_simulation.get_log_record()
+
+    self.assertEqual(log_record, {"event": "simulation",
+                                  "simulation_type": "DynamicSimulation",
+                                  "file_path": self.file_path,
+                                  "start_offset": 0,
+                                  "motion_file": mock_motion_file_reference(),
+                                  "run_duration": self.run_duration,
+                                  "gain": self.gain,
+                                  "start_time": "2020-08-15T05:00:00",
+                                  "end_time": "2020-08-15T05:00:10",
+                                  "return_code": None,
+                                  "telemetry": None})
+    # elapsed time is taken from the monotonic clock
+    file_path, start_index, elapsed_seconds = mock_motion_file_reference.call_args_list[0][0]
+    self.assertEqual((file_path, start_index), (self.file_path, 0))
+    self.assertAlmostEqual(elapsed_seconds, 9.95)
+
+  @patch('geobeam.simulations.datetime.datetime')
+  @patch('geobeam.simulations.create_bladeGPS_process')
+  @patch('geobeam.simulations.start_bladeGPS_process')
+  @patch('geobeam.simulations.validate_motion_file')
+  def test_run_prepared_dynamic_simulation(self, mock_validate_motion_file,
+                                           mock_start_bladeGPS_process,
+                                           mock_create_bladeGPS_process, mock_datetime):
+    test_simulation = geobeam.simulations.DynamicSimulation(self.file_path,
+                                                            self.run_duration,
+                                                            self.gain)
+
+    test_simulation.prepare()
+    test_simulation.run_simulation()
+
+    mock_validate_motion_file.assert_called_once_with(self.file_path)
+    mock_start_bladeGPS_process.assert_called_once_with(
+        ["./run_bladerfGPS.sh", "-T", "now", "-d", "100", "-a", "-2", "-u", self.file_path],
+        scheduling=None)
+    mock_create_bladeGPS_process.assert_not_called()
+    self.assertEqual(test_simulation._process, mock_start_bladeGPS_process())
 
-    open_mock = mock_open()
-    with patch("geobeam.simulations.open", open_mock, create=True):
-      open_mock.return_value = MagicMock()
-      test_simulation.log_run(mock_logfile)
+    # the staged command is only used once
+    test_simulation.run_simulation()
+    mock_create_bladeGPS_process.assert_called_once()
+
+  @patch('geobeam.simulations.validate_motion_file')
+  def test_prepare_dynamic_simulation_invalid_file(self, mock_validate_motion_file):
+    mock_validate_motion_file.side_effect = ValueError("bad file")
+    test_simulation = geobeam.simulations.DynamicSimulation(self.file_path)
+
+    with self.assertRaises(ValueError):
+      test_simulation.prepare()
+    self.assertIsNone(test_simulation._prepared_command)
+
+  @patch('geobeam.simulations.validate_motion_file')
+  @patch('geobeam.simulations.write_trimmed_motion_file')
+  @patch('geobeam.simulations.get_motion_file_rate')
+  @patch('geobeam.simulations.os.makedirs')
+  def test_dynamic_simulation_start_offset(self, mock_makedirs, mock_get_motion_file_rate,
+                                           mock_write_trimmed_motion_file,
+                                           mock_validate_motion_file):
+    mock_get_motion_file_rate.return_value = 10.0
+    test_simulation = geobeam.simulations.DynamicSimulation(self.file_path,
+                                                            start_offset=7200)
+
+    process_arguments = test_simulation.get_process_arguments()
+
+    expected_path = os.path.join(geobeam.simulations.RESUME_FILE_DIRECTORY,
+                                 "testfile_from_row_72000.csv")
+    self.assertEqual(process_arguments["dynamic_file_path"], expected_path)
+    # inspecting the arguments writes nothing, the trimmed copy is written on prepare
+    mock_write_trimmed_motion_file.assert_not_called()
+    test_simulation.prepare()
+    mock_write_trimmed_motion_file.assert_called_once_with(self.file_path, 72000, expected_path)
+    self.assertEqual(test_simulation._prepared_command[-1], expected_path)
 
-    mock_csv.writer.assert_called_once()
-    fields = ["simulation_type", "file_path", "run_duration", "gain", "start_time", "end_time"]
-    values = ["DynamicSimulation", self.file_path, self.run_duration, self.gain, "2020-08-15T05:00:00", "2020-08-15T05:00:10"]
-    gps_fields = ["time_from_zero", "x", "y", "z"]
-    csv_calls = [call(fields), call(values), call(gps_fields)]
-    mock_csv.writer().writerow.assert_has_calls(csv_calls)
+  @patch('geobeam.simulations.create_bladeGPS_process')
+  @patch('geobeam.simulations.write_trimmed_motion_file')
+  @patch('geobeam.simulations.get_motion_file_rate')
+  @patch('geobeam.simulations.os.makedirs')
+  def test_run_unprepared_dynamic_simulation_with_start_offset(
+      self, mock_makedirs, mock_get_motion_file_rate, mock_write_trimmed_motion_file,
+      mock_create_bladeGPS_process):
+    mock_get_motion_file_rate.return_value = 10.0
+    test_simulation = geobeam.simulations.DynamicSimulation(self.file_path, start_offset=1)
 
-    open_mock.assert_called_with(self.file_path, "r")
-    self.assertEqual(mock_logfile.write.call_args_list[0], call('\n'))
-    # check for 1 blank line call and 100 copied lines for 10 seconds of data
-    self.assertEqual(mock_logfile.write.call_count, 101)
+    test_simulation.run_simulation()
 
+    expected_path = os.path.join(geobeam.simulations.RESUME_FILE_DIRECTORY,
+                                 "testfile_from_row_10.csv")
+    mock_write_trimmed_motion_file.assert_called_once_with(self.file_path, 10, expected_path)
+    self.assertEqual(mock_create_bladeGPS_process.call_args[1]["dynamic_file_path"],
+                     expected_path)
+
+  @patch('geobeam.simulations.has_motion_file_row')
+  @patch('geobeam.simulations.get_motion_file_rate')
+  def test_dynamic_simulation_save_resume_point(self, mock_get_motion_file_rate,
+                                                mock_has_motion_file_row):
+    mock_get_motion_file_rate.return_value = 10.0
+    mock_has_motion_file_row.side_effect = lambda file_path, row_index: row_index < 1000
+    test_simulation = geobeam.simulations.DynamicSimulation(self.file_path, start_offset=20)
+    test_simulation._start_monotonic = 50.0
+    test_simulation._end_monotonic = 60.05
+
+    test_simulation.save_resume_point()
+    self.assertEqual(test_simulation.get_start_offset(), 30)
+
+    # starts over once the end of the route has been played
+    test_simulation._end_monotonic = 150.0
+    test_simulation.save_resume_point()
+    self.assertEqual(test_simulation.get_start_offset(), 0)
+
+  @patch('geobeam.simulations.TelemetryReader')
   @patch('geobeam.simulations.subprocess')
-  def test_create_blade_GPS_process(self, mock_subprocess):
+  def test_create_blade_GPS_process(self, mock_subprocess, mock_telemetry_reader):
     mock_subprocess.Popen = Mock()
     mock_subprocess.PIPE = Mock()
 
@@ -298,5 +452,107 @@ class SimulationTest(unittest.TestCase):
                                                            dynamic_file_path="test/path")]
     for i in range(len(commands)):
       self.assertEqual(mock_subprocess.Popen.call_args_list[i][0][0], commands[i])
-      self.assertEqual(results[i], mock_subprocess.Popen())
+      self.assertEqual(results[i].popen, mock_subprocess.Popen())
+      self.assertEqual(results[i].telemetry, mock_telemetry_reader())
+    # the telemetry reader owns the output pipe of the process
+    self.assertEqual(mock_telemetry_reader.call_args_list[0],
+                     call(mock_subprocess.Popen().stdout,
+                          echo=geobeam.simulations._echo_bladeGPS_output))
+
+  @patch('geobeam.simulations._echo_bladeGPS_output')
+  def test_telemetry_reader_keeps_launcher_scheduling(self, mock_echo):
+    cpus = os.sched_getaffinity(0)
+    nice = os.getpriority(os.PRIO_PROCESS, 0)
+    scheduling = geobeam.process_scheduling.ProcessScheduling(cpus=[max(cpus)], nice=nice + 5)
+
+    with patch('geobeam.simulations.BLADEGPS_DIRECTORY', os.getcwd()):
+      process = geobeam.simulations.start_bladeGPS_process(
+          [sys.executable, "-c", "input()"], scheduling=scheduling)
+    try:
+      reader_thread_id = process.telemetry._thread.native_id
+      self.assertEqual(os.sched_getaffinity(process.pid), {max(cpus)})
+      self.assertEqual(os.getpriority(os.PRIO_PROCESS, process.pid), nice + 5)
+      self.assertEqual(os.sched_getaffinity(reader_thread_id), cpus)
+      self.assertEqual(os.getpriority(os.PRIO_PROCESS, reader_thread_id), nice)
+    finally:
+      process.communicate(b"q")
+
+  def test_build_blade_GPS_command_with_device(self):
+    command = geobeam.simulations.build_bladeGPS_command(gain=-2, location="27.1,-37.4",
+                                                         device="*:serial=f12ce103")
+
+    self.assertEqual(command, ["./run_bladerfGPS.sh", "-T", "now", "-a", "-2",
+                               "-D", "*:serial=f12ce103", "-l", "27.1,-37.4"])
+
+    command = geobeam.simulations.build_bladeGPS_command(location="27.1,-37.4",
+                                                         device="*:serial=f12ce103",
+                                                         device_option="--device")
+
+    self.assertEqual(command, ["./run_bladerfGPS.sh", "-T", "now",
+                               "--device", "*:serial=f12ce103", "-l", "27.1,-37.4"])
+
+  def test_build_blade_GPS_command_with_ephemeris(self):
+    command = geobeam.simulations.build_bladeGPS_command(run_duration=20, location="27.1,-37.4",
+                                                         ephemeris_file_path="/cache/brdc1230.20n")
+
+    self.assertEqual(command, ["./bladegps", "-e", "/cache/brdc1230.20n", "-T", "now",
+                               "-d", "20", "-l", "27.1,-37.4"])
+
+  def test_get_process_arguments_with_ephemeris_cache(self):
+    test_simulation = geobeam.simulations.StaticSimulation(27.1, -37.4, run_duration=20)
+    mock_ephemeris_cache = MagicMock()
+    mock_ephemeris_cache.find_ephemeris.return_value = "/cache/brdc1230.20n"
+    test_simulation.set_ephemeris_cache(mock_ephemeris_cache)
+
+    self.assertEqual(test_simulation.get_process_arguments()["ephemeris_file_path"],
+                     "/cache/brdc1230.20n")
+
+    mock_ephemeris_cache.find_ephemeris.return_value = None
+    self.assertNotIn("ephemeris_file_path", test_simulation.get_process_arguments())
+
+
+class StreamedDynamicSimulationTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    # stub bladeGPS launcher that copies the motion file it is given with -u
+    launcher_path = os.path.join(self.temp_dir.name, "run_bladerfGPS.sh")
+    with open(launcher_path, "w") as launcher:
+      launcher.write("#!/bin/sh\nwhile [ \"$1\" != \"-u\" ]; do shift; done\n"
+                     "cat \"$2\" > played.csv\nread line\n")
+    os.chmod(launcher_path, 0o755)
+    self.directory_patcher = patch('geobeam.simulations.BLADEGPS_DIRECTORY',
+                                   self.temp_dir.name)
+    self.directory_patcher.start()
+
+  def tearDown(self):
+    self.directory_patcher.stop()
+    self.temp_dir.cleanup()
+
+  @patch('builtins.print')
+  def test_run_streamed_simulation(self, mock_print):
+    def row_source():
+      return (("%.1f" % (i*0.1), i, 2, 3) for i in range(100))
+    test_simulation = geobeam.simulations.StreamedDynamicSimulation(row_source, gain=-2)
+
+    test_simulation.run_simulation()
+    fifo_path = test_simulation.get_process_arguments()["dynamic_file_path"]
+    test_simulation.end_simulation()
+
+    with open(os.path.join(self.temp_dir.name, "played.csv")) as played_file:
+      played_rows = played_file.read().splitlines()
+    self.assertEqual(len(played_rows), 100)
+    self.assertEqual(played_rows[-1], "9.9,99,2,3")
+    self.assertFalse(os.path.exists(fifo_path))
+    self.assertEqual(test_simulation.get_log_record()["rows_streamed"], 100)
+
+  def test_release_prefetched_stream(self):
+    test_simulation = geobeam.simulations.StreamedDynamicSimulation(
+        lambda: iter([("0.0", 1, 2, 3)]))
+
+    test_simulation.prepare()
+    fifo_path = test_simulation.get_process_arguments()["dynamic_file_path"]
+    test_simulation.release()
 
+    self.assertFalse(os.path.exists(os.path.dirname(fifo_path)))
+    self.assertIsNone(test_simulation._prepared_command)
@@ -0,0 +1,94 @@
+import unittest
+
+from geobeam import speed_profiles
+
+
+class MotionCurveTest(unittest.TestCase):
+
+  def test_get_distances(self):
+    curve = speed_profiles.MotionCurve([(0.0, 2.0, 1.0), (2.0, 0.0, 2.0)])
+
+    distances = curve.get_distances([0.0, 0.5, 1.0, 2.0, 3.0, 10.0])
+
+    self.assertEqual(curve.total_time, 3.0)
+    self.assertEqual(curve.total_distance, 5.0)
+    self.assertEqual(distances, [0.0, 0.25, 1.0, 3.0, 5.0, 5.0])
+
+  def test_zero_duration_phases_skipped(self):
+    curve = speed_profiles.MotionCurve([(1.0, 0.0, 0.0), (1.0, 0.0, 2.0)])
+
+    self.assertEqual(len(curve.start_times), 1)
+    self.assertEqual(curve.total_distance, 2.0)
+
+
+class SpeedProfileTest(unittest.TestCase):
+
+  def test_constant_speed_profile(self):
+    curve = speed_profiles.ConstantSpeedProfile(2.5).get_motion_curve(100)
+
+    self.assertEqual(curve.total_time, 40)
+    self.assertEqual(curve.get_distances([4.0]), [10.0])
+
+  def test_subclass_without_phases_fails_on_construction(self):
+    class IncompleteSpeedProfile(speed_profiles.SpeedProfile):
+      pass
+
+    with self.assertRaises(TypeError):
+      IncompleteSpeedProfile()
+
+  def test_constant_speed_profile_invalid_speed(self):
+    with self.assertRaises(ValueError):
+      speed_profiles.ConstantSpeedProfile(0)
+
+  def test_piecewise_constant_speed_profile(self):
+    profile = speed_profiles.PiecewiseConstantSpeedProfile([(0, 1.0), (10, 5.0), (500, 2.0)])
+
+    curve = profile.get_motion_curve(60)
+
+    self.assertEqual(curve.total_time, 20)
+    self.assertEqual(curve.get_distances([10.0, 12.0]), [10.0, 20.0])
+
+  def test_piecewise_constant_speed_profile_must_start_at_zero(self):
+    with self.assertRaises(ValueError):
+      speed_profiles.PiecewiseConstantSpeedProfile([(5, 1.0)])
+
+  def test_acceleration_limited_trapezoid(self):
+    profile = speed_profiles.AccelerationLimitedSpeedProfile(10, 2)
+
+    curve = profile.get_motion_curve(150)
+
+    # 25 m to accelerate, 100 m cruise, 25 m to decelerate
+    self.assertAlmostEqual(curve.total_time, 20)
+    self.assertAlmostEqual(curve.total_distance, 150)
+    self.assertAlmostEqual(curve.get_distances([5.0])[0], 25)
+
+  def test_acceleration_limited_triangle(self):
+    profile = speed_profiles.AccelerationLimitedSpeedProfile(10, 1)
+
+    curve = profile.get_motion_curve(16)
+
+    # peak speed of 4 m/s is reached after 4 seconds
+    self.assertAlmostEqual(curve.total_time, 8)
+    self.assertAlmostEqual(curve.total_distance, 16)
+    self.assertAlmostEqual(max(curve.start_speeds), 4)
+
+  def test_acceleration_limited_no_distance(self):
+    profile = speed_profiles.AccelerationLimitedSpeedProfile(10, 2)
+
+    curve = profile.get_motion_curve(0)
+
+    self.assertEqual(curve.total_time, 0)
+    self.assertEqual(curve.total_distance, 0)
+    self.assertEqual(curve.get_distances([0.0, 1.0]), [0.0, 0.0])
+
+  def test_stop_and_go_dwell(self):
+    profile = speed_profiles.StopAndGoSpeedProfile(5, stops=[(50, 30)])
+
+    curve = profile.get_motion_curve(100)
+
+    self.assertAlmostEqual(curve.total_time, 50)
+    self.assertEqual(curve.get_distances([10.0, 25.0, 40.0, 45.0]), [50.0, 50.0, 50.0, 75.0])
+
+
+if __name__ == '__main__':
+  unittest.main()
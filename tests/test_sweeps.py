@@ -0,0 +1,73 @@
+import configparser
+import unittest
+
+from geobeam import sweeps
+
+
+class SweepsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.config = configparser.ConfigParser()
+    self.config["DEFAULT"]["Speed"] = "1.4"
+    self.config.read_string("[Single]\n"
+                            "Gain = -2\n"
+                            "[GainSweep]\n"
+                            "Gain = -20:0:5\n"
+                            "RunDuration = 30\n"
+                            "[SpeedSweep]\n"
+                            "Speed = 1.4, 2.5\n"
+                            "Gain = -4, -2\n")
+
+  def test_parse_sweep_values(self):
+    self.assertEqual(sweeps.parse_sweep_values("-2", int), [-2])
+    self.assertEqual(sweeps.parse_sweep_values("-6, -4,-2", int), [-6, -4, -2])
+    self.assertEqual(sweeps.parse_sweep_values("-20:0:5", int), [-20, -15, -10, -5, 0])
+    self.assertEqual(sweeps.parse_sweep_values("1:2:0.25"), [1.0, 1.25, 1.5, 1.75, 2.0])
+    self.assertEqual(sweeps.parse_sweep_values("0:1:0.1")[-1], 1.0)
+    self.assertEqual(sweeps.parse_sweep_values("0:10:3", int), [0, 3, 6, 9])
+    self.assertEqual(sweeps.parse_sweep_values("5:0:1", int), [])
+
+  def test_parse_sweep_values_invalid(self):
+    for value in ["1:2", "1:2:0", "a, b", ",", "1:2:-1"]:
+      with self.assertRaises(ValueError):
+        sweeps.parse_sweep_values(value)
+
+  def test_is_sweep(self):
+    self.assertFalse(sweeps.is_sweep(self.config, "Single"))
+    self.assertTrue(sweeps.is_sweep(self.config, "GainSweep"))
+    self.assertTrue(sweeps.is_sweep(self.config, "SpeedSweep"))
+
+  def test_iter_sweep_points(self):
+    points = sweeps.iter_sweep_points(self.config, "SpeedSweep")
+
+    self.assertEqual(next(points), {"Speed": 1.4, "RunDuration": None, "Gain": -4})
+    self.assertEqual(list(points), [{"Speed": 1.4, "RunDuration": None, "Gain": -2},
+                                    {"Speed": 2.5, "RunDuration": None, "Gain": -4},
+                                    {"Speed": 2.5, "RunDuration": None, "Gain": -2}])
+    self.assertEqual(sweeps.count_sweep_points(self.config, "GainSweep"), 5)
+    self.assertEqual(list(sweeps.iter_sweep_points(self.config, "Single")),
+                     [{"Speed": 1.4, "RunDuration": None, "Gain": -2}])
+
+
+  def test_get_sweep_file_name(self):
+    self.assertEqual(sweeps.get_sweep_file_name("walk.csv", 1.4, False), "walk.csv")
+    self.assertEqual(sweeps.get_sweep_file_name("walk.csv", 2.5, True), "walk_2.5mps.csv")
+
+  def test_get_route_key(self):
+    self.config.read_string("[Gpx]\n"
+                            "GpxSourcePath = run.gpx\n"
+                            "[Directions]\n"
+                            "StartLatitude = 37.4\n"
+                            "StartLongitude = -122.0\n"
+                            "EndLatitude = 37.5\n"
+                            "EndLongitude = -122.1\n")
+
+    self.assertEqual(sweeps.get_route_key(self.config, "Gpx"), ("gpx", "run.gpx"))
+    self.assertEqual(sweeps.get_route_key(self.config, "Directions"),
+                     ("directions", 37.4, -122.0, 37.5, -122.1))
+    with self.assertRaises(configparser.NoOptionError):
+      sweeps.get_route_key(self.config, "Single")
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,101 @@
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+from unittest.mock import patch
+
+from benchmarks import stub_bladegps
+from benchmarks import switch_benchmarks
+from geobeam import telemetry
+
+
+class StubBladeGPSTest(unittest.TestCase):
+
+  def test_quits_on_q(self):
+    with tempfile.TemporaryDirectory() as temp_dir:
+      stub_bladegps.install_stub_bladegps(temp_dir, download_delay=0.01, startup_delay=0.01,
+                                          quit_delay=0.01)
+      process = subprocess.Popen(["./run_bladerfGPS.sh", "-T", "now", "-l", "27.1,-37.4"],
+                                 cwd=temp_dir, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+      # wait for it to start transmitting
+      output = b""
+      while b"Time into run" not in output:
+        output += process.stdout.read1()
+      remaining_output, _ = process.communicate(b"q", timeout=10)
+      output += remaining_output
+
+    self.assertEqual(process.returncode, 0)
+    lines = [line for chunk in output.decode().split("\n") for line in chunk.split("\r")]
+    kinds = [event.kind for event in map(telemetry.parse_bladeGPS_line, lines) if event]
+    self.assertEqual(kinds[:2], [telemetry.START_TIME, telemetry.DURATION])
+    self.assertIn(telemetry.SATELLITE, kinds)
+    self.assertIn(telemetry.TIME_INTO_RUN, kinds)
+    self.assertEqual(kinds[-1], telemetry.DONE)
+
+  def test_ends_after_duration(self):
+    completed = subprocess.run([sys.executable, stub_bladegps.__file__, "--startup-delay", "0",
+                                "-d", "0.2", "-u", "/tmp/motion.csv"],
+                               stdin=subprocess.PIPE, capture_output=True, timeout=10)
+
+    self.assertEqual(completed.returncode, 0)
+    self.assertIn(b"Using user motion file", completed.stdout)
+    self.assertIn(b"Done!", completed.stdout)
+
+
+class SwitchBenchmarksTest(unittest.TestCase):
+
+  def test_get_percentiles(self):
+    summary = switch_benchmarks.get_percentiles([float(value) for value in range(100, 0, -1)])
+
+    self.assertEqual(summary, {"count": 100, "p50": 50.0, "p90": 90.0, "p99": 99.0,
+                               "max": 100.0})
+    self.assertEqual(switch_benchmarks.get_percentiles([]),
+                     {"count": 0, "p50": None, "p90": None, "p99": None, "max": None})
+
+  def test_get_switch_script(self):
+    self.assertEqual(switch_benchmarks.get_switch_script(3, 4), [0, 1, 2, 0, 1])
+
+  @patch('builtins.print')
+  def test_measure_switches(self, mock_print):
+    latencies = switch_benchmarks.measure_switches(simulation_count=2, switches=2,
+                                                   download_delay=0.05, startup_delay=0.05,
+                                                   quit_delay=0.01)
+
+    self.assertEqual(len(latencies["first_signal"]), 1)
+    self.assertEqual(len(latencies["switch_launch"]), 2)
+    for launch, signal in zip(latencies["switch_launch"], latencies["switch_to_signal"]):
+      self.assertGreaterEqual(signal, launch)
+      self.assertGreaterEqual(signal, 0.1)
+
+  def test_measure_startup(self):
+    latencies = switch_benchmarks.measure_startup(runs=1, cached_ephemeris=True,
+                                                  startup_delay=0.05, quit_delay=0.01)
+
+    self.assertEqual(len(latencies["run_py_to_signal"]), 1)
+    self.assertGreater(latencies["run_py_to_signal"][0], 0.05)
+
+  @patch.object(switch_benchmarks, "SIGNAL_TIMEOUT", 0.5)
+  def test_measure_startup_times_out(self):
+    start = time.monotonic()
+
+    with self.assertRaises(RuntimeError):
+      switch_benchmarks.measure_startup(runs=1, cached_ephemeris=True, startup_delay=30,
+                                        quit_delay=0.01)
+    self.assertLess(time.monotonic() - start, 10)
+
+  @patch.object(switch_benchmarks, "SIGNAL_TIMEOUT", 0.1)
+  def test_wait_for_silent_simulation_times_out(self):
+    silent_run = threading.Event()
+    simulation = Mock()
+    simulation.iter_telemetry.side_effect = lambda: silent_run.wait() and iter([])
+
+    with self.assertRaises(RuntimeError):
+      switch_benchmarks._wait_for_signal(simulation)
+    silent_run.set()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,182 @@
+import os
+import subprocess
+import sys
+import threading
+import unittest
+from unittest.mock import patch
+
+import geobeam
+from geobeam import telemetry
+
+
+class ParseBladeGPSLineTest(unittest.TestCase):
+
+  def test_time_into_run(self):
+    event = telemetry.parse_bladeGPS_line("Time into run =  12.3")
+
+    self.assertEqual(event.kind, telemetry.TIME_INTO_RUN)
+    self.assertEqual(event.values, {"seconds": 12.3})
+
+  def test_satellite(self):
+    event = telemetry.parse_bladeGPS_line("05  212.4  34.5  22345678.9   4.1")
+
+    self.assertEqual(event.kind, telemetry.SATELLITE)
+    self.assertEqual(event.values, {"prn": 5, "azimuth": 212.4, "elevation": 34.5,
+                                    "range": 22345678.9, "iono_delay": 4.1})
+
+  def test_start_time_and_duration(self):
+    start = telemetry.parse_bladeGPS_line("Start time = 2020/08/15,05:00:00 (2118:450000)")
+    duration = telemetry.parse_bladeGPS_line("Duration = 300.0 [sec]")
+
+    self.assertEqual(start.values, {"start_time": "2020/08/15,05:00:00"})
+    self.assertEqual(duration.values, {"seconds": 300.0})
+
+  def test_underrun_and_tx_error(self):
+    underrun = telemetry.parse_bladeGPS_line("[WARNING @ sync.c:412] TX underrun detected")
+    tx_error = telemetry.parse_bladeGPS_line("Failed to TX samples: Operation timed out")
+
+    self.assertEqual(underrun.kind, telemetry.UNDERRUN)
+    self.assertEqual(tx_error.kind, telemetry.TX_ERROR)
+    self.assertEqual(tx_error.values, {"message": "Operation timed out"})
+
+  def test_late_buffer(self):
+    event = telemetry.parse_bladeGPS_line("[WARNING @ sync.c:319] Discarding late TX buffer")
+    time_past = telemetry.parse_bladeGPS_line(
+        "Failed to TX samples: Requested timestamp is in the past")
+
+    self.assertEqual(event.kind, telemetry.LATE_BUFFER)
+    self.assertEqual(time_past.kind, telemetry.LATE_BUFFER)
+
+  def test_late_in_other_lines(self):
+    self.assertIsNone(telemetry.parse_bladeGPS_line("Ephemeris is too late for the start time"))
+
+  def test_unknown_line(self):
+    self.assertIsNone(telemetry.parse_bladeGPS_line("Opening and initializing device..."))
+
+
+class TelemetryReaderTest(unittest.TestCase):
+
+  def test_reads_lines_split_across_chunks(self):
+    read_fd, write_fd = os.pipe()
+    reader = telemetry.TelemetryReader(os.fdopen(read_fd, "rb"))
+    reader.start()
+
+    os.write(write_fd, b"05  212.4  34.5  22345678.9   4.1\n12  80.0  60.2  20")
+    os.write(write_fd, b"345678.9   2.0\nRunning...\n\rTime into run =   0.1\rTime into")
+    os.write(write_fd, b" run =   0.2\r[WARNING] TX underrun\n")
+    os.close(write_fd)
+    events = list(reader.events())
+    reader.join()
+
+    self.assertEqual([event.kind for event in events],
+                     [telemetry.SATELLITE, telemetry.SATELLITE, telemetry.TIME_INTO_RUN,
+                      telemetry.TIME_INTO_RUN, telemetry.UNDERRUN])
+    self.assertEqual(reader.status, {"elapsed_seconds": 0.2, "satellite_count": 2,
+                                     "underruns": 1, "late_buffers": 0})
+
+  def test_new_satellite_table_replaces_last(self):
+    read_fd, write_fd = os.pipe()
+    reader = telemetry.TelemetryReader(os.fdopen(read_fd, "rb"))
+    reader.start()
+
+    os.write(write_fd, b"05  212.4  34.5  22345678.9   4.1\n12  80.0  60.2  20345678.9   2.0\n"
+                       b"Time into run =  30.0\n07  10.0  5.0  25345678.9   6.0\n")
+    os.close(write_fd)
+    reader.join()
+
+    self.assertEqual(reader.status["satellite_count"], 1)
+
+  def test_listener_called_for_every_event(self):
+    read_fd, write_fd = os.pipe()
+    reader = telemetry.TelemetryReader(os.fdopen(read_fd, "rb"))
+    received = []
+    finished = threading.Event()
+
+    def listener(event):
+      received.append(event.values["seconds"])
+      if len(received) == 3:
+        finished.set()
+    reader.start()
+    reader.add_listener(listener)
+    os.write(write_fd, b"\rTime into run =   0.1\rTime into run =   0.2\rTime into run =   0.3")
+    os.close(write_fd)
+
+    self.assertTrue(finished.wait(5))
+    self.assertEqual(received, [0.1, 0.2, 0.3])
+
+  @patch('geobeam.telemetry.SUBSCRIBER_QUEUE_SIZE', 2)
+  def test_slow_iterator_loses_oldest_events(self):
+    read_fd, write_fd = os.pipe()
+    reader = telemetry.TelemetryReader(os.fdopen(read_fd, "rb"))
+    events = reader.events()
+    next_event = threading.Thread(target=lambda: self.first_events.append(next(events)))
+    self.first_events = []
+    reader.start()
+
+    os.write(write_fd, b"Time into run =   0.1\nTime into run =   0.2\nTime into run =   0.3\n")
+    os.close(write_fd)
+    reader.join()
+    next_event.start()
+    next_event.join(5)
+
+    # the queue kept the last event and the end of the output
+    self.assertEqual([event.values["seconds"] for event in self.first_events], [0.3])
+    self.assertEqual(list(events), [])
+
+  def test_closed_iterator_unsubscribed(self):
+    read_fd, write_fd = os.pipe()
+    reader = telemetry.TelemetryReader(os.fdopen(read_fd, "rb"))
+    reader.start()
+    os.write(write_fd, b"Time into run =   0.1\n")
+    events = reader.events()
+
+    next(events)
+    events.close()
+
+    self.assertEqual(reader._subscribers, [])
+    os.close(write_fd)
+    reader.join()
+
+
+class SimulationTelemetryTest(unittest.TestCase):
+
+  @patch('geobeam.simulations._echo_bladeGPS_output')
+  @patch('geobeam.simulations.build_bladeGPS_command')
+  @patch('builtins.print')
+  def test_simulation_telemetry_from_stub_process(self, mock_print, mock_build_bladeGPS_command,
+                                                  mock_echo):
+    # stub bladeGPS that reports a satellite and its progress, then waits to be quit
+    mock_build_bladeGPS_command.return_value = [
+        sys.executable, "-c",
+        "import sys; print('05  212.4  34.5  22345678.9   4.1');"
+        "print('\\rTime into run =   1.5', end='', flush=True); input()"]
+    with patch('geobeam.simulations.BLADEGPS_DIRECTORY', os.getcwd()):
+      test_simulation = geobeam.simulations.Simulation(gain=-2)
+      test_simulation.run_simulation()
+      events = test_simulation.iter_telemetry()
+      kinds = [next(events).kind, next(events).kind]
+      status = test_simulation.get_telemetry_status()
+      test_simulation.end_simulation()
+
+    self.assertEqual(kinds, [telemetry.SATELLITE, telemetry.TIME_INTO_RUN])
+    self.assertEqual(status["satellite_count"], 1)
+    mock_echo.assert_called()
+
+  @patch('geobeam.simulations._echo_bladeGPS_output')
+  @patch('geobeam.simulations.build_bladeGPS_command')
+  @patch('builtins.print')
+  def test_underruns_counted_in_log_record(self, mock_print, mock_build_bladeGPS_command,
+                                           mock_echo):
+    mock_build_bladeGPS_command.return_value = [
+        sys.executable, "-c",
+        "print('[WARNING] TX underrun'); print('[WARNING] TX underrun');"
+        "print('Discarding late TX buffer')"]
+    with patch('geobeam.simulations.BLADEGPS_DIRECTORY', os.getcwd()):
+      test_simulation = geobeam.simulations.Simulation(gain=-2)
+      test_simulation.run_simulation()
+      test_simulation._process.wait()
+      test_simulation.end_simulation()
+
+    telemetry_status = test_simulation.get_log_record()["telemetry"]
+    self.assertEqual(telemetry_status["underruns"], 2)
+    self.assertEqual(telemetry_status["late_buffers"], 1)